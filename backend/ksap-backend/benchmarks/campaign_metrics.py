@@ -0,0 +1,284 @@
+"""
+Benchmark: campaign metrics for --campaigns campaigns x --days days.
+
+Generates a portfolio of synthetic campaigns (daily and lifetime
+budgets, flights starting and ending inside the window, some paused)
+with gamma-distributed daily spend, occasional spikes and outages, and
+computes spend, ROAS, CPA, pacing and anomaly flags for all of them:
+
+- vectorized: src.services.campaign_metrics.compute()
+- loops: the same metrics with a Python loop per campaign and day, as
+  they were computed before, on --loop-campaigns campaigns and scaled up
+
+The loop results are compared with the vectorized ones on those
+campaigns: totals must match and flags may only differ on a handful of
+days sitting exactly on a threshold (float32 sums).
+
+With --database-url the stats are also written to ad_campaign_daily_stats
+for campaigns under a store created for the run (under an existing user,
+--user-id, default: any), and loading them is timed: CampaignSeries.load()
+(binary COPY into NumPy) against fetching rows and filling the arrays in
+Python. Everything is deleted afterwards. Migrations through
+create_ad_campaign_daily_stats must be applied.
+
+Usage:
+    python benchmarks/campaign_metrics.py [--campaigns 10000] [--days 365] \\
+        [--database-url postgresql://...]
+"""
+
+import argparse
+import io
+import math
+import os
+import re
+import sys
+import time
+import uuid
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from src.services.campaign_metrics import (
+    ANOMALY_MIN_HISTORY, ANOMALY_WINDOW, ANOMALY_Z, FLAGS, METRICS, OPEN_END, OPEN_START, PACING_TOLERANCE,
+    RUN_RATE_DAYS, CampaignSeries, compute
+)
+
+
+def portfolio(campaigns, days, start, seed=7):
+    rng = np.random.default_rng(seed)
+    daily = rng.random(campaigns) < 0.6
+    level = rng.gamma(2.0, 40.0, campaigns)
+    flight_start = np.where(rng.random(campaigns) < 0.3, rng.integers(0, days // 2, campaigns), rng.integers(-60, 1, campaigns))
+    flight_end = np.where(rng.random(campaigns) < 0.5, rng.integers(days // 2, days + 120, campaigns), OPEN_END)
+    flight_end = np.where(daily, flight_end, np.maximum(flight_end, flight_start + 30))
+    flight_end = np.where(~daily & (flight_end == OPEN_END), flight_start + days + 30, flight_end)
+    budget = np.where(daily, level * rng.uniform(0.8, 1.4, campaigns),
+                      level * (flight_end - flight_start + 1) * rng.uniform(0.8, 1.4, campaigns))
+    series = CampaignSeries(
+        [str(uuid.uuid4()) for _ in range(campaigns)], start, days,
+        status=np.where(rng.random(campaigns) < 0.85, 'active', 'paused'),
+        daily_budget=daily, budget=np.round(budget, 2), flight_start=flight_start, flight_end=flight_end,
+        spend_before=np.where(daily, 0, np.round(level * np.maximum(-flight_start, 0), 2))
+    )
+
+    day = np.arange(days)
+    live = (day >= flight_start[:, None]) & (day <= flight_end[:, None])
+    spend = rng.gamma(4.0, level[:, None] / 4.0, (campaigns, days)) * live
+    spend *= np.where(rng.random((campaigns, days)) < 0.003, rng.uniform(3, 6, (campaigns, days)), 1)
+    spend *= rng.random((campaigns, days)) > 0.002
+    spend = np.round(spend, 2)
+    impressions = np.round(spend * rng.uniform(50, 200, (campaigns, 1)))
+    clicks = np.round(impressions * rng.uniform(0.005, 0.03, (campaigns, 1)))
+    conversions = rng.binomial(clicks.astype(np.int64), rng.uniform(0.01, 0.06, (campaigns, 1)))
+    revenue = np.round(conversions * rng.uniform(20, 80, (campaigns, 1)), 2)
+    for name, values in zip(METRICS, (impressions, clicks, conversions, spend, revenue)):
+        series.values[name][:] = values
+    return series
+
+
+def loop_metrics(series, i, as_of):
+    """One campaign's metrics with plain Python, day by day"""
+    row = {name: series.values[name][i].tolist() for name in METRICS}
+    totals = {name: 0.0 for name in METRICS}
+    for d in range(as_of + 1):
+        for name in METRICS:
+            totals[name] += row[name][d]
+
+    def ratio(a, b):
+        return a / b if b > 0 else math.nan
+
+    start, end = int(series.flight_start[i]), int(series.flight_end[i])
+    budget, daily = float(series.budget[i]), bool(series.daily_budget[i])
+    active_days = max(min(end, as_of) - max(start, 0) + 1, 0)
+    if daily:
+        budget_to_date = budget * active_days
+        spent = totals['spend']
+    else:
+        bounded = start > OPEN_START and end < OPEN_END
+        share = min((max(as_of - start + 1, 0)) / (end - start + 1), 1) if bounded else math.nan
+        budget_to_date = budget * share
+        spent = totals['spend'] + float(series.spend_before[i])
+    pacing = ratio(spent, budget_to_date)
+    recent = row['spend'][max(as_of + 1 - RUN_RATE_DAYS, 0):as_of + 1]
+    run_rate = sum(recent) / len(recent)
+    projected = math.nan if daily or end >= OPEN_END else spent + run_rate * max(end - as_of, 0)
+
+    flags = 0
+    if pacing > 1 + PACING_TOLERANCE:
+        flags |= FLAGS['overpacing']
+    if series.active[i] and start <= as_of <= end and pacing < 1 - PACING_TOLERANCE:
+        flags |= FLAGS['underpacing']
+    if projected > budget * (1 + PACING_TOLERANCE):
+        flags |= FLAGS['projected_overspend']
+
+    anomaly_days = 0
+    for d in range(as_of + 1):
+        history = row['spend'][max(d - ANOMALY_WINDOW, 0):d]
+        n = len(history)
+        if n < ANOMALY_MIN_HISTORY:
+            continue
+        spend_sum = sum(history)
+        conversions_sum = sum(row['conversions'][d - n:d])
+        revenue_sum = sum(row['revenue'][d - n:d])
+        impressions_sum = sum(row['impressions'][d - n:d])
+        mean = spend_sum / n
+        deviation = math.sqrt(max(sum(x * x for x in history) / n - mean * mean, 0))
+        spend = row['spend'][d]
+        bits = 0
+        if deviation > 0 and spend - mean > ANOMALY_Z * deviation:
+            bits |= FLAGS['spend_spike']
+        if deviation > 0 and spend - mean < -ANOMALY_Z * deviation:
+            bits |= FLAGS['spend_drop']
+        if conversions_sum > 0 and spend / max(row['conversions'][d], 1) > 2 * spend_sum / conversions_sum:
+            bits |= FLAGS['cpa_spike']
+        if revenue_sum > 0 and spend > 0.5 * mean and row['revenue'][d] / spend < revenue_sum / spend_sum / 2:
+            bits |= FLAGS['roas_drop']
+        if series.active[i] and start <= d <= end and impressions_sum > 0 and row['impressions'][d] == 0:
+            bits |= FLAGS['no_delivery']
+        anomaly_days += bits != 0
+        if d == as_of:
+            flags |= bits
+
+    return {
+        **totals,
+        'roas': ratio(totals['revenue'], totals['spend']),
+        'cpa': ratio(totals['spend'], totals['conversions']),
+        'pacing': pacing,
+        'projected_spend': projected,
+        'flags': flags,
+        'anomaly_days': anomaly_days
+    }
+
+
+def database_load(args, series):
+    import psycopg2
+    from flask import Flask
+    from src.models import db
+
+    connection = psycopg2.connect(args.database_url)
+    store_id = str(uuid.uuid4())
+    try:
+        with connection.cursor() as cursor:
+            owner = args.user_id
+            if owner is None:
+                cursor.execute("SELECT id FROM public.users LIMIT 1")
+                owner = cursor.fetchone()[0]
+            cursor.execute("INSERT INTO public.stores (id, user_id, name, platform) VALUES (%s, %s, 'Ads', 'custom')",
+                           (store_id, owner))
+            budget_type = np.where(series.daily_budget, 'daily', 'lifetime')
+            cursor.executemany(
+                "INSERT INTO public.ad_campaigns (id, user_id, store_id, name, status, budget_type, budget_amount, "
+                "start_date, end_date) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                [(campaign_id, owner, store_id, f'Campaign {i}', 'active' if series.active[i] else 'paused',
+                  str(budget_type[i]), float(series.budget[i]),
+                  series.start + timedelta(days=int(series.flight_start[i])),
+                  None if series.flight_end[i] >= OPEN_END else series.start + timedelta(days=int(series.flight_end[i])))
+                 for i, campaign_id in enumerate(series.campaign_ids)]
+            )
+            started = time.perf_counter()
+            written = 0
+            for lo in range(0, len(series), 1000):
+                buffer = io.StringIO()
+                values = {name: series.values[name][lo:lo + 1000] for name in METRICS}
+                for j, campaign_id in enumerate(series.campaign_ids[lo:lo + 1000]):
+                    for d in range(series.days):
+                        buffer.write(f"{campaign_id}\t{series.start + timedelta(days=d)}\t{int(values['impressions'][j, d])}\t"
+                                     f"{int(values['clicks'][j, d])}\t{int(values['conversions'][j, d])}\t"
+                                     f"{values['spend'][j, d]:.2f}\t{values['revenue'][j, d]:.2f}\n")
+                        written += 1
+                buffer.seek(0)
+                cursor.copy_expert("COPY public.ad_campaign_daily_stats "
+                                   "(campaign_id, stat_date, impressions, clicks, conversions, spend, revenue) FROM STDIN", buffer)
+            cursor.execute("ANALYZE public.ad_campaign_daily_stats")
+        connection.commit()
+        print(f"\nwrote {written} stat rows in {time.perf_counter() - started:.1f}s")
+
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = re.sub(r'^postgres(ql)?://', 'postgresql+psycopg2://', args.database_url)
+        db.init_app(app)
+        with app.app_context():
+            started = time.perf_counter()
+            loaded = CampaignSeries.load(store_id=store_id, start=series.start, end=series.end)
+            copy_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT s.campaign_id, s.stat_date, s.impressions, s.clicks, s.conversions, s.spend, s.revenue "
+                "FROM public.ad_campaign_daily_stats s JOIN public.ad_campaigns c ON c.id = s.campaign_id "
+                "WHERE c.store_id = %s AND s.stat_date BETWEEN %s AND %s",
+                (store_id, series.start, series.end)
+            )
+            index = {campaign_id: i for i, campaign_id in enumerate(loaded.campaign_ids)}
+            arrays = {name: np.zeros((len(index), series.days), np.float32) for name in METRICS}
+            for campaign_id, stat_date, *values in cursor:
+                i, d = index[str(campaign_id)], (stat_date - series.start).days
+                for name, value in zip(METRICS, values):
+                    arrays[name][i, d] = float(value)
+        rows_seconds = time.perf_counter() - started
+        connection.commit()
+
+        order = [loaded.campaign_ids.index(campaign_id) for campaign_id in series.campaign_ids[:100]]
+        same = all(np.array_equal(loaded.values[name][order], series.values[name][:100]) for name in METRICS)
+        print(f"load {len(loaded)} campaigns x {loaded.days} days: binary COPY {copy_seconds:.2f}s, "
+              f"row fetch + Python fill {rows_seconds:.2f}s ({rows_seconds / copy_seconds:.1f}x); "
+              f"loaded values match: {same}")
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM public.ad_campaigns WHERE store_id = %s", (store_id,))
+            cursor.execute("DELETE FROM public.stores WHERE id = %s", (store_id,))
+        connection.commit()
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--campaigns', type=int, default=10000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--loop-campaigns', type=int, default=300, help='campaigns computed with Python loops')
+    parser.add_argument('--batch-size', type=int, default=None)
+    parser.add_argument('--database-url', help='also time loading the stats from Postgres')
+    parser.add_argument('--user-id', help='owner of the store created for the run (default: any user)')
+    args = parser.parse_args()
+
+    start = date.today() - timedelta(days=args.days)
+    series = portfolio(args.campaigns, args.days, start)
+    print(f"{args.campaigns} campaigns x {args.days} days: {series.nbytes / 2 ** 20:.0f} MiB of float32 arrays")
+
+    options = {'batch_size': args.batch_size} if args.batch_size else {}
+    runs = []
+    for _ in range(3):
+        started = time.perf_counter()
+        metrics = compute(series, **options)
+        runs.append(time.perf_counter() - started)
+    vectorized = min(runs)
+
+    sample = range(min(args.loop_campaigns, args.campaigns))
+    started = time.perf_counter()
+    looped = [loop_metrics(series, i, series.days - 1) for i in sample]
+    loops = (time.perf_counter() - started) / len(looped) * args.campaigns
+
+    print(f"vectorized: {vectorized:.3f}s ({args.campaigns / vectorized:,.0f} campaigns/s)")
+    print(f"loops:      {loops:.1f}s scaled from {len(looped)} campaigns ({loops / vectorized:.0f}x slower)")
+
+    def close(a, b):
+        return (math.isnan(a) and math.isnan(b)) or math.isclose(a, b, rel_tol=1e-5, abs_tol=1e-6)
+
+    mismatched = [i for i in sample for name in ('spend', 'revenue', 'conversions', 'roas', 'cpa', 'pacing', 'projected_spend')
+                  if not close(float(getattr(metrics, name)[i]), looped[i][name])]
+    flag_differences = sum(int(metrics.flags[i]) != looped[i]['flags'] for i in sample)
+    day_differences = sum(abs(int(metrics.anomaly_days[i]) - looped[i]['anomaly_days']) for i in sample)
+    print(f"check on {len(looped)} campaigns: {len(mismatched)} metric mismatches, {flag_differences} flag differences, "
+          f"{day_differences} anomaly days apart")
+    print("flags: " + ', '.join(f"{name} {len(metrics.flagged(name))}" for name in FLAGS))
+    if mismatched:
+        sys.exit('vectorized metrics do not match the loops')
+
+    if args.database_url:
+        database_load(args, series)
+
+
+if __name__ == '__main__':
+    main()
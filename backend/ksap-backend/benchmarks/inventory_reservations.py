@@ -0,0 +1,218 @@
+"""
+Benchmark: parallel checkouts contending for one SKU.
+
+Creates a store with a hot product holding --stock units and --products
+other products with plenty of stock. --checkouts carts are then checked
+out from --concurrency threads, each with its own connection. Every cart
+has one unit of the hot product plus --items - 1 other products, in
+random order. Three ways of taking the stock are compared:
+
+- naive: read inventory_quantity, check it and write the new value, one
+  line at a time (read-modify-write, committed per line)
+- locking: SELECT ... FOR UPDATE each line (in product order, so carts
+  don't deadlock), then update, holding the locks across every round trip
+- reserve: InventoryReservations.reserve(), one conditional statement
+  locking in id order
+
+For each one it reports checkouts per second, latency p50/p99, carts
+sold and when the last one sold, carts refused, database errors, and the hot SKU's final stock
+against the units sold. Sold units beyond --stock, or stock that doesn't
+add up, mean overselling. --rtt-ms of sleep is added to every statement
+and commit to stand in for the network between app and database; row
+locks held across round trips are what serialize a hot SKU. Rows are written into a store created for the
+run under an existing user (--user-id, default: any) and deleted
+afterwards. Migrations through create_inventory_reservations must be
+applied.
+
+Usage:
+    python benchmarks/inventory_reservations.py --database-url postgresql://... \\
+        [--checkouts 1000] [--concurrency 64] [--stock 300] [--items 3]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+
+from src.models import db
+from src.services.inventory import InventoryError, inventory
+
+
+def naive_checkout(store_id, cart):
+    for product_id, quantity in cart:
+        stock = db.session.execute(
+            db.text("SELECT inventory_quantity FROM public.products WHERE id = :id"), {'id': product_id}
+        ).scalar()
+        if stock < quantity:
+            db.session.rollback()
+            return False
+        db.session.execute(
+            db.text("UPDATE public.products SET inventory_quantity = :stock WHERE id = :id"),
+            {'id': product_id, 'stock': stock - quantity}
+        )
+        db.session.commit()
+    return True
+
+
+def locking_checkout(store_id, cart):
+    # In product order: locking in cart order deadlocks most of the time at this contention
+    for product_id, quantity in sorted(cart):
+        stock = db.session.execute(
+            db.text("SELECT inventory_quantity FROM public.products WHERE id = :id FOR UPDATE"), {'id': product_id}
+        ).scalar()
+        if stock < quantity:
+            db.session.rollback()
+            return False
+        db.session.execute(
+            db.text("UPDATE public.products SET inventory_quantity = inventory_quantity - :quantity WHERE id = :id"),
+            {'id': product_id, 'quantity': quantity}
+        )
+    db.session.commit()
+    return True
+
+
+def reserve_checkout(store_id, cart):
+    try:
+        inventory.reserve(store_id, [{'product_id': product_id, 'quantity': quantity} for product_id, quantity in cart])
+    except InventoryError as e:
+        if e.code != 'INSUFFICIENT_INVENTORY':
+            raise
+        return False
+    return True
+
+
+STRATEGIES = {
+    'naive': naive_checkout,
+    'locking': locking_checkout,
+    'reserve': reserve_checkout
+}
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))] if values else 0.0
+
+
+def run(app, checkout, store_id, carts, concurrency):
+    latencies, outcomes = [], {'sold': 0, 'refused': 0, 'errors': 0, 'last_sale': 0.0}
+    lock = threading.Lock()
+
+    def one(cart):
+        begun = time.perf_counter()
+        with app.app_context():
+            try:
+                outcome = 'sold' if checkout(store_id, cart) else 'refused'
+            except DBAPIError:
+                db.session.rollback()
+                outcome = 'errors'
+        finished = time.perf_counter()
+        with lock:
+            latencies.append(finished - begun)
+            outcomes[outcome] += 1
+            if outcome == 'sold':
+                outcomes['last_sale'] = max(outcomes['last_sale'], finished - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(one, carts))
+    return time.perf_counter() - started, latencies, outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--user-id', help='owner of the store created for the run (default: any user)')
+    parser.add_argument('--checkouts', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=64, help='parallel checkouts (one connection each)')
+    parser.add_argument('--stock', type=int, default=300, help='units of the hot product')
+    parser.add_argument('--products', type=int, default=20, help='other products carts pick from')
+    parser.add_argument('--items', type=int, default=3, help='line items per cart')
+    parser.add_argument('--strategies', default=','.join(STRATEGIES))
+    parser.add_argument('--rtt-ms', type=float, default=1.0,
+                        help='network round trip added to every statement and commit (a local socket has ~none)')
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error('--database-url or DATABASE_URL is required')
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = re.sub(r'^postgres(ql)?://', 'postgresql+psycopg2://', args.database_url)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_size': args.concurrency, 'max_overflow': 0}
+    db.init_app(app)
+    inventory.init_app(app)
+
+    def round_trip(*args):
+        time.sleep(args_rtt)
+
+    args_rtt = args.rtt_ms / 1000
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', round_trip)
+        event.listen(db.engine, 'commit', round_trip)
+
+    store_id = str(uuid.uuid4())
+    hot = str(uuid.uuid4())
+    others = [str(uuid.uuid4()) for _ in range(args.products)]
+    with app.app_context():
+        owner = args.user_id or db.session.execute(db.text("SELECT id FROM public.users LIMIT 1")).scalar()
+        db.session.execute(
+            db.text("INSERT INTO public.stores (id, user_id, name, platform) VALUES (:id, :user_id, 'Flash sale', 'custom')"),
+            {'id': store_id, 'user_id': owner}
+        )
+        db.session.execute(
+            db.text("INSERT INTO public.products (id, store_id, title, inventory_quantity, track_inventory) "
+                    "VALUES (:id, :store_id, :title, 0, true)"),
+            [{'id': product_id, 'store_id': store_id, 'title': f'Product {i}'} for i, product_id in enumerate([hot, *others])]
+        )
+        db.session.commit()
+
+    carts = []
+    for _ in range(args.checkouts):
+        cart = [(hot, 1)] + [(product_id, random.randint(1, 3)) for product_id in random.sample(others, args.items - 1)]
+        random.shuffle(cart)
+        carts.append(cart)
+
+    print(f"{args.checkouts} checkouts from {args.concurrency} connections, {args.stock} units of the hot SKU, "
+          f"{args.items} items per cart, {args.rtt_ms}ms round trips\n")
+    print(f"{'strategy':<10}{'carts/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'sold':>7}{'last sale s':>13}{'refused':>9}"
+          f"{'errors':>8}{'hot stock left':>16}{'oversold':>10}")
+    try:
+        for name in args.strategies.split(','):
+            with app.app_context():
+                db.session.execute(db.text("DELETE FROM public.inventory_reservations WHERE store_id = :id"), {'id': store_id})
+                db.session.execute(
+                    db.text("UPDATE public.products SET inventory_quantity = CASE WHEN id = :hot THEN :stock ELSE 1000000 END "
+                            "WHERE store_id = :store_id"),
+                    {'hot': hot, 'stock': args.stock, 'store_id': store_id}
+                )
+                db.session.commit()
+
+            elapsed, latencies, outcomes = run(app, STRATEGIES[name], store_id, carts, args.concurrency)
+
+            with app.app_context():
+                left = db.session.execute(
+                    db.text("SELECT inventory_quantity FROM public.products WHERE id = :id"), {'id': hot}
+                ).scalar()
+            # Each sold cart took one hot unit: selling more than the stock, or
+            # more than the stock went down by, is overselling
+            oversold = max(outcomes['sold'] - args.stock, outcomes['sold'] - (args.stock - left), 0)
+            print(f"{name:<10}{args.checkouts / elapsed:>9.0f}{percentile(latencies, 0.5) * 1000:>9.1f}"
+                  f"{percentile(latencies, 0.99) * 1000:>9.1f}{outcomes['sold']:>7}{outcomes['last_sale']:>13.2f}{outcomes['refused']:>9}"
+                  f"{outcomes['errors']:>8}{left:>16}{oversold:>10}")
+    finally:
+        with app.app_context():
+            db.session.execute(db.text("DELETE FROM public.stores WHERE id = :id"), {'id': store_id})
+            db.session.commit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""
+Benchmark: a burst of payment webhook deliveries.
+
+Serves the app on a local port and posts --intents Stripe-style payment
+intents, each as a `payment_intent.created` and a
+`payment_intent.succeeded` event, from --clients concurrent senders. The
+events arrive shuffled, so some `succeeded` events come before their
+`created` event. A --duplicates share of deliveries is sent twice, as
+providers do when an acknowledgement is slow.
+
+Reported:
+- acknowledgement latency (p50/p99) as the provider sees it; the senders
+  share the process with the server, so the server-side handling time
+  from the request metrics is reported too
+- the time until every event is applied, and events per commit
+- the queue depth peak
+- for comparison, the cost of applying events one commit at a time, as a
+  handler doing the work inline would, measured on --inline more events
+
+It checks that every intent ends up as one completed transaction. The
+rows are written under a payment processor created for the run under an
+existing user (--user-id, default: any), and they are deleted afterwards.
+Migrations through create_payment_webhook_events must be applied.
+
+Usage:
+    python benchmarks/payment_webhooks.py --database-url postgresql://... \\
+        [--intents 2000] [--clients 32] [--duplicates 0.1]
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SECRET = 'whsec_benchmark'
+
+
+def stripe_event(intent_id, kind, amount):
+    return {
+        'id': f'evt_{uuid.uuid4().hex}',
+        'type': kind,
+        'data': {'object': {
+            'id': intent_id,
+            'amount': amount,
+            'amount_received': amount if kind == 'payment_intent.succeeded' else 0,
+            'currency': 'usd',
+            'metadata': {}
+        }}
+    }
+
+
+def sign(body):
+    timestamp = str(int(time.time()))
+    signature = hmac.new(SECRET.encode(), timestamp.encode() + b'.' + body, hashlib.sha256).hexdigest()
+    return {'Content-Type': 'application/json', 'Stripe-Signature': f't={timestamp},v1={signature}'}
+
+
+def mean(histogram, *labels):
+    series = histogram._series.get(labels)
+    return series[-2] / series[-1] if series else 0.0
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--user-id', help='owner of the payment processor created for the run (default: any user)')
+    parser.add_argument('--intents', type=int, default=2000)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--duplicates', type=float, default=0.1, help='share of deliveries sent twice')
+    parser.add_argument('--inline', type=int, default=200, help='events applied one commit at a time')
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error('--database-url or DATABASE_URL is required')
+    os.environ['DATABASE_URL'] = args.database_url
+    os.environ.setdefault('STARTUP_CHECKS', 'off')
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    import psycopg2
+    import requests
+    from werkzeug.serving import make_server
+    from src.main import create_app
+    from src.services.payment_webhooks import payment_webhooks
+
+    connection = psycopg2.connect(args.database_url)
+    processor_id = str(uuid.uuid4())
+    with connection.cursor() as cursor:
+        owner = args.user_id
+        if owner is None:
+            cursor.execute("SELECT id FROM public.users LIMIT 1")
+            owner = cursor.fetchone()[0]
+        cursor.execute(
+            "INSERT INTO public.payment_processors (id, user_id, name, provider, api_credentials) "
+            "VALUES (%s, %s, 'Benchmark', 'stripe', %s)",
+            (processor_id, owner, json.dumps({'webhook_secret': SECRET}))
+        )
+    connection.commit()
+
+    app = create_app()
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}/api/v1/webhooks/payments/{processor_id}'
+
+    intents = {f'pi_{uuid.uuid4().hex[:24]}': random.randint(500, 50000) for _ in range(args.intents)}
+    deliveries = [json.dumps(stripe_event(intent_id, kind, amount)).encode()
+                  for intent_id, amount in intents.items()
+                  for kind in ('payment_intent.created', 'payment_intent.succeeded')]
+    deliveries += random.sample(deliveries, int(len(deliveries) * args.duplicates))
+    random.shuffle(deliveries)
+
+    sessions = threading.local()
+    latencies, statuses = [], {}
+    peak_depth = 0
+
+    def deliver(body):
+        nonlocal peak_depth
+        session = getattr(sessions, 'session', None) or requests.Session()
+        sessions.session = session
+        started = time.perf_counter()
+        response = session.post(url, data=body, headers=sign(body))
+        latencies.append(time.perf_counter() - started)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        peak_depth = max(peak_depth, payment_webhooks.depth.read())
+
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(args.clients) as pool:
+            list(pool.map(deliver, deliveries))
+        acknowledged = time.perf_counter() - started
+
+        expected = 2 * args.intents
+        with connection.cursor() as cursor:
+            while True:
+                cursor.execute("SELECT count(*) FROM public.payment_webhook_events WHERE payment_processor_id = %s",
+                               (processor_id,))
+                recorded = cursor.fetchone()[0]
+                connection.commit()
+                if recorded >= expected or time.perf_counter() - started > 120:
+                    break
+                time.sleep(0.02)
+        applied = time.perf_counter() - started
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT count(*), count(*) FILTER (WHERE status = 'completed'), count(DISTINCT platform_transaction_id) "
+                "FROM public.transactions WHERE payment_processor_id = %s", (processor_id,)
+            )
+            transactions, completed, distinct = cursor.fetchone()
+        connection.commit()
+
+        # The same work one event per commit, as an inline handler would do it
+        inline = [{
+            'processor_id': processor_id, 'provider': 'stripe', 'event_id': event['id'], 'event_type': event['type'],
+            'payload': event, 'received_at': None, 'received': time.monotonic()
+        } for event in (stripe_event(f'pi_inline_{i}', 'payment_intent.succeeded', 1000) for i in range(args.inline))]
+        with app.app_context():
+            from datetime import datetime
+            inline_started = time.perf_counter()
+            for event in inline:
+                event['received_at'] = datetime.utcnow()
+                payment_webhooks.process_batch([event])
+            inline_each = (time.perf_counter() - inline_started) / args.inline
+
+        print(f"{len(deliveries)} deliveries ({expected} events, {len(deliveries) - expected} redeliveries) "
+              f"from {args.clients} clients")
+        print(f"  acknowledged in {acknowledged:.2f}s: p50 {percentile(latencies, 0.5) * 1000:.1f}ms, "
+              f"p99 {percentile(latencies, 0.99) * 1000:.1f}ms, statuses {statuses}")
+        print(f"  applied in {applied:.2f}s ({recorded / applied:.0f} events/s), peak queue depth {peak_depth}")
+        print(f"  transactions: {transactions} for {args.intents} intents ({distinct} distinct, {completed} completed)")
+        print(f"  one commit per event: {inline_each * 1000:.2f}ms each "
+              f"({1 / inline_each:.0f} events/s, {expected * inline_each:.1f}s for the burst)")
+        handler = mean(app.extensions['request_metrics'].latency,
+                       'webhooks', '/api/v1/webhooks/payments/<processor_id>', 'POST')
+        print(f"  server-side handling {handler * 1000:.2f}ms mean; events per commit {mean(payment_webhooks.batch_sizes):.1f}, "
+              f"receive to commit {mean(payment_webhooks.latency, 'stripe') * 1000:.0f}ms mean")
+        if transactions != args.intents or completed != args.intents:
+            sys.exit('transactions do not match the intents sent')
+    finally:
+        server.shutdown()
+        payment_webhooks.stop()
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM public.transactions WHERE payment_processor_id = %s", (processor_id,))
+            cursor.execute("DELETE FROM public.payment_webhook_events WHERE payment_processor_id = %s", (processor_id,))
+            cursor.execute("DELETE FROM public.payment_processors WHERE id = %s", (processor_id,))
+        connection.commit()
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,296 @@
+"""
+Benchmark: full re-pull vs incremental platform sync.
+
+Serves a local mock Shopify and WooCommerce API for --stores stores, half
+of each, with --products products and --orders orders apiece. The mock
+enforces each platform's page size and rate limit, answering 429 with
+Retry-After when a client goes over. Then the benchmark:
+
+1. syncs every store from scratch (no cursors)
+2. changes --changed of the records and touches as many more (updated_at
+   bumped, content identical), as a day of store activity would
+3. syncs incrementally from the cursors
+4. resets the cursors and re-pulls everything, as a full sync would
+
+For each pass it reports wall time, API requests, 429s and rows written.
+Rows are written into real stores created for the run under an existing
+user (--user-id, default: any) and deleted afterwards. Migrations through
+index_products_store_platform_product must be applied.
+
+Usage:
+    python benchmarks/platform_sync.py --database-url postgresql://... \\
+        [--stores 8] [--products 2000] [--orders 1000] [--workers 8] [--changed 0.01]
+"""
+
+import argparse
+import base64
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.platform_sync import ShopifyClient, SyncEngine, WooCommerceClient
+
+
+def _iso(moment):
+    return moment.isoformat(timespec='seconds')
+
+
+class MockStore:
+    """One store's records plus the leaky bucket its platform enforces"""
+
+    def __init__(self, platform, products, orders, started):
+        self.platform = platform
+        self.lock = threading.Lock()
+        self.level = 0.0
+        self.leaked_at = time.monotonic()
+        client = ShopifyClient if platform == 'shopify' else WooCommerceClient
+        self.rate, self.capacity = client.rate, client.burst
+        self.records = {
+            'products': [self._product(i + 1, started - timedelta(minutes=products - i)) for i in range(products)],
+            'orders': [self._order(i + 1, started - timedelta(minutes=orders - i)) for i in range(orders)]
+        }
+
+    def admit(self):
+        """True when a request fits in the bucket"""
+        with self.lock:
+            now = time.monotonic()
+            self.level = max(0.0, self.level - (now - self.leaked_at) * self.rate)
+            self.leaked_at = now
+            if self.level + 1 > self.capacity + 0.5:
+                return False
+            self.level += 1
+            return True
+
+    def _product(self, i, updated):
+        price = f'{random.randint(5, 200)}.99'
+        if self.platform == 'shopify':
+            return {'id': i, 'title': f'Product {i}', 'body_html': '<p>A mock product</p>', 'vendor': 'Mock',
+                    'product_type': 'Widget', 'status': 'active', 'tags': 'mock, bench', 'updated_at': _iso(updated),
+                    'images': [{'src': f'https://cdn.example.com/{i}.jpg'}],
+                    'variants': [{'price': price, 'sku': f'SKU-{i}', 'inventory_quantity': 10,
+                                  'inventory_management': 'shopify', 'weight': 0.5}]}
+        return {'id': i, 'name': f'Product {i}', 'description': 'A mock product', 'type': 'simple',
+                'status': 'publish', 'sku': f'SKU-{i}', 'price': price, 'regular_price': price, 'sale_price': '',
+                'stock_quantity': 10, 'manage_stock': True, 'weight': '0.5',
+                'images': [{'src': f'https://cdn.example.com/{i}.jpg'}], 'tags': [{'name': 'mock'}],
+                'date_modified_gmt': _iso(updated.replace(tzinfo=None))}
+
+    def _order(self, i, updated):
+        if self.platform == 'shopify':
+            return {'id': i, 'order_number': 1000 + i, 'email': f'buyer{i}@example.com', 'currency': 'USD',
+                    'customer': {'first_name': 'Mock', 'last_name': f'Buyer {i}'}, 'financial_status': 'paid',
+                    'fulfillment_status': None, 'subtotal_price': '20.00', 'total_tax': '2.00',
+                    'total_price': '27.00', 'total_shipping_price_set': {'shop_money': {'amount': '5.00'}},
+                    'tags': '', 'created_at': _iso(updated), 'updated_at': _iso(updated),
+                    'line_items': [{'product_id': i, 'title': f'Product {i}', 'sku': f'SKU-{i}',
+                                    'quantity': 2, 'price': '10.00', 'properties': []}]}
+        return {'id': i, 'number': str(1000 + i), 'status': 'processing', 'currency': 'USD',
+                'billing': {'first_name': 'Mock', 'last_name': f'Buyer {i}', 'email': f'buyer{i}@example.com'},
+                'shipping': {}, 'total': '27.00', 'total_tax': '2.00', 'shipping_total': '5.00',
+                'date_paid_gmt': _iso(updated.replace(tzinfo=None)),
+                'date_created_gmt': _iso(updated.replace(tzinfo=None)),
+                'date_modified_gmt': _iso(updated.replace(tzinfo=None)),
+                'line_items': [{'product_id': i, 'name': f'Product {i}', 'sku': f'SKU-{i}', 'quantity': 2,
+                                'price': 10.0, 'subtotal': '20.00', 'total': '20.00', 'meta_data': []}]}
+
+    def updated_at(self, record):
+        value = record.get('updated_at') or record['date_modified_gmt']
+        moment = datetime.fromisoformat(value)
+        return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+    def mutate(self, share, now):
+        """Change `share` of each resource and touch as many again; returns (changed, touched)"""
+        changed = touched = 0
+        stamp = 'updated_at' if self.platform == 'shopify' else 'date_modified_gmt'
+        for resource, records in self.records.items():
+            count = max(1, int(len(records) * share))
+            for n, record in enumerate(random.sample(records, 2 * count)):
+                record[stamp] = _iso(now if self.platform == 'shopify' else now.replace(tzinfo=None))
+                if n >= count:
+                    touched += 1
+                    continue
+                changed += 1
+                if resource == 'products' and self.platform == 'shopify':
+                    record['variants'][0]['inventory_quantity'] -= 1
+                elif resource == 'products':
+                    record['stock_quantity'] -= 1
+                elif self.platform == 'shopify':
+                    record['fulfillment_status'] = 'fulfilled'
+                else:
+                    record['status'] = 'completed'
+        return changed, touched
+
+
+class MockPlatformAPI(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, stores):
+        super().__init__(('127.0.0.1', 0), MockHandler)
+        self.stores = stores
+        self.requests = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    def count(self, throttled=False):
+        with self.lock:
+            self.requests += 1
+            self.throttled += throttled
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        _, _, index, *rest = url.path.split('/')
+        store = self.server.stores[int(index)]
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if not store.admit():
+            self.server.count(throttled=True)
+            return self._send(429, {'errors': 'rate limited'}, {'Retry-After': '1'})
+        self.server.count()
+        resource = rest[-1].replace('.json', '')
+        if store.platform == 'shopify':
+            self._shopify(store, resource, params, url.path)
+        else:
+            self._woocommerce(store, resource, params)
+
+    def _matching(self, store, resource, since):
+        records = store.records[resource]
+        if since is None:
+            return records
+        return [record for record in records if store.updated_at(record) >= since]
+
+    def _shopify(self, store, resource, params, path):
+        if 'page_info' in params:
+            params = {**json.loads(base64.urlsafe_b64decode(params['page_info'])), 'limit': params['limit']}
+        since = datetime.fromisoformat(params['updated_at_min']) if params.get('updated_at_min') else None
+        limit, offset = int(params.get('limit', 50)), int(params.get('offset', 0))
+        matching = self._matching(store, resource, since)
+        page = matching[offset:offset + limit]
+        headers = {'X-Shopify-Shop-Api-Call-Limit': f'{int(store.level)}/{store.capacity}'}
+        if offset + limit < len(matching):
+            cursor = {'updated_at_min': params.get('updated_at_min'), 'offset': offset + limit}
+            page_info = base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+            headers['Link'] = f'<http://{self.headers["Host"]}{path}?limit={limit}&page_info={page_info}>; rel="next"'
+        self._send(200, {resource: page}, headers)
+
+    def _woocommerce(self, store, resource, params):
+        since = params.get('modified_after')
+        since = datetime.fromisoformat(since).replace(tzinfo=timezone.utc) if since else None
+        per_page, page = int(params.get('per_page', 10)), int(params.get('page', 1))
+        matching = self._matching(store, resource, since)
+        pages = max(1, -(-len(matching) // per_page))
+        self._send(200, matching[(page - 1) * per_page:page * per_page],
+                   {'X-WP-Total': str(len(matching)), 'X-WP-TotalPages': str(pages)})
+
+
+def timed_sync(engine, api, store_ids):
+    requests, throttled = api.requests, api.throttled
+    started = time.perf_counter()
+    results = engine.run_once(store_ids)
+    elapsed = time.perf_counter() - started
+    totals = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'fetched': 0}
+    for result in results:
+        assert not result['errors'], result['errors']
+        for resource in ('products', 'orders'):
+            for key in totals:
+                totals[key] += result[resource][key]
+    return elapsed, api.requests - requests, api.throttled - throttled, totals
+
+
+def report(label, elapsed, requests, throttled, totals):
+    print(f"{label:<14} {elapsed:>7.1f}s {requests:>6} requests ({throttled} throttled), "
+          f"fetched {totals['fetched']}, written {totals['inserted'] + totals['updated']} "
+          f"({totals['inserted']} new, {totals['updated']} changed), unchanged {totals['unchanged']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--user-id', help='owner of the stores created for the run (default: any user)')
+    parser.add_argument('--stores', type=int, default=8)
+    parser.add_argument('--products', type=int, default=2000, help='products per store')
+    parser.add_argument('--orders', type=int, default=1000, help='orders per store')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--changed', type=float, default=0.01, help='share of records changed between syncs')
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error('--database-url or DATABASE_URL is required')
+    logging.getLogger('src.services.order_ingest').setLevel(logging.WARNING)
+
+    import psycopg2
+
+    started = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(hours=1)
+    stores = [MockStore('shopify' if i % 2 == 0 else 'woocommerce', args.products, args.orders, started)
+              for i in range(args.stores)]
+    api = MockPlatformAPI(stores)
+    threading.Thread(target=api.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{api.server_address[1]}'
+
+    connection = psycopg2.connect(args.database_url)
+    store_ids = [str(uuid.uuid4()) for _ in stores]
+    with connection.cursor() as cursor:
+        owner = args.user_id
+        if owner is None:
+            cursor.execute("SELECT id FROM public.users LIMIT 1")
+            owner = cursor.fetchone()[0]
+        for i, (store_id, store) in enumerate(zip(store_ids, stores)):
+            cursor.execute(
+                "INSERT INTO public.stores (id, user_id, name, platform, domain, api_credentials) "
+                "VALUES (%s, %s, %s, %s, %s, %s)",
+                (store_id, owner, f'Mock store {i}', store.platform, f'{base}/s/{i}',
+                 json.dumps({'access_token': 'mock', 'consumer_key': 'ck', 'consumer_secret': 'cs'}))
+            )
+    connection.commit()
+
+    engine = SyncEngine(args.database_url, workers=args.workers)
+    try:
+        report('initial sync', *timed_sync(engine, api, store_ids))
+
+        changed = touched = 0
+        for store in stores:
+            store_changed, store_touched = store.mutate(args.changed, datetime.now(timezone.utc))
+            changed, touched = changed + store_changed, touched + store_touched
+        print(f"\n{changed} records changed, {touched} touched without changes\n")
+
+        report('incremental', *timed_sync(engine, api, store_ids))
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM public.store_sync_state WHERE store_id = ANY(%s::uuid[])", (store_ids,))
+        connection.commit()
+        report('full re-pull', *timed_sync(engine, api, store_ids))
+    finally:
+        engine.close()
+        api.shutdown()
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM public.stores WHERE id = ANY(%s::uuid[])", (store_ids,))
+        connection.commit()
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""
+Benchmark: ILIKE scans vs. indexed full-text and trigram product search.
+
+Builds a scratch schema on a local Postgres with one large store (1M
+products by default) plus smaller neighbours, then times the same
+searches two ways:
+
+- ilike:   title/sku/description/vendor/tags ILIKE '%term%', the only option
+           before migrations 19-20
+- indexed: the query src/services/product_search.py runs, matching through
+           GIN indexes on search_vector, title and sku (pg_trgm)
+
+Everything lives in the `search_bench` schema and is dropped at the end
+unless --keep is given. Requires the pg_trgm extension to be available.
+
+Usage:
+    python benchmarks/product_search.py --database-url postgresql://postgres@localhost/postgres \
+        [--products 1000000] [--repeat 3]
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+import psycopg2
+
+SCHEMA = 'search_bench'
+STORE_ID = '00000000-0000-0000-0000-0000000000aa'
+
+SETUP_SQL = """
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+DROP SCHEMA IF EXISTS {schema} CASCADE;
+CREATE SCHEMA {schema};
+
+CREATE TABLE {schema}.products (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    store_id UUID NOT NULL,
+    title VARCHAR(500) NOT NULL,
+    description TEXT,
+    sku VARCHAR(255),
+    vendor VARCHAR(255),
+    product_type VARCHAR(255),
+    tags JSONB DEFAULT '[]'::jsonb,
+    status VARCHAR(20) DEFAULT 'active',
+    search_vector tsvector
+);
+
+-- Same expression as public.product_search_vector() (migration 21)
+CREATE FUNCTION {schema}.product_search_vector(title TEXT, description TEXT, vendor TEXT,
+                                               product_type TEXT, tags JSONB)
+RETURNS tsvector LANGUAGE sql IMMUTABLE AS $$
+    SELECT setweight(to_tsvector('english'::regconfig, coalesce(title, '')), 'A')
+        || setweight(to_tsvector('english'::regconfig, coalesce(vendor, '') || ' ' || coalesce(product_type, '')), 'B')
+        || setweight(jsonb_to_tsvector('english'::regconfig, coalesce(tags, '[]'::jsonb), '["string"]'), 'B')
+        || setweight(to_tsvector('english'::regconfig, coalesce(description, '')), 'D');
+$$;
+"""
+
+# Titles are drawn from small vocabularies so terms have realistic selectivity
+SEED_SQL = """
+WITH words AS (
+    SELECT ARRAY['wireless', 'organic', 'leather', 'vintage', 'portable', 'ceramic', 'bamboo',
+                 'stainless', 'waterproof', 'handmade', 'linen', 'smart', 'compact', 'deluxe'] AS adjectives,
+           ARRAY['headphones', 'mug', 'backpack', 'lamp', 'wallet', 'kettle', 'blanket', 'charger',
+                 'sneakers', 'notebook', 'speaker', 'jacket', 'candle', 'bottle', 'watch'] AS nouns,
+           ARRAY['Acme', 'Globex', 'Initech', 'Umbrella', 'Stark', 'Wayne', 'Hooli'] AS vendors,
+           ARRAY['red', 'blue', 'black', 'green', 'sand', 'grey'] AS colours
+)
+INSERT INTO {schema}.products (store_id, title, description, sku, vendor, product_type, tags)
+SELECT
+    CASE WHEN i <= %(products)s THEN %(store_id)s::uuid
+         ELSE ('00000000-0000-0000-0000-' || lpad(to_hex(i %% 50), 12, '0'))::uuid END,
+    initcap(colours[1 + i %% 6] || ' ' || adjectives[1 + (i / 7) %% 14] || ' ' || nouns[1 + (i / 3) %% 15]),
+    'A ' || adjectives[1 + (i / 11) %% 14] || ' ' || nouns[1 + i %% 15] || ' made for everyday use. Item ' || i,
+    upper(left(nouns[1 + (i / 3) %% 15], 3)) || '-' || lpad(i::text, 7, '0'),
+    vendors[1 + i %% 7],
+    nouns[1 + (i / 3) %% 15],
+    jsonb_build_array(colours[1 + i %% 6], adjectives[1 + (i / 13) %% 14])
+FROM generate_series(1, %(products)s + %(other_products)s) AS i, words;
+
+UPDATE {schema}.products
+SET search_vector = {schema}.product_search_vector(title, description, vendor, product_type, tags);
+
+CREATE INDEX ON {schema}.products(store_id);
+ANALYZE {schema}.products;
+"""
+
+INDEX_SQL = """
+CREATE INDEX idx_bench_search_vector ON {schema}.products USING gin (search_vector);
+CREATE INDEX idx_bench_title_trgm ON {schema}.products USING gin (title gin_trgm_ops);
+CREATE INDEX idx_bench_sku_trgm ON {schema}.products USING gin (sku gin_trgm_ops);
+ANALYZE {schema}.products;
+"""
+
+ILIKE_QUERY = """
+SELECT id, title FROM {schema}.products
+WHERE store_id = %(store_id)s AND (
+    title ILIKE %(pattern)s OR sku ILIKE %(pattern)s OR description ILIKE %(pattern)s
+    OR vendor ILIKE %(pattern)s OR tags::text ILIKE %(pattern)s
+)
+ORDER BY title, id
+LIMIT 50
+"""
+
+INDEXED_QUERY = """
+SELECT id, title, score FROM (
+    SELECT id, title,
+           ts_rank_cd(search_vector, websearch_to_tsquery('english'::regconfig, %(q)s), 32)
+           + 0.5 * greatest(word_similarity(%(q)s, title), word_similarity(%(q)s, coalesce(sku, ''))) AS score
+    FROM {schema}.products
+    WHERE store_id = %(store_id)s AND (
+        search_vector @@ websearch_to_tsquery('english'::regconfig, %(q)s)
+        OR %(q)s <%% title
+        OR %(q)s <%% sku
+    )
+) ranked
+ORDER BY score DESC, id
+LIMIT 51
+"""
+
+SEARCHES = {
+    'word': 'kettle',
+    'two words': 'waterproof jacket',
+    'typo': 'hedphones',
+    'sku prefix': 'KET-00012',
+    'vendor': 'globex',
+}
+
+
+def execute(connection, sql, params=None):
+    with connection.cursor() as cursor:
+        cursor.execute(sql.format(schema=SCHEMA), params)
+
+
+def time_query(connection, sql, params, repeat):
+    timings = []
+    with connection.cursor() as cursor:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            cursor.execute(sql.format(schema=SCHEMA), params)
+            rows = cursor.fetchall()
+            timings.append(time.perf_counter() - started)
+    return statistics.median(timings), len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', default=os.environ.get('BENCH_DATABASE_URL'),
+                        help='connection to a local Postgres (default: $BENCH_DATABASE_URL)')
+    parser.add_argument('--products', type=int, default=1000000, help='products in the searched store')
+    parser.add_argument('--other-products', type=int, default=200000,
+                        help='products spread over 50 other stores')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per query (median is reported)')
+    parser.add_argument('--keep', action='store_true', help=f'keep the {SCHEMA} schema afterwards')
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error('--database-url or BENCH_DATABASE_URL is required')
+
+    connection = psycopg2.connect(args.database_url)
+    connection.autocommit = True
+    try:
+        print(f"Seeding {args.products} products (+{args.other_products} in other stores)...")
+        started = time.perf_counter()
+        execute(connection, SETUP_SQL)
+        execute(connection, SEED_SQL, {
+            'store_id': STORE_ID,
+            'products': args.products,
+            'other_products': args.other_products
+        })
+        print(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+        ilike = {
+            label: time_query(connection, ILIKE_QUERY, {'store_id': STORE_ID, 'pattern': f'%{term}%'}, args.repeat)
+            for label, term in SEARCHES.items()
+        }
+
+        started = time.perf_counter()
+        execute(connection, INDEX_SQL)
+        print(f"Built GIN indexes in {time.perf_counter() - started:.1f}s")
+
+        indexed = {
+            label: time_query(connection, INDEXED_QUERY, {'store_id': STORE_ID, 'q': term}, args.repeat)
+            for label, term in SEARCHES.items()
+        }
+
+        print(f"\n{'search':<32} {'ilike ms':>10} {'rows':>5} {'indexed ms':>11} {'rows':>5} {'speedup':>8}")
+        for label, term in SEARCHES.items():
+            ilike_time, ilike_rows = ilike[label]
+            indexed_time, indexed_rows = indexed[label]
+            print(f"{label + ' (' + term + ')':<32} {ilike_time * 1000:>10.1f} {ilike_rows:>5} "
+                  f"{indexed_time * 1000:>11.1f} {indexed_rows:>5} {ilike_time / indexed_time:>7.1f}x")
+    finally:
+        if not args.keep:
+            execute(connection, "DROP SCHEMA IF EXISTS {schema} CASCADE")
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""
+Benchmark: proxy health checks, sequential vs concurrent.
+
+Starts local stand-in servers on 127.0.0.1 and checks a mix of proxies
+against them with ProxyHealthChecker:
+
+- an HTTP target answering 204
+- an HTTP proxy (absolute-form GET and CONNECT), optionally with Basic auth
+- a SOCKS5 proxy, optionally with username/password auth
+- a "blackhole" that accepts connections and never answers (-> timeout)
+- a closed port (-> failed)
+
+Every proxy adds --delay-ms before answering, like a remote proxy would.
+Each result is checked against the outcome its server should produce
+(wrong credentials fail, blackholes time out), then the concurrent run is
+compared with --concurrency 1 over a sample. No database is involved.
+
+Usage:
+    python benchmarks/proxy_checker.py [--proxies 2000] [--concurrency 200] [--timeout 1] [--delay-ms 50]
+"""
+
+import argparse
+import asyncio
+import base64
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.proxy_checker import ProxyHealthChecker
+
+USERNAME, PASSWORD = 'bench', 'secret'
+
+
+class StandIns:
+    """Local target, proxies, blackhole and closed port"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.servers = []
+
+    async def start(self):
+        self.target = await self._serve(self._target)
+        self.http_proxy = await self._serve(lambda r, w: self._http_proxy(r, w, auth=False))
+        self.http_proxy_auth = await self._serve(lambda r, w: self._http_proxy(r, w, auth=True))
+        self.socks5 = await self._serve(lambda r, w: self._socks5(r, w, auth=False))
+        self.socks5_auth = await self._serve(lambda r, w: self._socks5(r, w, auth=True))
+        self.blackhole = await self._serve(self._blackhole)
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            self.closed = sock.getsockname()[1]
+
+    async def close(self):
+        for server in self.servers:
+            server.close()
+
+    async def _serve(self, handler):
+        server = await asyncio.start_server(handler, '127.0.0.1', 0, backlog=4096)
+        self.servers.append(server)
+        return server.sockets[0].getsockname()[1]
+
+    async def _target(self, reader, writer):
+        while (await reader.readline()).strip():
+            pass
+        writer.write(b'HTTP/1.1 204 No Content\r\nConnection: close\r\n\r\n')
+        await writer.drain()
+        writer.close()
+
+    async def _pipe(self, reader, writer):
+        try:
+            while data := await reader.read(65536):
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _tunnel(self, reader, writer, host, port):
+        upstream_reader, upstream_writer = await asyncio.open_connection(host, port)
+        await asyncio.gather(self._pipe(reader, upstream_writer), self._pipe(upstream_reader, writer))
+
+    async def _http_proxy(self, reader, writer, auth):
+        request_line = (await reader.readline()).decode('latin-1')
+        headers = []
+        while (line := await reader.readline()).strip():
+            headers.append(line.decode('latin-1').strip())
+        await asyncio.sleep(self.delay)
+        expected = 'Proxy-Authorization: Basic ' + base64.b64encode(f'{USERNAME}:{PASSWORD}'.encode()).decode()
+        if auth and expected not in headers:
+            writer.write(b'HTTP/1.1 407 Proxy Authentication Required\r\n\r\n')
+            await writer.drain()
+            writer.close()
+            return
+
+        method, resource, _ = request_line.split(' ', 2)
+        if method == 'CONNECT':
+            host, port = resource.rsplit(':', 1)
+            writer.write(b'HTTP/1.1 200 Connection established\r\n\r\n')
+            await writer.drain()
+            await self._tunnel(reader, writer, host, int(port))
+            return
+        authority = resource.split('://', 1)[1].split('/', 1)[0]
+        host, port = authority.rsplit(':', 1)
+        upstream_reader, upstream_writer = await asyncio.open_connection(host, int(port))
+        upstream_writer.write(f'GET / HTTP/1.1\r\nHost: {authority}\r\n\r\n'.encode())
+        await upstream_writer.drain()
+        writer.write(await upstream_reader.read())
+        upstream_writer.close()
+        await writer.drain()
+        writer.close()
+
+    async def _socks5(self, reader, writer, auth):
+        _, count = await reader.readexactly(2)
+        methods = await reader.readexactly(count)
+        await asyncio.sleep(self.delay)
+        if auth:
+            if 2 not in methods:
+                writer.write(b'\x05\xff')
+                writer.close()
+                return
+            writer.write(b'\x05\x02')
+            await reader.readexactly(1)
+            username = await reader.readexactly((await reader.readexactly(1))[0])
+            password = await reader.readexactly((await reader.readexactly(1))[0])
+            if (username, password) != (USERNAME.encode(), PASSWORD.encode()):
+                writer.write(b'\x01\x01')
+                writer.close()
+                return
+            writer.write(b'\x01\x00')
+        else:
+            writer.write(b'\x05\x00')
+
+        _, _, _, address_type = await reader.readexactly(4)
+        host = (await reader.readexactly((await reader.readexactly(1))[0])).decode() if address_type == 3 \
+            else socket.inet_ntoa(await reader.readexactly(4))
+        port = int.from_bytes(await reader.readexactly(2), 'big')
+        writer.write(b'\x05\x00\x00\x01' + socket.inet_aton('127.0.0.1') + (0).to_bytes(2, 'big'))
+        await writer.drain()
+        await self._tunnel(reader, writer, host, port)
+
+    async def _blackhole(self, reader, writer):
+        await reader.read()
+        writer.close()
+
+
+def make_proxies(stand_ins, count):
+    """[(proxy, expected_result)] cycling through every kind of stand-in"""
+    kinds = [
+        ('http', stand_ins.http_proxy, None, 'success'),
+        ('https', stand_ins.http_proxy, None, 'success'),
+        ('socks5', stand_ins.socks5, None, 'success'),
+        ('http', stand_ins.http_proxy_auth, PASSWORD, 'success'),
+        ('https', stand_ins.http_proxy_auth, 'wrong', 'failed'),
+        ('socks5', stand_ins.socks5_auth, PASSWORD, 'success'),
+        ('socks5', stand_ins.socks5_auth, 'wrong', 'failed'),
+        ('http', stand_ins.blackhole, None, 'timeout'),
+        ('socks5', stand_ins.closed, None, 'failed'),
+    ]
+    proxies = []
+    for i in range(count):
+        protocol, port, password, expected = kinds[i % len(kinds)]
+        proxies.append(({
+            'id': str(i), 'host': '127.0.0.1', 'port': port, 'protocol': protocol,
+            'username': USERNAME if password else None, 'password': password
+        }, expected))
+    return proxies
+
+
+async def run(args):
+    stand_ins = StandIns(args.delay_ms / 1000)
+    await stand_ins.start()
+    target = f'http://127.0.0.1:{stand_ins.target}/generate_204'
+    proxies = make_proxies(stand_ins, args.proxies)
+    try:
+        results = {}
+
+        async def collect(batch):
+            results.update((result.proxy_id, result) for result in batch)
+
+        checker = ProxyHealthChecker(concurrency=args.concurrency, timeout=args.timeout,
+                                     http_url=target, https_url=target, write_batch=500)
+        stats = (await checker.check([proxy for proxy, _ in proxies], on_results=collect)).to_dict()
+        wrong = [
+            (proxy, expected, results[proxy['id']].result, results[proxy['id']].error)
+            for proxy, expected in proxies if results[proxy['id']].result != expected
+        ]
+        for proxy, expected, actual, error in wrong[:10]:
+            print(f"  ❌ {proxy['protocol']}://127.0.0.1:{proxy['port']} expected {expected}, got {actual}: {error}")
+        assert not wrong, f'{len(wrong)} proxies got an unexpected result'
+
+        sample = [proxy for proxy, _ in proxies[:args.sample]]
+        sequential = ProxyHealthChecker(concurrency=1, timeout=args.timeout, http_url=target, https_url=target)
+        started = time.perf_counter()
+        await sequential.check(sample)
+        per_proxy = (time.perf_counter() - started) / len(sample)
+        return stats, per_proxy
+    finally:
+        await stand_ins.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--proxies', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--timeout', type=float, default=1.0, help='seconds per probe')
+    parser.add_argument('--delay-ms', type=float, default=50, help='latency added by every stand-in proxy')
+    parser.add_argument('--sample', type=int, default=45, help='proxies checked sequentially for comparison')
+    args = parser.parse_args()
+
+    stats, per_proxy = asyncio.run(run(args))
+    sequential_seconds = per_proxy * args.proxies
+    print(f"{stats['checked']} proxies: {stats['success']} ok, {stats['failed']} failed, "
+          f"{stats['timeout']} timed out (all as expected)")
+    print(f"  concurrent ({args.concurrency}): {stats['elapsed_seconds']:.2f}s, "
+          f"{stats['proxies_per_second']:.0f} proxies/s, "
+          f"latency p50 {stats['latency_ms_p50']}ms p95 {stats['latency_ms_p95']}ms")
+    print(f"  sequential: {per_proxy * 1000:.0f}ms per proxy -> ~{sequential_seconds:.0f}s "
+          f"({sequential_seconds / stats['elapsed_seconds']:.0f}x slower)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+Benchmark: bursts of identical market research queries.
+
+Registers two stub sources that take --latency-ms per fetch and answers
+--queries distinct queries, each asked by --callers concurrent callers
+spread over --processes worker processes (threads within each), in
+two rounds:
+
+- cold: every query misses; callers asking the same query at the same
+  time should share one fetch, across processes too
+- warm: every query is a hit
+
+A --empty share of the queries get an empty result, as narrow filters do
+on real sources; identical payloads are stored once. Parameters are
+sent with their keys in random order, so the canonical key is what
+makes the callers' queries match.
+
+Reported: fetches made against the --queries a perfect cache needs,
+how callers were served, latency p50/p99 per round, and the storage
+used: entries, distinct payloads, and raw against compressed bytes.
+Entries and payloads written by the run are deleted afterwards.
+Migrations through create_research_cache must be applied.
+
+Usage:
+    python benchmarks/research_cache.py --database-url postgresql://... \\
+        [--queries 200] [--callers 16] [--processes 4] [--latency-ms 200]
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SOURCES = ('bench_ad_library', 'bench_trends')
+
+
+def queries(count, empty):
+    """(source, research_type, parameters) for each query; the first `empty` share match nothing"""
+    result = []
+    for i in range(count):
+        parameters = {'keywords': [f'keyword {i}'], 'country': 'US', 'page_size': 50, 'cursor': None}
+        if i < count * empty:
+            parameters['min_spend'] = 10 ** 9
+        result.append((SOURCES[i % len(SOURCES)], 'competitor_ad', parameters))
+    return result
+
+
+def shuffled(parameters):
+    items = list(parameters.items())
+    random.shuffle(items)
+    return dict(items)
+
+
+def worker(args, rounds, fetches, results):
+    from flask import Flask
+    from src.models import db
+    from src.services.research_cache import ResearchCache, StubSource
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = re.sub(r'^postgres(ql)?://', 'postgresql+psycopg2://', args.database_url)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_size': args.threads * 2, 'max_overflow': 0}
+    app.config['RESEARCH_STUB_SOURCES'] = False
+    db.init_app(app)
+    cache = ResearchCache()
+    cache.init_app(app)
+
+    def source(name):
+        stub = StubSource(name, latency=args.latency_ms / 1000, results=50)
+
+        def fetch(research_type, parameters, timeout):
+            with fetches.get_lock():
+                fetches.value += 1
+            if parameters.get('min_spend'):
+                time.sleep(stub.latency)
+                return {'source': name, 'results': []}
+            return stub(research_type, parameters, timeout)
+        return fetch
+
+    for name in SOURCES:
+        cache.register_source(name, source(name), ttl=3600)
+
+    def ask(query):
+        source_name, research_type, parameters = query
+        started = time.perf_counter()
+        with app.app_context():
+            outcome = cache.get(source_name, research_type, shuffled(parameters))['cache']
+        return outcome, time.perf_counter() - started
+
+    for calls in rounds:
+        with ThreadPoolExecutor(args.threads) as pool:
+            results.put(list(pool.map(ask, calls)))
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))] if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--callers', type=int, default=16, help='concurrent callers asking each query')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=16, help='callers running at once in each process')
+    parser.add_argument('--latency-ms', type=float, default=200, help='time a stub source takes per fetch')
+    parser.add_argument('--empty', type=float, default=0.25, help='share of queries with an empty result')
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error('--database-url or DATABASE_URL is required')
+
+    import psycopg2
+
+    wanted = queries(args.queries, args.empty)
+    # Each process gets callers / processes callers of every query, interleaved
+    # so the callers of one query run at about the same time everywhere
+    share = max(1, args.callers // args.processes)
+    calls = [query for query in wanted for _ in range(share)]
+    context = multiprocessing.get_context('fork')
+    fetches, results = context.Value('i', 0), context.Queue()
+
+    connection = psycopg2.connect(args.database_url)
+    try:
+        print(f"{args.queries} queries x {share * args.processes} callers over {args.processes} processes, "
+              f"{args.latency_ms:.0f}ms per fetch, {args.empty:.0%} with empty results\n")
+        print(f"{'round':<7}{'calls':>7}{'fetches':>9}{'miss':>7}{'coalesced':>11}{'hit':>7}{'stale':>7}"
+              f"{'p50 ms':>9}{'p99 ms':>9}{'wall s':>8}")
+        for name in ('cold', 'warm'):
+            fetches.value = 0
+            started = time.perf_counter()
+            processes = [context.Process(target=worker, args=(args, [calls], fetches, results))
+                         for _ in range(args.processes)]
+            for process in processes:
+                process.start()
+            outcomes = [outcome for _ in processes for outcome in results.get()]
+            for process in processes:
+                process.join()
+            elapsed = time.perf_counter() - started
+            counts = {kind: sum(1 for outcome, _ in outcomes if outcome == kind)
+                      for kind in ('miss', 'coalesced', 'hit', 'stale')}
+            latencies = [latency for _, latency in outcomes]
+            print(f"{name:<7}{len(outcomes):>7}{fetches.value:>9}{counts['miss']:>7}{counts['coalesced']:>11}"
+                  f"{counts['hit']:>7}{counts['stale']:>7}{percentile(latencies, 0.5) * 1000:>9.1f}"
+                  f"{percentile(latencies, 0.99) * 1000:>9.1f}{elapsed:>8.2f}")
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT count(*), count(DISTINCT c.payload_hash), "
+                "(SELECT sum(raw_bytes) FROM public.research_payloads WHERE payload_hash IN "
+                "    (SELECT payload_hash FROM public.research_cache WHERE source = ANY(%s))), "
+                "(SELECT sum(octet_length(data)) FROM public.research_payloads WHERE payload_hash IN "
+                "    (SELECT payload_hash FROM public.research_cache WHERE source = ANY(%s))), "
+                "sum(p.raw_bytes) "
+                "FROM public.research_cache c JOIN public.research_payloads p USING (payload_hash) "
+                "WHERE c.source = ANY(%s)",
+                (list(SOURCES), list(SOURCES), list(SOURCES))
+            )
+            entries, payloads, raw, stored, undeduplicated = cursor.fetchone()
+        connection.commit()
+        print(f"\nstorage: {entries} entries, {payloads} distinct payloads; "
+              f"{undeduplicated / 1024:.0f} KiB of results as entries, {raw / 1024:.0f} KiB deduplicated, "
+              f"{stored / 1024:.0f} KiB compressed ({undeduplicated / stored:.1f}x smaller)")
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "WITH gone AS (DELETE FROM public.research_cache WHERE source = ANY(%s) RETURNING payload_hash) "
+                "DELETE FROM public.research_payloads p WHERE payload_hash IN (SELECT payload_hash FROM gone) "
+                "AND NOT EXISTS (SELECT 1 FROM public.research_cache c "
+                "                WHERE c.payload_hash = p.payload_hash AND c.source <> ALL(%s))",
+                (list(SOURCES), list(SOURCES))
+            )
+        connection.commit()
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+"""
+Benchmark: original vs. optimized store-ownership RLS policies.
+
+Builds a scratch schema on a local Postgres, fills it with synthetic
+stores, orders and order items (millions of rows by default), and times
+the same scans as an RLS-restricted role under both policy sets:
+
+- legacy:    per-row EXISTS against stores (orders -> stores join for items)
+- optimized: store_id IN (SELECT owned_store_ids()) with the denormalized
+             order_items.store_id column from migration 14
+
+Everything lives in the `rls_bench` schema and is dropped at the end
+unless --keep is given. Requires a superuser connection (creates a role).
+
+Usage:
+    python benchmarks/rls_ownership.py --database-url postgresql://postgres@localhost/postgres \
+        [--stores 500] [--orders 2000000] [--items-per-order 2] [--repeat 3]
+"""
+
+import argparse
+import os
+import statistics
+import time
+import uuid
+
+import psycopg2
+
+SCHEMA = 'rls_bench'
+ROLE = 'rls_bench_user'
+
+SETUP_SQL = """
+DROP SCHEMA IF EXISTS {schema} CASCADE;
+CREATE SCHEMA {schema};
+
+-- Stand-in for Supabase's auth.uid(): reads the JWT subject claim
+CREATE FUNCTION {schema}.uid() RETURNS uuid LANGUAGE sql STABLE AS $$
+    SELECT nullif(current_setting('request.jwt.claim.sub', true), '')::uuid
+$$;
+
+CREATE TABLE {schema}.stores (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    user_id UUID NOT NULL,
+    name VARCHAR(255) NOT NULL
+);
+
+CREATE TABLE {schema}.orders (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    store_id UUID REFERENCES {schema}.stores(id) NOT NULL,
+    total_amount DECIMAL(10,2),
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE {schema}.order_items (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    order_id UUID REFERENCES {schema}.orders(id) NOT NULL,
+    store_id UUID,
+    quantity INTEGER NOT NULL,
+    total DECIMAL(10,2) NOT NULL
+);
+"""
+
+SEED_SQL = """
+INSERT INTO {schema}.stores (user_id, name)
+SELECT (ARRAY[%(owner)s::uuid, gen_random_uuid()])[1 + (i %% %(owner_every)s <> 0)::int], 'store ' || i
+FROM generate_series(1, %(stores)s) AS i;
+
+INSERT INTO {schema}.orders (store_id, total_amount, created_at)
+SELECT s.ids[1 + (i %% array_length(s.ids, 1))], (random() * 500)::numeric(10,2),
+       now() - (i %% 365) * interval '1 day'
+FROM generate_series(1, %(orders)s) AS i,
+     (SELECT array_agg(id) AS ids FROM {schema}.stores) AS s;
+
+INSERT INTO {schema}.order_items (order_id, store_id, quantity, total)
+SELECT o.id, o.store_id, 1 + (n %% 3), (random() * 100)::numeric(10,2)
+FROM {schema}.orders o, generate_series(1, %(items_per_order)s) AS n;
+
+CREATE INDEX ON {schema}.stores(user_id);
+CREATE INDEX ON {schema}.orders(store_id);
+CREATE INDEX ON {schema}.order_items(order_id);
+CREATE INDEX ON {schema}.order_items(store_id);
+ANALYZE {schema}.stores;
+ANALYZE {schema}.orders;
+ANALYZE {schema}.order_items;
+"""
+
+LEGACY_POLICIES = """
+CREATE POLICY bench_orders ON {schema}.orders FOR SELECT USING (
+    EXISTS (
+        SELECT 1 FROM {schema}.stores
+        WHERE stores.id = orders.store_id
+        AND stores.user_id = {schema}.uid()
+    )
+);
+
+CREATE POLICY bench_order_items ON {schema}.order_items FOR SELECT USING (
+    EXISTS (
+        SELECT 1 FROM {schema}.orders
+        JOIN {schema}.stores ON stores.id = orders.store_id
+        WHERE orders.id = order_items.order_id
+        AND stores.user_id = {schema}.uid()
+    )
+);
+"""
+
+OPTIMIZED_POLICIES = """
+CREATE FUNCTION {schema}.owned_store_ids()
+RETURNS SETOF uuid LANGUAGE sql STABLE SECURITY DEFINER ROWS 10 AS $$
+    SELECT id FROM {schema}.stores WHERE user_id = {schema}.uid();
+$$;
+
+CREATE POLICY bench_orders ON {schema}.orders FOR SELECT USING (
+    store_id IN (SELECT {schema}.owned_store_ids())
+);
+
+CREATE POLICY bench_order_items ON {schema}.order_items FOR SELECT USING (
+    store_id IN (SELECT {schema}.owned_store_ids())
+);
+"""
+
+DROP_POLICIES = """
+DROP POLICY IF EXISTS bench_orders ON {schema}.orders;
+DROP POLICY IF EXISTS bench_order_items ON {schema}.order_items;
+DROP FUNCTION IF EXISTS {schema}.owned_store_ids();
+"""
+
+QUERIES = {
+    'orders: count(*)': "SELECT count(*) FROM {schema}.orders",
+    'orders: revenue last 30 days': (
+        "SELECT sum(total_amount) FROM {schema}.orders WHERE created_at >= now() - interval '30 days'"
+    ),
+    'order_items: count(*)': "SELECT count(*) FROM {schema}.order_items",
+    'order_items: units per store': (
+        "SELECT store_id, sum(quantity) FROM {schema}.order_items GROUP BY store_id"
+    ),
+}
+
+
+def execute(connection, sql, params=None):
+    with connection.cursor() as cursor:
+        cursor.execute(sql.format(schema=SCHEMA), params)
+
+
+def setup(connection, args, owner):
+    print(f"Seeding {args.stores} stores, {args.orders} orders, "
+          f"{args.orders * args.items_per_order} order items...")
+    started = time.perf_counter()
+    execute(connection, SETUP_SQL)
+    execute(connection, SEED_SQL, {
+        'owner': owner,
+        'owner_every': args.owner_every,
+        'stores': args.stores,
+        'orders': args.orders,
+        'items_per_order': args.items_per_order
+    })
+    execute(connection, f"""
+        DO $$ BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = '{ROLE}') THEN
+                CREATE ROLE {ROLE} NOLOGIN;
+            END IF;
+        END $$;
+        GRANT USAGE ON SCHEMA {{schema}} TO {ROLE};
+        GRANT SELECT ON ALL TABLES IN SCHEMA {{schema}} TO {ROLE};
+        GRANT EXECUTE ON ALL FUNCTIONS IN SCHEMA {{schema}} TO {ROLE};
+        ALTER TABLE {{schema}}.orders ENABLE ROW LEVEL SECURITY;
+        ALTER TABLE {{schema}}.order_items ENABLE ROW LEVEL SECURITY;
+    """)
+    print(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+
+def time_queries(connection, owner, repeat):
+    results = {}
+    with connection.cursor() as cursor:
+        cursor.execute(f"SET ROLE {ROLE}")
+        cursor.execute("SELECT set_config('request.jwt.claim.sub', %s, false)", (owner,))
+        for label, sql in QUERIES.items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                cursor.execute(sql.format(schema=SCHEMA))
+                rows = cursor.fetchall()
+                timings.append(time.perf_counter() - started)
+            results[label] = (statistics.median(timings), rows)
+        cursor.execute("RESET ROLE")
+    return results
+
+
+def run_policy_set(connection, policies, owner, repeat):
+    execute(connection, DROP_POLICIES)
+    execute(connection, policies)
+    execute(connection, f"GRANT EXECUTE ON ALL FUNCTIONS IN SCHEMA {{schema}} TO {ROLE}")
+    return time_queries(connection, owner, repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', default=os.environ.get('BENCH_DATABASE_URL'),
+                        help='superuser connection to a local Postgres (default: $BENCH_DATABASE_URL)')
+    parser.add_argument('--stores', type=int, default=500)
+    parser.add_argument('--orders', type=int, default=2000000)
+    parser.add_argument('--items-per-order', type=int, default=2)
+    parser.add_argument('--owner-every', type=int, default=10,
+                        help='the benchmark user owns one store in every N')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per query (median is reported)')
+    parser.add_argument('--keep', action='store_true', help=f'keep the {SCHEMA} schema afterwards')
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error('--database-url or BENCH_DATABASE_URL is required')
+
+    owner = str(uuid.uuid4())
+    connection = psycopg2.connect(args.database_url)
+    connection.autocommit = True
+    try:
+        setup(connection, args, owner)
+        legacy = run_policy_set(connection, LEGACY_POLICIES, owner, args.repeat)
+        optimized = run_policy_set(connection, OPTIMIZED_POLICIES, owner, args.repeat)
+
+        print(f"\n{'query':<32} {'legacy ms':>11} {'optimized ms':>13} {'speedup':>8}")
+        for label in QUERIES:
+            legacy_time, legacy_rows = legacy[label]
+            optimized_time, optimized_rows = optimized[label]
+            assert sorted(legacy_rows) == sorted(optimized_rows), f"policies disagree on '{label}'"
+            print(f"{label:<32} {legacy_time * 1000:>11.1f} {optimized_time * 1000:>13.1f} "
+                  f"{legacy_time / optimized_time:>7.1f}x")
+    finally:
+        if not args.keep:
+            execute(connection, f"DROP SCHEMA IF EXISTS {{schema}} CASCADE; DROP ROLE IF EXISTS {ROLE};")
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
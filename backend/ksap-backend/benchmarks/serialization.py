@@ -0,0 +1,99 @@
+"""
+Benchmark: serializing a product listing into a JSON response.
+
+Compares the current path (`[p.to_dict() for p in products]` + `jsonify`
+on Flask's default provider) with the fast path (`serialize_many` +
+`jsonify` on FastJSONProvider), checking both produce the same JSON.
+Products are built in memory, so only serialization is timed. Without
+orjson installed the fast provider falls back to the stdlib encoder and
+only the compiled serializer contributes.
+
+Usage:
+    python benchmarks/serialization.py [--rows 1000 10000 50000] [--repeat 5]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify
+
+from src.models import db, Product
+from src.utils.serialization import FastJSONProvider, orjson, serialize_many
+
+
+def make_products(count):
+    started = datetime(2024, 1, 1, 12, 0, 0, 123456)
+    return [
+        Product(
+            id=f'00000000-0000-4000-8000-{i:012d}',
+            store_id='11111111-1111-4111-8111-111111111111',
+            platform_product_id=str(1000000 + i),
+            title=f'Product {i}',
+            description='A product used to benchmark JSON serialization',
+            price=Decimal('19.99'),
+            compare_at_price=Decimal('24.99') if i % 2 else None,
+            cost_per_item=Decimal('7.50'),
+            sku=f'SKU-{i:06d}',
+            barcode=None,
+            inventory_quantity=i % 17,
+            track_inventory=True,
+            weight=Decimal('0.35'),
+            images=[f'https://cdn.example.com/{i}.jpg'],
+            tags=['bench', 'sample'] if i % 3 else None,
+            vendor='Acme',
+            product_type='Widget',
+            status='active',
+            created_at=started + timedelta(minutes=i),
+            updated_at=started + timedelta(minutes=i, seconds=30)
+        )
+        for i in range(count)
+    ]
+
+
+def timed(app, render, repeat):
+    """Best of `repeat` runs, in seconds, plus the last response body"""
+    best = None
+    with app.test_request_context():
+        for _ in range(repeat):
+            started = time.perf_counter()
+            body = render().get_data()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+    return best, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 50000], help='listing sizes')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per measurement (best is reported)')
+    args = parser.parse_args()
+
+    default_app = Flask(__name__)
+    fast_app = Flask(__name__)
+    fast_app.json = FastJSONProvider(fast_app)
+    for app in (default_app, fast_app):
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(app)
+
+    print(f"encoder: {'orjson ' + orjson.__version__ if orjson else 'stdlib json (orjson not installed)'}")
+    print(f"{'rows':>8} {'to_dict+jsonify ms':>19} {'compiled+fast ms':>17} {'speedup':>8} {'bytes':>10}")
+    for rows in args.rows:
+        products = make_products(rows)
+        baseline_time, baseline_body = timed(
+            default_app, lambda: jsonify([product.to_dict() for product in products]), args.repeat
+        )
+        fast_time, fast_body = timed(fast_app, lambda: jsonify(serialize_many(products, Product)), args.repeat)
+        assert json.loads(baseline_body) == json.loads(fast_body), "fast path output differs from to_dict()"
+        print(f"{rows:>8} {baseline_time * 1000:>19.1f} {fast_time * 1000:>17.1f} "
+              f"{baseline_time / fast_time:>7.2f}x {len(fast_body):>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark: cold-start time of the Flask app.
+
+Starts a fresh interpreter with `python -X importtime`, imports src.main
+(which runs create_app()), and reports:
+
+- total time to a ready `app` object
+- create_app() phases, from app.extensions['startup']
+- the slowest imports, by cumulative time, and import time (self time)
+  per top-level package
+
+Each run is a new process, so nothing is warm except the OS page cache;
+the best of --runs is reported. STARTUP_CHECKS defaults to off here so
+the background prober's own imports do not land in the breakdown. With --budget-ms the script exits 1 when
+the cold start is slower, so CI can track regressions; --json writes the
+report for CI to archive.
+
+Usage:
+    python benchmarks/startup.py [--runs 3] [--top 15] [--budget-ms 1500] [--json report.json]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+from src.main import app
+total_ms = round((time.perf_counter() - started) * 1000, 2)
+print(json.dumps({'total_ms': total_ms, 'create_app': app.extensions['startup'].to_dict()}))
+'''
+
+
+def parse_importtime(stderr):
+    """[(module, self_us, cumulative_us, depth)] from -X importtime output"""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return imports
+
+
+def cold_start(env):
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report['imports'] = parse_importtime(result.stderr)
+    return report
+
+
+def summarize(report, top):
+    imports = report['imports']
+    packages = {}
+    for name, self_us, _, _ in imports:
+        root = name.split('.')[0]
+        packages[root] = packages.get(root, 0) + self_us
+    slowest = sorted(imports, key=lambda item: item[2], reverse=True)[:top]
+    return {
+        'total_ms': report['total_ms'],
+        'import_ms': round(sum(self_us for _, self_us, _, _ in imports) / 1000, 2),
+        'create_app': report['create_app'],
+        'packages_ms': {
+            name: round(us / 1000, 2) for name, us in sorted(packages.items(), key=lambda item: -item[1])
+        },
+        'slowest_imports_ms': [(name, round(cumulative_us / 1000, 2)) for name, _, cumulative_us, _ in slowest]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=3, help='cold starts to run (best is reported)')
+    parser.add_argument('--top', type=int, default=15, help='slowest imports to list')
+    parser.add_argument('--budget-ms', type=float, help='fail when the cold start is slower than this')
+    parser.add_argument('--json', help='also write the report to this file')
+    args = parser.parse_args()
+
+    env = {**os.environ, 'PYTHONPATH': ROOT, 'STARTUP_CHECKS': os.environ.get('STARTUP_CHECKS', 'off')}
+    reports = [cold_start(env) for _ in range(args.runs)]
+    summary = summarize(min(reports, key=lambda report: report['total_ms']), args.top)
+
+    print(f"cold start: {summary['total_ms']:.1f}ms (best of {args.runs}), "
+          f"imports: {summary['import_ms']:.1f}ms, create_app(): {summary['create_app']['total_ms']:.1f}ms")
+    print("\ncreate_app() phases")
+    for phase, ms in summary['create_app']['phases'].items():
+        print(f"  {phase:<40} {ms:>9.1f}ms")
+    print("\nimport time by top-level package")
+    for name, ms in list(summary['packages_ms'].items())[:args.top]:
+        print(f"  {name:<40} {ms:>9.1f}ms")
+    print(f"\nslowest {args.top} imports (cumulative)")
+    for name, ms in summary['slowest_imports_ms']:
+        print(f"  {name:<40} {ms:>9.1f}ms")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+    if args.budget_ms is not None and summary['total_ms'] > args.budget_ms:
+        print(f"\n❌ cold start {summary['total_ms']:.1f}ms exceeds budget {args.budget_ms:.1f}ms")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark: query count for rendering a page of store cards.
+
+Compares the per-store property path (`Store.to_dict()` on its own) with
+the batched path (`Store.load_counts()` followed by `to_dict()`), counting
+the SQL statements each one issues as the number of stores grows.
+
+Usage:
+    python benchmarks/store_counts.py [--products 20] [--orders 20]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import event
+
+from src.models import db, User, Store, Product, Order
+
+STORE_COUNTS = [10, 50, 100, 500]
+
+
+class QueryCounter:
+    """Counts statements executed on an engine while active"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+
+def seed(store_count, products_per_store, orders_per_store):
+    db.drop_all()
+    db.create_all()
+    owner = User(email='bench@example.com', password_hash='x')
+    db.session.add(owner)
+    db.session.flush()
+    for i in range(store_count):
+        store = Store(user_id=owner.id, name=f'Store {i}')
+        db.session.add(store)
+        db.session.flush()
+        db.session.add_all(Product(store_id=store.id, title=f'Product {j}') for j in range(products_per_store))
+        db.session.add_all(Order(store_id=store.id, order_number=str(j)) for j in range(orders_per_store))
+    db.session.commit()
+
+
+def render(batched):
+    db.session.expunge_all()
+    with QueryCounter(db.engine) as counter:
+        started = time.perf_counter()
+        stores = db.session.scalars(db.select(Store).order_by(Store.created_at)).all()
+        if batched:
+            Store.load_counts(stores)
+        cards = [store.to_dict() for store in stores]
+        elapsed = time.perf_counter() - started
+    return counter.count, elapsed, cards
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=20, help='products per store')
+    parser.add_argument('--orders', type=int, default=20, help='orders per store')
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('BENCH_DATABASE_URL', 'sqlite://')
+    db.init_app(app)
+
+    print(f"{'stores':>8} {'per-store queries':>18} {'batched queries':>16} {'per-store ms':>13} {'batched ms':>11}")
+    with app.app_context():
+        for store_count in STORE_COUNTS:
+            seed(store_count, args.products, args.orders)
+            naive_queries, naive_time, naive_cards = render(batched=False)
+            batched_queries, batched_time, batched_cards = render(batched=True)
+            assert naive_cards == batched_cards, "batched counts disagree with per-store counts"
+            print(f"{store_count:>8} {naive_queries:>18} {batched_queries:>16} "
+                  f"{naive_time * 1000:>13.1f} {batched_time * 1000:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
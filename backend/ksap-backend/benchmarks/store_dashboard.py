@@ -0,0 +1,224 @@
+"""
+Benchmark: the multi-store dashboard.
+
+Creates --stores stores under one existing user (--user-id, default:
+any), each with --products products and --orders orders, then measures:
+
+- reads: the dashboard aggregated from orders and products on every load
+  (one grouped query over the user's stores) against
+  StoreDashboard.cards(), one index scan on store_dashboard_summaries
+- write overhead of the summary triggers: orders inserted one statement
+  each and in --batch-size row statements, with the triggers enabled
+  and disabled (ALTER TABLE ... DISABLE TRIGGER, needs the table owner)
+- consistency: --writers threads insert, update and delete orders of a
+  few stores while reconcile() runs; a final reconcile must find no
+  drifted rows
+
+Everything created is deleted afterwards. Migrations through
+create_store_dashboard_summaries must be applied.
+
+Usage:
+    python benchmarks/store_dashboard.py --database-url postgresql://... \\
+        [--stores 50] [--orders 20000] [--products 500]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from src.models import db
+from src.services.dashboard import StoreDashboard
+
+AGGREGATE_CARDS = """
+    SELECT st.id, st.name, st.platform, st.status,
+           COALESCE(o.revenue, 0), COALESCE(o.orders, 0), COALESCE(o.pending, 0),
+           COALESCE(p.products, 0), COALESCE(p.active_products, 0)
+    FROM public.stores st
+    LEFT JOIN (
+        SELECT store_id,
+               SUM(total_amount) FILTER (WHERE public.dashboard_order_counts(status)) AS revenue,
+               COUNT(*) FILTER (WHERE public.dashboard_order_counts(status)) AS orders,
+               COUNT(*) FILTER (WHERE public.dashboard_order_pending(status, fulfillment_status)) AS pending
+        FROM public.orders WHERE store_id IN (SELECT id FROM public.stores WHERE user_id = :user_id)
+        GROUP BY store_id
+    ) o ON o.store_id = st.id
+    LEFT JOIN (
+        SELECT store_id, COUNT(*) AS products, COUNT(*) FILTER (WHERE status = 'active') AS active_products
+        FROM public.products WHERE store_id IN (SELECT id FROM public.stores WHERE user_id = :user_id)
+        GROUP BY store_id
+    ) p ON p.store_id = st.id
+    WHERE st.user_id = :user_id
+    ORDER BY st.name, st.id
+"""
+
+INSERT_ORDERS = """
+    INSERT INTO public.orders (store_id, total_amount, status, fulfillment_status)
+    SELECT :store_id, round((random() * 200)::numeric, 2),
+           (ARRAY['pending', 'paid', 'fulfilled', 'cancelled'])[1 + floor(random() * 4)::int], NULL
+    FROM generate_series(1, :count)
+"""
+
+TRIGGERS = ('trigger_orders_dashboard_insert', 'trigger_orders_dashboard_update', 'trigger_orders_dashboard_delete')
+
+
+def timed(function, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--user-id', help='owner of the stores created for the run (default: any user)')
+    parser.add_argument('--stores', type=int, default=50)
+    parser.add_argument('--orders', type=int, default=20000, help='orders per store')
+    parser.add_argument('--products', type=int, default=500, help='products per store')
+    parser.add_argument('--reads', type=int, default=20)
+    parser.add_argument('--writes', type=int, default=500, help='orders inserted per write measurement')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10, help='length of the consistency run')
+    args = parser.parse_args()
+    if not args.database_url:
+        parser.error('--database-url or DATABASE_URL is required')
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = re.sub(r'^postgres(ql)?://', 'postgresql+psycopg2://', args.database_url)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_size': args.writers + 2}
+    db.init_app(app)
+    dashboard = StoreDashboard()
+
+    # A user of its own, so the dashboard holds exactly the stores of the run
+    user_id = str(uuid.uuid4())
+    store_ids = sorted(str(uuid.uuid4()) for _ in range(args.stores))
+    with app.app_context():
+        template = args.user_id or db.session.execute(db.text("SELECT id FROM public.users LIMIT 1")).scalar()
+        db.session.execute(db.text("SET session_replication_role = replica"))  # public.users references auth.users
+        db.session.execute(
+            db.text("INSERT INTO public.users (id, email) SELECT :id, :email FROM public.users WHERE id = :template"),
+            {'id': user_id, 'email': f'dashboard-{user_id}@example.com', 'template': template}
+        )
+        db.session.execute(db.text("SET session_replication_role = origin"))
+        db.session.execute(
+            db.text("INSERT INTO public.stores (id, user_id, name, platform) VALUES (:id, :user_id, :name, 'custom')"),
+            [{'id': store_id, 'user_id': user_id, 'name': f'Store {i:03d}'} for i, store_id in enumerate(store_ids)]
+        )
+        started = time.perf_counter()
+        for store_id in store_ids:
+            db.session.execute(
+                db.text("INSERT INTO public.products (store_id, title, status) "
+                        "SELECT :store_id, 'Product ' || i, CASE WHEN i % 5 = 0 THEN 'draft' ELSE 'active' END "
+                        "FROM generate_series(1, :count) i"),
+                {'store_id': store_id, 'count': args.products}
+            )
+            db.session.execute(db.text(INSERT_ORDERS), {'store_id': store_id, 'count': args.orders})
+        db.session.execute(db.text("ANALYZE public.orders; ANALYZE public.products"))
+        db.session.commit()
+        print(f"{args.stores} stores x {args.orders} orders and {args.products} products "
+              f"created in {time.perf_counter() - started:.1f}s\n")
+
+    try:
+        with app.app_context():
+            live = [tuple(row) for row in db.session.execute(db.text(AGGREGATE_CARDS), {'user_id': user_id})]
+            cards = dashboard.cards(user_id)
+            same = [(card['store_id'], round(card['revenue'], 2), card['order_count'], card['pending_fulfillment_count'],
+                     card['product_count'], card['active_product_count']) for card in cards] == \
+                   [(str(row[0]), round(float(row[4]), 2), row[5], row[6], row[7], row[8]) for row in live]
+            aggregate = timed(lambda: db.session.execute(db.text(AGGREGATE_CARDS), {'user_id': user_id}).all(), args.reads)
+            summary = timed(lambda: dashboard.cards(user_id), args.reads)
+            db.session.commit()
+        print(f"dashboard of {args.stores} cards: aggregated {aggregate * 1000:.1f}ms, "
+              f"summaries {summary * 1000:.2f}ms ({aggregate / summary:.0f}x); same cards: {same}")
+
+        def write(single, triggers):
+            with app.app_context():
+                if not triggers:
+                    for name in TRIGGERS:
+                        db.session.execute(db.text(f"ALTER TABLE public.orders DISABLE TRIGGER {name}"))
+                started = time.perf_counter()
+                if single:
+                    for _ in range(args.writes):
+                        db.session.execute(db.text(INSERT_ORDERS), {'store_id': random.choice(store_ids), 'count': 1})
+                else:
+                    for _ in range(max(1, args.writes // args.batch_size)):
+                        db.session.execute(db.text(INSERT_ORDERS), {'store_id': random.choice(store_ids),
+                                                                    'count': args.batch_size})
+                elapsed = time.perf_counter() - started
+                db.session.rollback()
+            return elapsed / (args.writes if single else max(1, args.writes // args.batch_size) * args.batch_size)
+
+        print("\norder inserts        triggers off   triggers on")
+        for label, single in (('one per statement', True), (f'{args.batch_size} per statement', False)):
+            off, on = write(single, False), write(single, True)
+            print(f"{label:<20}{off * 1e6:>10.0f}us{on * 1e6:>12.0f}us  (+{(on - off) * 1e6:.0f}us per order)")
+
+        hot = store_ids[:3]
+        stop = threading.Event()
+        counts = {'writes': 0, 'deadlocks': 0}
+
+        def writer():
+            with app.app_context():
+                while not stop.is_set():
+                    store_id = random.choice(hot)
+                    action = random.random()
+                    try:
+                        if action < 0.5:
+                            db.session.execute(db.text(INSERT_ORDERS), {'store_id': store_id, 'count': random.randint(1, 20)})
+                        elif action < 0.85:
+                            db.session.execute(
+                                db.text("UPDATE public.orders SET status = 'fulfilled', total_amount = total_amount + 1 "
+                                        "WHERE id IN (SELECT id FROM public.orders WHERE store_id = :store_id "
+                                        "AND status IN ('pending', 'paid') LIMIT 10)"),
+                                {'store_id': store_id}
+                            )
+                        else:
+                            db.session.execute(
+                                db.text("DELETE FROM public.orders WHERE id IN "
+                                        "(SELECT id FROM public.orders WHERE store_id = :store_id LIMIT 5)"),
+                                {'store_id': store_id}
+                            )
+                        db.session.commit()
+                        counts['writes'] += 1
+                    except Exception:
+                        db.session.rollback()
+                        counts['deadlocks'] += 1
+
+        threads = [threading.Thread(target=writer) for _ in range(args.writers)]
+        for thread in threads:
+            thread.start()
+        reconciles = 0
+        deadline = time.monotonic() + args.seconds
+        with app.app_context():
+            while time.monotonic() < deadline:
+                dashboard.reconcile()
+                reconciles += 1
+        stop.set()
+        for thread in threads:
+            thread.join()
+        with app.app_context():
+            checked, repaired = dashboard.reconcile()
+        print(f"\n{counts['writes']} concurrent write transactions on {len(hot)} stores "
+              f"({counts['deadlocks']} failed) during {reconciles} reconciles: "
+              f"final reconcile checked {checked} stores, repaired {repaired}")
+        if repaired or not same:
+            sys.exit('dashboard summaries drifted')
+    finally:
+        with app.app_context():
+            db.session.execute(db.text("DELETE FROM public.stores WHERE user_id = :user_id"), {'user_id': user_id})
+            db.session.execute(db.text("DELETE FROM public.users WHERE id = :user_id"), {'user_id': user_id})
+            db.session.commit()
+
+
+if __name__ == '__main__':
+    main()
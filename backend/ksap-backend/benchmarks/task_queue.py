@@ -0,0 +1,157 @@
+"""
+Benchmark: background tasks under one tenant's burst.
+
+One user enqueues --burst tasks at once (an export of every store, a
+bulk resync); then --tenants other users enqueue --light tasks each.
+Every task sleeps --task-ms. --workers worker threads run them, first
+with no concurrency caps and then with a per-user cap of --user-cap, and
+the wait (enqueue to start) of the light tenants' tasks is reported:
+without caps they queue behind the whole burst, with caps the burst only
+ever holds --user-cap workers.
+
+Then --throughput no-op tasks measure how many claims per second the
+broker sustains.
+
+--broker is memory, sqlite:///path or postgres (needs --database-url and
+the create_background_tasks migration; tasks of the run are deleted).
+
+Usage:
+    python benchmarks/task_queue.py [--broker memory] [--workers 8] [--burst 400] [--task-ms 20]
+"""
+
+import argparse
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from src.models import db
+from src.services.tasks import TaskQueue, create_broker
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))] if values else 0.0
+
+
+def run(app, broker_url, args, user_cap):
+    """Run the burst and the light tenants' tasks; returns (light waits, burst waits, wall seconds)"""
+    queue = TaskQueue(broker=create_broker(broker_url), user_concurrency=user_cap, poll_interval=0.01)
+    app.config['TASK_WORKERS'] = 0
+    queue.init_app(app)
+    started = {}
+    lock = threading.Lock()
+
+    @queue.task('bench.work', max_retries=0)
+    def work(tenant, sleep):
+        with lock:
+            started.setdefault(tenant, []).append(time.perf_counter())
+        time.sleep(sleep)
+
+    heavy = str(uuid.uuid4())
+    light = [str(uuid.uuid4()) for _ in range(args.tenants)]
+    with app.app_context():
+        began = time.perf_counter()
+        for _ in range(args.burst):
+            queue.enqueue('bench.work', {'tenant': heavy, 'sleep': args.task_ms / 1000}, user_id=heavy)
+        enqueued = time.perf_counter()
+        for _ in range(args.light):
+            for tenant in light:
+                queue.enqueue('bench.work', {'tenant': tenant, 'sleep': args.task_ms / 1000}, user_id=tenant)
+        queue.workers = args.workers
+        queue.ensure_started()
+        total = args.burst + args.light * args.tenants
+        while sum(len(times) for times in started.values()) < total:
+            time.sleep(0.01)
+        while queue.broker.depth()['running']:
+            time.sleep(0.01)
+        wall = time.perf_counter() - began
+        queue.stop()
+    light_waits = [at - enqueued for tenant in light for at in started.get(tenant, [])]
+    heavy_waits = [at - began for at in started[heavy]]
+    return light_waits, heavy_waits, wall
+
+
+def throughput(app, broker_url, count):
+    """No-op tasks run per second by one worker thread"""
+    queue = TaskQueue(broker=create_broker(broker_url), poll_interval=0.01)
+    app.config['TASK_WORKERS'] = 0
+    queue.init_app(app)
+
+    @queue.task('bench.noop')
+    def noop():
+        return None
+
+    with app.app_context():
+        for _ in range(count):
+            queue.enqueue('bench.noop')
+        started = time.perf_counter()
+        ran = 0
+        while True:
+            task = queue.claim('bench')
+            if task is None:
+                break
+            queue.execute(task)
+            ran += 1
+        return ran / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--broker', default='memory', help='memory, sqlite:///path or postgres')
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--burst', type=int, default=400, help="tasks the heavy tenant enqueues")
+    parser.add_argument('--tenants', type=int, default=10, help='light tenants')
+    parser.add_argument('--light', type=int, default=3, help='tasks per light tenant')
+    parser.add_argument('--task-ms', type=float, default=20)
+    parser.add_argument('--user-cap', type=int, default=2)
+    parser.add_argument('--throughput', type=int, default=2000, help='no-op tasks for the claim rate')
+    args = parser.parse_args()
+    if args.broker == 'postgres' and not args.database_url:
+        parser.error('--database-url or DATABASE_URL is required with the postgres broker')
+
+    app = Flask(__name__)
+    if args.database_url:
+        app.config['SQLALCHEMY_DATABASE_URI'] = re.sub(r'^postgres(ql)?://', 'postgresql+psycopg2://',
+                                                       args.database_url)
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_size': args.workers + 2}
+        db.init_app(app)
+    if args.broker.startswith('sqlite:///') and os.path.exists(args.broker[len('sqlite:///'):]):
+        sys.exit(f"{args.broker} exists; give a path the benchmark may create and delete")
+
+    print(f"{args.broker} broker, {args.workers} workers, {args.task_ms:.0f}ms tasks: one user enqueues "
+          f"{args.burst}, then {args.tenants} users {args.light} each\n")
+    print(f"{'per-user cap':<14}{'light p50 ms':>14}{'light p99 ms':>14}{'burst p50 ms':>14}{'wall s':>8}")
+    try:
+        for label, cap in (('none', 0), (str(args.user_cap), args.user_cap)):
+            light, heavy, wall = run(app, args.broker, args, cap)
+            print(f"{label:<14}{percentile(light, 0.5) * 1000:>14.0f}{percentile(light, 0.99) * 1000:>14.0f}"
+                  f"{percentile(heavy, 0.5) * 1000:>14.0f}{wall:>8.2f}")
+            cleanup(app, args.broker)
+        rate = throughput(app, args.broker, args.throughput)
+        print(f"\nclaim + run + record, one worker: {rate:.0f} no-op tasks/s")
+    finally:
+        cleanup(app, args.broker)
+        if args.broker.startswith('sqlite:///'):
+            for suffix in ('', '-wal', '-shm'):
+                path = args.broker[len('sqlite:///'):] + suffix
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+def cleanup(app, broker_url):
+    if broker_url == 'postgres':
+        with app.app_context():
+            db.session.execute(db.text("DELETE FROM public.background_tasks WHERE name LIKE 'bench.%'"))
+            db.session.commit()
+
+
+if __name__ == '__main__':
+    main()
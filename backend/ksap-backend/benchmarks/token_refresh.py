@@ -0,0 +1,145 @@
+"""
+Benchmark: refreshing a burst of expiring social tokens.
+
+Starts a local OAuth stand-in answering the Facebook, Instagram and
+RFC 6749 refresh grants. A share of its answers are 500s (retried with
+backoff), and some grants are revoked (invalid_grant, not retried).
+--accounts accounts all expire at the same moment, --lead seconds from
+now, and TokenRefreshScheduler refreshes them with the given rate, batch
+size and workers.
+
+Reported: requests per second at the stand-in (peak over any one-second
+window against --rate), tokens refreshed before expiry, retries and
+revoked grants. Refreshing on first failure instead would send every
+account at the platform in the same second. No database is involved.
+
+Usage:
+    python benchmarks/token_refresh.py [--accounts 2000] [--rate 200] [--batch-size 50] [--workers 16]
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services import token_refresh
+from src.services.token_refresh import OAuthProvider, TokenRefreshScheduler
+
+
+class OAuthStandIn(ThreadingHTTPServer):
+    """Token endpoint recording request times; fails `error_rate` of requests with 500"""
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, error_rate):
+        super().__init__(('127.0.0.1', 0), OAuthHandler)
+        self.error_rate = error_rate
+        self.request_times = []
+        self.lock = threading.Lock()
+
+
+class OAuthHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self._answer(parse_qs(urlsplit(self.path).query))
+
+    def do_POST(self):
+        self._answer(parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode()))
+
+    def _answer(self, params):
+        with self.server.lock:
+            self.server.request_times.append(time.time())
+        grant = params['grant_type'][0]
+        token = (params.get('refresh_token') or params.get('fb_exchange_token') or params.get('access_token'))[0]
+        if token.startswith('revoked'):
+            status, body = 400, {'error': 'invalid_grant'}
+        elif random.random() < self.server.error_rate:
+            status, body = 500, {'error': 'server_error'}
+        else:
+            status, body = 200, {'access_token': f'new-{token}', 'token_type': 'bearer', 'expires_in': 5184000}
+            if grant == 'refresh_token':
+                body['refresh_token'] = f'new-{token}'
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def peak_per_second(times):
+    times = sorted(times)
+    peak, start = 0, 0
+    for end, moment in enumerate(times):
+        while moment - times[start] >= 1.0:
+            start += 1
+        peak = max(peak, end - start + 1)
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--accounts', type=int, default=2000)
+    parser.add_argument('--rate', type=float, default=200, help='refreshes per second')
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--lead', type=float, default=20, help='seconds until every token expires')
+    parser.add_argument('--error-rate', type=float, default=0.05, help='share of 500 answers')
+    parser.add_argument('--revoked', type=float, default=0.01, help='share of revoked grants')
+    args = parser.parse_args()
+    logging.getLogger(token_refresh.__name__).setLevel(logging.ERROR)  # one warning per revoked grant
+
+    server = OAuthStandIn(args.error_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_address[1]}/oauth/token'
+    providers = {
+        'facebook': OAuthProvider('facebook', url, 'app', 'secret', grant='fb_exchange_token'),
+        'instagram': OAuthProvider('instagram', url, grant='ig_refresh_token'),
+        'tiktok': OAuthProvider('tiktok', url, 'app', 'secret')
+    }
+    token_refresh.BACKOFF_BASE = 0.5  # seconds instead of minutes, to fit the run
+
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=args.lead)
+    scheduler = TokenRefreshScheduler(providers=providers, lead_time=args.lead, batch_size=args.batch_size,
+                                      rate=args.rate, workers=args.workers)
+    for i in range(args.accounts):
+        token = f'revoked-{i}' if random.random() < args.revoked else f'token-{i}'
+        scheduler.push({'id': str(i), 'platform': list(providers)[i % len(providers)],
+                        'access_token': token, 'refresh_token': token, 'token_expires_at': expires_at})
+
+    started = time.time()
+    settled = lambda: scheduler.stats['refreshed'] + scheduler.stats['needs_reauth'] + scheduler.stats['failed']
+    while settled() < args.accounts and time.time() < expires_at.timestamp():
+        scheduler.run_due()
+        due_at = scheduler.next_due()
+        if due_at is not None:
+            time.sleep(min(max(0.0, due_at - time.time()), 0.1))
+    finished = time.time()
+    scheduler.close()
+    server.shutdown()
+
+    stats = scheduler.stats
+    print(f"{args.accounts} accounts expiring together, refreshed in {finished - started:.1f}s "
+          f"({'before' if finished < expires_at.timestamp() else 'AFTER'} expiry)")
+    print(f"  refreshed {stats['refreshed']}, revoked {stats['needs_reauth']}, gave up {stats['failed']}, "
+          f"retries {stats['retried']}")
+    print(f"  token endpoint: {len(server.request_times)} requests, "
+          f"peak {peak_per_second(server.request_times)}/s (rate {args.rate:.0f}/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Command-line entry point for KSAP schema migrations.
+
+Usage:
+    python -m src.database.migrate [--dry-run] [--baseline VERSION] [--reapply-changed]
+
+Connects directly when DATABASE_URL (or --database-url) is set, which is
+required for concurrent index builds; otherwise falls back to the
+Supabase `exec_sql` RPC using the service key.
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+from dotenv import load_dotenv
+
+from .migrations import MigrationError, MigrationRunner, PsycopgExecutor, SupabaseRpcExecutor
+from .schema import MIGRATIONS
+
+logger = logging.getLogger(__name__)
+
+
+def main(argv=None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Apply KSAP schema migrations")
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'),
+                        help='direct Postgres connection string (default: $DATABASE_URL)')
+    parser.add_argument('--dry-run', action='store_true', help='list pending migrations without applying them')
+    parser.add_argument('--baseline', type=int, metavar='VERSION',
+                        help='mark migrations up to VERSION as applied (databases built by create_tables)')
+    parser.add_argument('--reapply-changed', action='store_true',
+                        help='re-run applied migrations whose SQL changed instead of failing')
+    args = parser.parse_args(argv)
+
+    if args.database_url:
+        executor = PsycopgExecutor(args.database_url)
+    else:
+        from .supabase_client import get_admin_supabase
+        executor = SupabaseRpcExecutor(get_admin_supabase())
+
+    runner = MigrationRunner(executor, MIGRATIONS)
+    try:
+        if args.baseline is not None:
+            for migration in runner.baseline(args.baseline):
+                logger.info(f"Baselined {migration!r}")
+        else:
+            runner.migrate(dry_run=args.dry_run, reapply_changed=args.reapply_changed)
+    except MigrationError as e:
+        logger.error(str(e))
+        return 1
+    finally:
+        executor.close()
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,295 @@
+"""
+Versioned schema migrations for the KSAP Supabase database.
+
+Each Migration is applied at most once and recorded in
+public.schema_migrations with a checksum of its SQL. A deploy reads the
+applied versions in a single query and only runs what is new, so deploy
+time no longer grows with the size of the schema:
+
+- Transactional migrations are sent as one script (DDL plus the
+  bookkeeping insert) in a single round trip, run under a short
+  lock_timeout and commit or roll back as a unit.
+- Concurrent migrations hold `CREATE INDEX CONCURRENTLY` statements,
+  which cannot run inside a transaction. They are executed one statement
+  at a time in autocommit mode so building an index on a large table
+  never blocks writes to `orders` or `products`.
+
+Usage:
+    python -m src.database.migrate [--dry-run] [--baseline VERSION]
+
+References:
+- https://www.postgresql.org/docs/current/sql-createindex.html#SQL-CREATEINDEX-CONCURRENTLY
+- https://www.postgresql.org/docs/current/runtime-config-client.html#GUC-LOCK-TIMEOUT
+"""
+
+import hashlib
+import logging
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS public.schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    checksum CHAR(64) NOT NULL,
+    execution_ms INTEGER,
+    applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+DEFAULT_LOCK_TIMEOUT = '5s'
+
+_INDEX_NAME = re.compile(
+    r'CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?("?[\w.]+"?)',
+    re.IGNORECASE
+)
+
+_DOLLAR_QUOTE = re.compile(r'\$[A-Za-z_]*\$')
+
+
+class MigrationError(Exception):
+    """Raised when a migration cannot be applied"""
+
+
+class MigrationChecksumError(MigrationError):
+    """Raised when an already-applied migration's SQL has been edited"""
+
+
+class Migration:
+    """
+    A single versioned schema change.
+
+    `sql` is a script for transactional migrations. For concurrent
+    migrations it may be a script or a list of statements; each is run on
+    its own in autocommit mode and must be idempotent (use IF NOT EXISTS).
+    A script is split on `;`, so one with dollar-quoted bodies (DO blocks,
+    functions) is rejected: give those as a list.
+    """
+
+    def __init__(self, version, name, sql, concurrent=False):
+        if concurrent and isinstance(sql, str) and _DOLLAR_QUOTE.search(sql):
+            raise MigrationError(
+                f"Concurrent migration {version} ({name}) has a dollar-quoted body that splitting on ';' "
+                "would break; give its statements as a list"
+            )
+        self.version = version
+        self.name = name
+        self.sql = sql
+        self.concurrent = concurrent
+
+    @property
+    def statements(self):
+        """SQL split into individual statements (concurrent migrations only)"""
+        if isinstance(self.sql, (list, tuple)):
+            return [statement.strip() for statement in self.sql if statement.strip()]
+        return [statement.strip() for statement in self.sql.split(';') if statement.strip()]
+
+    @property
+    def checksum(self):
+        source = ';\n'.join(self.statements) if isinstance(self.sql, (list, tuple)) else self.sql
+        return hashlib.sha256(source.strip().encode('utf-8')).hexdigest()
+
+    def __repr__(self):
+        kind = 'concurrent' if self.concurrent else 'transactional'
+        return f'<Migration {self.version:04d}_{self.name} ({kind})>'
+
+
+def _record_sql(migration, execution_ms=None):
+    """
+    Bookkeeping statement; values are trusted (they come from code, not input).
+    Without an explicit duration, the time since the enclosing transaction
+    started is recorded, measured by the server.
+    """
+    name = migration.name.replace("'", "''")
+    if execution_ms is None:
+        duration = "(EXTRACT(EPOCH FROM clock_timestamp() - transaction_timestamp()) * 1000)::integer"
+    else:
+        duration = str(int(execution_ms))
+    return (
+        "INSERT INTO public.schema_migrations (version, name, checksum, execution_ms) "
+        f"VALUES ({int(migration.version)}, '{name}', '{migration.checksum}', {duration}) "
+        "ON CONFLICT (version) DO UPDATE SET name = EXCLUDED.name, checksum = EXCLUDED.checksum, "
+        "execution_ms = EXCLUDED.execution_ms, applied_at = CURRENT_TIMESTAMP;"
+    )
+
+
+class PsycopgExecutor:
+    """
+    Runs migrations over a direct Postgres connection (DATABASE_URL).
+
+    Required for concurrent index builds, which PostgREST cannot run
+    because every RPC executes inside a transaction.
+    """
+
+    supports_concurrent = True
+
+    def __init__(self, dsn, lock_timeout=DEFAULT_LOCK_TIMEOUT):
+        import psycopg2
+
+        self.connection = psycopg2.connect(dsn)
+        self.lock_timeout = lock_timeout
+
+    def ensure_migrations_table(self):
+        self.connection.autocommit = True
+        with self.connection.cursor() as cursor:
+            cursor.execute(MIGRATIONS_TABLE)
+
+    def applied_versions(self):
+        self.connection.autocommit = True
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT version, checksum FROM public.schema_migrations")
+            return dict(cursor.fetchall())
+
+    def run_transactional(self, migration, record_sql):
+        # One round trip: lock timeout, the DDL and the bookkeeping row
+        script = f"SET LOCAL lock_timeout = '{self.lock_timeout}';\n{migration.sql}\n{record_sql}"
+        self.connection.autocommit = False
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute(script)
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+
+    def run_concurrent_statement(self, statement):
+        self.connection.autocommit = True
+        with self.connection.cursor() as cursor:
+            index_name = _INDEX_NAME.search(statement)
+            if index_name:
+                # A failed concurrent build leaves an INVALID index behind that
+                # IF NOT EXISTS would silently keep; drop it and rebuild
+                cursor.execute(
+                    "SELECT c.oid::regclass::text FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+                    "WHERE c.oid = to_regclass(%s) AND NOT i.indisvalid",
+                    (index_name.group(1),)
+                )
+                invalid = cursor.fetchone()
+                if invalid:
+                    logger.warning(f"Dropping invalid index {invalid[0]} left by an earlier failed build")
+                    cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {invalid[0]}")
+            cursor.execute(statement)
+
+    def record(self, record_sql):
+        self.connection.autocommit = True
+        with self.connection.cursor() as cursor:
+            cursor.execute(record_sql)
+
+    def close(self):
+        self.connection.close()
+
+
+class SupabaseRpcExecutor:
+    """
+    Runs migrations through the `exec_sql` RPC of a Supabase client.
+
+    Each RPC call is one round trip executed in a single transaction, so a
+    transactional migration is atomic. Concurrent index builds are not
+    possible over RPC; use PsycopgExecutor for those.
+    """
+
+    supports_concurrent = False
+
+    def __init__(self, client, lock_timeout=DEFAULT_LOCK_TIMEOUT):
+        self.client = client
+        self.lock_timeout = lock_timeout
+
+    def _exec(self, sql):
+        self.client.rpc('exec_sql', {'sql': sql}).execute()
+
+    def ensure_migrations_table(self):
+        # Reload the PostgREST schema cache so the table is queryable right away
+        self._exec(MIGRATIONS_TABLE + "\nNOTIFY pgrst, 'reload schema';")
+
+    def applied_versions(self):
+        response = self.client.table('schema_migrations').select('version,checksum').execute()
+        return {row['version']: row['checksum'] for row in response.data or []}
+
+    def run_transactional(self, migration, record_sql):
+        self._exec(f"SET LOCAL lock_timeout = '{self.lock_timeout}';\n{migration.sql}\n{record_sql}")
+
+    def run_concurrent_statement(self, statement):
+        raise MigrationError("CREATE INDEX CONCURRENTLY needs a direct connection; set DATABASE_URL")
+
+    def record(self, record_sql):
+        self._exec(record_sql)
+
+    def close(self):
+        pass
+
+
+class MigrationRunner:
+    """Applies pending migrations in version order"""
+
+    def __init__(self, executor, migrations):
+        versions = [migration.version for migration in migrations]
+        if len(versions) != len(set(versions)):
+            raise MigrationError("Duplicate migration versions")
+        self.executor = executor
+        self.migrations = sorted(migrations, key=lambda migration: migration.version)
+
+    def pending(self, applied=None, reapply_changed=False):
+        """Migrations that still need to run, validating checksums of applied ones"""
+        if applied is None:
+            applied = self.executor.applied_versions()
+
+        pending = []
+        for migration in self.migrations:
+            checksum = applied.get(migration.version)
+            if checksum is None:
+                pending.append(migration)
+            elif checksum.strip() != migration.checksum:
+                if not reapply_changed:
+                    raise MigrationChecksumError(
+                        f"{migration!r} was edited after being applied; add a new migration instead"
+                    )
+                pending.append(migration)
+        return pending
+
+    def migrate(self, dry_run=False, reapply_changed=False):
+        """Apply pending migrations; returns the list that was (or would be) applied"""
+        self.executor.ensure_migrations_table()
+        pending = self.pending(reapply_changed=reapply_changed)
+
+        if not pending:
+            logger.info("Schema is up to date")
+        for migration in pending:
+            if dry_run:
+                logger.info(f"Would apply {migration!r}")
+                continue
+            self.apply(migration)
+        return pending
+
+    def apply(self, migration):
+        if migration.concurrent and not self.executor.supports_concurrent:
+            raise MigrationError(f"{migration!r} builds indexes concurrently; set DATABASE_URL")
+
+        logger.info(f"Applying {migration!r}")
+        started = time.perf_counter()
+        try:
+            if migration.concurrent:
+                for statement in migration.statements:
+                    self.executor.run_concurrent_statement(statement)
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                self.executor.record(_record_sql(migration, elapsed_ms))
+            else:
+                self.executor.run_transactional(migration, _record_sql(migration))
+                elapsed_ms = (time.perf_counter() - started) * 1000
+        except MigrationError:
+            raise
+        except Exception as e:
+            raise MigrationError(f"{migration!r} failed: {e}") from e
+        logger.info(f"Applied {migration!r} in {elapsed_ms:.0f}ms")
+
+    def baseline(self, up_to_version):
+        """Mark migrations up to a version as applied without running them"""
+        self.executor.ensure_migrations_table()
+        applied = self.executor.applied_versions()
+        marked = []
+        for migration in self.migrations:
+            if migration.version <= up_to_version and migration.version not in applied:
+                self.executor.record(_record_sql(migration, 0))
+                marked.append(migration)
+        return marked
@@ -0,0 +1,531 @@
+"""
+Monthly range partitioning and retention for high-volume tables.
+
+`orders` (by created_at) and `analytics_data` (by date_recorded) grow
+without bound. Partitioning them by month keeps date-bounded queries
+fast, because Postgres prunes partitions outside the WHERE range, and
+turns retention into detaching whole partitions instead of huge DELETEs
+that leave the table to vacuum.
+
+Commands (direct connection via DATABASE_URL):
+    python -m src.database.partitioning convert orders [--batch-size 50000]
+    python -m src.database.partitioning maintain [--drop]
+
+`convert` migrates an existing table online:
+ 1. create <table>_partitioned with the same columns, defaults, checks,
+    foreign keys, indexes and a (id, <key>) primary key, plus monthly
+    partitions covering the existing data and a default partition
+ 2. mirror every write on the old table into the new one with a trigger
+ 3. copy existing rows in keyset batches, one commit per batch; each
+    batch locks its rows FOR SHARE, so an UPDATE or DELETE racing the
+    copy waits for it and its mirrored write then sees the copied row
+ 4. compare row counts and checksums of both tables per id range, and
+    recopy the ranges that differ (the swap is refused if they still do)
+ 5. swap names in one short transaction (under lock_timeout), moving
+    triggers, RLS policies and referencing foreign keys to the new table
+The old table is kept as <table>_unpartitioned until dropped by hand.
+
+`maintain` is meant for a daily cron: it creates partitions
+PARTITION_MONTHS_AHEAD months ahead and detaches (or with --drop, drops)
+partitions older than each table's retention window. Dropping raw
+analytics partitions leaves analytics_rollups untouched, so long-range
+charts keep working after the raw rows expire.
+"""
+
+import argparse
+import logging
+import os
+import re
+import sys
+import time
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCK_TIMEOUT = '5s'
+VERIFY_PASSES = 3
+_PARTITION_SUFFIX = re.compile(r'_p(\d{4})(\d{2})$')
+
+
+class PartitionError(Exception):
+    """Raised when a conversion cannot be completed safely"""
+
+
+class PartitionSpec:
+    """
+    How one table is partitioned.
+
+    `key_fill` is the SQL expression used for the partition key when
+    copying old rows (which may have NULL keys), written against the
+    row alias `r`. `retention_months` of 0 keeps partitions forever.
+    """
+
+    def __init__(self, table, key, key_fill, retention_months=0, fk_fixups=None):
+        self.table = table
+        self.key = key
+        self.key_fill = key_fill
+        self.retention_months = retention_months
+        self.fk_fixups = fk_fixups or []
+
+    @property
+    def shadow(self):
+        return f'{self.table}_partitioned'
+
+    @property
+    def legacy(self):
+        return f'{self.table}_unpartitioned'
+
+
+PARTITIONED_TABLES = {
+    'orders': PartitionSpec(
+        'orders',
+        key='created_at',
+        key_fill='COALESCE(r.created_at, CURRENT_TIMESTAMP)',
+        retention_months=int(os.environ.get('ORDERS_RETENTION_MONTHS', 0)),
+        # Foreign keys to a partitioned table must reference its whole
+        # primary key, so order items point at (id, created_at)
+        fk_fixups=[
+            "ALTER TABLE public.order_items DROP CONSTRAINT IF EXISTS order_items_order_id_fkey",
+            "ALTER TABLE public.order_items ADD CONSTRAINT order_items_order_fkey "
+            "FOREIGN KEY (order_id, order_created_at) REFERENCES public.orders(id, created_at) "
+            "ON UPDATE CASCADE ON DELETE CASCADE NOT VALID"
+        ]
+    ),
+    'analytics_data': PartitionSpec(
+        'analytics_data',
+        key='date_recorded',
+        key_fill='COALESCE(r.date_recorded, r.created_at::date, CURRENT_DATE)',
+        retention_months=int(os.environ.get('ANALYTICS_RETENTION_MONTHS', 25))
+    ),
+}
+
+
+class PartitionManager:
+    """Runs partition conversion and maintenance over a psycopg2 connection"""
+
+    def __init__(self, connection, months_ahead=3, lock_timeout=DEFAULT_LOCK_TIMEOUT):
+        self.connection = connection
+        self.connection.autocommit = True
+        self.months_ahead = months_ahead
+        self.lock_timeout = lock_timeout
+
+    def _fetch(self, sql, params=None):
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def _execute(self, sql, params=None):
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+    def is_partitioned(self, table):
+        rows = self._fetch(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)",
+            (f'public.{table}',)
+        )
+        return bool(rows)
+
+    def partitions(self, table):
+        """Monthly partitions of a table as (name, month start) pairs, oldest first"""
+        rows = self._fetch(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(%s)",
+            (f'public.{table}',)
+        )
+        partitions = []
+        for (name,) in rows:
+            match = _PARTITION_SUFFIX.search(name)
+            if match and name.startswith(f'{table}_p'):
+                partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+        return sorted(partitions, key=lambda partition: partition[1])
+
+    # Maintenance
+
+    def ensure_partitions(self, spec, from_month=None, table=None):
+        """Create monthly partitions from `from_month` through months_ahead; returns how many"""
+        table = table or spec.table
+        rows = self._fetch(
+            "SELECT public.ensure_monthly_partitions(%s, %s, %s)",
+            (table, from_month or date.today(), self.months_ahead)
+        )
+        created = rows[0][0]
+        if created:
+            logger.info(f"Created {created} partition(s) for {table}")
+        return created
+
+    def apply_retention(self, spec, drop=False, today=None):
+        """Detach (and optionally drop) partitions entirely older than the retention window"""
+        if not spec.retention_months:
+            return []
+        today = today or date.today()
+        months = today.year * 12 + today.month - 1 - spec.retention_months
+        cutoff = date(months // 12, months % 12 + 1, 1)
+
+        expired = [name for name, month_start in self.partitions(spec.table) if month_start < cutoff]
+        has_default = bool(self._fetch(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s) AND partdefid <> 0",
+            (f'public.{spec.table}',)
+        ))
+        for name in expired:
+            if has_default:
+                # Postgres refuses DETACH CONCURRENTLY next to a default
+                # partition; detach under a short lock_timeout instead
+                self._execute(
+                    f"BEGIN; SET LOCAL lock_timeout = '{self.lock_timeout}'; "
+                    f"ALTER TABLE public.{spec.table} DETACH PARTITION public.{name}; COMMIT;"
+                )
+            else:
+                # CONCURRENTLY avoids an ACCESS EXCLUSIVE lock on the parent;
+                # it cannot run inside a transaction, hence autocommit
+                self._execute(f"ALTER TABLE public.{spec.table} DETACH PARTITION public.{name} CONCURRENTLY")
+            if drop:
+                self._execute(f"DROP TABLE public.{name}")
+                logger.info(f"Dropped expired partition {name}")
+            else:
+                logger.info(f"Detached expired partition {name}; archive and drop it when no longer needed")
+        return expired
+
+    def maintain(self, drop=False):
+        """Pre-create upcoming partitions and apply retention on every converted table"""
+        for spec in PARTITIONED_TABLES.values():
+            if not self.is_partitioned(spec.table):
+                logger.info(f"{spec.table} is not partitioned yet; run `convert {spec.table}` first")
+                continue
+            self.ensure_partitions(spec)
+            self.apply_retention(spec, drop=drop)
+
+    # Online conversion
+
+    def _columns(self, table):
+        rows = self._fetch(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_schema = 'public' AND table_name = %s ORDER BY ordinal_position",
+            (table,)
+        )
+        return [name for (name,) in rows]
+
+    def _select_list(self, spec, columns):
+        return ', '.join(spec.key_fill if column == spec.key else f'r.{column}' for column in columns)
+
+    def _create_shadow(self, spec):
+        table, shadow, key = spec.table, spec.shadow, spec.key
+        self._execute(
+            f"CREATE TABLE IF NOT EXISTS public.{shadow} (LIKE public.{table} "
+            f"INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING GENERATED INCLUDING STORAGE INCLUDING COMMENTS) "
+            f"PARTITION BY RANGE ({key})"
+        )
+        self._execute(f"ALTER TABLE public.{shadow} ALTER COLUMN {key} SET NOT NULL")
+        if not self._fetch("SELECT 1 FROM pg_constraint WHERE conname = %s", (f'{shadow}_pkey',)):
+            self._execute(f"ALTER TABLE public.{shadow} ADD CONSTRAINT {shadow}_pkey PRIMARY KEY (id, {key})")
+
+        # Outgoing foreign keys (e.g. store_id -> stores)
+        for name, definition in self._fetch(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+            (f'public.{table}',)
+        ):
+            if not self._fetch(
+                "SELECT 1 FROM pg_constraint WHERE conrelid = to_regclass(%s) AND conname = %s",
+                (f'public.{shadow}', name)
+            ):
+                self._execute(f"ALTER TABLE public.{shadow} ADD CONSTRAINT {name} {definition}")
+
+        # Secondary indexes, built on the parent so every partition gets them
+        for name, definition in self._fetch(
+            "SELECT i.indexname, i.indexdef FROM pg_indexes i "
+            "JOIN pg_index x ON x.indexrelid = to_regclass('public.' || quote_ident(i.indexname)) "
+            "WHERE i.schemaname = 'public' AND i.tablename = %s AND NOT x.indisprimary",
+            (table,)
+        ):
+            definition = definition.replace(f' ON public.{table} ', f' ON public.{shadow} ', 1)
+            definition = definition.replace(f'INDEX {name} ON', f'INDEX IF NOT EXISTS {name}_part ON', 1)
+            if definition.startswith('CREATE UNIQUE') and key not in definition and ' WHERE ' not in definition:
+                # Unique indexes on a partitioned table must include the partition key
+                definition = f'{definition[:-1]}, {key})'
+                logger.warning(f"Unique index {name} now also covers {key} on the partitioned table")
+            self._execute(definition)
+
+        self._execute(f"ALTER TABLE public.{shadow} ENABLE ROW LEVEL SECURITY")
+
+    def _install_mirror(self, spec, columns):
+        table, shadow = spec.table, spec.shadow
+        self._execute(f"""
+            CREATE OR REPLACE FUNCTION public.{table}_mirror_to_partitioned()
+            RETURNS TRIGGER AS $$
+            DECLARE
+                r public.{table}%ROWTYPE;
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    DELETE FROM public.{shadow} WHERE id = OLD.id;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    r := NEW;
+                    INSERT INTO public.{shadow} ({', '.join(columns)})
+                    SELECT {self._select_list(spec, columns)}
+                    ON CONFLICT DO NOTHING;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+
+            DROP TRIGGER IF EXISTS trigger_{table}_mirror_to_partitioned ON public.{table};
+            CREATE TRIGGER trigger_{table}_mirror_to_partitioned
+                AFTER INSERT OR UPDATE OR DELETE ON public.{table}
+                FOR EACH ROW EXECUTE FUNCTION public.{table}_mirror_to_partitioned();
+        """)
+
+    def _backfill(self, spec, columns, batch_size):
+        table, shadow = spec.table, spec.shadow
+        copied = 0
+        last_id = None
+        started = time.perf_counter()
+        while True:
+            rows = self._fetch(f"""
+                WITH batch AS (
+                    SELECT * FROM public.{table} r
+                    WHERE %(last_id)s::uuid IS NULL OR r.id > %(last_id)s::uuid
+                    ORDER BY r.id
+                    LIMIT %(batch_size)s
+                    FOR SHARE
+                ), copied AS (
+                    INSERT INTO public.{shadow} ({', '.join(columns)})
+                    SELECT {self._select_list(spec, columns)} FROM batch r
+                    ON CONFLICT DO NOTHING
+                )
+                SELECT (SELECT id FROM batch ORDER BY id DESC LIMIT 1), (SELECT count(*) FROM batch)
+            """, {'last_id': last_id, 'batch_size': batch_size})
+            batch_last_id, batch_count = rows[0]
+            if not batch_count:
+                break
+            last_id = str(batch_last_id)
+            copied += batch_count
+            elapsed = time.perf_counter() - started
+            logger.info(f"Copied {copied} {table} rows ({copied / elapsed:.0f} rows/s)")
+        return copied
+
+    def _ranges(self, spec, batch_size):
+        """(lo, hi] id ranges of about batch_size rows covering the table; None is open"""
+        bounds = [None]
+        while True:
+            rows = self._fetch(
+                f"SELECT id FROM public.{spec.table} WHERE %(lo)s::uuid IS NULL OR id > %(lo)s::uuid "
+                f"ORDER BY id OFFSET %(skip)s LIMIT 1",
+                {'lo': bounds[-1], 'skip': batch_size - 1}
+            )
+            if not rows:
+                break
+            bounds.append(str(rows[0][0]))
+        return list(zip(bounds, bounds[1:] + [None]))
+
+    def _differing_ranges(self, spec, columns, ranges):
+        """
+        Ranges whose row count or checksum differ between the table and its
+        copy, each compared in one statement (one snapshot of both). The
+        partition key is left out: the copy fills it where it was NULL.
+        """
+        row = f"ROW({', '.join(f'r.{column}' for column in columns if column != spec.key)})::text"
+        in_range = ("(%(lo)s::uuid IS NULL OR r.id > %(lo)s::uuid) "
+                    "AND (%(hi)s::uuid IS NULL OR r.id <= %(hi)s::uuid)")
+        differing = []
+        for lo, hi in ranges:
+            (source, copy), = self._fetch(
+                f"SELECT (SELECT (count(*), COALESCE(sum(hashtext({row})::bigint), 0))::text "
+                f"        FROM public.{spec.table} r WHERE {in_range}), "
+                f"       (SELECT (count(*), COALESCE(sum(hashtext({row})::bigint), 0))::text "
+                f"        FROM public.{spec.shadow} r WHERE {in_range})",
+                {'lo': lo, 'hi': hi}
+            )
+            if source != copy:
+                differing.append((lo, hi))
+        return differing
+
+    def _recopy(self, spec, columns, lo, hi):
+        """Replace a range of the copy with the table's rows, locked against changes meanwhile"""
+        in_range = ("(%(lo)s::uuid IS NULL OR r.id > %(lo)s::uuid) "
+                    "AND (%(hi)s::uuid IS NULL OR r.id <= %(hi)s::uuid)")
+        self.connection.autocommit = False
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute(f"SET LOCAL lock_timeout = '{self.lock_timeout}'")
+                cursor.execute(f"SELECT 1 FROM public.{spec.table} r WHERE {in_range} FOR SHARE",
+                               {'lo': lo, 'hi': hi})
+                cursor.execute(f"DELETE FROM public.{spec.shadow} r WHERE {in_range}", {'lo': lo, 'hi': hi})
+                cursor.execute(
+                    f"INSERT INTO public.{spec.shadow} ({', '.join(columns)}) "
+                    f"SELECT {self._select_list(spec, columns)} FROM public.{spec.table} r WHERE {in_range} "
+                    f"ON CONFLICT DO NOTHING",
+                    {'lo': lo, 'hi': hi}
+                )
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        finally:
+            self.connection.autocommit = True
+
+    def _verify(self, spec, columns, batch_size):
+        """Check the copy against the table range by range, recopying ranges that differ"""
+        ranges = self._ranges(spec, batch_size)
+        for attempt in range(VERIFY_PASSES):
+            ranges = self._differing_ranges(spec, columns, ranges)
+            if not ranges:
+                logger.info(f"Verified {spec.shadow} against {spec.table}")
+                return
+            logger.warning(f"{len(ranges)} id range(s) of {spec.shadow} differ from {spec.table}; recopying")
+            for lo, hi in ranges:
+                self._recopy(spec, columns, lo, hi)
+        ranges = self._differing_ranges(spec, columns, ranges)
+        if ranges:
+            raise PartitionError(f"{spec.shadow} still differs from {spec.table} in {len(ranges)} id range(s) "
+                                 f"after {VERIFY_PASSES} recopies; not swapping")
+
+    def _swap(self, spec):
+        table, shadow, legacy = spec.table, spec.shadow, spec.legacy
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT tgname, pg_get_triggerdef(oid) FROM pg_trigger "
+                "WHERE tgrelid = to_regclass(%s) AND NOT tgisinternal AND tgname <> %s",
+                (f'public.{table}', f'trigger_{table}_mirror_to_partitioned')
+            )
+            triggers = cursor.fetchall()
+            cursor.execute(
+                "SELECT policyname, permissive, roles::text[], cmd, qual, with_check FROM pg_policies "
+                "WHERE schemaname = 'public' AND tablename = %s",
+                (table,)
+            )
+            policies = cursor.fetchall()
+            cursor.execute(
+                "SELECT indexname FROM pg_indexes WHERE schemaname = 'public' AND tablename = %s",
+                (shadow,)
+            )
+            shadow_indexes = [name for (name,) in cursor.fetchall() if name.endswith('_part')]
+            cursor.execute(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = to_regclass(%s)",
+                (f'public.{shadow}',)
+            )
+            shadow_partitions = [name for (name,) in cursor.fetchall() if name.startswith(f'{shadow}_p')]
+            cursor.execute(
+                "SELECT grantee, string_agg(privilege_type, ', ') FROM information_schema.role_table_grants "
+                "WHERE table_schema = 'public' AND table_name = %s AND grantee <> current_user GROUP BY grantee",
+                (table,)
+            )
+            grants = cursor.fetchall()
+
+        self.connection.autocommit = False
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute(f"SET LOCAL lock_timeout = '{self.lock_timeout}'")
+                cursor.execute(f"LOCK TABLE public.{table} IN ACCESS EXCLUSIVE MODE")
+                cursor.execute(f"DROP TRIGGER trigger_{table}_mirror_to_partitioned ON public.{table}")
+                cursor.execute(f"DROP FUNCTION public.{table}_mirror_to_partitioned()")
+
+                cursor.execute(f"ALTER TABLE public.{table} RENAME TO {legacy}")
+                cursor.execute(f"ALTER TABLE public.{shadow} RENAME TO {table}")
+                cursor.execute(f"ALTER TABLE public.{legacy} RENAME CONSTRAINT {table}_pkey TO {legacy}_pkey")
+                cursor.execute(f"ALTER TABLE public.{table} RENAME CONSTRAINT {shadow}_pkey TO {table}_pkey")
+                for name in shadow_indexes:
+                    original = name[:-len('_part')]
+                    cursor.execute(f"ALTER INDEX IF EXISTS public.{original} RENAME TO {original}_unpartitioned")
+                    cursor.execute(f"ALTER INDEX public.{name} RENAME TO {original}")
+                for name in shadow_partitions:
+                    cursor.execute(f"ALTER TABLE public.{name} RENAME TO {table}{name[len(shadow):]}")
+
+                # Definitions were read before the rename, so they name the new table
+                for name, definition in triggers:
+                    cursor.execute(f"DROP TRIGGER {name} ON public.{legacy}")
+                    cursor.execute(definition)
+
+                for grantee, privileges in grants:
+                    grantee = grantee if grantee == 'PUBLIC' else f'"{grantee}"'
+                    cursor.execute(f'GRANT {privileges} ON public.{table} TO {grantee}')
+
+                for name, permissive, roles, command, qual, with_check in policies:
+                    cursor.execute(f'DROP POLICY "{name}" ON public.{legacy}')
+                    statement = (f'CREATE POLICY "{name}" ON public.{table} AS {permissive} FOR {command} '
+                                 f'TO {", ".join(roles)}')
+                    if qual:
+                        statement += f' USING ({qual})'
+                    if with_check:
+                        statement += f' WITH CHECK ({with_check})'
+                    cursor.execute(statement)
+
+                for statement in spec.fk_fixups:
+                    cursor.execute(statement)
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+        finally:
+            self.connection.autocommit = True
+
+        # Validating outside the swap keeps the exclusive lock short
+        for statement in spec.fk_fixups:
+            match = re.search(r'ADD CONSTRAINT (\w+) .* NOT VALID$', statement)
+            if match:
+                referencing = re.search(r'ALTER TABLE ([\w.]+)', statement).group(1)
+                self._execute(f"ALTER TABLE {referencing} VALIDATE CONSTRAINT {match.group(1)}")
+
+    def convert(self, spec, batch_size=50000):
+        """Convert a regular table into a monthly range-partitioned one, online"""
+        if self.is_partitioned(spec.table):
+            logger.info(f"{spec.table} is already partitioned")
+            return 0
+
+        columns = self._columns(spec.table)
+        logger.info(f"Creating {spec.shadow}")
+        self._create_shadow(spec)
+
+        oldest = self._fetch(f"SELECT min({spec.key_fill})::date FROM public.{spec.table} r")[0][0]
+        self.ensure_partitions(spec, from_month=oldest or date.today(), table=spec.shadow)
+        self._execute(f"CREATE TABLE IF NOT EXISTS public.{spec.table}_default "
+                      f"PARTITION OF public.{spec.shadow} DEFAULT")
+
+        self._install_mirror(spec, columns)
+        copied = self._backfill(spec, columns, batch_size)
+        self._verify(spec, columns, batch_size)
+        logger.info(f"Swapping {spec.table} for its partitioned copy ({copied} rows)")
+        self._swap(spec)
+        self._execute(f"ANALYZE public.{spec.table}")
+        logger.info(f"{spec.table} is now partitioned by month on {spec.key}; "
+                    f"drop public.{spec.legacy} once verified")
+        return copied
+
+
+def main(argv=None):
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Partition maintenance for orders and analytics_data")
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'),
+                        help='direct Postgres connection string (default: $DATABASE_URL)')
+    parser.add_argument('--months-ahead', type=int, default=int(os.environ.get('PARTITION_MONTHS_AHEAD', 3)))
+    commands = parser.add_subparsers(dest='command', required=True)
+    convert = commands.add_parser('convert', help='convert a table to monthly partitions online')
+    convert.add_argument('table', choices=sorted(PARTITIONED_TABLES))
+    convert.add_argument('--batch-size', type=int, default=50000)
+    maintain = commands.add_parser('maintain', help='create upcoming partitions and apply retention')
+    maintain.add_argument('--drop', action='store_true', help='drop expired partitions instead of detaching')
+    args = parser.parse_args(argv)
+    if not args.database_url:
+        parser.error('--database-url or DATABASE_URL is required')
+
+    import psycopg2
+
+    manager = PartitionManager(psycopg2.connect(args.database_url), months_ahead=args.months_ahead)
+    try:
+        if args.command == 'convert':
+            manager.convert(PARTITIONED_TABLES[args.table], batch_size=args.batch_size)
+        else:
+            manager.maintain(drop=args.drop)
+    except PartitionError as e:
+        logger.error(str(e))
+        return 1
+    finally:
+        manager.connection.close()
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""
+Bounded keep-alive HTTP connection pool for Supabase clients.
+
+supabase-py builds a fresh httpx session per client with default limits
+and no visibility into how it behaves under load. PooledTransport wraps a
+single httpx transport per worker process: a semaphore caps concurrent
+requests at the pool size, idle connections are kept alive for reuse
+(avoiding a TLS handshake per burst), and every request updates the
+counters in PoolMetrics.
+
+Reference: https://www.python-httpx.org/advanced/resource-limits/
+"""
+
+import sys
+import threading
+import time
+
+import httpx
+
+
+# Callables invoked as observer(request, status_code, seconds) after each
+# pooled request; status_code is None when the request raised
+request_observers = []
+
+# Request metrics time Supabase calls without importing this module at
+# startup: when they are already loaded, register with them here (they
+# ignore requests until an app enables them)
+_metrics = sys.modules.get('src.services.metrics')
+if _metrics is not None:
+    request_observers.append(_metrics.request_metrics.observe_supabase)
+
+
+class PoolExhaustedError(httpx.PoolTimeout):
+    """Raised when no pooled connection frees up within the acquire timeout"""
+
+
+class PoolMetrics:
+    """Thread-safe counters describing pool usage"""
+
+    def __init__(self, pool_size):
+        self._lock = threading.Lock()
+        self.pool_size = pool_size
+        self.in_flight = 0
+        self.requests_total = 0
+        self.errors_total = 0
+        self.errors_by_type = {}
+        self.pool_timeouts = 0
+        self.acquire_wait_total = 0.0
+        self.acquire_wait_max = 0.0
+        self.request_time_total = 0.0
+
+    def record_acquired(self, waited):
+        with self._lock:
+            self.in_flight += 1
+            self.requests_total += 1
+            self.acquire_wait_total += waited
+            self.acquire_wait_max = max(self.acquire_wait_max, waited)
+
+    def record_released(self, elapsed):
+        with self._lock:
+            self.in_flight -= 1
+            self.request_time_total += elapsed
+
+    def record_error(self, error_type):
+        with self._lock:
+            self.errors_total += 1
+            self.errors_by_type[error_type] = self.errors_by_type.get(error_type, 0) + 1
+            if error_type == PoolExhaustedError.__name__:
+                self.pool_timeouts += 1
+
+    def to_dict(self):
+        with self._lock:
+            completed = self.requests_total - self.in_flight
+            return {
+                'pool_size': self.pool_size,
+                'in_flight': self.in_flight,
+                'requests_total': self.requests_total,
+                'errors_total': self.errors_total,
+                'errors_by_type': dict(self.errors_by_type),
+                'pool_timeouts': self.pool_timeouts,
+                'acquire_wait_seconds_total': round(self.acquire_wait_total, 6),
+                'acquire_wait_seconds_max': round(self.acquire_wait_max, 6),
+                'acquire_wait_seconds_avg': round(self.acquire_wait_total / self.requests_total, 6)
+                if self.requests_total else 0.0,
+                'request_seconds_avg': round(self.request_time_total / completed, 6) if completed else 0.0
+            }
+
+
+class PooledTransport(httpx.BaseTransport):
+    """
+    httpx transport with a bounded number of keep-alive connections.
+
+    Shared by every Supabase client in a worker so the per-process
+    connection count stays at `pool_size` however many clients exist.
+    """
+
+    def __init__(self, pool_size=10, acquire_timeout=5.0, keepalive_expiry=60.0, transport=None):
+        self.pool_size = pool_size
+        self.acquire_timeout = acquire_timeout
+        self.metrics = PoolMetrics(pool_size)
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._transport = transport or httpx.HTTPTransport(
+            limits=httpx.Limits(
+                max_connections=pool_size,
+                max_keepalive_connections=pool_size,
+                keepalive_expiry=keepalive_expiry
+            )
+        )
+
+    def handle_request(self, request):
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            error = PoolExhaustedError(
+                f"No Supabase connection available after {self.acquire_timeout}s "
+                f"(pool size {self.pool_size})",
+                request=request
+            )
+            self.metrics.record_error(type(error).__name__)
+            raise error
+
+        acquired = time.perf_counter()
+        self.metrics.record_acquired(acquired - started)
+        status_code = None
+        try:
+            response = self._transport.handle_request(request)
+            # Read the body while holding the slot so the connection returns
+            # to the pool before another request can claim it
+            response.read()
+            status_code = response.status_code
+            if response.status_code >= 500:
+                self.metrics.record_error(f'HTTP{response.status_code}')
+            return response
+        except Exception as e:
+            self.metrics.record_error(type(e).__name__)
+            raise
+        finally:
+            elapsed = time.perf_counter() - acquired
+            self.metrics.record_released(elapsed)
+            self._slots.release()
+            for observer in request_observers:
+                observer(request, status_code, elapsed)
+
+    def close(self):
+        self._transport.close()
@@ -3,6 +3,10 @@ Supabase database schema definitions for KSAP platform
 These are the SQL commands to create tables in Supabase
 """
 
+import os
+
+from .migrations import Migration, MigrationRunner, PsycopgExecutor, SupabaseRpcExecutor
+
 # Users table (extends Supabase auth.users)
 USERS_TABLE = """
 CREATE TABLE IF NOT EXISTS public.users (
@@ -517,6 +521,1100 @@ CREATE TRIGGER trigger_ad_campaigns_updated_at
     FOR EACH ROW EXECUTE FUNCTION handle_updated_at();
 """
 
+# Store ownership helper and RLS policies that use it.
+# The original policies ran an EXISTS subquery against stores for every
+# row (and an orders-stores join for order_items). The helper is STABLE and
+# used as an uncorrelated IN (SELECT ...), so Postgres evaluates it once per
+# statement into a hashed set; order_items carries a denormalized store_id,
+# kept in sync by a trigger, so its policy no longer touches orders. The
+# column is added nullable here; existing items are backfilled, and it is
+# indexed and made NOT NULL, by the next (concurrent) migration.
+# Reference: https://supabase.com/docs/guides/database/postgres/row-level-security#rls-performance-recommendations
+RLS_OWNERSHIP_OPTIMIZATION = """
+-- Store ids owned by the current user. SECURITY DEFINER skips RLS on
+-- stores itself; the empty search_path prevents object hijacking.
+CREATE OR REPLACE FUNCTION public.owned_store_ids()
+RETURNS SETOF uuid
+LANGUAGE sql
+STABLE
+ROWS 10
+SECURITY DEFINER
+SET search_path = ''
+AS $$
+    SELECT id FROM public.stores WHERE user_id = auth.uid();
+$$;
+
+REVOKE ALL ON FUNCTION public.owned_store_ids() FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION public.owned_store_ids() TO authenticated;
+
+-- Denormalized owner column for order_items
+ALTER TABLE public.order_items ADD COLUMN IF NOT EXISTS store_id UUID REFERENCES public.stores(id) ON DELETE CASCADE;
+
+CREATE OR REPLACE FUNCTION public.set_order_item_store_id()
+RETURNS TRIGGER AS $$
+BEGIN
+    SELECT orders.store_id INTO NEW.store_id FROM public.orders WHERE orders.id = NEW.order_id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trigger_order_items_store_id
+    BEFORE INSERT OR UPDATE OF order_id ON public.order_items
+    FOR EACH ROW EXECUTE FUNCTION public.set_order_item_store_id();
+
+-- Orders never move between stores in practice, but keep items consistent if they do
+CREATE OR REPLACE FUNCTION public.sync_order_items_store_id()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE public.order_items SET store_id = NEW.store_id WHERE order_id = NEW.id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trigger_orders_sync_item_store_id
+    AFTER UPDATE OF store_id ON public.orders
+    FOR EACH ROW WHEN (OLD.store_id IS DISTINCT FROM NEW.store_id)
+    EXECUTE FUNCTION public.sync_order_items_store_id();
+
+-- Products
+DROP POLICY IF EXISTS "Users can view own store products" ON public.products;
+DROP POLICY IF EXISTS "Users can insert products to own stores" ON public.products;
+DROP POLICY IF EXISTS "Users can update own store products" ON public.products;
+DROP POLICY IF EXISTS "Users can delete own store products" ON public.products;
+
+CREATE POLICY "Users can view own store products" ON public.products
+    FOR SELECT USING (store_id IN (SELECT public.owned_store_ids()));
+
+CREATE POLICY "Users can insert products to own stores" ON public.products
+    FOR INSERT WITH CHECK (store_id IN (SELECT public.owned_store_ids()));
+
+CREATE POLICY "Users can update own store products" ON public.products
+    FOR UPDATE USING (store_id IN (SELECT public.owned_store_ids()));
+
+CREATE POLICY "Users can delete own store products" ON public.products
+    FOR DELETE USING (store_id IN (SELECT public.owned_store_ids()));
+
+-- Orders
+DROP POLICY IF EXISTS "Users can view own store orders" ON public.orders;
+DROP POLICY IF EXISTS "Users can insert orders to own stores" ON public.orders;
+DROP POLICY IF EXISTS "Users can update own store orders" ON public.orders;
+
+CREATE POLICY "Users can view own store orders" ON public.orders
+    FOR SELECT USING (store_id IN (SELECT public.owned_store_ids()));
+
+CREATE POLICY "Users can insert orders to own stores" ON public.orders
+    FOR INSERT WITH CHECK (store_id IN (SELECT public.owned_store_ids()));
+
+CREATE POLICY "Users can update own store orders" ON public.orders
+    FOR UPDATE USING (store_id IN (SELECT public.owned_store_ids()));
+
+-- Analytics data (same per-row EXISTS pattern)
+DROP POLICY IF EXISTS "Users can view own store analytics" ON public.analytics_data;
+DROP POLICY IF EXISTS "Users can insert analytics to own stores" ON public.analytics_data;
+
+CREATE POLICY "Users can view own store analytics" ON public.analytics_data
+    FOR SELECT USING (store_id IN (SELECT public.owned_store_ids()));
+
+CREATE POLICY "Users can insert analytics to own stores" ON public.analytics_data
+    FOR INSERT WITH CHECK (store_id IN (SELECT public.owned_store_ids()));
+"""
+
+# Second half of the order_items ownership change, run statement by
+# statement outside a transaction so no step holds a long lock on
+# order_items:
+# - existing items get their store_id in keyset batches of 5000 ids, each
+#   committed on its own (the trigger already fills new items)
+# - NOT NULL is proven by a NOT VALID check constraint validated without
+#   blocking writes, after which SET NOT NULL skips the table scan
+# - indexes are built concurrently
+# - the order_items policies switch to store_id once every row has one
+# Every statement is idempotent, so a failed run can simply be retried.
+# Reference: https://www.postgresql.org/docs/current/sql-altertable.html#SQL-ALTERTABLE-NOTES
+ORDER_ITEMS_STORE_ID_BACKFILL = [
+    """
+DO $$
+DECLARE
+    last_id UUID;
+    batch_last UUID;
+BEGIN
+    LOOP
+        WITH batch AS (
+            SELECT id FROM public.order_items
+            WHERE last_id IS NULL OR id > last_id
+            ORDER BY id
+            LIMIT 5000
+        ), updated AS (
+            UPDATE public.order_items
+            SET store_id = orders.store_id
+            FROM batch, public.orders
+            WHERE order_items.id = batch.id
+                AND orders.id = order_items.order_id
+                AND order_items.store_id IS NULL
+        )
+        SELECT id INTO batch_last FROM batch ORDER BY id DESC LIMIT 1;
+        EXIT WHEN batch_last IS NULL;
+        last_id := batch_last;
+        COMMIT;
+    END LOOP;
+END;
+$$
+""",
+    """
+DO $$
+BEGIN
+    SET LOCAL lock_timeout = '5s';
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_catalog.pg_attribute
+        WHERE attrelid = 'public.order_items'::regclass AND attname = 'store_id' AND attnotnull
+    ) AND NOT EXISTS (
+        SELECT 1 FROM pg_catalog.pg_constraint
+        WHERE conrelid = 'public.order_items'::regclass AND conname = 'order_items_store_id_not_null'
+    ) THEN
+        ALTER TABLE public.order_items
+            ADD CONSTRAINT order_items_store_id_not_null CHECK (store_id IS NOT NULL) NOT VALID;
+    END IF;
+END;
+$$
+""",
+    """
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM pg_catalog.pg_constraint
+        WHERE conrelid = 'public.order_items'::regclass AND conname = 'order_items_store_id_not_null'
+    ) THEN
+        ALTER TABLE public.order_items VALIDATE CONSTRAINT order_items_store_id_not_null;
+    END IF;
+END;
+$$
+""",
+    """
+DO $$
+BEGIN
+    SET LOCAL lock_timeout = '5s';
+    ALTER TABLE public.order_items ALTER COLUMN store_id SET NOT NULL;
+    ALTER TABLE public.order_items DROP CONSTRAINT IF EXISTS order_items_store_id_not_null;
+END;
+$$
+""",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_order_items_store_id ON public.order_items(store_id)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_order_items_order_id ON public.order_items(order_id)",
+    """
+DO $$
+BEGIN
+    SET LOCAL lock_timeout = '5s';
+    DROP POLICY IF EXISTS "Users can view own store order items" ON public.order_items;
+    DROP POLICY IF EXISTS "Users can insert order items to own store orders" ON public.order_items;
+    DROP POLICY IF EXISTS "Users can update own store order items" ON public.order_items;
+
+    CREATE POLICY "Users can view own store order items" ON public.order_items
+        FOR SELECT USING (store_id IN (SELECT public.owned_store_ids()));
+
+    CREATE POLICY "Users can insert order items to own store orders" ON public.order_items
+        FOR INSERT WITH CHECK (store_id IN (SELECT public.owned_store_ids()));
+
+    CREATE POLICY "Users can update own store order items" ON public.order_items
+        FOR UPDATE USING (store_id IN (SELECT public.owned_store_ids()));
+END;
+$$
+""",
+]
+
+# Incremental analytics rollups.
+# Writes to analytics_data queue the (store, day) pairs they touch; the
+# refresh function recomputes only those days and the weeks/months that
+# contain them, so dashboards read small pre-aggregated rows instead of
+# scanning raw metrics on every request.
+ANALYTICS_ROLLUPS = """
+CREATE TABLE IF NOT EXISTS public.analytics_rollups (
+    store_id UUID REFERENCES public.stores(id) ON DELETE CASCADE NOT NULL,
+    metric_type VARCHAR(100) NOT NULL,
+    metric_name VARCHAR(100) NOT NULL DEFAULT '',
+    period VARCHAR(10) NOT NULL, -- 'day', 'week', 'month'
+    period_start DATE NOT NULL,
+    value_sum DECIMAL(20,4) NOT NULL,
+    value_count BIGINT NOT NULL,
+    value_min DECIMAL(15,4),
+    value_max DECIMAL(15,4),
+    refreshed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (store_id, metric_type, period, period_start, metric_name)
+);
+
+-- (store, day) pairs whose raw rows changed since the last refresh
+CREATE TABLE IF NOT EXISTS public.analytics_rollup_queue (
+    store_id UUID NOT NULL,
+    date_recorded DATE NOT NULL,
+    queued_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (store_id, date_recorded)
+);
+
+-- Enable RLS
+ALTER TABLE public.analytics_rollups ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.analytics_rollup_queue ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view own store analytics rollups" ON public.analytics_rollups
+    FOR SELECT USING (store_id IN (SELECT public.owned_store_ids()));
+
+CREATE OR REPLACE FUNCTION public.queue_analytics_rollup_days()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = ''
+AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO public.analytics_rollup_queue (store_id, date_recorded)
+        SELECT DISTINCT store_id, date_recorded FROM new_rows WHERE date_recorded IS NOT NULL
+        ON CONFLICT DO NOTHING;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO public.analytics_rollup_queue (store_id, date_recorded)
+        SELECT DISTINCT store_id, date_recorded FROM old_rows WHERE date_recorded IS NOT NULL
+        ON CONFLICT DO NOTHING;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Statement-level triggers: one queue insert per statement, not per row
+CREATE TRIGGER trigger_analytics_rollup_insert
+    AFTER INSERT ON public.analytics_data
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION public.queue_analytics_rollup_days();
+
+CREATE TRIGGER trigger_analytics_rollup_update
+    AFTER UPDATE ON public.analytics_data
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION public.queue_analytics_rollup_days();
+
+CREATE TRIGGER trigger_analytics_rollup_delete
+    AFTER DELETE ON public.analytics_data
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION public.queue_analytics_rollup_days();
+
+-- Recompute rollups for up to batch_size queued days; returns days refreshed.
+-- SKIP LOCKED lets several refreshers run without blocking each other.
+CREATE OR REPLACE FUNCTION public.refresh_analytics_rollups(batch_size INTEGER DEFAULT 5000)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = ''
+AS $$
+DECLARE
+    claimed_stores UUID[];
+    claimed_days DATE[];
+BEGIN
+    WITH claimed AS (
+        DELETE FROM public.analytics_rollup_queue q
+        USING (
+            SELECT store_id, date_recorded FROM public.analytics_rollup_queue
+            ORDER BY queued_at
+            LIMIT batch_size
+            FOR UPDATE SKIP LOCKED
+        ) batch
+        WHERE q.store_id = batch.store_id AND q.date_recorded = batch.date_recorded
+        RETURNING q.store_id, q.date_recorded
+    )
+    SELECT array_agg(store_id), array_agg(date_recorded) INTO claimed_stores, claimed_days FROM claimed;
+
+    IF claimed_stores IS NULL THEN
+        RETURN 0;
+    END IF;
+
+    -- Daily rollups straight from raw rows
+    DELETE FROM public.analytics_rollups r
+    USING unnest(claimed_stores, claimed_days) AS d(store_id, day)
+    WHERE r.period = 'day' AND r.store_id = d.store_id AND r.period_start = d.day;
+
+    INSERT INTO public.analytics_rollups
+        (store_id, metric_type, metric_name, period, period_start, value_sum, value_count, value_min, value_max)
+    SELECT a.store_id, COALESCE(a.metric_type, ''), COALESCE(a.metric_name, ''), 'day', a.date_recorded,
+           COALESCE(SUM(a.value), 0), COUNT(*), MIN(a.value), MAX(a.value)
+    FROM unnest(claimed_stores, claimed_days) AS d(store_id, day)
+    JOIN public.analytics_data a ON a.store_id = d.store_id AND a.date_recorded = d.day
+    GROUP BY a.store_id, COALESCE(a.metric_type, ''), COALESCE(a.metric_name, ''), a.date_recorded;
+
+    -- Weeks and months containing a refreshed day, rebuilt from daily rollups
+    CREATE TEMP TABLE IF NOT EXISTS pg_temp.rollup_buckets (
+        store_id UUID, period VARCHAR(10), period_start DATE, period_end DATE
+    ) ON COMMIT DROP;
+    TRUNCATE pg_temp.rollup_buckets;
+
+    INSERT INTO pg_temp.rollup_buckets
+    SELECT DISTINCT d.store_id, p.period, date_trunc(p.period, d.day)::date,
+           (date_trunc(p.period, d.day) + ('1 ' || p.period)::interval)::date
+    FROM unnest(claimed_stores, claimed_days) AS d(store_id, day)
+    CROSS JOIN (VALUES ('week'), ('month')) AS p(period);
+
+    DELETE FROM public.analytics_rollups r
+    USING pg_temp.rollup_buckets b
+    WHERE r.store_id = b.store_id AND r.period = b.period AND r.period_start = b.period_start;
+
+    INSERT INTO public.analytics_rollups
+        (store_id, metric_type, metric_name, period, period_start, value_sum, value_count, value_min, value_max)
+    SELECT b.store_id, r.metric_type, r.metric_name, b.period, b.period_start,
+           SUM(r.value_sum), SUM(r.value_count), MIN(r.value_min), MAX(r.value_max)
+    FROM pg_temp.rollup_buckets b
+    JOIN public.analytics_rollups r
+        ON r.store_id = b.store_id AND r.period = 'day'
+        AND r.period_start >= b.period_start AND r.period_start < b.period_end
+    GROUP BY b.store_id, r.metric_type, r.metric_name, b.period, b.period_start;
+
+    RETURN array_length(claimed_stores, 1);
+END;
+$$;
+
+REVOKE ALL ON FUNCTION public.refresh_analytics_rollups(INTEGER) FROM PUBLIC;
+
+-- Queue every existing day so the first refresh builds the rollups
+INSERT INTO public.analytics_rollup_queue (store_id, date_recorded)
+SELECT DISTINCT store_id, date_recorded FROM public.analytics_data WHERE date_recorded IS NOT NULL
+ON CONFLICT DO NOTHING;
+"""
+
+# Composite index for the raw-data fallback path of analytics reads
+ANALYTICS_STORE_METRIC_DATE_INDEX = """
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_analytics_store_metric_date
+    ON public.analytics_data(store_id, metric_type, date_recorded);
+"""
+
+# Monthly range partitioning support for orders and analytics_data.
+# The tables are converted online by `python -m src.database.partitioning
+# convert <table>`; this migration only installs what the conversion and
+# the maintenance job rely on:
+# - ensure_monthly_partitions() creates <table>_pYYYYMM partitions ahead
+#   of time so new rows never land in the default partition
+# - order_items.order_created_at, so order items can keep a cascading
+#   foreign key to a partitioned orders table, whose primary key must
+#   include the partition key (id, created_at); existing items are
+#   backfilled by the next migration
+# Reference: https://www.postgresql.org/docs/current/ddl-partitioning.html
+PARTITIONING_SUPPORT = """
+CREATE OR REPLACE FUNCTION public.ensure_monthly_partitions(
+    parent_table TEXT,
+    from_month DATE DEFAULT CURRENT_DATE,
+    months_ahead INTEGER DEFAULT 3
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SET search_path = ''
+AS $$
+DECLARE
+    month_start DATE := date_trunc('month', from_month)::date;
+    last_month DATE := (date_trunc('month', CURRENT_DATE) + make_interval(months => months_ahead))::date;
+    partition_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_catalog.pg_partitioned_table
+        WHERE partrelid = to_regclass(format('public.%I', parent_table))
+    ) THEN
+        RETURN 0;
+    END IF;
+
+    WHILE month_start <= last_month LOOP
+        partition_name := parent_table || '_p' || to_char(month_start, 'YYYYMM');
+        IF to_regclass(format('public.%I', partition_name)) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE public.%I PARTITION OF public.%I FOR VALUES FROM (%L) TO (%L)',
+                partition_name, parent_table, month_start, (month_start + interval '1 month')::date
+            );
+            created := created + 1;
+        END IF;
+        month_start := (month_start + interval '1 month')::date;
+    END LOOP;
+
+    RETURN created;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION public.ensure_monthly_partitions(TEXT, DATE, INTEGER) FROM PUBLIC;
+
+-- Partition key of the parent order, carried by each item
+ALTER TABLE public.order_items ADD COLUMN IF NOT EXISTS order_created_at TIMESTAMP WITH TIME ZONE;
+
+CREATE OR REPLACE FUNCTION public.set_order_item_store_id()
+RETURNS TRIGGER AS $$
+BEGIN
+    SELECT orders.store_id, orders.created_at INTO NEW.store_id, NEW.order_created_at
+    FROM public.orders WHERE orders.id = NEW.order_id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION public.sync_order_items_store_id()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE public.order_items SET store_id = NEW.store_id, order_created_at = NEW.created_at
+    WHERE order_id = NEW.id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_orders_sync_item_store_id ON public.orders;
+CREATE TRIGGER trigger_orders_sync_item_store_id
+    AFTER UPDATE OF store_id, created_at ON public.orders
+    FOR EACH ROW WHEN (OLD.store_id IS DISTINCT FROM NEW.store_id OR OLD.created_at IS DISTINCT FROM NEW.created_at)
+    EXECUTE FUNCTION public.sync_order_items_store_id();
+
+-- Partition keys cannot be NULL in the primary key; give them defaults
+ALTER TABLE public.analytics_data ALTER COLUMN date_recorded SET DEFAULT CURRENT_DATE;
+"""
+
+# Copies each order's created_at onto its existing items in committed
+# keyset batches (see ORDER_ITEMS_STORE_ID_BACKFILL); the triggers keep new
+# and moved items in sync. Run before converting orders to partitions.
+ORDER_ITEMS_ORDER_CREATED_AT_BACKFILL = [
+    """
+DO $$
+DECLARE
+    last_id UUID;
+    batch_last UUID;
+BEGIN
+    LOOP
+        WITH batch AS (
+            SELECT id FROM public.order_items
+            WHERE last_id IS NULL OR id > last_id
+            ORDER BY id
+            LIMIT 5000
+        ), updated AS (
+            UPDATE public.order_items
+            SET order_created_at = orders.created_at
+            FROM batch, public.orders
+            WHERE order_items.id = batch.id
+                AND orders.id = order_items.order_id
+                AND order_items.order_created_at IS NULL
+        )
+        SELECT id INTO batch_last FROM batch ORDER BY id DESC LIMIT 1;
+        EXIT WHEN batch_last IS NULL;
+        last_id := batch_last;
+        COMMIT;
+    END LOOP;
+END;
+$$
+""",
+]
+
+# Natural key for platform orders; bulk ingestion upserts on it.
+# NULL platform_order_id (manual orders) stays allowed and never conflicts.
+# Fails if duplicates already exist; resolve them and re-run the migration.
+ORDERS_PLATFORM_ORDER_ID_INDEX = """
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_store_platform_order
+    ON public.orders(store_id, platform_order_id);
+"""
+
+# Product search: a maintained tsvector plus trigram matching for typos
+# and partial SKUs. The vector is computed by one IMMUTABLE function used
+# by both the trigger and the backfill. Existing rows are backfilled and
+# the GIN indexes built concurrently by the next two migrations.
+# Reference: https://www.postgresql.org/docs/current/textsearch-controls.html
+PRODUCT_SEARCH = """
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE public.products ADD COLUMN IF NOT EXISTS search_vector tsvector;
+
+CREATE OR REPLACE FUNCTION public.product_search_vector(
+    title TEXT,
+    description TEXT,
+    vendor TEXT,
+    product_type TEXT,
+    tags JSONB
+)
+RETURNS tsvector
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT setweight(to_tsvector('english'::regconfig, coalesce(title, '')), 'A')
+        || setweight(to_tsvector('english'::regconfig, coalesce(vendor, '') || ' ' || coalesce(product_type, '')), 'B')
+        || setweight(jsonb_to_tsvector('english'::regconfig, coalesce(tags, '[]'::jsonb), '["string"]'), 'B')
+        || setweight(to_tsvector('english'::regconfig, coalesce(description, '')), 'D');
+$$;
+
+CREATE OR REPLACE FUNCTION public.set_product_search_vector()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.search_vector := public.product_search_vector(
+        NEW.title, NEW.description, NEW.vendor, NEW.product_type, NEW.tags
+    );
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_products_search_vector ON public.products;
+CREATE TRIGGER trigger_products_search_vector
+    BEFORE INSERT OR UPDATE OF title, description, vendor, product_type, tags ON public.products
+    FOR EACH ROW EXECUTE FUNCTION public.set_product_search_vector();
+
+-- Updates that don't change what a row says (backfills) set
+-- ksap.skip_updated_at for their transaction, so updated_at, which drives
+-- cache validators, keeps its value
+CREATE OR REPLACE FUNCTION handle_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF current_setting('ksap.skip_updated_at', true) = 'on' THEN
+        RETURN NEW;
+    END IF;
+    NEW.updated_at = CURRENT_TIMESTAMP;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# Fills search_vector for existing products in committed keyset batches
+# (see ORDER_ITEMS_STORE_ID_BACKFILL). Triggers stay enabled: each batch
+# sets ksap.skip_updated_at for its own transaction only.
+PRODUCT_SEARCH_BACKFILL = [
+    """
+DO $$
+DECLARE
+    last_id UUID;
+    batch_last UUID;
+BEGIN
+    LOOP
+        PERFORM set_config('ksap.skip_updated_at', 'on', true);
+        WITH batch AS (
+            SELECT id FROM public.products
+            WHERE last_id IS NULL OR id > last_id
+            ORDER BY id
+            LIMIT 5000
+        ), updated AS (
+            UPDATE public.products
+            SET search_vector = public.product_search_vector(title, description, vendor, product_type, tags)
+            FROM batch
+            WHERE products.id = batch.id AND products.search_vector IS NULL
+        )
+        SELECT id INTO batch_last FROM batch ORDER BY id DESC LIMIT 1;
+        EXIT WHEN batch_last IS NULL;
+        last_id := batch_last;
+        COMMIT;
+    END LOOP;
+END;
+$$
+""",
+]
+
+PRODUCT_SEARCH_INDEXES = """
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_products_search_vector
+    ON public.products USING gin (search_vector);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_products_title_trgm
+    ON public.products USING gin (title gin_trgm_ops);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_products_sku_trgm
+    ON public.products USING gin (sku gin_trgm_ops);
+"""
+
+# Conditional GETs validate a store's products with max(updated_at)
+# and count(*); both become index-only lookups
+PRODUCTS_STORE_UPDATED_AT_INDEX = """
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_products_store_updated_at
+    ON public.products(store_id, updated_at);
+"""
+
+# Proxy health checks (src.services.proxy_checker) record latency and pick
+# the stalest active proxies first
+PROXY_HEALTH = """
+ALTER TABLE public.proxies ADD COLUMN IF NOT EXISTS latency_ms INTEGER;
+CREATE INDEX IF NOT EXISTS idx_proxies_active_last_tested
+    ON public.proxies(last_tested NULLS FIRST) WHERE is_active;
+"""
+
+# The token refresh scheduler (src.services.token_refresh) reads active
+# accounts expiring soon
+SOCIAL_ACCOUNTS_TOKEN_EXPIRY_INDEX = """
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_social_accounts_token_expires_at
+    ON public.social_media_accounts(token_expires_at) WHERE status = 'active';
+"""
+
+# Incremental platform sync (src.services.platform_sync): one updated_since
+# cursor per store and resource
+STORE_SYNC_STATE = """
+CREATE TABLE IF NOT EXISTS public.store_sync_state (
+    store_id UUID REFERENCES public.stores(id) ON DELETE CASCADE NOT NULL,
+    resource VARCHAR(20) NOT NULL, -- 'products', 'orders'
+    updated_since TIMESTAMP WITH TIME ZONE,
+    last_attempted_at TIMESTAMP WITH TIME ZONE,
+    last_synced_at TIMESTAMP WITH TIME ZONE,
+    last_error TEXT,
+    PRIMARY KEY (store_id, resource)
+);
+
+-- Enable RLS
+ALTER TABLE public.store_sync_state ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view own store sync state" ON public.store_sync_state
+    FOR SELECT USING (store_id IN (SELECT public.owned_store_ids()));
+"""
+
+# Synced products are upserted on their platform id (NULLs stay distinct,
+# so manually created products are unaffected)
+PRODUCTS_PLATFORM_PRODUCT_ID_INDEX = """
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_products_store_platform_product
+    ON public.products(store_id, platform_product_id);
+"""
+
+# Payment transactions (the Transaction model), written by the webhook
+# consumer (src.services.payment_webhooks) keyed on the provider's ID
+TRANSACTIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS public.transactions (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    payment_processor_id UUID REFERENCES public.payment_processors(id) ON DELETE CASCADE NOT NULL,
+    order_id UUID, -- no foreign key: orders may be partitioned (see PARTITIONING_SUPPORT)
+    platform_transaction_id VARCHAR(255),
+    type VARCHAR(50), -- 'payment', 'refund', 'chargeback', 'fee'
+    amount DECIMAL(10,2) NOT NULL,
+    currency VARCHAR(3) DEFAULT 'USD',
+    status VARCHAR(50), -- 'pending', 'completed', 'failed', 'cancelled'
+    gateway_response JSONB,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_processor_platform_transaction
+    ON public.transactions(payment_processor_id, platform_transaction_id);
+CREATE INDEX IF NOT EXISTS idx_transactions_order_id ON public.transactions(order_id);
+CREATE INDEX IF NOT EXISTS idx_transactions_created_at ON public.transactions(created_at);
+
+-- Enable RLS
+ALTER TABLE public.transactions ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view own transactions" ON public.transactions
+    FOR SELECT USING (
+        payment_processor_id IN (SELECT id FROM public.payment_processors WHERE user_id = auth.uid())
+    );
+"""
+
+# Webhook inbox: one row per provider event, so retried deliveries are
+# recognized and applied once
+PAYMENT_WEBHOOK_EVENTS = """
+CREATE TABLE IF NOT EXISTS public.payment_webhook_events (
+    payment_processor_id UUID REFERENCES public.payment_processors(id) ON DELETE CASCADE NOT NULL,
+    event_id VARCHAR(255) NOT NULL,
+    event_type VARCHAR(100),
+    payload JSONB NOT NULL,
+    received_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    processed_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    error TEXT,
+    PRIMARY KEY (payment_processor_id, event_id)
+);
+
+-- Enable RLS
+ALTER TABLE public.payment_webhook_events ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view own payment webhook events" ON public.payment_webhook_events
+    FOR SELECT USING (
+        payment_processor_id IN (SELECT id FROM public.payment_processors WHERE user_id = auth.uid())
+    );
+"""
+
+# Inventory holds taken at checkout (src.services.inventory); stock is
+# decremented when a hold is taken and returned when it is released or expires
+INVENTORY_RESERVATIONS = """
+CREATE TABLE IF NOT EXISTS public.inventory_reservations (
+    reservation_id UUID NOT NULL,
+    product_id UUID REFERENCES public.products(id) ON DELETE CASCADE NOT NULL,
+    store_id UUID REFERENCES public.stores(id) ON DELETE CASCADE NOT NULL,
+    quantity INTEGER NOT NULL CHECK (quantity > 0),
+    stock_taken BOOLEAN NOT NULL, -- false for products that don't track inventory
+    status VARCHAR(20) NOT NULL DEFAULT 'held', -- 'held', 'committed', 'released', 'expired'
+    order_id UUID, -- set on commit; no foreign key: orders may be partitioned
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (reservation_id, product_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_inventory_reservations_product_id ON public.inventory_reservations(product_id);
+CREATE INDEX IF NOT EXISTS idx_inventory_reservations_held_expires_at
+    ON public.inventory_reservations(expires_at) WHERE status = 'held';
+
+-- Enable RLS
+ALTER TABLE public.inventory_reservations ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view own inventory reservations" ON public.inventory_reservations
+    FOR SELECT USING (store_id IN (SELECT public.owned_store_ids()));
+"""
+
+# Market research cache (src.services.research_cache). Entries are found
+# by a hash of the source and the canonical query parameters and point at a
+# zlib-compressed payload stored once per distinct content. A fetch claim
+# marks a key some process is fetching, until the entry is stored or the
+# claim expires. Shared by all users, so only the service role reads it.
+RESEARCH_CACHE = """
+CREATE TABLE IF NOT EXISTS public.research_payloads (
+    payload_hash CHAR(64) PRIMARY KEY, -- sha256 of the canonical JSON
+    data BYTEA NOT NULL, -- zlib-compressed canonical JSON
+    raw_bytes INTEGER NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    last_used_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS public.research_cache (
+    id BIGSERIAL PRIMARY KEY,
+    query_hash CHAR(64) NOT NULL, -- sha256 of source, research type and canonical parameters
+    source VARCHAR(100) NOT NULL,
+    research_type VARCHAR(50),
+    query_parameters JSONB,
+    payload_hash CHAR(64) REFERENCES public.research_payloads(payload_hash) NOT NULL,
+    fetched_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+-- Equality lookups only: a hash index is smaller than a btree on 64-char keys
+CREATE INDEX IF NOT EXISTS idx_research_cache_query_hash ON public.research_cache USING hash (query_hash);
+CREATE INDEX IF NOT EXISTS idx_research_cache_payload_hash ON public.research_cache(payload_hash);
+CREATE INDEX IF NOT EXISTS idx_research_cache_expires_at ON public.research_cache(expires_at);
+
+-- Short-lived and rebuilt by the next fetch: no need to WAL-log it
+CREATE UNLOGGED TABLE IF NOT EXISTS public.research_fetch_claims (
+    query_hash CHAR(64) PRIMARY KEY,
+    claimed_by CHAR(32) NOT NULL, -- token of the fetching caller
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+-- Enable RLS (no policies: service role only)
+ALTER TABLE public.research_payloads ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.research_cache ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.research_fetch_claims ENABLE ROW LEVEL SECURITY;
+"""
+
+# Daily campaign delivery reported by ad platforms, read in bulk by
+# src.services.campaign_metrics
+AD_CAMPAIGN_DAILY_STATS = """
+CREATE TABLE IF NOT EXISTS public.ad_campaign_daily_stats (
+    campaign_id UUID REFERENCES public.ad_campaigns(id) ON DELETE CASCADE NOT NULL,
+    stat_date DATE NOT NULL,
+    impressions BIGINT NOT NULL DEFAULT 0,
+    clicks BIGINT NOT NULL DEFAULT 0,
+    conversions INTEGER NOT NULL DEFAULT 0,
+    spend DECIMAL(12,2) NOT NULL DEFAULT 0,
+    revenue DECIMAL(12,2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (campaign_id, stat_date)
+);
+
+CREATE INDEX IF NOT EXISTS idx_ad_campaigns_store_id ON public.ad_campaigns(store_id);
+
+-- Enable RLS
+ALTER TABLE public.ad_campaign_daily_stats ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view own ad campaign stats" ON public.ad_campaign_daily_stats
+    FOR SELECT USING (
+        campaign_id IN (SELECT id FROM public.ad_campaigns WHERE user_id = auth.uid())
+    );
+"""
+
+# Per-store dashboard cards (src.services.dashboard), kept current by
+# statement-level triggers on orders, products and stores that add each
+# statement's per-store deltas. reconcile_store_dashboard_summaries()
+# recomputes stores from scratch and repairs drifted rows; existing stores
+# are built by STORE_DASHBOARD_SUMMARIES_BACKFILL, outside this migration's
+# transaction, which holds the triggers' locks on orders, products and stores.
+STORE_DASHBOARD_SUMMARIES = """
+CREATE TABLE IF NOT EXISTS public.store_dashboard_summaries (
+    store_id UUID REFERENCES public.stores(id) ON DELETE CASCADE PRIMARY KEY,
+    user_id UUID NOT NULL, -- the store's owner, so a user's cards are one index scan
+    revenue DECIMAL(14,2) NOT NULL DEFAULT 0, -- total_amount of orders not cancelled
+    order_count INTEGER NOT NULL DEFAULT 0, -- orders not cancelled
+    pending_fulfillment_count INTEGER NOT NULL DEFAULT 0,
+    product_count INTEGER NOT NULL DEFAULT 0,
+    active_product_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_store_dashboard_summaries_user_id ON public.store_dashboard_summaries(user_id);
+
+-- Enable RLS
+ALTER TABLE public.store_dashboard_summaries ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view own store dashboard summaries" ON public.store_dashboard_summaries
+    FOR SELECT USING (auth.uid() = user_id);
+
+-- What counts, shared by the triggers and reconciliation
+CREATE OR REPLACE FUNCTION public.dashboard_order_counts(status VARCHAR)
+RETURNS BOOLEAN
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT status IS DISTINCT FROM 'cancelled';
+$$;
+
+CREATE OR REPLACE FUNCTION public.dashboard_order_pending(status VARCHAR, fulfillment_status VARCHAR)
+RETURNS BOOLEAN
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT COALESCE(status NOT IN ('cancelled', 'fulfilled', 'shipped', 'delivered'), true)
+        AND fulfillment_status IS DISTINCT FROM 'fulfilled';
+$$;
+
+-- Adds the net change of a statement on orders or products to each
+-- affected store's row. Transition tables only exist for the trigger's
+-- event, so the query naming them is built for it.
+CREATE OR REPLACE FUNCTION public.apply_store_dashboard_changes()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = ''
+AS $$
+DECLARE
+    contribution TEXT;
+    changes TEXT[] := '{}';
+BEGIN
+    IF TG_TABLE_NAME = 'orders' THEN
+        contribution := 'store_id, '
+            || 'CASE WHEN public.dashboard_order_counts(status) THEN COALESCE(total_amount, 0) ELSE 0 END AS revenue, '
+            || 'CASE WHEN public.dashboard_order_counts(status) THEN 1 ELSE 0 END AS orders, '
+            || 'CASE WHEN public.dashboard_order_pending(status, fulfillment_status) THEN 1 ELSE 0 END AS pending, '
+            || '0 AS products, 0 AS active_products';
+    ELSE
+        contribution := 'store_id, 0 AS revenue, 0 AS orders, 0 AS pending, 1 AS products, '
+            || 'CASE WHEN status = ''active'' THEN 1 ELSE 0 END AS active_products';
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        changes := changes || format('SELECT %s, 1 AS sign FROM new_rows', contribution);
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        changes := changes || format('SELECT %s, -1 AS sign FROM old_rows', contribution);
+    END IF;
+
+    -- Stores deleted in this transaction (cascades) are skipped by the join
+    EXECUTE format($sql$
+        INSERT INTO public.store_dashboard_summaries AS s
+            (store_id, user_id, revenue, order_count, pending_fulfillment_count, product_count, active_product_count)
+        SELECT d.store_id, st.user_id, d.revenue, d.orders, d.pending, d.products, d.active_products
+        FROM (
+            SELECT store_id, SUM(sign * revenue) AS revenue, SUM(sign * orders) AS orders,
+                   SUM(sign * pending) AS pending, SUM(sign * products) AS products,
+                   SUM(sign * active_products) AS active_products
+            FROM (%s) changes
+            GROUP BY store_id
+        ) d
+        JOIN public.stores st ON st.id = d.store_id
+        WHERE (d.revenue, d.orders, d.pending, d.products, d.active_products) <> (0, 0, 0, 0, 0)
+        ORDER BY d.store_id
+        ON CONFLICT (store_id) DO UPDATE SET
+            revenue = s.revenue + EXCLUDED.revenue,
+            order_count = s.order_count + EXCLUDED.order_count,
+            pending_fulfillment_count = s.pending_fulfillment_count + EXCLUDED.pending_fulfillment_count,
+            product_count = s.product_count + EXCLUDED.product_count,
+            active_product_count = s.active_product_count + EXCLUDED.active_product_count,
+            updated_at = CURRENT_TIMESTAMP
+    $sql$, array_to_string(changes, ' UNION ALL '));
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER trigger_orders_dashboard_insert
+    AFTER INSERT ON public.orders
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION public.apply_store_dashboard_changes();
+
+CREATE TRIGGER trigger_orders_dashboard_update
+    AFTER UPDATE ON public.orders
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION public.apply_store_dashboard_changes();
+
+CREATE TRIGGER trigger_orders_dashboard_delete
+    AFTER DELETE ON public.orders
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION public.apply_store_dashboard_changes();
+
+CREATE TRIGGER trigger_products_dashboard_insert
+    AFTER INSERT ON public.products
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION public.apply_store_dashboard_changes();
+
+CREATE TRIGGER trigger_products_dashboard_update
+    AFTER UPDATE ON public.products
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION public.apply_store_dashboard_changes();
+
+CREATE TRIGGER trigger_products_dashboard_delete
+    AFTER DELETE ON public.products
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION public.apply_store_dashboard_changes();
+
+-- New stores get an empty card; a store changing owner moves its card
+CREATE OR REPLACE FUNCTION public.sync_store_dashboard_owner()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = ''
+AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO public.store_dashboard_summaries (store_id, user_id)
+        SELECT id, user_id FROM new_rows
+        ON CONFLICT (store_id) DO NOTHING;
+    ELSE
+        UPDATE public.store_dashboard_summaries s
+        SET user_id = n.user_id, updated_at = CURRENT_TIMESTAMP
+        FROM new_rows n
+        WHERE s.store_id = n.id AND s.user_id IS DISTINCT FROM n.user_id;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER trigger_stores_dashboard_insert
+    AFTER INSERT ON public.stores
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION public.sync_store_dashboard_owner();
+
+CREATE TRIGGER trigger_stores_dashboard_update
+    AFTER UPDATE ON public.stores
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION public.sync_store_dashboard_owner();
+
+-- Recompute up to batch_size stores after after_store_id (keyset order) and
+-- repair the rows that drifted. The rows are locked before counting, so a
+-- write committing meanwhile either is counted or applies its delta after
+-- the repair, never both.
+CREATE OR REPLACE FUNCTION public.reconcile_store_dashboard_summaries(
+    after_store_id UUID DEFAULT NULL,
+    batch_size INTEGER DEFAULT 500
+)
+RETURNS TABLE (last_store_id UUID, checked INTEGER, repaired INTEGER)
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = ''
+AS $$
+DECLARE
+    batch UUID[];
+BEGIN
+    SELECT array_agg(id ORDER BY id) INTO batch FROM (
+        SELECT id FROM public.stores
+        WHERE after_store_id IS NULL OR id > after_store_id
+        ORDER BY id
+        LIMIT batch_size
+    ) b;
+    IF batch IS NULL THEN
+        RETURN QUERY SELECT NULL::UUID, 0, 0;
+        RETURN;
+    END IF;
+
+    INSERT INTO public.store_dashboard_summaries (store_id, user_id)
+    SELECT id, user_id FROM public.stores WHERE id = ANY(batch)
+    ORDER BY id
+    ON CONFLICT (store_id) DO NOTHING;
+
+    PERFORM 1 FROM public.store_dashboard_summaries WHERE store_id = ANY(batch) ORDER BY store_id FOR UPDATE;
+
+    RETURN QUERY
+    WITH actual AS (
+        SELECT st.id AS store_id, st.user_id, o.revenue, o.orders, o.pending, p.products, p.active_products
+        FROM public.stores st
+        CROSS JOIN LATERAL (
+            SELECT COALESCE(SUM(total_amount) FILTER (WHERE public.dashboard_order_counts(status)), 0) AS revenue,
+                   COUNT(*) FILTER (WHERE public.dashboard_order_counts(status)) AS orders,
+                   COUNT(*) FILTER (WHERE public.dashboard_order_pending(status, fulfillment_status)) AS pending
+            FROM public.orders WHERE orders.store_id = st.id
+        ) o
+        CROSS JOIN LATERAL (
+            SELECT COUNT(*) AS products, COUNT(*) FILTER (WHERE status = 'active') AS active_products
+            FROM public.products WHERE products.store_id = st.id
+        ) p
+        WHERE st.id = ANY(batch)
+    ), fixed AS (
+        UPDATE public.store_dashboard_summaries s
+        SET user_id = a.user_id, revenue = a.revenue, order_count = a.orders,
+            pending_fulfillment_count = a.pending, product_count = a.products,
+            active_product_count = a.active_products, updated_at = CURRENT_TIMESTAMP
+        FROM actual a
+        WHERE s.store_id = a.store_id
+          AND (s.user_id, s.revenue, s.order_count, s.pending_fulfillment_count, s.product_count, s.active_product_count)
+              IS DISTINCT FROM (a.user_id, a.revenue, a.orders, a.pending, a.products, a.active_products)
+        RETURNING s.store_id
+    )
+    SELECT batch[array_length(batch, 1)], array_length(batch, 1), (SELECT COUNT(*)::INTEGER FROM fixed);
+END;
+$$;
+
+REVOKE ALL ON FUNCTION public.reconcile_store_dashboard_summaries(UUID, INTEGER) FROM PUBLIC;
+"""
+
+# Background task queue (src.services.tasks, Postgres broker). Workers claim
+# the next queued task by priority under a transaction-level advisory lock,
+# so the per-user and per-store running counts they check can't race. No
+# foreign keys: a task may outlive, or delete, its own store.
+BACKGROUND_TASKS = """
+CREATE TABLE IF NOT EXISTS public.background_tasks (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    kwargs JSONB NOT NULL DEFAULT '{}',
+    priority SMALLINT NOT NULL DEFAULT 5, -- 0 runs first
+    user_id UUID,
+    store_id UUID,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued', -- 'queued', 'running', 'succeeded', 'failed'
+    attempts INTEGER NOT NULL DEFAULT 0, -- runs started
+    max_retries INTEGER NOT NULL DEFAULT 3,
+    timeout_seconds INTEGER NOT NULL DEFAULT 900, -- lease length; an expired lease counts as a failed run
+    run_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP, -- not before; moved on each retry
+    enqueued_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP WITH TIME ZONE,
+    finished_at TIMESTAMP WITH TIME ZONE,
+    lease_expires_at TIMESTAMP WITH TIME ZONE,
+    worker VARCHAR(255),
+    result JSONB,
+    error TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_background_tasks_queued
+    ON public.background_tasks(priority, run_at) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS idx_background_tasks_running_user_id
+    ON public.background_tasks(user_id) WHERE status = 'running';
+CREATE INDEX IF NOT EXISTS idx_background_tasks_running_store_id
+    ON public.background_tasks(store_id) WHERE status = 'running';
+CREATE INDEX IF NOT EXISTS idx_background_tasks_lease_expires_at
+    ON public.background_tasks(lease_expires_at) WHERE status = 'running';
+CREATE INDEX IF NOT EXISTS idx_background_tasks_finished_at
+    ON public.background_tasks(finished_at) WHERE status IN ('succeeded', 'failed');
+
+-- Enable RLS
+ALTER TABLE public.background_tasks ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view own background tasks" ON public.background_tasks
+    FOR SELECT USING (auth.uid() = user_id);
+"""
+
+# Units of each product in live checkout holds (src.services.inventory).
+# Holds still take their stock out of inventory_quantity; a platform sync
+# writes the platform's count less inventory_held, so it no longer wipes
+# out holds that releasing would then add back on top.
+PRODUCTS_INVENTORY_HELD = """
+ALTER TABLE public.products ADD COLUMN IF NOT EXISTS inventory_held INTEGER NOT NULL DEFAULT 0;
+
+UPDATE public.products p SET inventory_held = h.units
+FROM (
+    SELECT product_id, sum(quantity)::int AS units FROM public.inventory_reservations
+    WHERE status = 'held' AND stock_taken
+    GROUP BY product_id
+) h
+WHERE p.id = h.product_id;
+"""
+
+# Builds the dashboard summary of every existing store in committed keyset
+# batches of 500 stores (see ORDER_ITEMS_STORE_ID_BACKFILL), so writes to a
+# store wait on at most one batch. Rows the triggers created for stores
+# before their batch ran hold only the deltas since migration 34; the
+# reconcile recomputes them like any drifted row.
+STORE_DASHBOARD_SUMMARIES_BACKFILL = [
+    """
+DO $$
+DECLARE
+    last_id UUID;
+    batch_last UUID;
+BEGIN
+    LOOP
+        SELECT r.last_store_id INTO batch_last
+        FROM public.reconcile_store_dashboard_summaries(last_id, 500) r;
+        EXIT WHEN batch_last IS NULL;
+        last_id := batch_last;
+        COMMIT;
+    END LOOP;
+END;
+$$
+""",
+]
+
 # All table creation commands in order
 ALL_TABLES = [
     USERS_TABLE,
@@ -534,19 +1632,84 @@ ALL_TABLES = [
     UPDATED_AT_TRIGGERS
 ]
 
+# Versioned migrations, applied in order by src.database.migrations.
+# Never edit an applied migration; append a new one instead. Index builds
+# on large tables belong in a concurrent=True migration.
+MIGRATIONS = [
+    Migration(1, 'create_users', USERS_TABLE),
+    Migration(2, 'create_stores', STORES_TABLE),
+    Migration(3, 'create_products', PRODUCTS_TABLE),
+    Migration(4, 'create_orders', ORDERS_TABLE),
+    Migration(5, 'create_order_items', ORDER_ITEMS_TABLE),
+    Migration(6, 'create_payment_processors', PAYMENT_PROCESSORS_TABLE),
+    Migration(7, 'create_proxies', PROXIES_TABLE),
+    Migration(8, 'create_social_media_accounts', SOCIAL_MEDIA_ACCOUNTS_TABLE),
+    Migration(9, 'create_ad_campaigns', AD_CAMPAIGNS_TABLE),
+    Migration(10, 'create_analytics_data', ANALYTICS_DATA_TABLE),
+    Migration(11, 'create_market_research_data', MARKET_RESEARCH_DATA_TABLE),
+    Migration(12, 'create_updated_at_function', UPDATED_AT_FUNCTION),
+    Migration(13, 'create_updated_at_triggers', UPDATED_AT_TRIGGERS),
+    Migration(14, 'optimize_store_ownership_rls', RLS_OWNERSHIP_OPTIMIZATION),
+    Migration(15, 'backfill_order_items_store_id', ORDER_ITEMS_STORE_ID_BACKFILL, concurrent=True),
+    Migration(16, 'create_analytics_rollups', ANALYTICS_ROLLUPS),
+    Migration(17, 'index_analytics_store_metric_date', ANALYTICS_STORE_METRIC_DATE_INDEX, concurrent=True),
+    Migration(18, 'add_partitioning_support', PARTITIONING_SUPPORT),
+    Migration(19, 'backfill_order_items_order_created_at', ORDER_ITEMS_ORDER_CREATED_AT_BACKFILL, concurrent=True),
+    Migration(20, 'index_orders_store_platform_order', ORDERS_PLATFORM_ORDER_ID_INDEX, concurrent=True),
+    Migration(21, 'add_product_search', PRODUCT_SEARCH),
+    Migration(22, 'backfill_product_search', PRODUCT_SEARCH_BACKFILL, concurrent=True),
+    Migration(23, 'index_product_search', PRODUCT_SEARCH_INDEXES, concurrent=True),
+    Migration(24, 'index_products_store_updated_at', PRODUCTS_STORE_UPDATED_AT_INDEX, concurrent=True),
+    Migration(25, 'add_proxy_health', PROXY_HEALTH),
+    Migration(26, 'index_social_accounts_token_expiry', SOCIAL_ACCOUNTS_TOKEN_EXPIRY_INDEX, concurrent=True),
+    Migration(27, 'create_store_sync_state', STORE_SYNC_STATE),
+    Migration(28, 'index_products_store_platform_product', PRODUCTS_PLATFORM_PRODUCT_ID_INDEX, concurrent=True),
+    Migration(29, 'create_transactions', TRANSACTIONS_TABLE),
+    Migration(30, 'create_payment_webhook_events', PAYMENT_WEBHOOK_EVENTS),
+    Migration(31, 'create_inventory_reservations', INVENTORY_RESERVATIONS),
+    Migration(32, 'create_research_cache', RESEARCH_CACHE),
+    Migration(33, 'create_ad_campaign_daily_stats', AD_CAMPAIGN_DAILY_STATS),
+    Migration(34, 'create_store_dashboard_summaries', STORE_DASHBOARD_SUMMARIES),
+    Migration(35, 'create_background_tasks', BACKGROUND_TASKS),
+    Migration(36, 'add_products_inventory_held', PRODUCTS_INVENTORY_HELD),
+    Migration(37, 'backfill_store_dashboard_summaries', STORE_DASHBOARD_SUMMARIES_BACKFILL, concurrent=True),
+]
+
 def create_tables(supabase_client):
-    """Create all tables in Supabase"""
-    for table_sql in ALL_TABLES:
-        try:
-            supabase_client.rpc('exec_sql', {'sql': table_sql}).execute()
-            print(f"Successfully executed SQL block")
-        except Exception as e:
-            print(f"Error executing SQL: {e}")
-            print(f"SQL: {table_sql[:100]}...")
+    """
+    Apply pending schema migrations in Supabase.
+
+    Uses a direct connection when DATABASE_URL is set (required for
+    concurrent index builds), otherwise the `exec_sql` RPC. Already-applied
+    migrations are skipped. Databases created before
+    migrations were tracked should be baselined once with
+    `python -m src.database.migrate --baseline 13`.
+    """
+    database_url = os.environ.get('DATABASE_URL')
+    if database_url:
+        executor = PsycopgExecutor(database_url)
+    else:
+        executor = SupabaseRpcExecutor(supabase_client)
+    
+    try:
+        return MigrationRunner(executor, MIGRATIONS).migrate()
+    finally:
+        executor.close()
 
 def drop_tables(supabase_client):
     """Drop all tables (for development/testing)"""
     tables = [
+        'schema_migrations',
+        'background_tasks',
+        'research_fetch_claims',
+        'research_cache',
+        'research_payloads',
+        'inventory_reservations',
+        'payment_webhook_events',
+        'transactions',
+        'store_sync_state',
+        'store_dashboard_summaries',
+        'ad_campaign_daily_stats',
         'market_research_data',
         'analytics_data', 
         'ad_campaigns',
@@ -1,8 +1,14 @@
 import os
-from supabase import create_client, Client
-from typing import Optional
+import threading
+from typing import TYPE_CHECKING, Optional
+import httpx
 import logging
 
+from .pool import PooledTransport
+
+if TYPE_CHECKING:
+    from supabase import Client
+
 logger = logging.getLogger(__name__)
 
 class SupabaseClient:
@@ -12,27 +18,109 @@ class SupabaseClient:
         self.url: str = os.environ.get("SUPABASE_URL", "")
         self.key: str = os.environ.get("SUPABASE_ANON_KEY", "")
         self.service_key: str = os.environ.get("SUPABASE_SERVICE_KEY", "")
-        self._client: Optional[Client] = None
-        self._admin_client: Optional[Client] = None
+        
+        # Connection pool tuning (per worker process)
+        self.pool_size: int = int(os.environ.get("SUPABASE_POOL_SIZE", 10))
+        self.pool_timeout: float = float(os.environ.get("SUPABASE_POOL_TIMEOUT", 5))
+        self.connect_timeout: float = float(os.environ.get("SUPABASE_CONNECT_TIMEOUT", 5))
+        self.read_timeout: float = float(os.environ.get("SUPABASE_READ_TIMEOUT", 30))
+        self.keepalive_expiry: float = float(os.environ.get("SUPABASE_KEEPALIVE_EXPIRY", 60))
+        
+        self._client: Optional['Client'] = None
+        self._admin_client: Optional['Client'] = None
+        self._transport: Optional[PooledTransport] = None
+        self._lock = threading.RLock()
+    
+    @property
+    def transport(self) -> PooledTransport:
+        """Shared keep-alive transport used by both clients"""
+        if self._transport is None:
+            with self._lock:
+                if self._transport is None:
+                    self._transport = PooledTransport(
+                        pool_size=self.pool_size,
+                        acquire_timeout=self.pool_timeout,
+                        keepalive_expiry=self.keepalive_expiry
+                    )
+        return self._transport
     
     @property
-    def client(self) -> Client:
+    def client(self) -> 'Client':
         """Get Supabase client with anon key (for frontend operations)"""
         if not self._client:
-            if not self.url or not self.key:
-                raise ValueError("SUPABASE_URL and SUPABASE_ANON_KEY must be set")
-            self._client = create_client(self.url, self.key)
+            with self._lock:
+                if not self._client:
+                    if not self.url or not self.key:
+                        raise ValueError("SUPABASE_URL and SUPABASE_ANON_KEY must be set")
+                    self._client = self._create_pooled_client(self.key)
         return self._client
     
     @property
-    def admin_client(self) -> Client:
+    def admin_client(self) -> 'Client':
         """Get Supabase client with service key (for admin operations)"""
         if not self._admin_client:
-            if not self.url or not self.service_key:
-                raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set")
-            self._admin_client = create_client(self.url, self.service_key)
+            with self._lock:
+                if not self._admin_client:
+                    if not self.url or not self.service_key:
+                        raise ValueError("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set")
+                    self._admin_client = self._create_pooled_client(self.service_key, listen_to_auth=False)
         return self._admin_client
     
+    def _create_pooled_client(self, key: str, listen_to_auth: bool = True) -> 'Client':
+        """
+        Create a Supabase client whose PostgREST session runs on the shared
+        pooled transport instead of its own unbounded httpx session.
+        Must be called with self._lock held. The SDK is imported here, on
+        first use, because importing it is most of a cold start.
+        
+        supabase 2.3.4 drops its PostgREST client (`_postgrest = None`) on
+        every SIGNED_IN / TOKEN_REFRESHED / SIGNED_OUT event and rebuilds it
+        through `_init_postgrest_client` on next use, which would quietly
+        move the client back onto a private unbounded session. The client's
+        factory is replaced so every rebuild lands on the pooled transport
+        again. With `listen_to_auth=False` the client also stops listening
+        to auth events, so it keeps sending `key` (the service key) no
+        matter who signs in through it.
+        """
+        from postgrest import SyncPostgrestClient
+        from postgrest.utils import SyncClient
+        from supabase import create_client
+        from supabase.lib.client_options import ClientOptions
+        
+        timeout = httpx.Timeout(
+            self.read_timeout,
+            connect=self.connect_timeout,
+            pool=self.pool_timeout
+        )
+        transport = self.transport
+        
+        class PooledPostgrestClient(SyncPostgrestClient):
+            def create_session(self, base_url, headers, timeout):
+                return SyncClient(base_url=base_url, headers=headers, timeout=timeout, transport=transport)
+        
+        def init_postgrest_client(rest_url, headers, schema, timeout=timeout):
+            return PooledPostgrestClient(rest_url, headers=headers, schema=schema, timeout=timeout)
+        
+        client = create_client(self.url, key, options=ClientOptions(postgrest_client_timeout=timeout))
+        client._init_postgrest_client = init_postgrest_client
+        if not listen_to_auth:
+            for subscription in list(client.auth._state_change_emitters.values()):
+                subscription.unsubscribe()
+        return client
+    
+    def pool_metrics(self) -> dict:
+        """Acquire-wait time, in-flight requests, pool size and error counters"""
+        return self.transport.metrics.to_dict()
+    
+    def close(self):
+        """Close pooled connections (e.g. on worker shutdown)"""
+        with self._lock:
+            if self._transport is not None:
+                self._transport.close()
+            self._transport = None
+            self._client = None
+            self._admin_client = None
+    
     def test_connection(self) -> bool:
         """Test connection to Supabase"""
         try:
@@ -47,11 +135,10 @@ class SupabaseClient:
 supabase_client = SupabaseClient()
 
 # Convenience functions
-def get_supabase() -> Client:
+def get_supabase() -> 'Client':
     """Get the main Supabase client"""
     return supabase_client.client
 
-def get_admin_supabase() -> Client:
+def get_admin_supabase() -> 'Client':
     """Get the admin Supabase client"""
     return supabase_client.admin_client
-
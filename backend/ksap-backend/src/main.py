@@ -10,7 +10,9 @@ References:
 - Supabase Python: https://supabase.com/docs/reference/python/introduction
 """
 
+import importlib
 import os
+import re
 import sys
 from flask import Flask, jsonify, request
 from flask_cors import CORS
@@ -24,16 +26,35 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 # Load environment variables
 load_dotenv()
 
+from src.utils.startup import StartupProfile
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# (module, blueprint name, URL prefix); the module defines `<name>_bp`
+BLUEPRINTS = [
+    ('src.routes.user', 'user', '/api/v1/users'),
+    ('src.routes.product', 'product', '/api/v1/products'),
+    ('src.routes.analytics', 'analytics', '/api/v1/analytics'),
+    ('src.routes.webhooks', 'webhooks', '/api/v1/webhooks'),
+    ('src.routes.research', 'research', '/api/v1/research'),
+    ('src.routes.tasks', 'tasks', '/api/v1/tasks')
+]
+
+def _check_supabase():
+    """Health check for Supabase; imports the client on the prober thread, not at startup"""
+    from src.database import supabase_client
+    return supabase_client.test_connection()
+
 def create_app():
     """
     Application factory pattern for creating Flask app.
     Reference: https://flask.palletsprojects.com/en/3.0.x/patterns/appfactories/
     """
+    startup = StartupProfile()
     app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
+    app.extensions['startup'] = startup
     
     # Configuration following Flask best practices
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
@@ -45,6 +66,74 @@ def create_app():
     app.config['SUPABASE_ANON_KEY'] = os.environ.get('SUPABASE_ANON_KEY', '')
     app.config['SUPABASE_SERVICE_KEY'] = os.environ.get('SUPABASE_SERVICE_KEY', '')
     
+    # SQLAlchemy: direct Postgres connection (same DATABASE_URL as migrations).
+    # psycopg2 is the driver we ship; SQLAlchemy 2.1 defaults to psycopg 3
+    database_url = os.environ.get('DATABASE_URL', 'sqlite:///ksap-dev.db')
+    app.config['SQLALCHEMY_DATABASE_URI'] = re.sub(r'^postgres(ql)?://', 'postgresql+psycopg2://', database_url)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_pre_ping': True}
+    
+    # Health probing: dependencies are checked in the background and cached
+    app.config['HEALTH_PROBE_INTERVAL'] = float(os.environ.get('HEALTH_PROBE_INTERVAL', 15))
+    app.config['HEALTH_PROBE_TTL'] = float(os.environ.get('HEALTH_PROBE_TTL', 60))
+    
+    # Response cache for GET endpoints; in-process LRU when Redis is not configured
+    app.config['CACHE_ENABLED'] = os.environ.get('CACHE_ENABLED', 'true').lower() == 'true'
+    app.config['CACHE_REDIS_URL'] = os.environ.get('CACHE_REDIS_URL', os.environ.get('REDIS_URL', ''))
+    app.config['CACHE_DEFAULT_TTL'] = int(os.environ.get('CACHE_DEFAULT_TTL', 60))
+    app.config['CACHE_MAX_ENTRIES'] = int(os.environ.get('CACHE_MAX_ENTRIES', 1024))
+    
+    # Request instrumentation on /metrics; slow requests are profiled when
+    # PROFILE_THRESHOLD_MS is set (a PROFILE_SAMPLE_RATE fraction of requests)
+    app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    app.config['PROFILE_THRESHOLD_MS'] = float(os.environ.get('PROFILE_THRESHOLD_MS', 0))
+    app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0.01))
+    app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', '')
+    app.config['PROFILE_KEEP'] = int(os.environ.get('PROFILE_KEEP', 50))
+    
+    # N+1 query detection: off, log or raise (logs by default on the dev server)
+    default_n_plus_one = 'log' if os.environ.get('FLASK_ENV') == 'development' else 'off'
+    app.config['NPLUSONE_MODE'] = (os.environ.get('NPLUSONE_MODE') or default_n_plus_one).lower()
+    app.config['NPLUSONE_THRESHOLD'] = int(os.environ.get('NPLUSONE_THRESHOLD', 5))
+    
+    # Payment webhooks: bounded in-process queue drained in batches by a consumer thread
+    app.config['WEBHOOK_QUEUE_SIZE'] = int(os.environ.get('WEBHOOK_QUEUE_SIZE', 10000))
+    app.config['WEBHOOK_BATCH_SIZE'] = int(os.environ.get('WEBHOOK_BATCH_SIZE', 200))
+    app.config['WEBHOOK_BATCH_LINGER_MS'] = float(os.environ.get('WEBHOOK_BATCH_LINGER_MS', 50))
+    
+    # Inventory holds taken at checkout expire after this many seconds
+    app.config['RESERVATION_TTL'] = int(os.environ.get('RESERVATION_TTL', 600))
+    
+    # Market research cache: per-source TTLs ("source=seconds,..."), RESEARCH_CACHE_TTL for the rest
+    app.config['RESEARCH_CACHE_TTL'] = int(os.environ.get('RESEARCH_CACHE_TTL', 3600))
+    app.config['RESEARCH_CACHE_TTLS'] = os.environ.get('RESEARCH_CACHE_TTLS', '')
+    app.config['RESEARCH_CACHE_STALE_IF_ERROR'] = int(os.environ.get('RESEARCH_CACHE_STALE_IF_ERROR', 86400))
+    app.config['RESEARCH_FETCH_TIMEOUT'] = float(os.environ.get('RESEARCH_FETCH_TIMEOUT', 30))
+    # Made-up research results; only development serves them unless enabled explicitly
+    app.config['RESEARCH_STUB_SOURCES'] = os.environ.get(
+        'RESEARCH_STUB_SOURCES', 'true' if os.environ.get('FLASK_ENV') == 'development' else 'false'
+    ).lower() == 'true'
+    
+    # Background tasks: postgres, memory or sqlite:///path broker (postgres with a
+    # Postgres DATABASE_URL); worker threads run here only with the memory broker
+    # unless TASK_WORKERS is set, otherwise in `python -m src.services.tasks worker`
+    app.config['TASK_BROKER'] = os.environ.get('TASK_BROKER', '')
+    app.config['TASK_WORKERS'] = int(os.environ['TASK_WORKERS']) if os.environ.get('TASK_WORKERS') else None
+    app.config['TASK_USER_CONCURRENCY'] = int(os.environ.get('TASK_USER_CONCURRENCY', 2))
+    app.config['TASK_STORE_CONCURRENCY'] = int(os.environ.get('TASK_STORE_CONCURRENCY', 1))
+    app.config['TASK_POLL_INTERVAL'] = float(os.environ.get('TASK_POLL_INTERVAL', 1))
+    app.config['TASK_RESULT_TTL'] = int(os.environ.get('TASK_RESULT_TTL', 7 * 24 * 60 * 60))
+    
+    # Startup connectivity check: background (default), blocking or off
+    app.config['STARTUP_CHECKS'] = os.environ.get('STARTUP_CHECKS', 'background').lower()
+    
+    # JSON encoding: 'fast' uses orjson when installed, 'default' keeps Flask's stdlib provider
+    app.config['JSON_PROVIDER'] = os.environ.get('JSON_PROVIDER', 'fast').lower()
+    if app.config['JSON_PROVIDER'] == 'fast':
+        from src.utils.serialization import FastJSONProvider, orjson
+        app.json = FastJSONProvider(app)
+        if orjson is None:
+            logger.warning("⚠️ orjson not installed, JSON responses use the standard library encoder")
+    
     # Initialize extensions following Flask patterns
     # CORS configuration: https://flask-cors.readthedocs.io/en/latest/
     CORS(app, 
@@ -55,47 +144,87 @@ def create_app():
     # JWT Manager: https://flask-jwt-extended.readthedocs.io/
     jwt = JWTManager(app)
     
-    # Test Supabase connection on startup
-    try:
-        from src.database import supabase_client
-        if supabase_client.test_connection():
-            logger.info("✅ Supabase connection successful")
-        else:
-            logger.warning("❌ Supabase connection failed")
-    except Exception as e:
-        logger.error(f"❌ Supabase connection error: {e}")
+    # Flask-SQLAlchemy: https://flask-sqlalchemy.palletsprojects.com/
+    with startup.phase('extensions'):
+        from src.models import db
+        db.init_app(app)
+        
+        from src.services.cache import response_cache
+        response_cache.init_app(app)
+        
+        from src.services.metrics import request_metrics
+        request_metrics.init_app(app)
+        
+        from src.services.n_plus_one import n_plus_one_detector
+        n_plus_one_detector.init_app(app)
+        
+        from src.services.payment_webhooks import payment_webhooks
+        payment_webhooks.init_app(app)
+        
+        from src.services.inventory import inventory
+        inventory.init_app(app)
+        
+        from src.services.research_cache import research_cache
+        research_cache.init_app(app)
+        
+        from src.services.tasks import task_queue
+        task_queue.init_app(app)
     
     # Register blueprints following Flask patterns
     # Reference: https://flask.palletsprojects.com/en/3.0.x/blueprints/
-    try:
-        from src.routes.user import user_bp
-        app.register_blueprint(user_bp, url_prefix='/api/v1/users')
-        logger.info("✅ Registered user blueprint")
-    except ImportError as e:
-        logger.warning(f"⚠️ Could not import user blueprint: {e}")
+    # Flask needs every route before the first request, so blueprints are
+    # registered here; what they use (Supabase SDK, other models) loads lazily
+    for module, name, url_prefix in BLUEPRINTS:
+        with startup.phase(f'blueprint:{name}'):
+            try:
+                blueprint = getattr(importlib.import_module(module), f'{name}_bp')
+                app.register_blueprint(blueprint, url_prefix=url_prefix)
+                logger.info(f"✅ Registered {name} blueprint")
+            except ImportError as e:
+                logger.warning(f"⚠️ Could not import {name} blueprint: {e}")
+    
+    # Background dependency probing; health endpoints only read its cache
+    from src.services.health import health_prober
+    health_prober.register('supabase', _check_supabase)
+    health_prober.init_app(app)
+    
+    # Startup connectivity check: 'background' probes on the prober thread
+    # right away, 'blocking' waits for the result (slow cold starts), 'off'
+    # leaves it to the first request
+    if app.config['STARTUP_CHECKS'] == 'blocking':
+        with startup.phase('startup_checks'):
+            health_prober.probe_now()
+        if health_prober.is_ready():
+            logger.info("✅ Supabase connection successful")
+        else:
+            logger.warning("❌ Supabase connection failed")
+    elif app.config['STARTUP_CHECKS'] == 'background':
+        health_prober.ensure_started()
     
     # Health check endpoint
     @app.route('/health')
     def health_check():
         """
         Health check endpoint for monitoring and load balancers.
-        Returns JSON with service status and dependencies.
+        Returns JSON with service status and cached dependency probe results.
         """
         try:
-            from src.database import supabase_client
-            supabase_connected = supabase_client.test_connection()
+            dependencies = health_prober.snapshot()
+            ready = health_prober.is_ready()
             
             health_status = {
-                'status': 'healthy' if supabase_connected else 'degraded',
+                'status': 'healthy' if ready else 'degraded',
                 'version': '1.0.0',
                 'services': {
-                    'supabase': 'connected' if supabase_connected else 'disconnected',
+                    **{name: status['status'] for name, status in dependencies.items()},
                     'flask': 'running'
                 },
+                'dependencies': dependencies,
+                'cache': response_cache.metrics.to_dict(),
                 'environment': os.environ.get('FLASK_ENV', 'production')
             }
             
-            status_code = 200 if supabase_connected else 503
+            status_code = 200 if ready else 503
             return jsonify(health_status), status_code
             
         except Exception as e:
@@ -106,6 +235,17 @@ def create_app():
                 'version': '1.0.0'
             }), 503
     
+    @app.route('/livez')
+    def liveness_check():
+        """Liveness probe: the worker is up and serving requests"""
+        return jsonify({'status': 'alive'}), 200
+    
+    @app.route('/readyz')
+    def readiness_check():
+        """Readiness probe: every dependency has a fresh, successful cached probe"""
+        ready = health_prober.is_ready()
+        return jsonify({'status': 'ready' if ready else 'not_ready'}), 200 if ready else 503
+    
     # Root endpoint with API documentation
     @app.route('/')
     def root():
@@ -123,12 +263,18 @@ def create_app():
             },
             'endpoints': {
                 'health': '/health',
+                'liveness': '/livez',
+                'readiness': '/readyz',
+                'metrics': '/metrics',
                 'users': '/api/v1/users',
                 'stores': '/api/v1/stores',
                 'products': '/api/v1/products',
                 'orders': '/api/v1/orders',
                 'analytics': '/api/v1/analytics',
-                'social': '/api/v1/social'
+                'social': '/api/v1/social',
+                'webhooks': '/api/v1/webhooks',
+                'research': '/api/v1/research',
+                'tasks': '/api/v1/tasks'
             },
             'technologies': {
                 'backend': 'Flask 3.1.1',
@@ -200,6 +346,7 @@ def create_app():
             }
         }), 401
     
+    logger.info(f"🚀 App created in {startup.finish()}ms")
     return app
 
 # Create app instance using factory pattern
@@ -1,33 +1,100 @@
-from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
-import uuid
+"""
+KSAP models.
+
+Model modules are imported on first use (`from src.models import Store`
+or attribute access) rather than all at once, so starting a worker only
+pays for the models its blueprints reference. Relationships name other
+models by string, so the first mapper configuration (first query or
+instantiation) loads every model module; create_all()/drop_all() do the
+same so no table is missed.
+"""
+
+import importlib
+
+from flask_sqlalchemy import SQLAlchemy as _SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.orm import Mapper
+
+# Model name -> module defining it
+_MODEL_MODULES = {
+    'User': 'user',
+    'Store': 'store',
+    'StoreDashboardSummary': 'store',
+    'Product': 'product',
+    'InventoryReservation': 'product',
+    'Order': 'order',
+    'OrderItem': 'order',
+    'PaymentProcessor': 'payment',
+    'Transaction': 'payment',
+    'PaymentWebhookEvent': 'payment',
+    'SocialMediaAccount': 'social',
+    'AdCampaign': 'social',
+    'AdCampaignDailyStat': 'social',
+    'Proxy': 'proxy',
+    'AnalyticsData': 'analytics',
+    'AnalyticsRollup': 'analytics',
+    'MarketResearchData': 'research',
+    'ResearchPayload': 'research',
+    'ResearchCacheEntry': 'research',
+    'BackgroundTask': 'task'
+}
+
+
+class SQLAlchemy(_SQLAlchemy):
+    """Flask-SQLAlchemy that loads every model before creating or dropping tables"""
+
+    def create_all(self, *args, **kwargs):
+        load_models()
+        return super().create_all(*args, **kwargs)
+
+    def drop_all(self, *args, **kwargs):
+        load_models()
+        return super().drop_all(*args, **kwargs)
+
 
 db = SQLAlchemy()
 
-# Import all models
-from .user import User
-from .store import Store
-from .product import Product
-from .order import Order, OrderItem
-from .payment import PaymentProcessor, Transaction
-from .social import SocialMediaAccount, AdCampaign
-from .proxy import Proxy
-from .analytics import AnalyticsData
-from .research import MarketResearchData
+
+def load_models():
+    """Import every model module"""
+    for module in sorted(set(_MODEL_MODULES.values())):
+        importlib.import_module(f'{__name__}.{module}')
+
+
+@event.listens_for(Mapper, 'before_configured')
+def _load_models_before_configure():
+    # Relationship targets must be mapped before any mapper is configured
+    load_models()
+
+
+def __getattr__(name):
+    module = _MODEL_MODULES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(f'{__name__}.{module}'), name)
+
 
 __all__ = [
     'db',
+    'load_models',
     'User',
-    'Store', 
+    'Store',
+    'StoreDashboardSummary',
     'Product',
+    'InventoryReservation',
     'Order',
     'OrderItem',
     'PaymentProcessor',
     'Transaction',
+    'PaymentWebhookEvent',
     'SocialMediaAccount',
     'AdCampaign',
+    'AdCampaignDailyStat',
     'Proxy',
     'AnalyticsData',
-    'MarketResearchData'
+    'AnalyticsRollup',
+    'MarketResearchData',
+    'ResearchPayload',
+    'ResearchCacheEntry',
+    'BackgroundTask'
 ]
-
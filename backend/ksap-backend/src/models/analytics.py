@@ -0,0 +1,62 @@
+from . import db
+from datetime import datetime, date
+import uuid
+
+class AnalyticsData(db.Model):
+    __tablename__ = 'analytics_data'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    store_id = db.Column(db.String(36), db.ForeignKey('stores.id'), nullable=False, index=True)
+    metric_type = db.Column(db.String(100), index=True)  # 'sales', 'traffic', 'conversion', etc.
+    metric_name = db.Column(db.String(100))
+    value = db.Column(db.Numeric(15, 4))
+    dimensions = db.Column(db.JSON)  # Additional dimensions like date, product_id, etc.
+    date_recorded = db.Column(db.Date, default=date.today, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<AnalyticsData {self.metric_type}.{self.metric_name}={self.value}>'
+
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'id': self.id,
+            'store_id': self.store_id,
+            'metric_type': self.metric_type,
+            'metric_name': self.metric_name,
+            'value': float(self.value) if self.value is not None else None,
+            'dimensions': self.dimensions or {},
+            'date_recorded': self.date_recorded.isoformat() if self.date_recorded else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class AnalyticsRollup(db.Model):
+    """Pre-aggregated analytics_data, maintained by refresh_analytics_rollups()"""
+    __tablename__ = 'analytics_rollups'
+    
+    store_id = db.Column(db.String(36), db.ForeignKey('stores.id'), primary_key=True)
+    metric_type = db.Column(db.String(100), primary_key=True)
+    period = db.Column(db.String(10), primary_key=True)  # 'day', 'week', 'month'
+    period_start = db.Column(db.Date, primary_key=True)
+    metric_name = db.Column(db.String(100), primary_key=True, default='')
+    value_sum = db.Column(db.Numeric(20, 4), nullable=False)
+    value_count = db.Column(db.BigInteger, nullable=False)
+    value_min = db.Column(db.Numeric(15, 4))
+    value_max = db.Column(db.Numeric(15, 4))
+    refreshed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<AnalyticsRollup {self.metric_type}.{self.metric_name} {self.period} {self.period_start}>'
+
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'period_start': self.period_start.isoformat() if self.period_start else None,
+            'metric_name': self.metric_name,
+            'sum': float(self.value_sum),
+            'count': self.value_count,
+            'avg': float(self.value_sum) / self.value_count if self.value_count else None,
+            'min': float(self.value_min) if self.value_min is not None else None,
+            'max': float(self.value_max) if self.value_max is not None else None
+        }
@@ -0,0 +1,103 @@
+from . import db
+from datetime import datetime
+import uuid
+
+class Order(db.Model):
+    __tablename__ = 'orders'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    store_id = db.Column(db.String(36), db.ForeignKey('stores.id'), nullable=False, index=True)
+    platform_order_id = db.Column(db.String(255))
+    order_number = db.Column(db.String(100))
+    customer_email = db.Column(db.String(255), index=True)
+    customer_name = db.Column(db.String(255))
+    customer_phone = db.Column(db.String(50))
+    billing_address = db.Column(db.JSON)
+    shipping_address = db.Column(db.JSON)
+    subtotal = db.Column(db.Numeric(10, 2))
+    tax_amount = db.Column(db.Numeric(10, 2))
+    shipping_amount = db.Column(db.Numeric(10, 2))
+    total_amount = db.Column(db.Numeric(10, 2))
+    currency = db.Column(db.String(3), default='USD')
+    status = db.Column(db.String(50), index=True)  # 'pending', 'paid', 'fulfilled', 'shipped', 'delivered', 'cancelled'
+    fulfillment_status = db.Column(db.String(50))
+    payment_status = db.Column(db.String(50))
+    notes = db.Column(db.Text)
+    tags = db.Column(db.JSON, default=list)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationships
+    items = db.relationship('OrderItem', backref='order', lazy=True, cascade='all, delete-orphan')
+
+    def __repr__(self):
+        return f'<Order {self.order_number or self.id}>'
+
+    def to_dict(self, include_items=False):
+        """Convert to dictionary"""
+        data = {
+            'id': self.id,
+            'store_id': self.store_id,
+            'platform_order_id': self.platform_order_id,
+            'order_number': self.order_number,
+            'customer_email': self.customer_email,
+            'customer_name': self.customer_name,
+            'customer_phone': self.customer_phone,
+            'billing_address': self.billing_address,
+            'shipping_address': self.shipping_address,
+            'subtotal': float(self.subtotal) if self.subtotal is not None else None,
+            'tax_amount': float(self.tax_amount) if self.tax_amount is not None else None,
+            'shipping_amount': float(self.shipping_amount) if self.shipping_amount is not None else None,
+            'total_amount': float(self.total_amount) if self.total_amount is not None else None,
+            'currency': self.currency,
+            'status': self.status,
+            'fulfillment_status': self.fulfillment_status,
+            'payment_status': self.payment_status,
+            'notes': self.notes,
+            'tags': self.tags or [],
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+        
+        if include_items:
+            data['items'] = [item.to_dict() for item in self.items]
+        
+        return data
+
+
+class OrderItem(db.Model):
+    __tablename__ = 'order_items'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    order_id = db.Column(db.String(36), db.ForeignKey('orders.id'), nullable=False, index=True)
+    store_id = db.Column(db.String(36), db.ForeignKey('stores.id'), index=True)  # Set from the order by a trigger (RLS)
+    order_created_at = db.Column(db.DateTime)  # Set from the order by a trigger (partition key)
+    product_id = db.Column(db.String(36), db.ForeignKey('products.id'))
+    platform_product_id = db.Column(db.String(255))
+    title = db.Column(db.String(500))
+    sku = db.Column(db.String(255))
+    quantity = db.Column(db.Integer, nullable=False)
+    price = db.Column(db.Numeric(10, 2), nullable=False)
+    total = db.Column(db.Numeric(10, 2), nullable=False)
+    variant_title = db.Column(db.String(255))
+    properties = db.Column(db.JSON, default=dict)
+
+    def __repr__(self):
+        return f'<OrderItem {self.sku or self.title}>'
+
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'id': self.id,
+            'order_id': self.order_id,
+            'store_id': self.store_id,
+            'product_id': self.product_id,
+            'platform_product_id': self.platform_product_id,
+            'title': self.title,
+            'sku': self.sku,
+            'quantity': self.quantity,
+            'price': float(self.price) if self.price is not None else None,
+            'total': float(self.total) if self.total is not None else None,
+            'variant_title': self.variant_title,
+            'properties': self.properties or {}
+        }
@@ -0,0 +1,100 @@
+from . import db
+from datetime import datetime
+import uuid
+
+class PaymentProcessor(db.Model):
+    __tablename__ = 'payment_processors'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False, index=True)
+    name = db.Column(db.String(100), nullable=False)
+    provider = db.Column(db.String(50), nullable=False)  # 'stripe', 'paypal', 'square', etc.
+    api_credentials = db.Column(db.JSON)  # Encrypted API keys
+    webhook_url = db.Column(db.String(500))
+    is_active = db.Column(db.Boolean, default=True)
+    settings = db.Column(db.JSON, default=dict)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationships
+    transactions = db.relationship('Transaction', backref='payment_processor', lazy=True)
+
+    def __repr__(self):
+        return f'<PaymentProcessor {self.provider}:{self.name}>'
+
+    def to_dict(self, include_sensitive=False):
+        """Convert to dictionary"""
+        data = {
+            'id': self.id,
+            'user_id': self.user_id,
+            'name': self.name,
+            'provider': self.provider,
+            'webhook_url': self.webhook_url,
+            'is_active': self.is_active,
+            'settings': self.settings or {},
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+        
+        if include_sensitive:
+            data['api_credentials'] = self.api_credentials
+        
+        return data
+
+
+class Transaction(db.Model):
+    __tablename__ = 'transactions'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    payment_processor_id = db.Column(db.String(36), db.ForeignKey('payment_processors.id'), nullable=False, index=True)
+    order_id = db.Column(db.String(36), db.ForeignKey('orders.id'), index=True)
+    platform_transaction_id = db.Column(db.String(255))
+    type = db.Column(db.String(50))  # 'payment', 'refund', 'chargeback', 'fee'
+    amount = db.Column(db.Numeric(10, 2), nullable=False)
+    currency = db.Column(db.String(3), default='USD')
+    status = db.Column(db.String(50))  # 'pending', 'completed', 'failed', 'cancelled'
+    gateway_response = db.Column(db.JSON)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f'<Transaction {self.type} {self.amount} {self.currency}>'
+
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'id': self.id,
+            'payment_processor_id': self.payment_processor_id,
+            'order_id': self.order_id,
+            'platform_transaction_id': self.platform_transaction_id,
+            'type': self.type,
+            'amount': float(self.amount) if self.amount is not None else None,
+            'currency': self.currency,
+            'status': self.status,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class PaymentWebhookEvent(db.Model):
+    __tablename__ = 'payment_webhook_events'
+
+    payment_processor_id = db.Column(db.String(36), db.ForeignKey('payment_processors.id'), primary_key=True)
+    event_id = db.Column(db.String(255), primary_key=True)  # Provider's event ID; retries reuse it
+    event_type = db.Column(db.String(100))
+    payload = db.Column(db.JSON, nullable=False)
+    received_at = db.Column(db.DateTime, nullable=False)
+    processed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    error = db.Column(db.Text)  # Set when the event could not be applied
+
+    def __repr__(self):
+        return f'<PaymentWebhookEvent {self.event_type} {self.event_id}>'
+
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'payment_processor_id': self.payment_processor_id,
+            'event_id': self.event_id,
+            'event_type': self.event_type,
+            'received_at': self.received_at.isoformat() if self.received_at else None,
+            'processed_at': self.processed_at.isoformat() if self.processed_at else None,
+            'error': self.error
+        }
@@ -0,0 +1,93 @@
+from . import db
+from datetime import datetime
+import uuid
+
+class Product(db.Model):
+    __tablename__ = 'products'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    store_id = db.Column(db.String(36), db.ForeignKey('stores.id'), nullable=False, index=True)
+    platform_product_id = db.Column(db.String(255))
+    title = db.Column(db.String(500), nullable=False)
+    description = db.Column(db.Text)
+    price = db.Column(db.Numeric(10, 2))
+    compare_at_price = db.Column(db.Numeric(10, 2))
+    cost_per_item = db.Column(db.Numeric(10, 2))
+    sku = db.Column(db.String(255), index=True)
+    barcode = db.Column(db.String(255))
+    inventory_quantity = db.Column(db.Integer, default=0)
+    inventory_held = db.Column(db.Integer, nullable=False, default=0)  # Units in live checkout holds
+    track_inventory = db.Column(db.Boolean, default=True)
+    weight = db.Column(db.Numeric(8, 2))
+    images = db.Column(db.JSON, default=list)
+    tags = db.Column(db.JSON, default=list)
+    vendor = db.Column(db.String(255))
+    product_type = db.Column(db.String(255))
+    status = db.Column(db.String(20), default='active', index=True)  # 'active', 'draft', 'archived'
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<Product {self.title}>'
+
+    @property
+    def in_stock(self):
+        """Check if product can currently be sold"""
+        return not self.track_inventory or (self.inventory_quantity or 0) > 0
+
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'id': self.id,
+            'store_id': self.store_id,
+            'platform_product_id': self.platform_product_id,
+            'title': self.title,
+            'description': self.description,
+            'price': float(self.price) if self.price is not None else None,
+            'compare_at_price': float(self.compare_at_price) if self.compare_at_price is not None else None,
+            'cost_per_item': float(self.cost_per_item) if self.cost_per_item is not None else None,
+            'sku': self.sku,
+            'barcode': self.barcode,
+            'inventory_quantity': self.inventory_quantity,
+            'track_inventory': self.track_inventory,
+            'in_stock': self.in_stock,
+            'weight': float(self.weight) if self.weight is not None else None,
+            'images': self.images or [],
+            'tags': self.tags or [],
+            'vendor': self.vendor,
+            'product_type': self.product_type,
+            'status': self.status,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
+class InventoryReservation(db.Model):
+    __tablename__ = 'inventory_reservations'
+
+    reservation_id = db.Column(db.String(36), primary_key=True)
+    product_id = db.Column(db.String(36), db.ForeignKey('products.id'), primary_key=True)
+    store_id = db.Column(db.String(36), db.ForeignKey('stores.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    stock_taken = db.Column(db.Boolean, nullable=False)  # False for products that don't track inventory
+    status = db.Column(db.String(20), nullable=False, default='held')  # 'held', 'committed', 'released', 'expired'
+    order_id = db.Column(db.String(36))
+    expires_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<InventoryReservation {self.reservation_id} {self.product_id} x{self.quantity}>'
+
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'reservation_id': self.reservation_id,
+            'product_id': self.product_id,
+            'store_id': self.store_id,
+            'quantity': self.quantity,
+            'stock_taken': self.stock_taken,
+            'status': self.status,
+            'order_id': self.order_id,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
@@ -0,0 +1,50 @@
+from . import db
+from datetime import datetime
+import uuid
+
+class Proxy(db.Model):
+    __tablename__ = 'proxies'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False, index=True)
+    name = db.Column(db.String(255))
+    host = db.Column(db.String(255), nullable=False)
+    port = db.Column(db.Integer, nullable=False)
+    username = db.Column(db.String(255))
+    password = db.Column(db.String(255))  # Encrypted
+    protocol = db.Column(db.String(10), default='http')  # 'http', 'https', 'socks5'
+    country = db.Column(db.String(2))
+    is_active = db.Column(db.Boolean, default=True)
+    last_tested = db.Column(db.DateTime)
+    test_result = db.Column(db.String(20))  # 'success', 'failed', 'timeout'
+    latency_ms = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    social_accounts = db.relationship('SocialMediaAccount', backref='proxy', lazy=True)
+
+    def __repr__(self):
+        return f'<Proxy {self.protocol}://{self.host}:{self.port}>'
+
+    def to_dict(self, include_sensitive=False):
+        """Convert to dictionary"""
+        data = {
+            'id': self.id,
+            'user_id': self.user_id,
+            'name': self.name,
+            'host': self.host,
+            'port': self.port,
+            'protocol': self.protocol,
+            'country': self.country,
+            'is_active': self.is_active,
+            'last_tested': self.last_tested.isoformat() if self.last_tested else None,
+            'test_result': self.test_result,
+            'latency_ms': self.latency_ms,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+        
+        if include_sensitive:
+            data['username'] = self.username
+            data['password'] = self.password
+        
+        return data
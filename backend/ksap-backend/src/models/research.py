@@ -0,0 +1,74 @@
+from . import db
+from datetime import datetime
+import uuid
+
+class MarketResearchData(db.Model):
+    __tablename__ = 'market_research_data'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False, index=True)
+    research_type = db.Column(db.String(50))  # 'competitor_ad', 'trend_analysis', 'product_research'
+    query_parameters = db.Column(db.JSON)
+    data = db.Column(db.JSON, nullable=False)
+    source = db.Column(db.String(100))  # 'facebook_ad_library', 'google_trends', etc.
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<MarketResearchData {self.research_type} from {self.source}>'
+
+    def to_dict(self, include_data=True):
+        """Convert to dictionary"""
+        data = {
+            'id': self.id,
+            'user_id': self.user_id,
+            'research_type': self.research_type,
+            'query_parameters': self.query_parameters or {},
+            'source': self.source,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+        
+        if include_data:
+            data['data'] = self.data
+        
+        return data
+
+
+class ResearchPayload(db.Model):
+    __tablename__ = 'research_payloads'
+
+    payload_hash = db.Column(db.CHAR(64), primary_key=True)  # sha256 of the canonical JSON
+    data = db.Column(db.LargeBinary, nullable=False)  # zlib-compressed canonical JSON
+    raw_bytes = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ResearchPayload {self.payload_hash[:12]} {self.raw_bytes}B>'
+
+
+class ResearchCacheEntry(db.Model):
+    __tablename__ = 'research_cache'
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    query_hash = db.Column(db.CHAR(64), nullable=False)  # sha256 of source, research type and canonical parameters
+    source = db.Column(db.String(100), nullable=False)
+    research_type = db.Column(db.String(50))
+    query_parameters = db.Column(db.JSON)
+    payload_hash = db.Column(db.CHAR(64), db.ForeignKey('research_payloads.payload_hash'), nullable=False)
+    fetched_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<ResearchCacheEntry {self.source} {self.query_hash[:12]}>'
+
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'query_hash': self.query_hash,
+            'source': self.source,
+            'research_type': self.research_type,
+            'query_parameters': self.query_parameters or {},
+            'payload_hash': self.payload_hash,
+            'fetched_at': self.fetched_at.isoformat() if self.fetched_at else None,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None
+        }
@@ -0,0 +1,128 @@
+from . import db
+from datetime import datetime
+import uuid
+
+class SocialMediaAccount(db.Model):
+    __tablename__ = 'social_media_accounts'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False, index=True)
+    platform = db.Column(db.String(50), nullable=False)  # 'facebook', 'instagram', 'tiktok', etc.
+    account_name = db.Column(db.String(255))
+    account_id = db.Column(db.String(255))
+    access_token = db.Column(db.Text)  # Encrypted
+    refresh_token = db.Column(db.Text)  # Encrypted
+    token_expires_at = db.Column(db.DateTime)
+    proxy_id = db.Column(db.String(36), db.ForeignKey('proxies.id'))
+    status = db.Column(db.String(20), default='active')  # 'active', 'suspended', 'banned'
+    warmup_status = db.Column(db.String(50))  # 'new', 'warming', 'ready', 'flagged'
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationships
+    ad_campaigns = db.relationship('AdCampaign', backref='social_account', lazy=True)
+
+    def __repr__(self):
+        return f'<SocialMediaAccount {self.platform}:{self.account_name}>'
+
+    @property
+    def token_expired(self):
+        """Check if the access token has expired"""
+        return bool(self.token_expires_at and self.token_expires_at <= datetime.utcnow())
+
+    def to_dict(self, include_sensitive=False):
+        """Convert to dictionary"""
+        data = {
+            'id': self.id,
+            'user_id': self.user_id,
+            'platform': self.platform,
+            'account_name': self.account_name,
+            'account_id': self.account_id,
+            'token_expires_at': self.token_expires_at.isoformat() if self.token_expires_at else None,
+            'token_expired': self.token_expired,
+            'proxy_id': self.proxy_id,
+            'status': self.status,
+            'warmup_status': self.warmup_status,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+        
+        if include_sensitive:
+            data['access_token'] = self.access_token
+            data['refresh_token'] = self.refresh_token
+        
+        return data
+
+
+class AdCampaign(db.Model):
+    __tablename__ = 'ad_campaigns'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False, index=True)
+    store_id = db.Column(db.String(36), db.ForeignKey('stores.id'), index=True)
+    social_account_id = db.Column(db.String(36), db.ForeignKey('social_media_accounts.id'))
+    name = db.Column(db.String(255), nullable=False)
+    objective = db.Column(db.String(100))  # 'traffic', 'conversions', 'brand_awareness', etc.
+    status = db.Column(db.String(50))  # 'draft', 'active', 'paused', 'completed'
+    budget_type = db.Column(db.String(20))  # 'daily', 'lifetime'
+    budget_amount = db.Column(db.Numeric(10, 2))
+    start_date = db.Column(db.DateTime)
+    end_date = db.Column(db.DateTime)
+    target_audience = db.Column(db.JSON)
+    creatives = db.Column(db.JSON)  # Array of creative assets
+    platform_campaign_id = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<AdCampaign {self.name}>'
+
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'store_id': self.store_id,
+            'social_account_id': self.social_account_id,
+            'name': self.name,
+            'objective': self.objective,
+            'status': self.status,
+            'budget_type': self.budget_type,
+            'budget_amount': float(self.budget_amount) if self.budget_amount is not None else None,
+            'start_date': self.start_date.isoformat() if self.start_date else None,
+            'end_date': self.end_date.isoformat() if self.end_date else None,
+            'target_audience': self.target_audience,
+            'creatives': self.creatives or [],
+            'platform_campaign_id': self.platform_campaign_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
+class AdCampaignDailyStat(db.Model):
+    """One day of delivery for a campaign, as reported by its platform"""
+    __tablename__ = 'ad_campaign_daily_stats'
+
+    campaign_id = db.Column(db.String(36), db.ForeignKey('ad_campaigns.id'), primary_key=True)
+    stat_date = db.Column(db.Date, primary_key=True)
+    impressions = db.Column(db.BigInteger, nullable=False, default=0)
+    clicks = db.Column(db.BigInteger, nullable=False, default=0)
+    conversions = db.Column(db.Integer, nullable=False, default=0)
+    spend = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    revenue = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<AdCampaignDailyStat {self.campaign_id} {self.stat_date}>'
+
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'campaign_id': self.campaign_id,
+            'stat_date': self.stat_date.isoformat() if self.stat_date else None,
+            'impressions': self.impressions,
+            'clicks': self.clicks,
+            'conversions': self.conversions,
+            'spend': float(self.spend) if self.spend is not None else None,
+            'revenue': float(self.revenue) if self.revenue is not None else None
+        }
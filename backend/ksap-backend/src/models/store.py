@@ -2,6 +2,13 @@ from . import db
 from datetime import datetime
 import uuid
 
+# Lightweight table constructs for aggregate queries; avoids importing the
+# Product / Order mappers just to count rows
+COUNTED_TABLES = {
+    'products': db.table('products', db.column('store_id')),
+    'orders': db.table('orders', db.column('store_id'))
+}
+
 class Store(db.Model):
     __tablename__ = 'stores'
     
@@ -35,12 +42,60 @@ class Store(db.Model):
     @property
     def total_products(self):
         """Get total number of products"""
-        return len(self.products)
+        return self._count('products')
 
     @property
     def total_orders(self):
         """Get total number of orders"""
-        return len(self.orders)
+        return self._count('orders')
+
+    def _count(self, relationship):
+        """
+        Count related rows without loading them.
+
+        Uses counts preloaded by `load_counts`, then an already-loaded
+        collection, and only falls back to a single COUNT query.
+        """
+        counts = getattr(self, '_preloaded_counts', None)
+        if counts is not None and relationship in counts:
+            return counts[relationship]
+        if relationship in self.__dict__:
+            return len(self.__dict__[relationship])
+        if self.id is None:
+            return 0
+        table = COUNTED_TABLES[relationship]
+        return db.session.scalar(
+            db.select(db.func.count()).select_from(table).where(table.c.store_id == self.id)
+        ) or 0
+
+    @classmethod
+    def load_counts(cls, stores):
+        """
+        Preload total_products / total_orders for a page of stores.
+
+        Issues a single grouped COUNT statement for the whole page instead
+        of two queries (and two full collection loads) per store, so
+        rendering N store cards costs a constant number of queries.
+        """
+        stores = [store for store in stores if store.id is not None]
+        if not stores:
+            return stores
+
+        store_ids = [store.id for store in stores]
+        counts_query = db.union_all(*[
+            db.select(table.c.store_id, db.literal(name).label('relationship'), db.func.count().label('total'))
+            .where(table.c.store_id.in_(store_ids))
+            .group_by(table.c.store_id)
+            for name, table in COUNTED_TABLES.items()
+        ])
+
+        counts = {store_id: dict.fromkeys(COUNTED_TABLES, 0) for store_id in store_ids}
+        for store_id, relationship, total in db.session.execute(counts_query):
+            counts[store_id][relationship] = total
+
+        for store in stores:
+            store._preloaded_counts = counts[store.id]
+        return stores
 
     def to_dict(self, include_sensitive=False):
         """Convert to dictionary"""
@@ -66,3 +121,32 @@ class Store(db.Model):
         
         return data
 
+
+
+class StoreDashboardSummary(db.Model):
+    """Per-store dashboard card, maintained by triggers on orders, products and stores"""
+    __tablename__ = 'store_dashboard_summaries'
+
+    store_id = db.Column(db.String(36), db.ForeignKey('stores.id'), primary_key=True)
+    user_id = db.Column(db.String(36), nullable=False, index=True)
+    revenue = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    pending_fulfillment_count = db.Column(db.Integer, nullable=False, default=0)
+    product_count = db.Column(db.Integer, nullable=False, default=0)
+    active_product_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<StoreDashboardSummary {self.store_id}>'
+
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'store_id': self.store_id,
+            'revenue': float(self.revenue) if self.revenue is not None else None,
+            'order_count': self.order_count,
+            'pending_fulfillment_count': self.pending_fulfillment_count,
+            'product_count': self.product_count,
+            'active_product_count': self.active_product_count,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
@@ -0,0 +1,48 @@
+from . import db
+from datetime import datetime
+import uuid
+
+class BackgroundTask(db.Model):
+    """A queued, running or finished task of the Postgres task broker (src.services.tasks)"""
+    __tablename__ = 'background_tasks'
+
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    name = db.Column(db.String(100), nullable=False)
+    kwargs = db.Column(db.JSON, nullable=False, default=dict)
+    priority = db.Column(db.SmallInteger, nullable=False, default=5)  # 0 runs first
+    user_id = db.Column(db.String(36))
+    store_id = db.Column(db.String(36))
+    status = db.Column(db.String(20), nullable=False, default='queued')  # 'queued', 'running', 'succeeded', 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_retries = db.Column(db.Integer, nullable=False, default=3)
+    timeout_seconds = db.Column(db.Integer, nullable=False, default=900)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    enqueued_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    lease_expires_at = db.Column(db.DateTime)
+    worker = db.Column(db.String(255))
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+
+    def __repr__(self):
+        return f'<BackgroundTask {self.name} {self.id}>'
+
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'priority': self.priority,
+            'user_id': self.user_id,
+            'store_id': self.store_id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_retries': self.max_retries,
+            'run_at': self.run_at.isoformat() if self.run_at else None,
+            'enqueued_at': self.enqueued_at.isoformat() if self.enqueued_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'result': self.result,
+            'error': self.error
+        }
@@ -0,0 +1,96 @@
+from datetime import date
+from flask import Blueprint, jsonify, request
+from src.models import AnalyticsRollup
+from src.services.analytics_rollups import PERIODS, analytics_rollups
+from src.services.campaign_metrics import FLAGS, CampaignSeries, compute
+from src.services.cache import response_cache
+from src.utils.conditional import collection_validators, conditional
+
+analytics_bp = Blueprint('analytics', __name__)
+
+def _parse_date(name):
+    value = request.args.get(name)
+    return date.fromisoformat(value) if value else None
+
+def _rollup_validators(store_id, metric_type):
+    # Series with unrefreshed days are aggregated from raw rows; no validator
+    if analytics_rollups.has_pending_days(store_id, date.min, date.max):
+        return None
+    return collection_validators(
+        AnalyticsRollup.refreshed_at,
+        AnalyticsRollup.store_id == store_id,
+        AnalyticsRollup.metric_type == metric_type
+    )
+
+@analytics_bp.route('/stores/<store_id>/metrics/<metric_type>', methods=['GET'])
+@conditional(_rollup_validators)
+@response_cache.cached(tags=lambda store_id, metric_type: [f'store:{store_id}:analytics_data'])
+def get_metric_series(store_id, metric_type):
+    """
+    Aggregated series for a store metric, served from rollups.
+
+    Query parameters: period (day, week or month), start and end
+    (YYYY-MM-DD) and an optional metric_name filter.
+    """
+    period = request.args.get('period', 'day')
+    try:
+        start = _parse_date('start')
+        end = _parse_date('end')
+        source, series = analytics_rollups.get_series(
+            store_id,
+            metric_type,
+            period=period,
+            start=start,
+            end=end,
+            metric_name=request.args.get('metric_name')
+        )
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'BAD_REQUEST',
+                'message': str(e),
+                'status': 400,
+                'periods': list(PERIODS)
+            }
+        }), 400
+
+    return jsonify({
+        'store_id': store_id,
+        'metric_type': metric_type,
+        'period': period,
+        'source': source,
+        'series': series
+    })
+
+@analytics_bp.route('/stores/<store_id>/campaigns/metrics', methods=['GET'])
+def get_campaign_metrics(store_id):
+    """
+    Spend, ROAS, CPA, budget pacing and anomaly flags for every ad
+    campaign of a store.
+
+    Query parameters: start and end (YYYY-MM-DD; the 90 days to yesterday
+    by default) and as_of, the day pacing and flags are reported for (end
+    by default).
+    """
+    try:
+        series = CampaignSeries.load(store_id=store_id, start=_parse_date('start'), end=_parse_date('end'))
+        metrics = compute(series, as_of=_parse_date('as_of'))
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'BAD_REQUEST',
+                'message': str(e),
+                'status': 400
+            }
+        }), 400
+
+    return jsonify({
+        'store_id': store_id,
+        'start': series.start.isoformat(),
+        'end': series.end.isoformat(),
+        'as_of': metrics.as_of.isoformat(),
+        'flags': list(FLAGS),
+        'campaigns': metrics.records()
+    })
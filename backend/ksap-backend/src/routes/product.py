@@ -0,0 +1,120 @@
+from urllib.parse import urlencode
+from flask import Blueprint, jsonify, request
+from src.models import Product
+from src.services.cache import response_cache
+from src.services.inventory import InventoryError, inventory
+from src.services.product_search import product_search
+from src.utils.conditional import collection_validators, conditional
+from src.utils.pagination import parse_limit
+
+product_bp = Blueprint('product', __name__)
+
+def _inventory_error(error):
+    return jsonify({
+        'success': False,
+        'error': {
+            'code': error.code,
+            'message': str(error),
+            'status': error.status,
+            **(error.details or {})
+        }
+    }), error.status
+
+def _store_products_validators():
+    store_id = request.args.get('store_id')
+    if not store_id:
+        return None
+    return collection_validators(Product.updated_at, Product.store_id == store_id)
+
+@product_bp.route('/search', methods=['GET'])
+@conditional(_store_products_validators)
+@response_cache.cached(tags=lambda: [f"store:{request.args.get('store_id')}:products"])
+def search_products():
+    """
+    Ranked full-text and fuzzy product search within one store.
+
+    Query parameters: store_id and q (required), optional status, limit
+    and cursor. The body is a JSON array of products, best match first,
+    each with its `score`; like the user list, the next page's cursor is
+    returned in the `X-Next-Cursor` and `Link: rel="next"` headers.
+    """
+    store_id = request.args.get('store_id')
+    try:
+        if not store_id:
+            raise ValueError("store_id is required")
+        limit = parse_limit(request.args.get('limit'))
+        results, next_cursor = product_search.search(
+            store_id,
+            request.args.get('q'),
+            limit=limit,
+            cursor=request.args.get('cursor'),
+            status=request.args.get('status')
+        )
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'BAD_REQUEST',
+                'message': str(e),
+                'status': 400
+            }
+        }), 400
+
+    response = jsonify(results)
+    if next_cursor:
+        params = {**request.args.to_dict(), 'limit': limit, 'cursor': next_cursor}
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{request.base_url}?{urlencode(params)}>; rel="next"'
+    return response
+
+@product_bp.route('/stores/<store_id>/reservations', methods=['POST'])
+def create_reservation(store_id):
+    """
+    Hold stock for a checkout: all line items or none.
+
+    Body: {"items": [{"product_id", "quantity"}], "ttl": seconds,
+    "reservation_id": optional UUID making retries idempotent}. Answers
+    201 with the reservation, or 409 INSUFFICIENT_INVENTORY listing the
+    short items with what is available.
+    """
+    body = request.get_json(silent=True) or {}
+    try:
+        reservation = inventory.reserve(
+            store_id,
+            body.get('items'),
+            ttl=body.get('ttl'),
+            reservation_id=body.get('reservation_id')
+        )
+    except InventoryError as e:
+        return _inventory_error(e)
+    return jsonify(reservation), 201
+
+@product_bp.route('/reservations/<reservation_id>', methods=['GET'])
+def get_reservation(reservation_id):
+    """A reservation with its items and status"""
+    try:
+        reservation = inventory.get(reservation_id)
+    except InventoryError as e:
+        return _inventory_error(e)
+    if reservation is None:
+        return _inventory_error(InventoryError('NOT_FOUND', "Reservation not found", 404))
+    return jsonify(reservation)
+
+@product_bp.route('/reservations/<reservation_id>/commit', methods=['POST'])
+def commit_reservation(reservation_id):
+    """Keep the held stock for an order. Body: {"order_id"}"""
+    body = request.get_json(silent=True) or {}
+    try:
+        reservation = inventory.commit(reservation_id, body.get('order_id'))
+    except InventoryError as e:
+        return _inventory_error(e)
+    return jsonify(reservation)
+
+@product_bp.route('/reservations/<reservation_id>', methods=['DELETE'])
+def release_reservation(reservation_id):
+    """Return held stock; releasing twice is harmless"""
+    try:
+        released = inventory.release(reservation_id)
+    except InventoryError as e:
+        return _inventory_error(e)
+    return jsonify({'reservation_id': reservation_id, 'released': released})
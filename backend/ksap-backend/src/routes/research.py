@@ -0,0 +1,36 @@
+from flask import Blueprint, jsonify, request
+from src.services.research_cache import ResearchError, research_cache
+
+research_bp = Blueprint('research', __name__)
+
+@research_bp.route('/<source>', methods=['POST'])
+def query_research(source):
+    """
+    Market research from a source, served from the research cache.
+
+    Body: research_type, query_parameters (an object) and optional refresh
+    to bypass a fresh entry. Identical queries running at the same time
+    share one fetch; `cache` says whether this one was a hit, a miss,
+    coalesced with another request or a stale entry served after the
+    source failed.
+    """
+    body = request.get_json(silent=True) or {}
+    try:
+        result = research_cache.get(
+            source,
+            body.get('research_type'),
+            body.get('query_parameters'),
+            refresh=bool(body.get('refresh'))
+        )
+    except ResearchError as e:
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': e.code,
+                'message': str(e),
+                'status': e.status,
+                **(e.details or {})
+            }
+        }), e.status
+
+    return jsonify(result), 200
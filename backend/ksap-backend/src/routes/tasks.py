@@ -0,0 +1,80 @@
+import uuid
+from flask import Blueprint, jsonify, request
+from src.services.tasks import TaskError, task_queue
+
+tasks_bp = Blueprint('tasks', __name__)
+
+def _task_error(error):
+    return jsonify({
+        'success': False,
+        'error': {
+            'code': error.code,
+            'message': str(error),
+            'status': error.status,
+            **(error.details or {})
+        }
+    }), error.status
+
+def _store_owner(store_id):
+    from src.models import db, Store
+
+    try:
+        store_id = str(uuid.UUID(str(store_id)))
+    except ValueError:
+        raise TaskError('BAD_REQUEST', 'store_id must be a UUID', 400)
+    store = db.session.get(Store, store_id)
+    if store is None:
+        raise TaskError('NOT_FOUND', 'Store not found', 404)
+    return store.user_id
+
+@tasks_bp.route('', methods=['POST'])
+def enqueue_task():
+    """
+    Queue a user-facing background task (see task_queue.public_tasks()).
+
+    Body: task (its name), kwargs (an object, checked against the task's
+    arguments), store_id unless the task takes it from kwargs (stores.sync
+    does), optional priority (the task's own or lower: up to 9 or low) and
+    delay in seconds. The task counts against the store's and its owner's
+    concurrency caps. Answers 202 with the task; its result is at
+    GET /api/v1/tasks/<task_id> once it has run.
+    """
+    body = request.get_json(silent=True) or {}
+    try:
+        name, kwargs = body.get('task'), body.get('kwargs')
+        if name not in task_queue.public_tasks():
+            raise TaskError('UNKNOWN_TASK', f"Unknown task '{name}'", 404, {'tasks': task_queue.public_tasks()})
+        # Tasks capped by a store (stores.sync) take it from their kwargs
+        _, store_id = task_queue.caps(name, kwargs, store_id=body.get('store_id'))
+        if not store_id:
+            raise TaskError('BAD_REQUEST', 'store_id is required', 400)
+        user_id = _store_owner(store_id)
+
+        priority = task_queue.priority(name)
+        if body.get('priority') is not None:
+            requested = task_queue.priority(name, body['priority'])
+            if requested < priority:
+                raise TaskError('BAD_REQUEST', f"priority can't be raised above the task's own ({priority})", 400)
+            priority = requested
+
+        task_id = task_queue.enqueue(
+            name,
+            kwargs,
+            user_id=user_id,
+            store_id=store_id,
+            priority=priority,
+            delay=body.get('delay')
+        )
+        task = task_queue.get(task_id)
+    except TaskError as e:
+        return _task_error(e)
+    return jsonify(task), 202
+
+@tasks_bp.route('/<task_id>', methods=['GET'])
+def get_task(task_id):
+    """A task's status, attempts and, once finished, its result or last error"""
+    try:
+        task = task_queue.get(task_id)
+    except TaskError as e:
+        return _task_error(e)
+    return jsonify(task)
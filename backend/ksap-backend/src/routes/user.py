@@ -1,12 +1,77 @@
-from flask import Blueprint, jsonify, request
+from datetime import datetime
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
 from src.models.user import User, db
+from src.services.cache import response_cache
+from src.services.dashboard import store_dashboard
+from src.utils.conditional import collection_validators, conditional, resource_validators
+from src.utils.pagination import decode_cursor, encode_cursor, parse_limit
+from src.utils.serialization import serialize_many
 
 user_bp = Blueprint('user', __name__)
 
+# Rows fetched per round trip from the server-side cursor in streaming mode
+STREAM_BATCH_SIZE = 500
+
+def _keyset_query(cursor):
+    """Users ordered by (created_at, id), seeking past `cursor` when given"""
+    query = db.select(User).order_by(User.created_at, User.id)
+    if cursor:
+        created_at, user_id = decode_cursor(cursor, datetime, str)
+        query = query.where(db.tuple_(User.created_at, User.id) > (created_at, user_id))
+    return query
+
+def _wants_ndjson():
+    return (request.args.get('format') == 'ndjson'
+            or request.accept_mimetypes.best == 'application/x-ndjson')
+
 @user_bp.route('/users', methods=['GET'])
+@conditional(lambda: collection_validators(User.updated_at))
+@response_cache.cached(tags=lambda: ['users'])
 def get_users():
-    users = User.query.all()
-    return jsonify([user.to_dict() for user in users])
+    """
+    List users a page at a time using keyset pagination on (created_at, id).
+
+    The response body stays a JSON array; the cursor for the next page is
+    returned in the `X-Next-Cursor` header (and a `Link: rel="next"`
+    header) and is absent on the last page.
+
+    With `?format=ndjson` (or `Accept: application/x-ndjson`) every user
+    after `cursor` is streamed one JSON object per line from a server-side
+    cursor, so memory stays flat regardless of table size.
+    """
+    try:
+        query = _keyset_query(request.args.get('cursor'))
+        limit = parse_limit(request.args.get('limit'))
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'BAD_REQUEST',
+                'message': str(e),
+                'status': 400
+            }
+        }), 400
+
+    if _wants_ndjson():
+        def generate():
+            rows = db.session.scalars(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+            dumps = current_app.json.dumps
+            for batch in rows.partitions():
+                yield ''.join(dumps(user) + '\n' for user in serialize_many(batch, User))
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    users = db.session.scalars(query.limit(limit + 1)).all()
+    has_more = len(users) > limit
+    users = users[:limit]
+
+    response = jsonify(serialize_many(users, User))
+    if has_more:
+        last = users[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{request.base_url}?limit={limit}&cursor={next_cursor}>; rel="next"'
+    return response
 
 @user_bp.route('/users', methods=['POST'])
 def create_user():
@@ -18,6 +83,8 @@ def create_user():
     return jsonify(user.to_dict()), 201
 
 @user_bp.route('/users/<int:user_id>', methods=['GET'])
+@conditional(lambda user_id: resource_validators(User.updated_at, User.id == user_id))
+@response_cache.cached(tags=lambda user_id: [f'users:{user_id}'])
 def get_user(user_id):
     user = User.query.get_or_404(user_id)
     return jsonify(user.to_dict())
@@ -37,3 +104,24 @@ def delete_user(user_id):
     db.session.delete(user)
     db.session.commit()
     return '', 204
+
+@user_bp.route('/users/<user_id>/dashboard', methods=['GET'])
+def get_dashboard(user_id):
+    """
+    One card per store the user owns: revenue, order count, orders
+    waiting for fulfillment and product counts, read from the maintained
+    per-store summaries.
+    """
+    try:
+        cards = store_dashboard.cards(user_id)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': 'BAD_REQUEST',
+                'message': str(e),
+                'status': 400
+            }
+        }), 400
+
+    return jsonify({'user_id': user_id, 'stores': cards})
@@ -0,0 +1,28 @@
+from flask import Blueprint, jsonify, request
+from src.services.payment_webhooks import WebhookError, payment_webhooks
+
+webhooks_bp = Blueprint('webhooks', __name__)
+
+@webhooks_bp.route('/payments/<processor_id>', methods=['POST'])
+def receive_payment_webhook(processor_id):
+    """
+    Payment processor webhook delivery.
+
+    Verified against the processor's webhook secret and queued; the answer
+    doesn't wait for the event to be applied. Redeliveries of an event
+    answer 200 with duplicate set, a full queue answers 503 so the provider
+    retries later.
+    """
+    try:
+        duplicate = payment_webhooks.receive(processor_id, request.get_data(), request.headers, request.url)
+    except WebhookError as e:
+        return jsonify({
+            'success': False,
+            'error': {
+                'code': e.code,
+                'message': str(e),
+                'status': e.status
+            }
+        }), e.status
+
+    return jsonify({'received': True, 'duplicate': duplicate}), 200
@@ -0,0 +1,6 @@
+from .health import HealthProber, health_prober
+
+__all__ = [
+    'HealthProber',
+    'health_prober'
+]
@@ -0,0 +1,158 @@
+"""
+Analytics reads served from incrementally maintained rollups.
+
+Triggers on analytics_data queue every (store, day) pair a write touches;
+refresh() drains that queue through public.refresh_analytics_rollups(),
+which recomputes just those days and the weeks/months containing them.
+Reads use the rollups unless the requested range still has queued days,
+in which case they aggregate raw rows via the
+(store_id, metric_type, date_recorded) index so results are never stale.
+
+Run a refresh from cron or a worker:
+    python -m src.services.analytics_rollups
+"""
+
+import logging
+from datetime import date, timedelta
+
+from src.models import db, AnalyticsData, AnalyticsRollup
+from src.services.cache import response_cache
+from src.utils.serialization import serialize_many
+
+logger = logging.getLogger(__name__)
+
+PERIODS = ('day', 'week', 'month')
+DEFAULT_BATCH_SIZE = 5000
+
+
+def period_bounds(start, end, period):
+    """
+    Align [start, end] to whole periods: returns the first period's start
+    and the (exclusive) end of the period containing `end`. Weeks start on
+    Monday, matching Postgres date_trunc('week').
+    """
+    if period == 'week':
+        first = start - timedelta(days=start.weekday())
+        last = end - timedelta(days=end.weekday()) + timedelta(days=7)
+    elif period == 'month':
+        first = start.replace(day=1)
+        last = date(end.year + end.month // 12, end.month % 12 + 1, 1)
+    else:
+        first, last = start, end + timedelta(days=1)
+    return first, last
+
+
+class AnalyticsRollupService:
+    """Refreshes rollups and answers time-series queries from them"""
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE):
+        self.batch_size = batch_size
+
+    def refresh(self, max_batches=None):
+        """Drain the rollup queue in batches; returns the number of days refreshed"""
+        refreshed = 0
+        batches = 0
+        store_ids = set()
+        while max_batches is None or batches < max_batches:
+            days = db.session.execute(
+                db.text("SELECT public.refresh_analytics_rollups(:batch_size)"),
+                {'batch_size': self.batch_size}
+            ).scalar()
+            if days:
+                # The function's bucket table lives until this transaction commits
+                store_ids.update(db.session.execute(
+                    db.text("SELECT DISTINCT store_id::text FROM pg_temp.rollup_buckets")
+                ).scalars())
+            db.session.commit()
+            batches += 1
+            refreshed += days or 0
+            if not days or days < self.batch_size:
+                break
+        if refreshed:
+            # The refresh is plain SQL, so the ORM commit hook cannot see it
+            response_cache.invalidate(*(f'store:{store_id}:analytics_data' for store_id in store_ids))
+            logger.info(f"Refreshed analytics rollups for {refreshed} store-days in {batches} batch(es)")
+        return refreshed
+
+    def has_pending_days(self, store_id, start, end):
+        """True if raw rows in [start, end) changed since the last refresh"""
+        query = db.text(
+            "SELECT EXISTS (SELECT 1 FROM public.analytics_rollup_queue "
+            "WHERE store_id = :store_id AND date_recorded >= :start AND date_recorded < :end)"
+        )
+        return bool(db.session.execute(query, {'store_id': store_id, 'start': start, 'end': end}).scalar())
+
+    def get_series(self, store_id, metric_type, period='day', start=None, end=None, metric_name=None):
+        """
+        Aggregated series for one store and metric type.
+
+        Returns (source, points) where source is 'rollup' or 'raw' and each
+        point has period_start, metric_name, sum, count, avg, min and max.
+        """
+        if period not in PERIODS:
+            raise ValueError(f"period must be one of {', '.join(PERIODS)}")
+        end = end or date.today()
+        start = start or date(end.year, 1, 1)
+        if start > end:
+            raise ValueError("start must not be after end")
+
+        start, end = period_bounds(start, end, period)
+        if self.has_pending_days(store_id, start, end):
+            return 'raw', self._raw_series(store_id, metric_type, period, start, end, metric_name)
+        return 'rollup', self._rollup_series(store_id, metric_type, period, start, end, metric_name)
+
+    def _rollup_series(self, store_id, metric_type, period, start, end, metric_name):
+        query = AnalyticsRollup.query.filter(
+            AnalyticsRollup.store_id == store_id,
+            AnalyticsRollup.metric_type == metric_type,
+            AnalyticsRollup.period == period,
+            AnalyticsRollup.period_start >= start,
+            AnalyticsRollup.period_start < end
+        )
+        if metric_name is not None:
+            query = query.filter(AnalyticsRollup.metric_name == metric_name)
+        rows = query.order_by(AnalyticsRollup.period_start, AnalyticsRollup.metric_name).all()
+        return serialize_many(rows, AnalyticsRollup)
+
+    def _raw_series(self, store_id, metric_type, period, start, end, metric_name):
+        bucket = db.func.date_trunc(period, AnalyticsData.date_recorded).cast(db.Date).label('period_start')
+        name = db.func.coalesce(AnalyticsData.metric_name, '').label('metric_name')
+        query = db.session.query(
+            bucket,
+            name,
+            db.func.coalesce(db.func.sum(AnalyticsData.value), 0),
+            db.func.count(),
+            db.func.min(AnalyticsData.value),
+            db.func.max(AnalyticsData.value)
+        ).filter(
+            AnalyticsData.store_id == store_id,
+            AnalyticsData.metric_type == metric_type,
+            AnalyticsData.date_recorded >= start,
+            AnalyticsData.date_recorded < end
+        )
+        if metric_name is not None:
+            query = query.filter(name == metric_name)
+        rows = query.group_by(bucket, name).order_by(bucket, name).all()
+        return [
+            {
+                'period_start': period_start.isoformat(),
+                'metric_name': row_name,
+                'sum': float(total),
+                'count': count,
+                'avg': float(total) / count if count else None,
+                'min': float(minimum) if minimum is not None else None,
+                'max': float(maximum) if maximum is not None else None
+            }
+            for period_start, row_name, total, count, minimum, maximum in rows
+        ]
+
+
+# Global instance
+analytics_rollups = AnalyticsRollupService()
+
+
+if __name__ == '__main__':
+    from src.main import app
+
+    with app.app_context():
+        analytics_rollups.refresh()
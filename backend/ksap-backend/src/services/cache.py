@@ -0,0 +1,425 @@
+"""
+Tag-invalidated response cache for GET endpoints.
+
+Views opt in with `@response_cache.cached(tags=...)`. A cached entry is
+keyed by endpoint, caller (JWT identity, or a hash of the Authorization
+header) and the full path with query string, and is labelled with tags
+naming the data it was built from:
+
+    <table>:<id>                one row, e.g. "stores:<uuid>"
+    store:<store_id>:<table>    a store's rows, e.g. "store:<uuid>:products"
+    <table>                     rows not scoped to a store, e.g. "users"
+
+Committing an ORM change evicts every entry tagged with the changed rows'
+tags, so a product update evicts that store's product searches and
+nothing else. Writes that bypass the ORM (bulk SQL, rollup refreshes)
+call `response_cache.invalidate(*tags)` themselves. Behind
+@conditional an entry also carries the validator version it was built
+from and is only served while the ETag still names that version, so a
+missed invalidation costs a cache miss, never a body that disagrees
+with its ETag.
+
+Backends: Redis (REDIS_URL; shared by all workers, tag membership kept in
+sets) or, without REDIS_URL, an in-process LRU for development and tests;
+its invalidations only reach the process that made the write. If Redis
+is configured but unreachable the cache is bypassed rather than falling
+back to per-process memory.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, request
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'ksap:cache:v1'
+DEFAULT_TTL = 60
+DEFAULT_MAX_ENTRIES = 1024
+# Redis tag sets live at least this long so they never expire before an entry
+TAG_TTL = 24 * 60 * 60
+
+# Response headers worth replaying from the cache
+CACHED_HEADERS = ('Content-Type', 'X-Next-Cursor', 'Link')
+
+
+class CacheMetrics:
+    """Thread-safe hit/miss counters, overall and per endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.invalidations = 0
+        self.by_endpoint = {}
+
+    def record(self, endpoint, hit):
+        with self._lock:
+            counts = self.by_endpoint.setdefault(endpoint, {'hits': 0, 'misses': 0})
+            if hit:
+                self.hits += 1
+                counts['hits'] += 1
+            else:
+                self.misses += 1
+                counts['misses'] += 1
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def record_invalidation(self, evicted):
+        with self._lock:
+            self.invalidations += evicted
+
+    @staticmethod
+    def _ratio(hits, misses):
+        total = hits + misses
+        return round(hits / total, 4) if total else None
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self._ratio(self.hits, self.misses),
+                'errors': self.errors,
+                'evicted': self.invalidations,
+                'endpoints': {
+                    endpoint: {**counts, 'hit_ratio': self._ratio(counts['hits'], counts['misses'])}
+                    for endpoint, counts in self.by_endpoint.items()
+                }
+            }
+
+
+class MemoryBackend:
+    """In-process LRU with per-entry TTL and a tag index"""
+
+    name = 'memory'
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value, tags)
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def _remove(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, tags, ttl):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, value, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, tags):
+        with self._lock:
+            keys = set()
+            for tag in tags:
+                keys.update(self._tags.get(tag, ()))
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+
+class RedisBackend:
+    """Redis entries with TTL; each tag is a set of the keys carrying it"""
+
+    name = 'redis'
+
+    def __init__(self, url, socket_timeout=0.5):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=socket_timeout, socket_connect_timeout=socket_timeout)
+
+    @staticmethod
+    def _tag_key(tag):
+        return f'{KEY_PREFIX}:tag:{tag}'
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, value, tags, ttl):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set(key, value, ex=ttl)
+        for tag in tags:
+            pipe.sadd(self._tag_key(tag), key)
+            pipe.expire(self._tag_key(tag), max(ttl, TAG_TTL))
+        pipe.execute()
+
+    def invalidate(self, tags):
+        tag_keys = [self._tag_key(tag) for tag in tags]
+        pipe = self.client.pipeline(transaction=False)
+        for tag_key in tag_keys:
+            pipe.smembers(tag_key)
+        members = dict(zip(tag_keys, pipe.execute()))
+        keys = set().union(*members.values())
+        if not keys:
+            return 0
+        # SREM only what was read, so entries cached meanwhile stay evictable
+        pipe = self.client.pipeline(transaction=False)
+        pipe.delete(*keys)
+        for tag_key, tag_members in members.items():
+            if tag_members:
+                pipe.srem(tag_key, *tag_members)
+        pipe.execute()
+        return len(keys)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=f'{KEY_PREFIX}:*', count=1000))
+        if keys:
+            self.client.delete(*keys)
+
+
+def model_tags(instance):
+    """Cache tags touched by a change to an ORM instance"""
+    table = getattr(instance, '__tablename__', None)
+    if table is None:
+        return set()
+    tags = set()
+    identity = inspect(instance).identity or (getattr(instance, 'id', None),)
+    if identity[0] is not None:
+        tags.add(f'{table}:{identity[0]}')
+
+    if hasattr(instance, 'store_id'):
+        # Include the previous store when a row moves between stores
+        history = inspect(instance).attrs.store_id.history
+        for store_id in (*history.unchanged, *history.added, *history.deleted):
+            if store_id is not None:
+                tags.add(f'store:{store_id}:{table}')
+    else:
+        tags.add(table)
+    return tags
+
+
+def _keep_previous_store(target, value, oldvalue, initiator):
+    return value
+
+
+def _track_store_moves():
+    """
+    Load a row's committed store_id when it is reassigned, so model_tags
+    can evict the store it left even if the attribute had expired
+    """
+    from src.models import db
+
+    for mapper in db.Model.registry.mappers:
+        if 'store_id' in mapper.column_attrs:
+            event.listen(mapper.class_.store_id, 'set', _keep_previous_store, active_history=True)
+
+
+def _caller():
+    """Identity segment of the cache key"""
+    authorization = request.headers.get('Authorization')
+    if not authorization:
+        return 'anonymous'
+    try:
+        from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+        if identity is not None:
+            return f'user:{identity}'
+    except Exception:
+        pass
+    # Unverifiable tokens never share entries with anyone else
+    return 'token:' + hashlib.sha256(authorization.encode('utf-8')).hexdigest()[:32]
+
+
+class ResponseCache:
+    """Caches GET responses and evicts them by tag after writes"""
+
+    def __init__(self, backend=None, default_ttl=DEFAULT_TTL):
+        self.backend = backend
+        self.default_ttl = default_ttl
+        self.metrics = CacheMetrics()
+        self.enabled = True
+        self._listening = False
+        self._error_logged = False
+
+    def init_app(self, app):
+        """Pick a backend from app config and hook ORM commits"""
+        self.enabled = app.config.get('CACHE_ENABLED', True)
+        self.default_ttl = int(app.config.get('CACHE_DEFAULT_TTL', self.default_ttl))
+        if self.backend is None:
+            redis_url = app.config.get('CACHE_REDIS_URL')
+            if redis_url:
+                try:
+                    self.backend = RedisBackend(redis_url)
+                except ImportError as e:
+                    logger.warning(f"⚠️ redis package unavailable, response cache disabled: {e}")
+                    self.enabled = False
+            else:
+                self.backend = MemoryBackend(int(app.config.get('CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)))
+        app.extensions['response_cache'] = self
+
+        if not self._listening:
+            event.listen(Session, 'after_flush', self._collect_tags)
+            event.listen(Session, 'after_commit', self._invalidate_committed)
+            event.listen(Session, 'after_soft_rollback', self._discard_tags)
+            _track_store_moves()
+            self._listening = True
+        if self.enabled:
+            logger.info(f"✅ Response cache enabled ({self.backend.name} backend)")
+
+    def init_standalone(self):
+        """
+        Use the shared Redis cache from a process without a Flask app
+        (bulk CLI jobs), so its invalidations reach the API workers. A
+        process-local memory cache would evict nothing anyone reads, so
+        without CACHE_REDIS_URL / REDIS_URL this does nothing.
+        """
+        redis_url = os.environ.get('CACHE_REDIS_URL', os.environ.get('REDIS_URL', ''))
+        if self.backend is None and redis_url:
+            try:
+                self.backend = RedisBackend(redis_url)
+            except ImportError as e:
+                logger.warning(f"⚠️ redis package unavailable, cannot invalidate cached responses: {e}")
+
+    def _backend_error(self, operation, error):
+        self.metrics.record_error()
+        if not self._error_logged:
+            logger.warning(f"⚠️ Response cache {operation} failed, bypassing cache: {error}")
+            self._error_logged = True
+
+    # Invalidation
+
+    def invalidate(self, *tags):
+        """Evict every entry carrying any of `tags`; returns how many were evicted"""
+        if not tags or self.backend is None:
+            return 0
+        try:
+            evicted = self.backend.invalidate(set(tags))
+        except Exception as e:
+            self._backend_error('invalidate', e)
+            return 0
+        self.metrics.record_invalidation(evicted)
+        return evicted
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+    def _collect_tags(self, session, flush_context):
+        tags = session.info.setdefault('response_cache_tags', set())
+        for instance in (*session.new, *session.dirty, *session.deleted):
+            tags.update(model_tags(instance))
+
+    def _invalidate_committed(self, session):
+        tags = session.info.pop('response_cache_tags', None)
+        if tags:
+            self.invalidate(*tags)
+
+    def _discard_tags(self, session, previous_transaction):
+        session.info.pop('response_cache_tags', None)
+
+    # Caching
+
+    def _key(self):
+        digest = hashlib.sha256(
+            f'{request.full_path}|{request.headers.get("Accept", "")}'.encode('utf-8')
+        ).hexdigest()[:40]
+        return f'{KEY_PREFIX}:{request.endpoint}:{_caller()}:{digest}'
+
+    def cached(self, tags, ttl=None):
+        """
+        Cache a GET view's successful responses.
+
+        `tags` is a callable taking the view's keyword arguments and
+        returning the tags the response depends on (it may read
+        `request.args`). Under @conditional an entry also records the
+        validator version it was built from, and one built from another
+        version is a miss: a write no invalidation reached (raw SQL,
+        another worker's memory cache) never serves a body that
+        disagrees with the ETag.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled or self.backend is None or request.method != 'GET':
+                    return view(*args, **kwargs)
+
+                key = self._key()
+                # Set by @conditional: the data version its ETag was built from
+                version = g.get('validator_version')
+                if 'no-cache' not in request.headers.get('Cache-Control', ''):
+                    try:
+                        stored = self.backend.get(key)
+                    except Exception as e:
+                        self._backend_error('read', e)
+                        return view(*args, **kwargs)
+                    cached = self._replay(stored, version) if stored is not None else None
+                    if cached is not None:
+                        self.metrics.record(request.endpoint, hit=True)
+                        return cached
+
+                self.metrics.record(request.endpoint, hit=False)
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code == 200 and not response.is_streamed:
+                    try:
+                        self.backend.set(key, self._serialize(response, version), set(tags(**kwargs)),
+                                         ttl or self.default_ttl)
+                    except Exception as e:
+                        self._backend_error('write', e)
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def _serialize(response, version):
+        headers = {name: response.headers[name] for name in CACHED_HEADERS if name in response.headers}
+        meta = json.dumps({'status': response.status_code, 'headers': headers, 'version': version},
+                          separators=(',', ':'))
+        return meta.encode('utf-8') + b'\n' + response.get_data()
+
+    @staticmethod
+    def _replay(stored, version):
+        """The stored response, or None if it was built from another data version"""
+        meta, _, body = stored.partition(b'\n')
+        meta = json.loads(meta)
+        if meta.get('version') != version:
+            return None
+        response = current_app.response_class(body, status=meta['status'])
+        for name, value in meta['headers'].items():
+            response.headers[name] = value
+        response.headers['X-Cache'] = 'HIT'
+        return response
+
+
+# Global instance
+response_cache = ResponseCache()
@@ -0,0 +1,398 @@
+"""
+Ad campaign performance computed over whole portfolios at once.
+
+CampaignSeries.load() reads a date range of ad_campaign_daily_stats into
+dense (campaigns x days) float32 arrays, one per metric, with a binary
+COPY parsed straight into NumPy (no Python object per row), in batches
+of campaigns so the transfer buffer stays small. Days without a row are
+zeros.
+
+compute() then works on every campaign of a batch together, as array
+operations over that matrix:
+
+- totals over the window and the ratios: ROAS, CPA, CPC, CTR and CVR
+  (None where the denominator is zero)
+- budget pacing: spend against what the budget allowed so far; daily
+  budgets allow budget x active days, lifetime budgets their share of the
+  flight (spend before the window counts, read separately)
+- the spend run rate over the last RUN_RATE_DAYS and, for lifetime
+  budgets with an end date, the spend projected to the end of the flight
+- anomaly flags on every day, each day compared with the ANOMALY_WINDOW
+  days before it (trailing sums from one cumulative sum per metric):
+  spend spikes and drops beyond ANOMALY_Z standard deviations, spend
+  buying conversions at over twice the trailing CPA, ROAS under half its
+  trailing value, and active campaigns that stopped delivering
+
+The result holds one value per campaign for the as-of day (the last day
+of the window by default): flags is a bitmask of FLAGS, anomaly_days
+counts the days of the window with any anomaly.
+
+A window is at most MAX_WINDOW_DAYS long; its arrays grow with every
+day. NumPy is imported on first use, not with the module, so the API
+process doesn't load it at startup.
+
+Usage:
+    from src.services.campaign_metrics import CampaignSeries, compute
+
+    series = CampaignSeries.load(store_id=store_id, start=start, end=end)
+    metrics = compute(series)
+    metrics.records()   # one dict per campaign, flags by name
+"""
+
+import io
+import logging
+import math
+import uuid
+from datetime import date, timedelta
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+METRICS = ('impressions', 'clicks', 'conversions', 'spend', 'revenue')
+DEFAULT_BATCH_SIZE = 512
+DEFAULT_WINDOW_DAYS = 90
+MAX_WINDOW_DAYS = 730
+
+PACING_TOLERANCE = 0.15
+RUN_RATE_DAYS = 7
+ANOMALY_WINDOW = 28
+ANOMALY_MIN_HISTORY = 7
+ANOMALY_Z = 3.0
+
+# Bits of CampaignMetrics.flags
+FLAGS = {
+    'overpacing': 1 << 0,
+    'underpacing': 1 << 1,
+    'projected_overspend': 1 << 2,
+    'spend_spike': 1 << 3,
+    'spend_drop': 1 << 4,
+    'cpa_spike': 1 << 5,
+    'roas_drop': 1 << 6,
+    'no_delivery': 1 << 7
+}
+ANOMALIES = FLAGS['spend_spike'] | FLAGS['spend_drop'] | FLAGS['cpa_spike'] | FLAGS['roas_drop'] | FLAGS['no_delivery']
+
+# Flight days are offsets from the window start; open ends sit far outside it
+OPEN_START = -(1 << 30)
+OPEN_END = 1 << 30
+
+SELECT_CAMPAIGNS = """
+    SELECT c.id, c.status, c.budget_type, c.budget_amount,
+           c.start_date::date - %(start)s::date AS flight_start,
+           c.end_date::date - %(start)s::date AS flight_end,
+           COALESCE(before.spend, 0) AS spend_before
+    FROM public.ad_campaigns c
+    LEFT JOIN LATERAL (
+        SELECT sum(s.spend) AS spend
+        FROM public.ad_campaign_daily_stats s
+        WHERE s.campaign_id = c.id AND c.budget_type = 'lifetime'
+          AND s.stat_date >= c.start_date::date AND s.stat_date < %(start)s
+    ) before ON true
+    WHERE {condition}
+    ORDER BY c.id
+"""
+
+# Fixed-width columns, so each binary COPY tuple has the same layout
+COPY_STATS = """
+    COPY (
+        SELECT (c.position - 1)::int4, (s.stat_date - %(start)s::date)::int4,
+               s.impressions::float4, s.clicks::float4, s.conversions::float4, s.spend::float4, s.revenue::float4
+        FROM unnest(%(ids)s::uuid[]) WITH ORDINALITY AS c(id, position)
+        JOIN public.ad_campaign_daily_stats s ON s.campaign_id = c.id
+        WHERE s.stat_date BETWEEN %(start)s AND %(end)s
+    ) TO STDOUT WITH (FORMAT binary)
+"""
+
+COPY_SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+
+
+@lru_cache(maxsize=None)
+def copy_row():
+    """Tuple: field count, then a length and a big-endian value per column"""
+    import numpy as np
+
+    return np.dtype([('fields', '>i2'), ('campaign_length', '>i4'), ('campaign', '>i4'), ('day_length', '>i4'),
+                     ('day', '>i4')] + [field for name in METRICS for field in ((f'{name}_length', '>i4'), (name, '>f4'))])
+
+
+def parse_binary_copy(raw):
+    """copy_row() records from a binary COPY of COPY_STATS"""
+    import numpy as np
+
+    if raw[:len(COPY_SIGNATURE)] != COPY_SIGNATURE:
+        raise ValueError('not a binary COPY stream')
+    extension = int.from_bytes(raw[15:19], 'big')
+    offset = 19 + extension
+    # The stream ends with a two-byte -1 field count
+    row = copy_row()
+    return np.frombuffer(raw, row, count=(len(raw) - offset - 2) // row.itemsize, offset=offset)
+
+
+class CampaignSeries:
+    """Daily stats of a set of campaigns as (campaigns x days) arrays"""
+
+    def __init__(self, campaign_ids, start, days, values=None, status=None, daily_budget=None, budget=None,
+                 flight_start=None, flight_end=None, spend_before=None):
+        import numpy as np
+
+        count = len(campaign_ids)
+        self.campaign_ids = list(campaign_ids)
+        self.start = start
+        self.days = days
+        self.values = values or {name: np.zeros((count, days), np.float32) for name in METRICS}
+        self.active = np.ones(count, bool) if status is None else np.asarray(status) == 'active'
+        self.daily_budget = np.zeros(count, bool) if daily_budget is None else np.asarray(daily_budget, bool)
+        self.budget = np.full(count, np.nan) if budget is None else np.asarray(budget, np.float64)
+        self.flight_start = np.full(count, OPEN_START, np.int64) if flight_start is None else np.asarray(flight_start, np.int64)
+        self.flight_end = np.full(count, OPEN_END, np.int64) if flight_end is None else np.asarray(flight_end, np.int64)
+        self.spend_before = np.zeros(count) if spend_before is None else np.asarray(spend_before, np.float64)
+
+    def __len__(self):
+        return len(self.campaign_ids)
+
+    @property
+    def end(self):
+        return self.start + timedelta(days=self.days - 1)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.values.values())
+
+    def slice(self, lo, hi):
+        """Campaigns lo:hi as a series sharing this one's arrays"""
+        part = CampaignSeries(self.campaign_ids[lo:hi], self.start, self.days,
+                              values={name: array[lo:hi] for name, array in self.values.items()})
+        for name in ('active', 'daily_budget', 'budget', 'flight_start', 'flight_end', 'spend_before'):
+            setattr(part, name, getattr(self, name)[lo:hi])
+        return part
+
+    @classmethod
+    def load(cls, store_id=None, user_id=None, start=None, end=None, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Campaigns of a store (or of a user) with their stats from start to
+        end inclusive; end defaults to yesterday, start to DEFAULT_WINDOW_DAYS
+        before it
+        """
+        import numpy as np
+
+        from src.models import db
+
+        if store_id is None and user_id is None:
+            raise ValueError('store_id or user_id is required')
+        end = end or date.today() - timedelta(days=1)
+        start = start or end - timedelta(days=DEFAULT_WINDOW_DAYS - 1)
+        if start > end:
+            raise ValueError('start must not be after end')
+        if (end - start).days >= MAX_WINDOW_DAYS:
+            raise ValueError(f'the window from start to end is limited to {MAX_WINDOW_DAYS} days')
+        condition = 'c.store_id = %(owner)s' if store_id is not None else 'c.user_id = %(owner)s'
+        try:
+            owner = str(uuid.UUID(str(store_id if store_id is not None else user_id)))
+        except ValueError:
+            raise ValueError('store_id and user_id must be UUIDs')
+        params = {'start': start, 'end': end, 'owner': owner}
+
+        connection = db.engine.raw_connection()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(SELECT_CAMPAIGNS.format(condition=condition), params)
+                campaigns = cursor.fetchall()
+                series = cls(
+                    [str(row[0]) for row in campaigns], start, (end - start).days + 1,
+                    status=[row[1] for row in campaigns],
+                    daily_budget=[row[2] == 'daily' for row in campaigns],
+                    budget=[float(row[3]) if row[3] is not None else np.nan for row in campaigns],
+                    flight_start=[OPEN_START if row[4] is None else row[4] for row in campaigns],
+                    flight_end=[OPEN_END if row[5] is None else row[5] for row in campaigns],
+                    spend_before=[float(row[6]) for row in campaigns]
+                )
+                for lo in range(0, len(series), batch_size):
+                    buffer = io.BytesIO()
+                    cursor.copy_expert(
+                        cursor.mogrify(COPY_STATS, {**params, 'ids': series.campaign_ids[lo:lo + batch_size]}).decode(),
+                        buffer
+                    )
+                    rows = parse_binary_copy(buffer.getbuffer())
+                    campaigns, days = rows['campaign'] + lo, rows['day']
+                    for name in METRICS:
+                        series.values[name][campaigns, days] = rows[name]
+            connection.commit()
+        finally:
+            connection.close()
+        return series
+
+
+class CampaignMetrics:
+    """Per-campaign results of compute(), one array entry per campaign"""
+
+    FIELDS = ('impressions', 'clicks', 'conversions', 'spend', 'revenue', 'roas', 'cpa', 'cpc', 'ctr', 'cvr',
+              'budget_to_date', 'pacing', 'run_rate', 'projected_spend', 'flags', 'anomaly_days')
+
+    def __init__(self, campaign_ids, as_of, **arrays):
+        self.campaign_ids = campaign_ids
+        self.as_of = as_of
+        for name in self.FIELDS:
+            setattr(self, name, arrays[name])
+
+    def flagged(self, flag):
+        """Indexes of the campaigns with a flag, by name"""
+        import numpy as np
+
+        return np.flatnonzero(self.flags & FLAGS[flag])
+
+    def records(self):
+        """One JSON-ready dict per campaign"""
+        columns = {name: getattr(self, name).tolist() for name in self.FIELDS}
+        names = list(FLAGS.items())
+        records = []
+        for i, campaign_id in enumerate(self.campaign_ids):
+            record = {'campaign_id': campaign_id}
+            for name, values in columns.items():
+                value = values[i]
+                record[name] = None if isinstance(value, float) and math.isnan(value) else value
+            record['flags'] = [name for name, bit in names if record['flags'] & bit]
+            records.append(record)
+        return records
+
+
+def _ratio(numerator, denominator):
+    import numpy as np
+
+    return np.divide(numerator, denominator, out=np.full(np.broadcast(numerator, denominator).shape, np.nan),
+                     where=denominator > 0)
+
+
+def _trailing(values, window):
+    """
+    Sum of each day's `window` preceding days (not the day itself), as
+    float32, and how many days that was, from one cumulative sum
+    """
+    import numpy as np
+
+    campaigns, days = values.shape
+    totals = np.zeros((campaigns, days + 1))
+    np.cumsum(values, axis=1, dtype=np.float64, out=totals[:, 1:])
+    sums = np.empty((campaigns, days), np.float32)
+    head = min(window, days)
+    np.subtract(totals[:, :head], totals[:, :1], out=sums[:, :head])
+    np.subtract(totals[:, window:days], totals[:, :days - window], out=sums[:, head:])
+    return sums, np.minimum(np.arange(days), window).astype(np.float32)
+
+
+def _flag(bits, condition, name):
+    import numpy as np
+
+    bits |= condition * np.uint16(FLAGS[name])
+
+
+def _anomalies(values, active_on_day):
+    """
+    Anomaly bits for every campaign and day. Ratios are compared
+    cross-multiplied, so days with nothing to divide by need no special case.
+    """
+    import numpy as np
+
+    spend = values['spend']
+    conversions = values['conversions']
+    revenue = values['revenue']
+
+    spend_sum, history = _trailing(spend, ANOMALY_WINDOW)
+    conversions_sum, _ = _trailing(conversions, ANOMALY_WINDOW)
+    revenue_sum, _ = _trailing(revenue, ANOMALY_WINDOW)
+    impressions_sum, _ = _trailing(values['impressions'], ANOMALY_WINDOW)
+    squares_sum, _ = _trailing(np.square(spend, dtype=np.float64), ANOMALY_WINDOW)
+
+    days = np.maximum(history, 1)
+    mean = spend_sum / days
+    # Variance from float64 moments; float32 would cancel out small ones
+    deviation = np.sqrt(np.maximum(squares_sum / days - np.square(mean, dtype=np.float64), 0)).astype(np.float32)
+
+    enough = history >= ANOMALY_MIN_HISTORY
+    steady = enough & (deviation > 0)
+    bits = np.zeros(spend.shape, np.uint16)
+    excess = spend - mean
+    deviation *= ANOMALY_Z
+    _flag(bits, steady & (excess > deviation), 'spend_spike')
+    _flag(bits, steady & (excess < -deviation), 'spend_drop')
+    # Spend that should have bought twice the conversions it did (at least one):
+    # spend / max(conversions, 1) > 2 * spend_sum / conversions_sum
+    _flag(bits, enough & (spend * conversions_sum > 2 * spend_sum * np.maximum(conversions, 1)), 'cpa_spike')
+    # revenue / spend < revenue_sum / spend_sum / 2, on days that spent at
+    # least half the usual amount
+    _flag(bits, enough & (revenue_sum > 0) & (spend > 0.5 * mean) & (2 * revenue * spend_sum < revenue_sum * spend),
+          'roas_drop')
+    _flag(bits, enough & active_on_day & (impressions_sum > 0) & (values['impressions'] == 0), 'no_delivery')
+    return bits
+
+
+def _compute_batch(series, as_of):
+    import numpy as np
+
+    values = series.values
+    window = slice(0, as_of + 1)
+    totals = {name: values[name][:, window].sum(axis=1, dtype=np.float64) for name in METRICS}
+
+    # Days of the window inside each campaign's flight, up to the as-of day
+    first = np.maximum(series.flight_start, 0)
+    last = np.minimum(series.flight_end, as_of)
+    active_days = np.maximum(last - first + 1, 0)
+    in_flight = (series.flight_start <= as_of) & (series.flight_end >= as_of)
+
+    flight_days = (series.flight_end - series.flight_start + 1).astype(np.float64)
+    elapsed = (as_of - series.flight_start + 1).clip(0, None)
+    bounded = (series.flight_start > OPEN_START) & (series.flight_end < OPEN_END)
+    lifetime_share = np.where(bounded, np.minimum(elapsed / flight_days, 1), np.nan)
+    budget_to_date = np.where(series.daily_budget, series.budget * active_days, series.budget * lifetime_share)
+    spent = totals['spend'] + np.where(series.daily_budget, 0, series.spend_before)
+    pacing = _ratio(spent, budget_to_date)
+
+    recent = slice(max(as_of + 1 - RUN_RATE_DAYS, 0), as_of + 1)
+    run_rate = values['spend'][:, recent].mean(axis=1, dtype=np.float64)
+    remaining = np.clip(series.flight_end - as_of, 0, None)
+    projected = np.where(series.daily_budget | (series.flight_end >= OPEN_END), np.nan, spent + run_rate * remaining)
+
+    flags = np.zeros(len(series), np.uint16)
+    with np.errstate(invalid='ignore'):
+        _flag(flags, pacing > 1 + PACING_TOLERANCE, 'overpacing')
+        _flag(flags, series.active & in_flight & (pacing < 1 - PACING_TOLERANCE), 'underpacing')
+        _flag(flags, projected > series.budget * (1 + PACING_TOLERANCE), 'projected_overspend')
+
+    day = np.arange(as_of + 1)
+    active_on_day = series.active[:, None] & (day >= series.flight_start[:, None]) & (day <= series.flight_end[:, None])
+    anomalies = _anomalies({name: array[:, window] for name, array in values.items()}, active_on_day)
+    flags |= anomalies[:, as_of]
+
+    return {
+        **totals,
+        'roas': _ratio(totals['revenue'], totals['spend']),
+        'cpa': _ratio(totals['spend'], totals['conversions']),
+        'cpc': _ratio(totals['spend'], totals['clicks']),
+        'ctr': _ratio(totals['clicks'], totals['impressions']),
+        'cvr': _ratio(totals['conversions'], totals['clicks']),
+        'budget_to_date': budget_to_date,
+        'pacing': pacing,
+        'run_rate': run_rate,
+        'projected_spend': projected,
+        'flags': flags,
+        'anomaly_days': np.count_nonzero(anomalies & ANOMALIES, axis=1)
+    }
+
+
+def compute(series, as_of=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Metrics, pacing and flags for every campaign in `series` as of a day
+    of its window (a date; the last day by default), batch_size campaigns
+    at a time
+    """
+    import numpy as np
+
+    as_of = series.days - 1 if as_of is None else (as_of - series.start).days
+    if not 0 <= as_of < series.days:
+        raise ValueError('as_of must be inside the loaded window')
+
+    batches = [_compute_batch(series.slice(lo, lo + batch_size), as_of) for lo in range(0, len(series), batch_size)]
+    arrays = {
+        name: np.concatenate([batch[name] for batch in batches]) if batches else np.zeros(0)
+        for name in CampaignMetrics.FIELDS
+    }
+    return CampaignMetrics(series.campaign_ids, series.start + timedelta(days=as_of), **arrays)
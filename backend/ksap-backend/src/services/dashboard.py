@@ -0,0 +1,120 @@
+"""
+Multi-store dashboard served from store_dashboard_summaries.
+
+Each store has one summary row: revenue and count of orders that aren't
+cancelled, orders waiting for fulfillment, and products (all and
+active). Statement-level triggers on orders and products add each
+statement's net per-store change to those rows, and triggers on stores
+create a row for a new store and follow a change of owner, so the
+dashboard is one index scan on the owner's rows instead of aggregating
+orders and products for every card on every load.
+
+Writes to one store queue on its summary row until they commit, once per
+statement rather than per row, so bulk order ingestion costs one update
+per store per batch.
+
+Anything that bypasses the triggers (TRUNCATE, a trigger disabled during
+maintenance, a restored backup) leaves rows drifted; reconcile()
+recomputes every store from orders and products, batch by batch, and
+repairs the rows that differ (migration 37 builds the rows of existing
+stores the same way). Run it from cron:
+    python -m src.services.dashboard [--batch-size 500]
+"""
+
+import argparse
+import logging
+import uuid
+
+from src.models import db
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+
+SELECT_CARDS = """
+    SELECT s.store_id, st.name, st.platform, st.status, s.revenue, s.order_count,
+           s.pending_fulfillment_count, s.product_count, s.active_product_count, s.updated_at
+    FROM public.store_dashboard_summaries s
+    JOIN public.stores st ON st.id = s.store_id
+    WHERE s.user_id = :user_id
+    ORDER BY st.name, s.store_id
+"""
+
+
+class StoreDashboard:
+    """Reads dashboard cards and repairs drifted summaries"""
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE):
+        self.batch_size = batch_size
+
+    def cards(self, user_id):
+        """Summary cards of every store a user owns"""
+        try:
+            user_id = str(uuid.UUID(str(user_id)))
+        except ValueError:
+            raise ValueError('user_id must be a UUID')
+        rows = db.session.execute(db.text(SELECT_CARDS), {'user_id': user_id})
+        return [{
+            'store_id': str(row.store_id),
+            'name': row.name,
+            'platform': row.platform,
+            'status': row.status,
+            'revenue': float(row.revenue),
+            'order_count': row.order_count,
+            'pending_fulfillment_count': row.pending_fulfillment_count,
+            'product_count': row.product_count,
+            'active_product_count': row.active_product_count,
+            'updated_at': row.updated_at.isoformat() if row.updated_at else None
+        } for row in rows]
+
+    def reconcile(self, max_batches=None):
+        """
+        Recompute every store's summary, one commit per batch of stores;
+        returns (stores checked, rows repaired)
+        """
+        checked = repaired = batches = 0
+        after = None
+        while max_batches is None or batches < max_batches:
+            last, batch_checked, batch_repaired = db.session.execute(
+                db.text("SELECT * FROM public.reconcile_store_dashboard_summaries(:after, :batch_size)"),
+                {'after': after, 'batch_size': self.batch_size}
+            ).one()
+            db.session.commit()
+            if last is None:
+                break
+            checked += batch_checked
+            repaired += batch_repaired
+            batches += 1
+            after = str(last)
+            if batch_checked < self.batch_size:
+                break
+
+        if repaired:
+            logger.warning(f"⚠️ Repaired {repaired} drifted dashboard summaries of {checked} stores")
+        else:
+            logger.info(f"✅ Dashboard summaries of {checked} stores are consistent")
+        return checked, repaired
+
+
+# Global instance
+store_dashboard = StoreDashboard()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild drifted store dashboard summaries")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='stores recomputed per commit')
+    args = parser.parse_args(argv)
+
+    from src.main import app
+
+    store_dashboard.batch_size = args.batch_size
+    with app.app_context():
+        store_dashboard.reconcile()
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
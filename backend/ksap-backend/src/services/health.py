@@ -0,0 +1,152 @@
+"""
+Background dependency prober for KSAP health endpoints.
+
+Load balancers probe every worker every few seconds. Rather than hitting
+Supabase on each probe, a daemon thread checks dependencies on a fixed
+interval and caches the result; `/health` and `/readyz` only read that
+cache, so probes never block on the database.
+"""
+
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class DependencyStatus:
+    """Last observed state of a single dependency"""
+
+    def __init__(self, name):
+        self.name = name
+        self.healthy = None
+        self.checked_at = None
+        self.latency_ms = None
+        self.error = None
+        self.consecutive_failures = 0
+
+    def age(self, now=None):
+        if self.checked_at is None:
+            return None
+        return (now or time.time()) - self.checked_at
+
+    def to_dict(self, ttl):
+        age = self.age()
+        return {
+            'status': self.state(ttl),
+            'checked_at': self.checked_at,
+            'age_seconds': round(age, 3) if age is not None else None,
+            'latency_ms': self.latency_ms,
+            'consecutive_failures': self.consecutive_failures,
+            'error': self.error
+        }
+
+    def state(self, ttl):
+        """'connected', 'disconnected', 'stale' (result older than ttl) or 'unknown'"""
+        age = self.age()
+        if age is None:
+            return 'unknown'
+        if age > ttl:
+            return 'stale'
+        return 'connected' if self.healthy else 'disconnected'
+
+
+class HealthProber:
+    """
+    Periodically runs registered dependency checks on a daemon thread.
+
+    Each check is a zero-argument callable returning a truthy value when the
+    dependency is reachable. Results older than `ttl` seconds are reported
+    as stale and treated as not ready.
+    """
+
+    def __init__(self, interval=15.0, ttl=60.0):
+        self.interval = interval
+        self.ttl = ttl
+        self._checks = {}
+        self._statuses = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def init_app(self, app):
+        """Configure from app config and start probing in this process"""
+        self.interval = float(app.config.get('HEALTH_PROBE_INTERVAL', self.interval))
+        self.ttl = float(app.config.get('HEALTH_PROBE_TTL', self.ttl))
+        app.extensions['health_prober'] = self
+
+        # Threads do not survive a fork; restart the prober in each worker
+        app.before_request(self.ensure_started)
+
+    def register(self, name, check):
+        """Register a dependency check"""
+        with self._lock:
+            self._checks[name] = check
+            self._statuses.setdefault(name, DependencyStatus(name))
+
+    def ensure_started(self):
+        """Start the probe thread if it isn't running in the current process"""
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='ksap-health-prober', daemon=True)
+            self._thread.start()
+
+    def probe_now(self):
+        """Run every check once, synchronously, and update the cache"""
+        with self._lock:
+            checks = list(self._checks.items())
+        for name, check in checks:
+            self._probe(name, check)
+
+    def _probe(self, name, check):
+        started = time.perf_counter()
+        error = None
+        try:
+            healthy = bool(check())
+        except Exception as e:
+            healthy = False
+            error = str(e)
+        latency_ms = round((time.perf_counter() - started) * 1000, 2)
+
+        with self._lock:
+            status = self._statuses[name]
+            status.healthy = healthy
+            status.checked_at = time.time()
+            status.latency_ms = latency_ms
+            status.error = error
+            status.consecutive_failures = 0 if healthy else status.consecutive_failures + 1
+            first_failure = status.consecutive_failures == 1
+
+        # Log transitions only; a down dependency would otherwise log every interval
+        if first_failure:
+            logger.warning(f"Health probe '{name}' failed after {latency_ms}ms: {error or 'check returned false'}")
+
+    def stop(self):
+        """Stop the probe thread after its current cycle"""
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self.probe_now()
+            self._stopped.wait(self.interval)
+
+    def snapshot(self):
+        """Cached status of every dependency, keyed by name"""
+        with self._lock:
+            return {name: status.to_dict(self.ttl) for name, status in self._statuses.items()}
+
+    def is_ready(self):
+        """True when every dependency has a fresh, successful probe result"""
+        with self._lock:
+            return all(status.state(self.ttl) == 'connected' for status in self._statuses.values())
+
+
+# Global instance
+health_prober = HealthProber()
@@ -0,0 +1,342 @@
+"""
+Inventory reservations for checkout.
+
+A checkout takes a short-lived hold on its line items before the order is
+placed. reserve() does it in one statement: lock the tracked products in
+id order, check that every line has enough stock, and, only if all do,
+decrement inventory_quantity and insert the holds. A cart that is
+already short when the statement starts (a sold-out SKU) is refused
+without waiting for the locks. The row locks are held
+for that one statement and its commit, so checkouts contending for a
+flash-sale SKU queue for milliseconds, never for a request's lifetime,
+and stock can't go negative the way a read-then-write would let it.
+Locking in id order keeps checkouts that share products from
+deadlocking.
+
+A hold is then committed to an order (the stock stays taken) or released
+(the stock goes back). products.inventory_held counts the units in live
+holds, moving in the same statements, so a platform sync can write the
+platform's count less what checkouts hold instead of wiping the holds out
+(see src.services.platform_sync); committed units stay out of stock until
+the order reaches the platform and its count. Holds nobody commits expire after their TTL:
+expire() returns them in batches (run it from cron or with --loop), and a
+reservation that falls short first releases expired holds on the
+products it wanted, so stock never waits on the sweeper. A hold past its
+expiry can still be committed until it has been released.
+
+Inventory changes are plain SQL, which the ORM commit hook cannot see,
+so every commit that moves stock evicts the store's cached product
+responses itself.
+
+Usage:
+    from src.services.inventory import inventory
+
+    hold = inventory.reserve(store_id, [{'product_id': ..., 'quantity': 2}])
+    inventory.commit(hold['reservation_id'], order_id)   # or inventory.release(...)
+
+    python -m src.services.inventory [--loop] [--interval 30]
+"""
+
+import argparse
+import logging
+import time
+import uuid
+
+from src.models import db, InventoryReservation
+from src.services.cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 600
+MAX_TTL = 3600
+MAX_ITEMS = 100
+DEFAULT_EXPIRE_BATCH = 1000
+
+RESERVE_SQL = """
+WITH wanted AS (
+    SELECT product_id, sum(quantity)::int AS quantity
+    FROM unnest(CAST(:product_ids AS uuid[]), CAST(:quantities AS int[])) AS w (product_id, quantity)
+    GROUP BY product_id
+),
+stock AS (
+    SELECT p.id, p.track_inventory, coalesce(p.inventory_quantity, 0) AS available
+    FROM public.products p JOIN wanted w ON w.product_id = p.id
+    WHERE p.store_id = :store_id
+),
+-- Read without locking: a cart already short of stock (a sold-out SKU)
+-- is refused without queueing for the row locks
+hopeful AS (
+    SELECT (SELECT count(*) FROM stock) = (SELECT count(*) FROM wanted)
+       AND NOT EXISTS (
+           SELECT 1 FROM stock c JOIN wanted w ON w.product_id = c.id
+           WHERE c.track_inventory AND c.available < w.quantity
+       ) AS hopeful
+),
+locked AS (
+    SELECT p.id, coalesce(p.inventory_quantity, 0) AS available, w.quantity
+    FROM public.products p JOIN wanted w ON w.product_id = p.id CROSS JOIN hopeful h
+    WHERE p.store_id = :store_id AND p.track_inventory AND h.hopeful
+    ORDER BY p.id
+    FOR UPDATE OF p
+),
+verdict AS (
+    SELECT h.hopeful AND fresh AND NOT EXISTS (SELECT 1 FROM locked WHERE available < quantity) AS ok, fresh
+    FROM hopeful h, (
+        SELECT NOT EXISTS (SELECT 1 FROM public.inventory_reservations WHERE reservation_id = :reservation_id) AS fresh
+    ) checks
+),
+decremented AS (
+    UPDATE public.products p
+    SET inventory_quantity = l.available - l.quantity, inventory_held = p.inventory_held + l.quantity
+    FROM locked l, verdict v
+    WHERE p.id = l.id AND v.ok
+),
+held AS (
+    INSERT INTO public.inventory_reservations (reservation_id, product_id, store_id, quantity, stock_taken, expires_at)
+    SELECT :reservation_id, w.product_id, :store_id, w.quantity, l.id IS NOT NULL, now() + make_interval(secs => :ttl)
+    FROM wanted w CROSS JOIN verdict v LEFT JOIN locked l ON l.id = w.product_id
+    WHERE v.ok
+    RETURNING expires_at
+)
+SELECT w.product_id::text, w.quantity, c.id IS NOT NULL, available.units,
+       available.units < w.quantity AND EXISTS (
+           SELECT 1 FROM public.inventory_reservations e
+           WHERE e.status = 'held' AND e.expires_at < now() AND e.product_id = w.product_id
+       ),
+       v.ok, v.fresh, (SELECT max(expires_at) FROM held)
+FROM wanted w CROSS JOIN verdict v
+LEFT JOIN stock c ON c.id = w.product_id
+LEFT JOIN locked l ON l.id = w.product_id
+CROSS JOIN LATERAL (SELECT CASE WHEN c.track_inventory THEN coalesce(l.available, c.available) END AS units) available
+"""
+
+# Marks held rows matching {condition} as :status (for an order, when
+# :order_id is given) and takes their units out of inventory_held, returning
+# the stock too when :restock; locks the products in id order like
+# RESERVE_SQL. Returns the count and the stores whose stock was returned.
+SETTLE_SQL = """
+WITH settled AS (
+    UPDATE public.inventory_reservations r SET status = :status, order_id = CAST(:order_id AS uuid)
+    WHERE r.status = 'held' AND {condition}
+    RETURNING r.product_id, r.store_id, r.quantity, r.stock_taken
+),
+unheld AS (
+    SELECT product_id, sum(quantity)::int AS quantity FROM settled WHERE stock_taken GROUP BY product_id
+),
+locked AS (
+    SELECT p.id FROM public.products p WHERE p.id IN (SELECT product_id FROM unheld)
+    ORDER BY p.id
+    FOR UPDATE
+),
+updated AS (
+    UPDATE public.products p
+    SET inventory_held = p.inventory_held - u.quantity,
+        inventory_quantity = coalesce(p.inventory_quantity, 0) + CASE WHEN :restock THEN u.quantity ELSE 0 END
+    FROM unheld u, locked l
+    WHERE p.id = u.product_id AND l.id = p.id
+)
+SELECT count(*), coalesce(array_agg(DISTINCT store_id::text) FILTER (WHERE stock_taken AND :restock), ARRAY[]::text[])
+FROM settled
+"""
+
+EXPIRED_CONDITION = """(r.reservation_id, r.product_id) IN (
+        SELECT reservation_id, product_id FROM public.inventory_reservations
+        WHERE status = 'held' AND expires_at < now() {products}
+        ORDER BY expires_at
+        LIMIT :limit
+        FOR UPDATE SKIP LOCKED
+    )"""
+
+
+class InventoryError(Exception):
+    """A reservation request that can't be met, with the API error code and HTTP status"""
+
+    def __init__(self, code, message, status, details=None):
+        super().__init__(message)
+        self.code = code
+        self.status = status
+        self.details = details
+
+
+def _uuid(value, name):
+    try:
+        return str(uuid.UUID(str(value)))
+    except ValueError:
+        raise InventoryError('BAD_REQUEST', f"{name} must be a UUID", 400)
+
+
+class InventoryReservations:
+    """Atomic multi-item holds on product stock"""
+
+    def __init__(self, default_ttl=DEFAULT_TTL, expire_batch=DEFAULT_EXPIRE_BATCH):
+        self.default_ttl = default_ttl
+        self.expire_batch = expire_batch
+
+    def init_app(self, app):
+        self.default_ttl = int(app.config.get('RESERVATION_TTL', self.default_ttl))
+        app.extensions['inventory'] = self
+
+    def reserve(self, store_id, items, ttl=None, reservation_id=None):
+        """
+        Hold every line item or none. `items` is a list of {product_id,
+        quantity}; repeated products are summed and untracked products
+        are held without touching stock. Passing the same reservation_id
+        again returns the existing hold, so a retried checkout doesn't
+        reserve twice.
+
+        Raises InventoryError: 400 for bad input, 404 for products not in
+        the store, 409 INSUFFICIENT_INVENTORY with the short lines.
+        """
+        store_id = _uuid(store_id, 'store_id')
+        reservation_id = _uuid(reservation_id, 'reservation_id') if reservation_id else str(uuid.uuid4())
+        ttl = self.default_ttl if ttl is None else ttl
+        if not isinstance(ttl, (int, float)) or not 0 < ttl <= MAX_TTL:
+            raise InventoryError('BAD_REQUEST', f"ttl must be between 1 and {MAX_TTL} seconds", 400)
+        if not isinstance(items, list) or not 0 < len(items) <= MAX_ITEMS:
+            raise InventoryError('BAD_REQUEST', f"items must be a list of 1 to {MAX_ITEMS} line items", 400)
+        product_ids, quantities = [], []
+        for item in items:
+            quantity = item.get('quantity') if isinstance(item, dict) else None
+            if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+                raise InventoryError('BAD_REQUEST', "each item needs a product_id and a positive integer quantity", 400)
+            product_ids.append(_uuid(item.get('product_id'), 'product_id'))
+            quantities.append(quantity)
+
+        params = {
+            'store_id': store_id,
+            'reservation_id': reservation_id,
+            'product_ids': product_ids,
+            'quantities': quantities,
+            'ttl': ttl
+        }
+        product_ids, quantities, found, available, expired_holds, ok, fresh, expires_at = zip(*self._reserve(params))
+        short = [product_id for product_id, expired in zip(product_ids, expired_holds) if expired]
+        # Stock may be sitting in holds that have expired but not been swept yet
+        if not ok[0] and fresh[0] and short and self._settle(
+            EXPIRED_CONDITION.format(products='AND product_id = ANY(CAST(:product_ids AS uuid[]))'),
+            'expired', {'product_ids': short, 'limit': self.expire_batch}
+        ):
+            product_ids, quantities, found, available, expired_holds, ok, fresh, expires_at = zip(*self._reserve(params))
+
+        if ok[0]:
+            response_cache.invalidate(f'store:{store_id}:products')
+            logger.debug(f"Reserved {sum(quantities)} unit(s) of {len(product_ids)} product(s) as {reservation_id}")
+            return {
+                'reservation_id': reservation_id,
+                'store_id': store_id,
+                'status': 'held',
+                'expires_at': expires_at[0].isoformat(),
+                'items': [{'product_id': product_id, 'quantity': quantity}
+                          for product_id, quantity in zip(product_ids, quantities)]
+            }
+        if not fresh[0]:
+            existing = self.get(reservation_id)
+            if existing['store_id'] != store_id:
+                raise InventoryError('CONFLICT', "reservation_id is already used by another store", 409)
+            return existing
+        missing = [product_id for product_id, is_found in zip(product_ids, found) if not is_found]
+        if missing:
+            raise InventoryError('NOT_FOUND', "Some products are not in this store", 404, {'product_ids': missing})
+        raise InventoryError('INSUFFICIENT_INVENTORY', "Not enough stock for some items", 409, {'shortages': [
+            {'product_id': product_id, 'requested': quantity, 'available': stock}
+            for product_id, quantity, stock in zip(product_ids, quantities, available)
+            if stock is not None and stock < quantity
+        ]})
+
+    def _reserve(self, params):
+        """Run RESERVE_SQL; one row per product: id, quantity, found, available, expired holds, ok, fresh, expires_at"""
+        from sqlalchemy.exc import IntegrityError
+
+        try:
+            rows = db.session.execute(db.text(RESERVE_SQL), params).all()
+            db.session.commit()
+        except IntegrityError:
+            # The same reservation_id was taken concurrently
+            db.session.rollback()
+            rows = [(product_id, quantity, True, None, False, False, False, None)
+                    for product_id, quantity in zip(params['product_ids'], params['quantities'])]
+        return rows
+
+    def get(self, reservation_id):
+        """A reservation with its items, or None"""
+        rows = InventoryReservation.query.filter_by(reservation_id=_uuid(reservation_id, 'reservation_id')).all()
+        if not rows:
+            return None
+        return {
+            'reservation_id': str(rows[0].reservation_id),
+            'store_id': str(rows[0].store_id),
+            'status': rows[0].status,
+            'order_id': str(rows[0].order_id) if rows[0].order_id else None,
+            'expires_at': rows[0].expires_at.isoformat(),
+            'items': [{'product_id': str(row.product_id), 'quantity': row.quantity} for row in rows]
+        }
+
+    def commit(self, reservation_id, order_id):
+        """
+        Keep a hold's stock for an order. Committing again for the same
+        order is a no-op; raises InventoryError 404 for an unknown
+        reservation and 409 for one released, expired or committed to
+        another order.
+        """
+        reservation_id = _uuid(reservation_id, 'reservation_id')
+        order_id = _uuid(order_id, 'order_id')
+        committed = self._settle('r.reservation_id = :reservation_id', 'committed',
+                                 {'reservation_id': reservation_id}, order_id=order_id, restock=False)
+        existing = self.get(reservation_id)
+        if existing is None:
+            raise InventoryError('NOT_FOUND', "Reservation not found", 404)
+        if not committed and (existing['status'] != 'committed' or existing['order_id'] != order_id):
+            raise InventoryError('RESERVATION_' + existing['status'].upper(),
+                                 f"Reservation is {existing['status']}", 409)
+        return existing
+
+    def release(self, reservation_id):
+        """Return a hold's stock; returns False when nothing was held (already released, expired or committed)"""
+        released = self._settle('r.reservation_id = :reservation_id', 'released',
+                                 {'reservation_id': _uuid(reservation_id, 'reservation_id')})
+        return released > 0
+
+    def expire(self):
+        """Return the stock of holds past their expiry, one batch; returns the number of lines released"""
+        expired = self._settle(EXPIRED_CONDITION.format(products=''), 'expired', {'limit': self.expire_batch})
+        if expired:
+            logger.info(f"Expired {expired} inventory hold(s)")
+        return expired
+
+    def _settle(self, condition, status, params, order_id=None, restock=True):
+        settled, store_ids = db.session.execute(
+            db.text(SETTLE_SQL.format(condition=condition)),
+            {**params, 'status': status, 'order_id': order_id, 'restock': restock}
+        ).one()
+        db.session.commit()
+        if store_ids:
+            response_cache.invalidate(*(f'store:{store_id}:products' for store_id in store_ids))
+        return settled
+
+
+# Global instance
+inventory = InventoryReservations()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Release inventory holds past their expiry")
+    parser.add_argument('--loop', action='store_true', help='keep sweeping every --interval seconds')
+    parser.add_argument('--interval', type=float, default=30)
+    args = parser.parse_args(argv)
+
+    from src.main import app
+
+    with app.app_context():
+        while True:
+            while inventory.expire() == inventory.expire_batch:
+                pass
+            if not args.loop:
+                return 0
+            time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,409 @@
+"""
+Request instrumentation and Prometheus metrics for KSAP.
+
+`request_metrics.init_app(app)` hooks every request and records:
+
+    ksap_http_requests_total                 by blueprint, route, method, status
+    ksap_http_request_duration_seconds       histogram by blueprint, route, method
+    ksap_http_response_size_bytes            histogram by blueprint, route
+    ksap_db_statements_total                 SQLAlchemy statements by verb
+    ksap_db_statement_duration_seconds       histogram by verb
+    ksap_db_statement_errors_total           statements that raised
+    ksap_http_request_db_statements          histogram of statements per request, by route
+    ksap_supabase_request_duration_seconds   histogram by method, table, status
+    ksap_profiles_captured_total             sampled slow-request profiles, by route
+
+and serves them, with the response cache and Supabase pool counters, in
+the Prometheus text format on /metrics. Routes are labelled with their
+URL rule (`/api/v1/users/<user_id>`), never the raw path, so label
+cardinality stays bounded.
+
+Metrics live in the worker process: Prometheus scrapes each worker (or
+the pod, with one worker per pod); nothing is shared across processes.
+
+Slow-request profiling: with PROFILE_THRESHOLD_MS set, a PROFILE_SAMPLE_RATE
+fraction of requests runs under cProfile, and the profile is written to
+PROFILE_DIR only when the request took longer than the threshold (open
+with `python -m pstats` or snakeviz). The newest PROFILE_KEEP files are
+kept.
+
+Reference: https://prometheus.io/docs/instrumenting/exposition_formats/
+"""
+
+import cProfile
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0, 5.0)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+SQL_VERBS = {'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'COPY', 'BEGIN', 'COMMIT', 'ROLLBACK'}
+POSTGREST_TABLE = re.compile(r'/rest/v1/(?:rpc/)?([^/?]+)')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter keyed by label values"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            yield f'{self.name}{_labels(self.labels, label_values)} {_number(value)}'
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by label values"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        for label_values, series in sorted(snapshot.items()):
+            for bound, count in zip((*self.buckets, float('inf')), (*series[:-2], series[-1])):
+                le = 'le="%s"' % _number(bound)
+                yield f'{self.name}_bucket{_labels(self.labels, label_values, le)} {count}'
+            yield f'{self.name}_sum{_labels(self.labels, label_values)} {_number(series[-2])}'
+            yield f'{self.name}_count{_labels(self.labels, label_values)} {series[-1]}'
+
+
+class Gauge:
+    """Value read from a callable at scrape time"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, read):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+
+    def samples(self):
+        value = self.read()
+        if value is not None:
+            yield f'{self.name} {_number(value)}'
+
+
+class Registry:
+    """Metrics rendered together on /metrics"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """`collect()` yields (name, kind, documentation, value) at scrape time"""
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            samples = list(metric.samples())
+            if samples:
+                lines.append(f'# HELP {metric.name} {metric.documentation}')
+                lines.append(f'# TYPE {metric.name} {metric.kind}')
+                lines.extend(samples)
+        for collect in self._collectors:
+            try:
+                for name, kind, documentation, value in collect():
+                    lines.append(f'# HELP {name} {documentation}')
+                    lines.append(f'# TYPE {name} {kind}')
+                    lines.append(f'{name} {_number(value)}')
+            except Exception as e:
+                logger.warning(f"⚠️ Metrics collector failed: {e}")
+        return '\n'.join(lines) + '\n'
+
+
+class RequestMetrics:
+    """Per-request instrumentation, SQL and Supabase timings, and the /metrics view"""
+
+    def __init__(self):
+        self.registry = Registry()
+        self.started_at = time.time()
+        self.requests = self.registry.register(Counter(
+            'ksap_http_requests_total', 'HTTP requests by route and status',
+            ('blueprint', 'route', 'method', 'status')
+        ))
+        self.latency = self.registry.register(Histogram(
+            'ksap_http_request_duration_seconds', 'Time to build the response',
+            ('blueprint', 'route', 'method')
+        ))
+        self.response_size = self.registry.register(Histogram(
+            'ksap_http_response_size_bytes', 'Response body size (non-streamed responses)',
+            ('blueprint', 'route'), buckets=SIZE_BUCKETS
+        ))
+        self.request_statements = self.registry.register(Histogram(
+            'ksap_http_request_db_statements', 'SQL statements executed per request',
+            ('blueprint', 'route'), buckets=COUNT_BUCKETS
+        ))
+        self.statements = self.registry.register(Counter(
+            'ksap_db_statements_total', 'SQL statements executed through SQLAlchemy', ('verb',)
+        ))
+        self.statement_latency = self.registry.register(Histogram(
+            'ksap_db_statement_duration_seconds', 'SQL statement execution time',
+            ('verb',), buckets=DB_LATENCY_BUCKETS
+        ))
+        self.supabase_latency = self.registry.register(Histogram(
+            'ksap_supabase_request_duration_seconds', 'Supabase HTTP request time',
+            ('method', 'table', 'status')
+        ))
+        self.profiles = self.registry.register(Counter(
+            'ksap_profiles_captured_total', 'Slow requests profiled and written to PROFILE_DIR', ('route',)
+        ))
+        self.registry.register(Gauge(
+            'ksap_process_uptime_seconds', 'Seconds since instrumentation started',
+            lambda: round(time.time() - self.started_at, 3)
+        ))
+        self.statement_errors = self.registry.register(Counter(
+            'ksap_db_statement_errors_total', 'SQL statements that raised'
+        ))
+        self.registry.add_collector(self._cache_samples)
+        self.registry.add_collector(self._pool_samples)
+
+        self.enabled = True
+        self.profile_threshold = None
+        self.profile_sample_rate = 0.0
+        self.profile_dir = None
+        self.profile_keep = 50
+        self._listening = False
+        self._profile_lock = threading.Lock()
+
+    def init_app(self, app):
+        """Attach request hooks, SQL and Supabase timing, and register /metrics"""
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        threshold_ms = float(app.config.get('PROFILE_THRESHOLD_MS') or 0)
+        self.profile_threshold = threshold_ms / 1000 if threshold_ms > 0 else None
+        self.profile_sample_rate = float(app.config.get('PROFILE_SAMPLE_RATE', 0.0))
+        self.profile_dir = app.config.get('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles')
+        self.profile_keep = int(app.config.get('PROFILE_KEEP', self.profile_keep))
+        app.extensions['request_metrics'] = self
+        if not self.enabled:
+            return
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+        if not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            event.listen(Engine, 'handle_error', self._statement_failed)
+            # Importing the pool would load httpx and the Supabase client at
+            # startup; when it is not loaded yet, it registers observe_supabase
+            # itself on first import (see src.database.pool)
+            pool = sys.modules.get('src.database.pool')
+            if pool is not None and self.observe_supabase not in pool.request_observers:
+                pool.request_observers.append(self.observe_supabase)
+            self._listening = True
+
+        if self.profile_threshold is not None and self.profile_sample_rate > 0:
+            logger.info(f"✅ Profiling {self.profile_sample_rate:.1%} of requests slower than "
+                        f"{threshold_ms:.0f}ms into {self.profile_dir}")
+
+    # Request hooks
+
+    def _before_request(self):
+        g._metrics_started = time.perf_counter()
+        g._metrics_statements = 0
+        g._metrics_profiler = None
+        if self.profile_threshold is not None and random.random() < self.profile_sample_rate:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                return  # another profiler is active in this process
+            g._metrics_profiler = profiler
+
+    @staticmethod
+    def _route():
+        rule = request.url_rule
+        return request.blueprint or '', rule.rule if rule is not None else 'unmatched'
+
+    def _after_request(self, response):
+        started = g.pop('_metrics_started', None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        blueprint, route = self._route()
+
+        self.requests.inc(blueprint, route, request.method, str(response.status_code))
+        self.latency.observe(elapsed, blueprint, route, request.method)
+        self.request_statements.observe(g.pop('_metrics_statements', 0), blueprint, route)
+        if not response.is_streamed:
+            self.response_size.observe(response.calculate_content_length() or 0, blueprint, route)
+
+        profiler = g.pop('_metrics_profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            if elapsed >= self.profile_threshold:
+                self._save_profile(profiler, route, elapsed)
+        return response
+
+    def _teardown_request(self, error):
+        # after_request does not run when the response could not be built
+        profiler = g.pop('_metrics_profiler', None)
+        if profiler is not None:
+            profiler.disable()
+
+    # SQLAlchemy
+
+    @staticmethod
+    def _verb(statement):
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ''
+        return verb if verb in SQL_VERBS else 'OTHER'
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_metrics_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['_metrics_started'].pop()
+        verb = self._verb(statement)
+        self.statements.inc(verb)
+        self.statement_latency.observe(time.perf_counter() - started, verb)
+        if has_request_context() and '_metrics_statements' in g:
+            g._metrics_statements += 1
+
+    def _statement_failed(self, context):
+        stack = context.connection.info.get('_metrics_started') if context.connection is not None else None
+        if stack:
+            stack.pop()
+        self.statement_errors.inc()
+
+    # Supabase
+
+    def observe_supabase(self, http_request, status_code, seconds):
+        """Pool request observer (src.database.pool.request_observers)"""
+        if not self._listening:
+            return
+        try:
+            match = POSTGREST_TABLE.search(http_request.url.path)
+            table = match.group(1) if match else http_request.url.path.split('/')[1] or 'root'
+            status = str(status_code) if status_code is not None else 'error'
+            self.supabase_latency.observe(seconds, http_request.method, table, status)
+        except Exception as e:
+            logger.debug(f"Could not record Supabase timing: {e}")
+
+    # Scrape-time collectors
+
+    @staticmethod
+    def _cache_samples():
+        from src.services.cache import response_cache
+
+        metrics = response_cache.metrics.to_dict()
+        yield 'ksap_cache_hits_total', 'counter', 'Response cache hits', metrics['hits']
+        yield 'ksap_cache_misses_total', 'counter', 'Response cache misses', metrics['misses']
+        yield 'ksap_cache_errors_total', 'counter', 'Response cache backend errors', metrics['errors']
+        yield 'ksap_cache_evictions_total', 'counter', 'Entries evicted by invalidation', metrics['evicted']
+
+    @staticmethod
+    def _pool_samples():
+        # Only report once something has used Supabase; never import the client for a scrape
+        client_module = sys.modules.get('src.database.supabase_client')
+        if client_module is None or client_module.supabase_client._transport is None:
+            return
+        pool = client_module.supabase_client.pool_metrics()
+        yield 'ksap_supabase_pool_size', 'gauge', 'Pooled Supabase connections per worker', pool['pool_size']
+        yield 'ksap_supabase_pool_in_flight', 'gauge', 'Supabase requests holding a connection', pool['in_flight']
+        yield 'ksap_supabase_pool_timeouts_total', 'counter', 'Requests that found no free connection', \
+            pool['pool_timeouts']
+        yield 'ksap_supabase_errors_total', 'counter', 'Failed Supabase requests', pool['errors_total']
+        yield 'ksap_supabase_acquire_wait_seconds_max', 'gauge', 'Longest wait for a pooled connection', \
+            pool['acquire_wait_seconds_max']
+
+    # Profiles
+
+    def _save_profile(self, profiler, route, elapsed):
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')
+        path = os.path.join(self.profile_dir, f'{stamp}-{slug}-{int(elapsed * 1000)}ms.prof')
+        try:
+            with self._profile_lock:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                profiler.dump_stats(path)
+                profiles = sorted(name for name in os.listdir(self.profile_dir) if name.endswith('.prof'))
+                for name in profiles[:-self.profile_keep] if self.profile_keep > 0 else []:
+                    os.remove(os.path.join(self.profile_dir, name))
+        except OSError as e:
+            logger.warning(f"⚠️ Could not write request profile {path}: {e}")
+            return
+        self.profiles.inc(route)
+        logger.info(f"Profiled slow request {request.method} {route} ({elapsed * 1000:.0f}ms): {path}")
+
+    # Endpoint
+
+    def metrics_view(self):
+        """Prometheus scrape endpoint"""
+        return Response(self.registry.render(), mimetype=None, content_type=CONTENT_TYPE)
+
+
+# Global instance
+request_metrics = RequestMetrics()
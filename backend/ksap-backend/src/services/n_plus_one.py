@@ -0,0 +1,192 @@
+"""
+N+1 query detector for development and tests.
+
+The models load relationships lazily (`User.stores`, `Store.products`,
+...), so code like `[store.to_dict() for store in user.stores]` quietly
+issues one query per row. The detector listens to SQLAlchemy engine
+events, normalizes each statement to its shape (bind parameters and
+literals replaced, IN lists collapsed) and counts shapes per scope - one
+HTTP request, or one `watch()` block. A shape executed more than
+`threshold` times in a scope is an N+1:
+
+    log    log a report when the scope ends, with counts and code locations
+    raise  raise NPlusOneError from the offending query
+
+Dev server: NPLUSONE_MODE=log (the default when FLASK_ENV=development)
+or raise, with NPLUSONE_THRESHOLD (default 5).
+
+Tests and scripts:
+
+    with n_plus_one_detector.watch(threshold=3):
+        client.get('/api/v1/users/users')
+
+raises NPlusOneError from the offending query (mode='log' logs a report
+instead) and works with or without an app.
+"""
+
+import logging
+import re
+import threading
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = 5
+MODES = ('off', 'log', 'raise')
+
+_BIND_PARAMS = re.compile(r"%\(\w+\)s|%s|\?|\$\d+|(?<![:\w]):\w+")
+_STRING_LITERALS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class NPlusOneError(AssertionError):
+    """A statement shape repeated more than the threshold within one scope"""
+
+
+def statement_shape(statement):
+    """Statement with parameters and literals replaced by ?, IN lists collapsed"""
+    shape = _STRING_LITERALS.sub('?', statement)
+    shape = _BIND_PARAMS.sub('?', shape)
+    shape = _NUMBERS.sub('?', shape)
+    shape = _WHITESPACE.sub(' ', shape).strip()
+    return _IN_LISTS.sub('(?)', shape)
+
+
+def _caller(depth=3):
+    """
+    Innermost project frames outside this module, e.g.
+    'src/models/store.py:67 in _count <- src/models/store.py:113 in to_dict <- ...'
+    """
+    frames = []
+    for frame in reversed(traceback.extract_stack()[:-2]):
+        path = frame.filename.replace('\\', '/')
+        if '/src/' in path and not path.endswith('/n_plus_one.py'):
+            frames.append(f"{path[path.rindex('/src/') + 1:]}:{frame.lineno} in {frame.name}")
+            if len(frames) == depth:
+                break
+    return ' <- '.join(frames) or 'unknown location'
+
+
+class Scope:
+    """Statement shapes seen in one request or watch() block"""
+
+    def __init__(self, name, threshold, mode):
+        self.name = name
+        self.threshold = threshold
+        self.mode = mode
+        self.counts = Counter()
+        self.locations = {}
+
+    def violations(self):
+        """{shape: (count, location)} for shapes over the threshold"""
+        return {
+            shape: (count, self.locations.get(shape, 'unknown location'))
+            for shape, count in self.counts.items() if count > self.threshold
+        }
+
+    def report(self):
+        lines = [f"N+1 queries in {self.name} (threshold {self.threshold}):"]
+        for shape, (count, location) in sorted(self.violations().items(), key=lambda item: -item[1][0]):
+            lines.append(f"  {count}x at {location}: {shape[:300]}")
+        return '\n'.join(lines)
+
+
+class NPlusOneDetector:
+    """Counts repeated statement shapes per scope and reports or raises on N+1 patterns"""
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, mode='off'):
+        self.threshold = threshold
+        self.mode = mode
+        self._local = threading.local()
+        self._listening = False
+
+    def init_app(self, app):
+        """Check every request of `app` according to NPLUSONE_MODE and NPLUSONE_THRESHOLD"""
+        self.mode = app.config.get('NPLUSONE_MODE', self.mode)
+        self.threshold = int(app.config.get('NPLUSONE_THRESHOLD', self.threshold))
+        if self.mode not in MODES:
+            raise ValueError(f"NPLUSONE_MODE must be one of {', '.join(MODES)}")
+        app.extensions['n_plus_one'] = self
+        if self.mode == 'off':
+            return
+
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+        self._listen()
+        logger.info(f"✅ N+1 detection enabled (mode={self.mode}, threshold={self.threshold})")
+
+    def _listen(self):
+        if not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            self._listening = True
+
+    # Scopes
+
+    @property
+    def _scopes(self):
+        scopes = getattr(self._local, 'scopes', None)
+        if scopes is None:
+            scopes = self._local.scopes = []
+        return scopes
+
+    def _before_request(self):
+        scope = Scope(f'{request.method} {request.path}', self.threshold, self.mode)
+        self._scopes.append(scope)
+        g._n_plus_one_scope = scope
+
+    def _teardown_request(self, error):
+        scope = g.pop('_n_plus_one_scope', None)
+        if scope is not None:
+            self._close(scope)
+
+    def _close(self, scope):
+        if scope in self._scopes:
+            self._scopes.remove(scope)
+        if scope.mode == 'log' and scope.violations():
+            logger.warning(f"⚠️ {scope.report()}")
+
+    @contextmanager
+    def watch(self, threshold=None, mode='raise', name='watch() block'):
+        """
+        Detect N+1 queries in a block. With mode='raise' the offending
+        query raises NPlusOneError; with mode='log' a report is logged
+        and the block completes. Yields the Scope for assertions.
+        """
+        self._listen()
+        scope = Scope(name, self.threshold if threshold is None else threshold, mode)
+        self._scopes.append(scope)
+        try:
+            yield scope
+        finally:
+            self._close(scope)
+
+    # Engine events
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        scopes = self._scopes
+        if not scopes:
+            return
+        shape = statement_shape(statement)
+        for scope in scopes:
+            scope.counts[shape] += 1
+            count = scope.counts[shape]
+            if count != scope.threshold + 1:
+                continue
+            scope.locations[shape] = _caller()
+            if scope.mode == 'raise':
+                raise NPlusOneError(
+                    f"N+1 query in {scope.name}: statement executed {count} times "
+                    f"(threshold {scope.threshold}) at {scope.locations[shape]}: {shape[:300]}"
+                )
+
+
+# Global instance
+n_plus_one_detector = NPlusOneDetector()
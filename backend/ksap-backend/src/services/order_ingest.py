@@ -0,0 +1,410 @@
+"""
+Bulk ingestion of platform order exports.
+
+Backfilling a store row by row through the ORM or the REST client costs
+a round trip (and an RLS check) per order and per item. This pipeline
+streams a JSONL or CSV export and, per batch of orders:
+ 1. COPYs orders and items into temporary staging tables
+ 2. upserts orders on (store_id, platform_order_id) in one statement,
+    keeping the created_at of orders already stored
+ 3. replaces the items of every upserted order in one DELETE and one INSERT
+ 4. commits, then evicts the store's cached order responses
+Each batch is idempotent, so an interrupted run can simply be restarted.
+
+Input formats:
+- JSONL: one order per line, keys named like the orders columns, with its
+  line items under "items" (or "line_items")
+- CSV: one row per line item, order columns repeated on each row and item
+  columns prefixed with "item_" (item_sku, item_quantity, item_price, ...);
+  rows of the same order must be consecutive, as platform exports are
+
+Usage (direct connection via DATABASE_URL):
+    python -m src.services.order_ingest --store-id <uuid> orders.jsonl [--batch-size 1000]
+"""
+
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+
+from .cache import response_cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+
+# (column, staging type); jsonb columns are serialized with json.dumps
+ORDER_COLUMNS = [
+    ('platform_order_id', 'VARCHAR(255)'),
+    ('order_number', 'VARCHAR(100)'),
+    ('customer_email', 'VARCHAR(255)'),
+    ('customer_name', 'VARCHAR(255)'),
+    ('customer_phone', 'VARCHAR(50)'),
+    ('billing_address', 'JSONB'),
+    ('shipping_address', 'JSONB'),
+    ('subtotal', 'DECIMAL(10,2)'),
+    ('tax_amount', 'DECIMAL(10,2)'),
+    ('shipping_amount', 'DECIMAL(10,2)'),
+    ('total_amount', 'DECIMAL(10,2)'),
+    ('currency', 'VARCHAR(3)'),
+    ('status', 'VARCHAR(50)'),
+    ('fulfillment_status', 'VARCHAR(50)'),
+    ('payment_status', 'VARCHAR(50)'),
+    ('notes', 'TEXT'),
+    ('tags', 'JSONB'),
+    ('created_at', 'TIMESTAMP WITH TIME ZONE'),
+]
+
+ITEM_COLUMNS = [
+    ('platform_order_id', 'VARCHAR(255)'),
+    ('platform_product_id', 'VARCHAR(255)'),
+    ('title', 'VARCHAR(500)'),
+    ('sku', 'VARCHAR(255)'),
+    ('quantity', 'INTEGER'),
+    ('price', 'DECIMAL(10,2)'),
+    ('total', 'DECIMAL(10,2)'),
+    ('variant_title', 'VARCHAR(255)'),
+    ('properties', 'JSONB'),
+]
+
+_JSON_COLUMNS = {'billing_address', 'shipping_address', 'tags', 'properties'}
+
+# Columns an upsert may overwrite; created_at is the platform's and never changes
+_UPDATED_COLUMNS = [name for name, _ in ORDER_COLUMNS if name not in ('platform_order_id', 'created_at')]
+
+
+def _staging_table(name, columns):
+    definition = ',\n    '.join(f'{column} {sql_type}' for column, sql_type in columns)
+    return f"CREATE TEMPORARY TABLE IF NOT EXISTS {name} (\n    {definition}\n)"
+
+
+STAGING_TABLES = f"""
+{_staging_table('ingest_orders', ORDER_COLUMNS)};
+{_staging_table('ingest_items', ITEM_COLUMNS)};
+CREATE TEMPORARY TABLE IF NOT EXISTS ingest_result (
+    id UUID,
+    platform_order_id VARCHAR(255),
+    created_at TIMESTAMP WITH TIME ZONE
+);
+"""
+
+
+def _upsert_orders_sql(conflict_columns, skip_unchanged=False):
+    columns = ', '.join(name for name, _ in ORDER_COLUMNS)
+    values = ', '.join(
+        {
+            'currency': "COALESCE(s.currency, 'USD')",
+            'tags': "COALESCE(s.tags, '[]'::jsonb)",
+            'created_at': 'COALESCE(s.created_at, CURRENT_TIMESTAMP)',
+        }.get(name, f's.{name}')
+        for name, _ in ORDER_COLUMNS
+    )
+    updates = ', '.join(f'{name} = EXCLUDED.{name}' for name in _UPDATED_COLUMNS)
+    if skip_unchanged:
+        # Identical orders are left alone: no write, no updated_at bump, and
+        # their items are not replaced since they are not in ingest_result
+        updates += (f" WHERE ({', '.join(f'orders.{name}' for name in _UPDATED_COLUMNS)})"
+                    f" IS DISTINCT FROM ({', '.join(f'EXCLUDED.{name}' for name in _UPDATED_COLUMNS)})")
+    return f"""
+        WITH upserted AS (
+            INSERT INTO public.orders (store_id, {columns})
+            SELECT %(store_id)s, {values} FROM ingest_orders s
+            ON CONFLICT ({', '.join(conflict_columns)}) DO UPDATE SET {updates}
+            RETURNING id, platform_order_id, created_at
+        )
+        INSERT INTO ingest_result SELECT * FROM upserted
+    """
+
+
+# Orders already stored keep their created_at: it is part of the conflict
+# key once orders is partitioned, so an export without it (or with a
+# different value) must not turn an update into a second copy of the
+# order. The row count (orders that will conflict, i.e. be updated rather
+# than inserted) feeds the inserted/updated counts, since RETURNING xmax
+# is not available on partitioned tables.
+RESOLVE_EXISTING = """
+UPDATE ingest_orders s SET created_at = o.created_at
+FROM public.orders o
+WHERE o.store_id = %(store_id)s AND o.platform_order_id = s.platform_order_id
+"""
+
+REPLACE_ITEMS = f"""
+DELETE FROM public.order_items i USING ingest_result r WHERE i.order_id = r.id;
+
+INSERT INTO public.order_items (order_id, store_id, order_created_at, {', '.join(name for name, _ in ITEM_COLUMNS[1:])})
+SELECT r.id, %(store_id)s, r.created_at, {', '.join(f's.{name}' for name, _ in ITEM_COLUMNS[1:])}
+FROM ingest_items s JOIN ingest_result r ON r.platform_order_id = s.platform_order_id;
+"""
+
+
+class IngestStats:
+    """Running totals for one ingestion run"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.batches = 0
+        self.orders_inserted = 0
+        self.orders_updated = 0
+        self.orders_unchanged = 0
+        self.items = 0
+        self.rejected = 0
+
+    @property
+    def rows(self):
+        return self.orders_inserted + self.orders_updated + self.items
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def to_dict(self):
+        return {
+            'batches': self.batches,
+            'orders_inserted': self.orders_inserted,
+            'orders_updated': self.orders_updated,
+            'orders_unchanged': self.orders_unchanged,
+            'items': self.items,
+            'rejected': self.rejected,
+            'seconds': round(self.elapsed, 3),
+            'rows_per_second': round(self.rows_per_second, 1)
+        }
+
+
+def _copy_value(value):
+    """Encode one value for COPY ... FROM STDIN in text format"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    value = str(value)
+    return (value.replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def _decimal(value, field):
+    if value is None or value == '':
+        return None
+    try:
+        return Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError(f"{field} is not a number: {value!r}")
+
+
+def _json_field(value):
+    # CSV exports carry JSON columns as strings
+    if isinstance(value, str):
+        return json.loads(value) if value.strip() else None
+    return value
+
+
+def _order_row(order):
+    if not order.get('platform_order_id'):
+        raise ValueError("platform_order_id is required")
+    row = []
+    for name, sql_type in ORDER_COLUMNS:
+        value = order.get(name)
+        if value == '':
+            value = None
+        if name in _JSON_COLUMNS:
+            value = _json_field(value)
+        elif sql_type.startswith('DECIMAL'):
+            value = _decimal(value, name)
+        row.append(value)
+    return row
+
+
+def _item_row(platform_order_id, item):
+    quantity = int(item.get('quantity') or 1)
+    price = _decimal(item.get('price'), 'price')
+    if price is None:
+        raise ValueError("item price is required")
+    total = _decimal(item.get('total'), 'total')
+    values = {
+        'platform_order_id': platform_order_id,
+        'platform_product_id': item.get('platform_product_id') or None,
+        'title': item.get('title') or None,
+        'sku': item.get('sku') or None,
+        'quantity': quantity,
+        'price': price,
+        'total': total if total is not None else price * quantity,
+        'variant_title': item.get('variant_title') or None,
+        'properties': _json_field(item.get('properties')) or {},
+    }
+    return [values[name] for name, _ in ITEM_COLUMNS]
+
+
+def read_jsonl(stream):
+    """Yield orders from a JSONL export"""
+    for line in stream:
+        if line.strip():
+            order = json.loads(line)
+            order.setdefault('items', order.pop('line_items', []))
+            yield order
+
+
+def read_csv(stream):
+    """Yield orders from a CSV export with one row per line item"""
+    order = None
+    for row in csv.DictReader(stream):
+        platform_order_id = row.get('platform_order_id')
+        if order is None or platform_order_id != order['platform_order_id']:
+            if order is not None:
+                yield order
+            order = {key: value for key, value in row.items() if not key.startswith('item_')}
+            order['items'] = []
+        item = {key[len('item_'):]: value for key, value in row.items() if key.startswith('item_')}
+        if any(item.values()):
+            order['items'].append(item)
+    if order is not None:
+        yield order
+
+
+class OrderIngestor:
+    """
+    Upserts batches of platform orders into one store over a psycopg2
+    connection. With skip_unchanged, orders identical to the stored row
+    are not rewritten (incremental syncs re-read many unchanged orders).
+    """
+
+    def __init__(self, connection, store_id, batch_size=DEFAULT_BATCH_SIZE, skip_unchanged=False):
+        self.connection = connection
+        self.store_id = store_id
+        self.batch_size = batch_size
+
+        with self.connection.cursor() as cursor:
+            cursor.execute(STAGING_TABLES)
+            # A partitioned orders table can only enforce uniqueness together
+            # with its partition key (see src.database.partitioning)
+            cursor.execute(
+                "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('public.orders')"
+            )
+            partitioned = cursor.fetchone() is not None
+        self.connection.commit()
+
+        conflict_columns = ['store_id', 'platform_order_id'] + (['created_at'] if partitioned else [])
+        self.upsert_sql = _upsert_orders_sql(conflict_columns, skip_unchanged)
+
+    def ingest(self, orders):
+        """Ingest an iterable of order dicts; returns IngestStats"""
+        stats = IngestStats()
+        batch = {}
+        for order in orders:
+            try:
+                rows = (_order_row(order), [_item_row(order['platform_order_id'], item)
+                                            for item in order.get('items') or []])
+            except (ValueError, TypeError) as e:
+                stats.rejected += 1
+                if stats.rejected <= 10:
+                    logger.warning(f"Skipping order {order.get('platform_order_id')!r}: {e}")
+                continue
+            # The upsert can touch each order only once per statement; the
+            # last occurrence in a batch wins
+            batch[order['platform_order_id']] = rows
+            if len(batch) >= self.batch_size:
+                self._write_batch(batch, stats)
+                batch = {}
+        if batch:
+            self._write_batch(batch, stats)
+
+        logger.info(
+            f"Ingested {stats.orders_inserted} new and {stats.orders_updated} updated orders "
+            f"({stats.orders_unchanged} unchanged), "
+            f"{stats.items} items in {stats.elapsed:.1f}s ({stats.rows_per_second:.0f} rows/s, "
+            f"{stats.rejected} rejected)"
+        )
+        return stats
+
+    def _copy(self, cursor, table, columns, rows):
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join(_copy_value(value) for value in row))
+            buffer.write('\n')
+        buffer.seek(0)
+        cursor.copy_expert(
+            f"COPY {table} ({', '.join(name for name, _ in columns)}) FROM STDIN", buffer
+        )
+
+    def _write_batch(self, batch, stats):
+        started = time.perf_counter()
+        orders = [order_row for order_row, _ in batch.values()]
+        items = [item_row for _, item_rows in batch.values() for item_row in item_rows]
+        params = {'store_id': self.store_id}
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute("TRUNCATE ingest_orders, ingest_items, ingest_result")
+                self._copy(cursor, 'ingest_orders', ORDER_COLUMNS, orders)
+                self._copy(cursor, 'ingest_items', ITEM_COLUMNS, items)
+                cursor.execute(RESOLVE_EXISTING, params)
+                existing = cursor.rowcount
+                cursor.execute(self.upsert_sql, params)
+                cursor.execute("SELECT count(*) FROM ingest_result")
+                written = cursor.fetchone()[0]
+                cursor.execute(REPLACE_ITEMS, params)
+                items_written = cursor.rowcount
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+
+        if written or items_written:
+            # Raw SQL, so the ORM commit hook cannot evict cached responses
+            response_cache.invalidate(f'store:{self.store_id}:orders', f'store:{self.store_id}:order_items')
+
+        stats.batches += 1
+        inserted = len(orders) - existing
+        stats.orders_inserted += inserted
+        stats.orders_updated += written - inserted
+        stats.orders_unchanged += existing - (written - inserted)
+        stats.items += items_written
+        elapsed = time.perf_counter() - started
+        logger.info(
+            f"Batch {stats.batches}: {len(orders)} orders, {len(items)} items "
+            f"({(len(orders) + len(items)) / elapsed:.0f} rows/s, {stats.rows_per_second:.0f} rows/s overall)"
+        )
+
+
+def main(argv=None):
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Bulk-ingest a platform order export")
+    parser.add_argument('path', help="JSONL or CSV export ('-' for stdin)")
+    parser.add_argument('--store-id', required=True)
+    parser.add_argument('--format', choices=('jsonl', 'csv'),
+                        help='input format (default: from the file extension, else jsonl)')
+    parser.add_argument('--batch-size', type=int, default=int(os.environ.get('INGEST_BATCH_SIZE', DEFAULT_BATCH_SIZE)))
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'),
+                        help='direct Postgres connection string (default: $DATABASE_URL)')
+    args = parser.parse_args(argv)
+    if not args.database_url:
+        parser.error('--database-url or DATABASE_URL is required')
+
+    import psycopg2
+
+    input_format = args.format or ('csv' if args.path.endswith('.csv') else 'jsonl')
+    reader = read_csv if input_format == 'csv' else read_jsonl
+    stream = sys.stdin if args.path == '-' else open(args.path, newline='', encoding='utf-8')
+    response_cache.init_standalone()
+    connection = psycopg2.connect(args.database_url)
+    try:
+        stats = OrderIngestor(connection, args.store_id, batch_size=args.batch_size).ingest(reader(stream))
+        print(json.dumps(stats.to_dict()))
+    finally:
+        connection.close()
+        if stream is not sys.stdin:
+            stream.close()
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,506 @@
+"""
+Payment webhook ingestion.
+
+Providers time out a delivery after a few seconds and retry it, so a
+webhook request that does database work during a sales peak turns into a
+retry storm. The receiving side here does no database work on the
+request path (the processor's secret is cached):
+
+1. verify the signature (Stripe, Square, or a generic HMAC-SHA256)
+2. drop events this process queued recently, by provider event ID
+3. put the event on a bounded in-process queue and answer 200; a full
+   queue answers 503 so the provider retries later
+
+A consumer thread drains the queue in batches: one query finds events
+already in payment_webhook_events (the inbox, keyed on processor and
+event ID), and the new ones are recorded and applied to `transactions`
+in one commit. The inbox makes delivery idempotent across retries and
+workers. An event that cannot be applied is recorded with its error
+rather than blocking the batch. While the database is unreachable the
+batch is retried, the queue fills and deliveries get 503s until it
+recovers. Events still queued at shutdown are drained; a hard crash
+loses what was queued and not yet committed, which providers can resend
+from their event logs.
+
+Queue depth, batch sizes, outcomes and receive-to-commit latency are
+exported on /metrics.
+
+Config: WEBHOOK_QUEUE_SIZE (10000), WEBHOOK_BATCH_SIZE (200) and
+WEBHOOK_BATCH_LINGER_MS (50, how long a batch waits to fill).
+"""
+
+import atexit
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal
+
+from src.services.metrics import COUNT_BUCKETS, Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_LINGER_MS = 50
+PROCESSOR_TTL = 60
+SEEN_EVENTS = 10000
+STRIPE_TOLERANCE = 300
+RETRY_DELAY = 1.0
+RETRY_DELAY_MAX = 30.0
+
+TERMINAL_STATUSES = {'completed', 'failed', 'cancelled'}
+ZERO_DECIMAL_CURRENCIES = {
+    'BIF', 'CLP', 'DJF', 'GNF', 'JPY', 'KMF', 'KRW', 'MGA', 'PYG', 'RWF', 'UGX', 'VND', 'VUV', 'XAF', 'XOF', 'XPF'
+}
+
+
+class WebhookError(Exception):
+    """A delivery rejected before queueing, with the API error code and HTTP status"""
+
+    def __init__(self, code, message, status):
+        super().__init__(message)
+        self.code = code
+        self.status = status
+
+
+# Signature verification
+
+def _signature_error(message):
+    return WebhookError('INVALID_SIGNATURE', message, 401)
+
+
+def verify_stripe(secret, body, headers, url):
+    """Stripe-Signature: t=<timestamp>,v1=<hex HMAC-SHA256 of '<t>.<body>'>"""
+    pairs = [item.split('=', 1) for item in headers.get('Stripe-Signature', '').split(',') if '=' in item]
+    timestamp = next((value for key, value in pairs if key == 't'), None)
+    signatures = [value for key, value in pairs if key == 'v1']
+    if not timestamp or not timestamp.isdigit() or not signatures:
+        raise _signature_error('Missing or malformed Stripe-Signature header')
+    if abs(time.time() - int(timestamp)) > STRIPE_TOLERANCE:
+        raise _signature_error('Stripe-Signature timestamp is outside the tolerance')
+    expected = hmac.new(secret.encode(), timestamp.encode() + b'.' + body, hashlib.sha256).hexdigest()
+    if not any(hmac.compare_digest(expected, signature) for signature in signatures):
+        raise _signature_error('Stripe signature does not match')
+
+
+def verify_square(secret, body, headers, url):
+    """X-Square-Hmacsha256-Signature: base64 HMAC-SHA256 of notification URL + body"""
+    signature = headers.get('X-Square-Hmacsha256-Signature', '')
+    expected = base64.b64encode(hmac.new(secret.encode(), url.encode() + body, hashlib.sha256).digest()).decode()
+    if not signature or not hmac.compare_digest(expected, signature):
+        raise _signature_error('Square signature does not match')
+
+
+def verify_hmac(secret, body, headers, url):
+    """X-Webhook-Signature: sha256=<hex HMAC-SHA256 of body>"""
+    signature = headers.get('X-Webhook-Signature', '').removeprefix('sha256=')
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    if not signature or not hmac.compare_digest(expected, signature):
+        raise _signature_error('Webhook signature does not match')
+
+
+VERIFIERS = {
+    'stripe': verify_stripe,
+    'square': verify_square
+}
+
+
+def event_identity(provider, event, headers):
+    """(event ID, event type) of a delivery"""
+    if provider == 'square':
+        return event.get('event_id'), event.get('type')
+    return event.get('id') or headers.get('X-Event-Id'), event.get('type')
+
+
+# Event -> transaction
+
+def _amount(minor_units, currency):
+    if minor_units is None:
+        return None
+    amount = Decimal(int(minor_units))
+    return amount if currency in ZERO_DECIMAL_CURRENCIES else amount / 100
+
+
+def _order_id(value):
+    """Our order ID from provider metadata, or None when it isn't one"""
+    try:
+        return str(uuid.UUID(str(value))) if value else None
+    except ValueError:
+        return None
+
+
+def stripe_transaction(event):
+    kind = event.get('type') or ''
+    obj = (event.get('data') or {}).get('object') or {}
+    currency = (obj.get('currency') or 'usd').upper()
+    if kind.startswith('payment_intent.'):
+        status = {
+            'payment_intent.succeeded': 'completed',
+            'payment_intent.payment_failed': 'failed',
+            'payment_intent.canceled': 'cancelled'
+        }.get(kind, 'pending')
+        minor_units, transaction_type = obj.get('amount_received') or obj.get('amount'), 'payment'
+    elif kind in ('refund.created', 'refund.updated', 'charge.refund.updated'):
+        status = {'succeeded': 'completed', 'failed': 'failed', 'canceled': 'cancelled'}.get(obj.get('status'), 'pending')
+        minor_units, transaction_type = obj.get('amount'), 'refund'
+    elif kind.startswith('charge.dispute.'):
+        status = {'lost': 'completed', 'won': 'cancelled'}.get(obj.get('status'), 'pending')
+        minor_units, transaction_type = obj.get('amount'), 'chargeback'
+    else:
+        return None
+    return {
+        'platform_transaction_id': obj.get('id'),
+        'type': transaction_type,
+        'amount': _amount(minor_units, currency),
+        'currency': currency,
+        'status': status,
+        'order_id': _order_id((obj.get('metadata') or {}).get('order_id'))
+    }
+
+
+def square_transaction(event):
+    obj = (event.get('data') or {}).get('object') or {}
+    record, transaction_type = (obj['payment'], 'payment') if 'payment' in obj else (obj.get('refund'), 'refund')
+    if not record:
+        return None
+    money = record.get('amount_money') or {}
+    currency = money.get('currency') or 'USD'
+    return {
+        'platform_transaction_id': record.get('id'),
+        'type': transaction_type,
+        'amount': _amount(money.get('amount'), currency),
+        'currency': currency,
+        'status': {'COMPLETED': 'completed', 'FAILED': 'failed', 'CANCELED': 'cancelled'}.get(record.get('status'), 'pending'),
+        'order_id': None
+    }
+
+
+def generic_transaction(event):
+    """{"id", "type", "data": {"transaction_id", "type", "amount", "currency", "status", "order_id"}}"""
+    data = event.get('data') or {}
+    if not data.get('transaction_id') or data.get('amount') is None:
+        return None
+    return {
+        'platform_transaction_id': str(data['transaction_id']),
+        'type': data.get('type') or 'payment',
+        'amount': Decimal(str(data['amount'])),
+        'currency': (data.get('currency') or 'USD').upper(),
+        'status': data.get('status') or 'pending',
+        'order_id': _order_id(data.get('order_id'))
+    }
+
+
+TRANSACTION_MAPPERS = {
+    'stripe': stripe_transaction,
+    'square': square_transaction
+}
+
+
+class PaymentWebhookIngestor:
+    """Verifies and queues webhook deliveries; a consumer thread applies them in batches"""
+
+    def __init__(self, queue_size=DEFAULT_QUEUE_SIZE, batch_size=DEFAULT_BATCH_SIZE, linger_ms=DEFAULT_LINGER_MS):
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.linger = linger_ms / 1000
+        self.app = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._seen = OrderedDict()
+        self._processors = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._registered = False
+
+        self.events = Counter(
+            'ksap_webhook_events_total', 'Payment webhook deliveries by outcome', ('provider', 'outcome')
+        )
+        self.latency = Histogram(
+            'ksap_webhook_processing_latency_seconds', 'Time from receiving an event to committing it', ('provider',)
+        )
+        self.batch_sizes = Histogram(
+            'ksap_webhook_batch_size', 'Events per consumer commit', buckets=COUNT_BUCKETS
+        )
+        self.depth = Gauge('ksap_webhook_queue_depth', 'Events received and not yet applied', self._queue.qsize)
+
+    def init_app(self, app):
+        """Configure from app config and export metrics on /metrics"""
+        self.queue_size = int(app.config.get('WEBHOOK_QUEUE_SIZE', self.queue_size))
+        self.batch_size = int(app.config.get('WEBHOOK_BATCH_SIZE', self.batch_size))
+        self.linger = float(app.config.get('WEBHOOK_BATCH_LINGER_MS', self.linger * 1000)) / 1000
+        self._queue.maxsize = self.queue_size
+        self.app = app
+        app.extensions['payment_webhooks'] = self
+
+        from src.services.metrics import request_metrics
+        if not self._registered:
+            for metric in (self.events, self.latency, self.batch_sizes, self.depth):
+                request_metrics.registry.register(metric)
+            atexit.register(self.stop)
+            self._registered = True
+
+    # Receiving
+
+    def receive(self, processor_id, body, headers, url):
+        """
+        Verify and queue one delivery. Returns True for a duplicate of an
+        event queued recently; raises WebhookError when rejected.
+        """
+        processor = self._processor(processor_id)
+        provider = processor['provider']
+        verify = VERIFIERS.get(provider, verify_hmac)
+        try:
+            verify(processor['secret'], body, headers, processor['webhook_url'] or url)
+            event = json.loads(body)
+            if not isinstance(event, dict):
+                raise WebhookError('BAD_REQUEST', 'Webhook body must be a JSON object', 400)
+        except WebhookError:
+            self.events.inc(provider, 'rejected')
+            raise
+        except ValueError:
+            self.events.inc(provider, 'rejected')
+            raise WebhookError('BAD_REQUEST', 'Webhook body is not valid JSON', 400)
+
+        event_id, event_type = event_identity(provider, event, headers)
+        if not event_id:
+            self.events.inc(provider, 'rejected')
+            raise WebhookError('BAD_REQUEST', 'Webhook event has no ID', 400)
+
+        key = (processor_id, str(event_id))
+        with self._lock:
+            if key in self._seen:
+                self.events.inc(provider, 'duplicate')
+                return True
+            try:
+                self._queue.put_nowait({
+                    'processor_id': processor_id,
+                    'provider': provider,
+                    'event_id': str(event_id)[:255],
+                    'event_type': (event_type or '')[:100] or None,
+                    'payload': event,
+                    'received_at': datetime.utcnow(),
+                    'received': time.monotonic()
+                })
+            except queue.Full:
+                self.events.inc(provider, 'throttled')
+                raise WebhookError('QUEUE_FULL', 'Webhook queue is full, retry later', 503)
+            self._seen[key] = None
+            if len(self._seen) > SEEN_EVENTS:
+                self._seen.popitem(last=False)
+        self.events.inc(provider, 'queued')
+        self.ensure_started()
+        return False
+
+    def _processor(self, processor_id):
+        """Provider, webhook secret and URL of an active processor, cached for PROCESSOR_TTL seconds"""
+        cached = self._processors.get(processor_id)
+        if cached is not None and cached['expires'] > time.monotonic():
+            processor = cached
+        else:
+            from src.models import db, PaymentProcessor
+
+            row = db.session.get(PaymentProcessor, processor_id)
+            processor = None if row is None else {
+                'provider': row.provider,
+                'secret': (row.api_credentials or {}).get('webhook_secret'),
+                'webhook_url': row.webhook_url,
+                'active': row.is_active,
+                'expires': time.monotonic() + PROCESSOR_TTL
+            }
+            if processor is not None:
+                self._processors[processor_id] = processor
+        if processor is None or not processor['active']:
+            raise WebhookError('NOT_FOUND', 'Payment processor not found', 404)
+        if not processor['secret']:
+            raise WebhookError('NOT_CONFIGURED', 'Payment processor has no webhook secret', 409)
+        return processor
+
+    # Consumer
+
+    def ensure_started(self):
+        """Start the consumer thread if it isn't running in the current process"""
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='ksap-webhook-consumer', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10):
+        """Stop the consumer once the queue is drained (or after `timeout` seconds)"""
+        self._stopped.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        from sqlalchemy.exc import OperationalError
+
+        with self.app.app_context():
+            delay = RETRY_DELAY
+            while not (self._stopped.is_set() and self._queue.empty()):
+                batch = self._next_batch()
+                while batch:
+                    try:
+                        self.process_batch(batch)
+                        batch, delay = None, RETRY_DELAY
+                    except OperationalError as e:
+                        # Database unreachable: keep the batch; the queue fills and deliveries get 503s
+                        logger.warning(f"⚠️ Webhook batch of {len(batch)} not applied, retrying in {delay:.0f}s: {e}")
+                        if self._stopped.wait(delay) and delay >= RETRY_DELAY_MAX:
+                            break
+                        delay = min(delay * 2, RETRY_DELAY_MAX)
+
+    def process_batch(self, batch):
+        """Record and apply a batch of queued events in one commit; returns the events that were new"""
+        from sqlalchemy.exc import OperationalError, SQLAlchemyError
+        from src.models import db
+
+        unique = {}
+        for event in batch:
+            unique.setdefault((event['processor_id'], event['event_id']), event)
+        try:
+            applied = self._apply(list(unique.values()))
+            db.session.commit()
+            outcomes = {id(event): 'applied' for event in applied}
+        except OperationalError:
+            db.session.rollback()
+            raise
+        except SQLAlchemyError as e:
+            # A bad event or a race with another worker; apply one at a time
+            db.session.rollback()
+            logger.warning(f"⚠️ Webhook batch failed ({e.__class__.__name__}), applying events one by one")
+            outcomes = {id(event): self._apply_one(event) for event in unique.values()}
+            applied = [event for event in unique.values() if outcomes[id(event)] == 'applied']
+
+        self.batch_sizes.observe(len(batch))
+        now = time.monotonic()
+        for event in applied:
+            self.latency.observe(now - event['received'], event['provider'])
+        for event in batch:
+            self.events.inc(event['provider'], outcomes.get(id(event), 'duplicate'))
+        return applied
+
+    def _apply_one(self, event):
+        """Apply one event in its own commit, recording it with the error when it can't be; returns the outcome"""
+        from sqlalchemy.exc import IntegrityError, OperationalError, SQLAlchemyError
+        from src.models import db, PaymentWebhookEvent
+
+        for attempt in range(2):
+            try:
+                applied = self._apply([event])
+                db.session.commit()
+                return 'applied' if applied else 'duplicate'
+            except OperationalError:
+                db.session.rollback()
+                raise
+            except SQLAlchemyError as e:
+                # An IntegrityError may be another worker committing the event (or its transaction) first; look again
+                db.session.rollback()
+                error = str(getattr(e, 'orig', None) or e)
+                if not isinstance(e, IntegrityError):
+                    break
+
+        try:
+            db.session.add(self._inbox_row(PaymentWebhookEvent, event, error=error[:2000]))
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return 'duplicate'
+        logger.warning(f"⚠️ Webhook event {event['event_id']} recorded but not applied: {error}")
+        return 'failed'
+
+    @staticmethod
+    def _inbox_row(model, event, error=None):
+        return model(
+            payment_processor_id=event['processor_id'],
+            event_id=event['event_id'],
+            event_type=event['event_type'],
+            payload=event['payload'],
+            received_at=event['received_at'],
+            error=error
+        )
+
+    def _apply(self, events):
+        """Stage inbox rows and transaction changes for the events not seen before; caller commits"""
+        from src.models import db, PaymentWebhookEvent, Transaction
+
+        processor_ids = {event['processor_id'] for event in events}
+        # Postgres hands uuid columns back as uuid.UUID; keys are compared as strings
+        existing = {(str(processor_id), event_id) for processor_id, event_id in db.session.execute(
+            db.select(PaymentWebhookEvent.payment_processor_id, PaymentWebhookEvent.event_id).where(
+                PaymentWebhookEvent.payment_processor_id.in_(processor_ids),
+                PaymentWebhookEvent.event_id.in_({event['event_id'] for event in events})
+            )
+        )}
+        new = [event for event in events if (event['processor_id'], event['event_id']) not in existing]
+
+        changes = []
+        for event in new:
+            change = TRANSACTION_MAPPERS.get(event['provider'], generic_transaction)(event['payload'])
+            if change and change['platform_transaction_id'] and change['amount'] is not None:
+                changes.append((event, change))
+        transactions = {}
+        if changes:
+            transactions = {
+                (str(row.payment_processor_id), row.platform_transaction_id): row
+                for row in db.session.scalars(db.select(Transaction).where(
+                    Transaction.payment_processor_id.in_(processor_ids),
+                    Transaction.platform_transaction_id.in_({change['platform_transaction_id'] for _, change in changes})
+                ))
+            }
+
+        for event in new:
+            db.session.add(self._inbox_row(PaymentWebhookEvent, event))
+        for event, change in changes:
+            key = (event['processor_id'], change['platform_transaction_id'])
+            row = transactions.get(key)
+            if row is None:
+                row = transactions[key] = Transaction(payment_processor_id=event['processor_id'], **change)
+                db.session.add(row)
+            else:
+                # Deliveries arrive out of order; a stale 'pending' never undoes a final status
+                if change['status'] == 'pending' and row.status in TERMINAL_STATUSES:
+                    change = {**change, 'status': row.status}
+                for name, value in change.items():
+                    if value is not None:
+                        setattr(row, name, value)
+            row.gateway_response = event['payload']
+        return new
+
+    def drain(self):
+        """Apply everything queued, synchronously (tests and scripts)"""
+        while not self._queue.empty():
+            batch = []
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            self.process_batch(batch)
+
+
+# Global instance
+payment_webhooks = PaymentWebhookIngestor()
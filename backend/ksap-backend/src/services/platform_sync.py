@@ -0,0 +1,679 @@
+"""
+Incremental catalog and order sync from store platforms.
+
+Re-pulling a large store's whole catalog and order history on every sync
+spends hours inside the platform's rate limit to rewrite mostly
+unchanged rows. SyncEngine syncs incrementally instead:
+
+- each store keeps an `updated_since` cursor per resource (products,
+  orders) in store_sync_state; a sync asks the platform only for records
+  updated since then (minus a small overlap) and moves the cursor to the
+  newest `updated_at` it saw once the resource is complete
+- due stores are synced concurrently by a pool of workers, each with its
+  own connection; every store gets its own token bucket sized to its
+  platform's limit, page size and Retry-After / call-limit headers
+- only rows that actually changed are written: upserts compare columns
+  with IS DISTINCT FROM, so unchanged rows keep their updated_at (and the
+  cache validators built on it); a batch that changed rows evicts the
+  store's cached responses for them
+- stock is the platform's count less the units our checkout holds
+  (products.inventory_held, see src.services.inventory)
+- a sync given a `stop` event (e.g. a background task's lost lease)
+  stops between pages, rolling back the page in progress and leaving
+  the cursor where it was
+
+Platform clients (ShopifyClient, WooCommerceClient) page through the REST
+APIs and map records to products rows and orders in the order_ingest
+format. The API base is the store's `domain` (https:// unless a scheme
+is given, e.g. a local mock API); credentials come from
+`api_credentials` as stored.
+
+Usage (direct connection via DATABASE_URL):
+    python -m src.services.platform_sync [--store-id <uuid>] [--workers 8] [--loop --interval 900]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal, InvalidOperation
+
+from .cache import response_cache
+from .order_ingest import OrderIngestor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 8
+DEFAULT_INTERVAL = 15 * 60
+REQUEST_TIMEOUT = 30
+MAX_RETRIES = 5
+# Re-read records updated this long before the cursor, in case the platform
+# committed them late; unchanged rows cost a comparison, not a write
+CURSOR_OVERLAP = timedelta(seconds=5)
+
+RESOURCES = ('products', 'orders')
+
+# (column, VALUES template); products columns a sync owns
+PRODUCT_COLUMNS = [
+    ('platform_product_id', '%s'),
+    ('title', '%s'),
+    ('description', '%s'),
+    ('price', '%s::numeric'),
+    ('compare_at_price', '%s::numeric'),
+    ('sku', '%s'),
+    ('barcode', '%s'),
+    ('inventory_quantity', '%s::integer'),
+    ('track_inventory', '%s::boolean'),
+    ('weight', '%s::numeric'),
+    ('images', '%s::jsonb'),
+    ('tags', '%s::jsonb'),
+    ('vendor', '%s'),
+    ('product_type', '%s'),
+    ('status', '%s'),
+]
+# New value of each updated column. The platform counts stock before our
+# checkout holds, which reservations track in inventory_held (read from the
+# locked row, so a hold committed meanwhile is never lost)
+_PRODUCT_UPDATED = {
+    name: 'EXCLUDED.inventory_quantity - p.inventory_held' if name == 'inventory_quantity' else f'EXCLUDED.{name}'
+    for name, _ in PRODUCT_COLUMNS if name != 'platform_product_id'
+}
+
+UPSERT_PRODUCTS = f"""
+WITH upserted AS (
+    INSERT INTO public.products AS p (store_id, {', '.join(name for name, _ in PRODUCT_COLUMNS)})
+    VALUES %s
+    ON CONFLICT (store_id, platform_product_id) DO UPDATE
+    SET {', '.join(f'{name} = {value}' for name, value in _PRODUCT_UPDATED.items())}
+    WHERE ({', '.join(f'p.{name}' for name in _PRODUCT_UPDATED)})
+        IS DISTINCT FROM ({', '.join(_PRODUCT_UPDATED.values())})
+    RETURNING (xmax = 0) AS inserted
+)
+SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM upserted
+"""
+UPSERT_PRODUCTS_TEMPLATE = f"(%s::uuid, {', '.join(template for _, template in PRODUCT_COLUMNS)})"
+
+SELECT_DUE_STORES = """
+SELECT s.id::text, s.platform, s.domain, s.platform_store_id, s.api_credentials
+FROM public.stores s
+LEFT JOIN (
+    SELECT store_id, min(last_attempted_at) AS last_attempted_at
+    FROM public.store_sync_state
+    GROUP BY store_id
+) state ON state.store_id = s.id
+WHERE s.status = 'active'
+  AND s.platform = ANY(%(platforms)s)
+  AND (state.last_attempted_at IS NULL OR state.last_attempted_at < now() - make_interval(secs => %(interval)s))
+ORDER BY state.last_attempted_at NULLS FIRST
+"""
+
+SELECT_STORE = """
+SELECT id::text, platform, domain, platform_store_id, api_credentials
+FROM public.stores WHERE id = %(store_id)s
+"""
+
+SELECT_CURSOR = """
+SELECT updated_since FROM public.store_sync_state
+WHERE store_id = %(store_id)s AND resource = %(resource)s
+"""
+
+SAVE_CURSOR = """
+INSERT INTO public.store_sync_state
+    (store_id, resource, updated_since, last_attempted_at, last_synced_at, last_error)
+VALUES (%(store_id)s, %(resource)s, %(updated_since)s, now(),
+        CASE WHEN %(error)s IS NULL THEN now() END, %(error)s)
+ON CONFLICT (store_id, resource) DO UPDATE SET
+    updated_since = COALESCE(EXCLUDED.updated_since, store_sync_state.updated_since),
+    last_attempted_at = EXCLUDED.last_attempted_at,
+    last_synced_at = COALESCE(EXCLUDED.last_synced_at, store_sync_state.last_synced_at),
+    last_error = EXCLUDED.last_error
+"""
+
+
+class SyncError(Exception):
+    """A platform request that failed for good"""
+
+
+class SyncCancelled(Exception):
+    """The sync's stop event was set"""
+
+
+class RateLimiter:
+    """
+    Token bucket: up to `burst` requests at once, refilled at `rate` per
+    second. acquire() reserves a slot and sleeps until it is available.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        with self.lock:
+            self._refill()
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+    def observe(self, used, limit):
+        """Align with the bucket the platform reports (e.g. Shopify's 32/40)"""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, limit - used)
+
+    def pause(self, seconds):
+        """Send nothing for `seconds` (a 429's Retry-After)"""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+def _decimal(value):
+    if value is None or value == '':
+        return None
+    try:
+        return Decimal(str(value))
+    except InvalidOperation:
+        return None
+
+
+def _timestamp(value):
+    """Aware datetime from an ISO 8601 string; naive values are UTC"""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+class PlatformClient:
+    """
+    Pages through one store's platform API. Subclasses set the platform's
+    page size and rate limit and implement `pages()` and the mappings.
+    """
+
+    platform = None
+    page_size = 100
+    rate = 5.0
+    burst = 5
+
+    def __init__(self, store, session=None):
+        import requests
+
+        self.store = store
+        self.credentials = store.get('api_credentials') or {}
+        if isinstance(self.credentials, str):
+            self.credentials = json.loads(self.credentials)
+        self.base_url = self._base_url(store)
+        self.session = session or requests.Session()
+        self.limiter = RateLimiter(self.rate, self.burst)
+        self.requests = 0
+
+    def _base_url(self, store):
+        domain = (store.get('domain') or '').rstrip('/')
+        if not domain:
+            raise SyncError(f"store {store['id']} has no domain")
+        return domain if '://' in domain else f'https://{domain}'
+
+    def get(self, url, params=None, **kwargs):
+        """GET within the rate limit, honouring Retry-After and retrying server errors"""
+        import requests
+
+        for attempt in range(MAX_RETRIES):
+            self.limiter.acquire()
+            self.requests += 1
+            try:
+                response = self.session.get(url, params=params, timeout=REQUEST_TIMEOUT, **kwargs)
+            except requests.RequestException as e:
+                error = f'{type(e).__name__}: {e}'
+                time.sleep(2 ** attempt)
+                continue
+            self._observe(response)
+            if response.status_code == 429:
+                error = 'HTTP 429'
+                self.limiter.pause(float(response.headers.get('Retry-After') or 2))
+                continue
+            if response.status_code >= 500:
+                error = f'HTTP {response.status_code}'
+                time.sleep(2 ** attempt)
+                continue
+            if response.status_code != 200:
+                raise SyncError(f'GET {url} returned HTTP {response.status_code}: {response.text[:200]}')
+            return response
+        raise SyncError(f'GET {url} failed after {MAX_RETRIES} attempts: {error}')
+
+    def _observe(self, response):
+        pass
+
+    def pages(self, resource, updated_since):
+        """Yield lists of raw records of `resource` updated since `updated_since` (None: all)"""
+        raise NotImplementedError
+
+    def updated_at(self, record):
+        raise NotImplementedError
+
+    def product_row(self, record):
+        """products values in PRODUCT_COLUMNS order"""
+        raise NotImplementedError
+
+    def order(self, record):
+        """Order dict in the order_ingest format, with its line items under 'items'"""
+        raise NotImplementedError
+
+
+class ShopifyClient(PlatformClient):
+    """Shopify Admin REST API: cursor (Link header) pagination, 40-call bucket leaking 2/s"""
+
+    platform = 'shopify'
+    api_version = '2024-01'
+    page_size = 250
+    rate = 2.0
+    burst = 40
+
+    def _base_url(self, store):
+        if not store.get('domain') and store.get('platform_store_id'):
+            store = {**store, 'domain': f"{store['platform_store_id']}.myshopify.com"}
+        return f'{super()._base_url(store)}/admin/api/{self.api_version}'
+
+    def _observe(self, response):
+        used, _, limit = response.headers.get('X-Shopify-Shop-Api-Call-Limit', '').partition('/')
+        if used.isdigit() and limit.isdigit():
+            self.limiter.observe(int(used), int(limit))
+
+    def pages(self, resource, updated_since):
+        params = {'limit': self.page_size}
+        if resource == 'orders':
+            params['status'] = 'any'
+        if updated_since is not None:
+            params['updated_at_min'] = updated_since.isoformat()
+        url = f'{self.base_url}/{resource}.json'
+        headers = {'X-Shopify-Access-Token': self.credentials.get('access_token', '')}
+        while url:
+            response = self.get(url, params, headers=headers)
+            yield response.json().get(resource, [])
+            # page_info URLs carry the filters; no other params are allowed
+            url, params = response.links.get('next', {}).get('url'), None
+
+    def updated_at(self, record):
+        return _timestamp(record.get('updated_at'))
+
+    def product_row(self, record):
+        variants = record.get('variants') or [{}]
+        first = variants[0]
+        tracked = any(variant.get('inventory_management') for variant in variants)
+        return [
+            str(record['id']),
+            (record.get('title') or f"Product {record['id']}")[:500],
+            record.get('body_html'),
+            _decimal(first.get('price')),
+            _decimal(first.get('compare_at_price')),
+            first.get('sku') or None,
+            first.get('barcode') or None,
+            sum(variant.get('inventory_quantity') or 0 for variant in variants),
+            tracked,
+            _decimal(first.get('weight')),
+            [image['src'] for image in record.get('images') or [] if image.get('src')],
+            [tag.strip() for tag in (record.get('tags') or '').split(',') if tag.strip()],
+            record.get('vendor'),
+            record.get('product_type'),
+            record.get('status') or 'active',
+        ]
+
+    def order(self, record):
+        customer = record.get('customer') or {}
+        shipping = ((record.get('total_shipping_price_set') or {}).get('shop_money') or {}).get('amount')
+        if record.get('cancelled_at'):
+            status = 'cancelled'
+        elif record.get('fulfillment_status') == 'fulfilled':
+            status = 'fulfilled'
+        elif record.get('financial_status') == 'paid':
+            status = 'paid'
+        else:
+            status = 'pending'
+        return {
+            'platform_order_id': str(record['id']),
+            'order_number': str(record.get('order_number') or record.get('name') or ''),
+            'customer_email': record.get('email'),
+            'customer_name': ' '.join(filter(None, [customer.get('first_name'), customer.get('last_name')])) or None,
+            'customer_phone': record.get('phone') or customer.get('phone'),
+            'billing_address': record.get('billing_address'),
+            'shipping_address': record.get('shipping_address'),
+            'subtotal': record.get('subtotal_price'),
+            'tax_amount': record.get('total_tax'),
+            'shipping_amount': shipping,
+            'total_amount': record.get('total_price'),
+            'currency': record.get('currency'),
+            'status': status,
+            'fulfillment_status': record.get('fulfillment_status'),
+            'payment_status': record.get('financial_status'),
+            'notes': record.get('note'),
+            'tags': [tag.strip() for tag in (record.get('tags') or '').split(',') if tag.strip()],
+            'created_at': record.get('created_at'),
+            'items': [
+                {
+                    'platform_product_id': str(item['product_id']) if item.get('product_id') else None,
+                    'title': item.get('title'),
+                    'sku': item.get('sku'),
+                    'quantity': item.get('quantity'),
+                    'price': item.get('price'),
+                    'variant_title': item.get('variant_title'),
+                    'properties': {prop['name']: prop.get('value') for prop in item.get('properties') or []},
+                }
+                for item in record.get('line_items') or []
+            ]
+        }
+
+
+class WooCommerceClient(PlatformClient):
+    """WooCommerce REST API v3: numbered pages of up to 100, no published limit (kept polite)"""
+
+    platform = 'woocommerce'
+    page_size = 100
+    rate = 5.0
+    burst = 5
+
+    PRODUCT_STATUS = {'publish': 'active', 'trash': 'archived'}
+    ORDER_STATUS = {
+        'processing': 'paid', 'completed': 'fulfilled',
+        'cancelled': 'cancelled', 'refunded': 'cancelled', 'failed': 'cancelled'
+    }
+
+    def _base_url(self, store):
+        return f'{super()._base_url(store)}/wp-json/wc/v3'
+
+    def pages(self, resource, updated_since):
+        params = {'per_page': self.page_size, 'orderby': 'id', 'order': 'asc', 'dates_are_gmt': 'true'}
+        if resource == 'products':
+            params['status'] = 'any'
+        if updated_since is not None:
+            params['modified_after'] = updated_since.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+        auth = (self.credentials.get('consumer_key', ''), self.credentials.get('consumer_secret', ''))
+        page = 1
+        while True:
+            response = self.get(f'{self.base_url}/{resource}', {**params, 'page': page}, auth=auth)
+            records = response.json()
+            yield records
+            if len(records) < self.page_size or page >= int(response.headers.get('X-WP-TotalPages') or page):
+                return
+            page += 1
+
+    def updated_at(self, record):
+        return _timestamp(record.get('date_modified_gmt'))
+
+    def product_row(self, record):
+        on_sale = bool(record.get('sale_price'))
+        return [
+            str(record['id']),
+            (record.get('name') or f"Product {record['id']}")[:500],
+            record.get('description'),
+            _decimal(record.get('price')),
+            _decimal(record.get('regular_price')) if on_sale else None,
+            record.get('sku') or None,
+            None,
+            record.get('stock_quantity') or 0,
+            bool(record.get('manage_stock')),
+            _decimal(record.get('weight')),
+            [image['src'] for image in record.get('images') or [] if image.get('src')],
+            [tag['name'] for tag in record.get('tags') or [] if tag.get('name')],
+            None,
+            record.get('type'),
+            self.PRODUCT_STATUS.get(record.get('status'), 'draft'),
+        ]
+
+    def order(self, record):
+        billing = record.get('billing') or {}
+        items = record.get('line_items') or []
+        return {
+            'platform_order_id': str(record['id']),
+            'order_number': str(record.get('number') or record['id']),
+            'customer_email': billing.get('email') or None,
+            'customer_name': ' '.join(filter(None, [billing.get('first_name'), billing.get('last_name')])) or None,
+            'customer_phone': billing.get('phone') or None,
+            'billing_address': billing or None,
+            'shipping_address': record.get('shipping') or None,
+            'subtotal': sum((_decimal(item.get('subtotal')) or Decimal(0) for item in items), Decimal(0)),
+            'tax_amount': record.get('total_tax'),
+            'shipping_amount': record.get('shipping_total'),
+            'total_amount': record.get('total'),
+            'currency': record.get('currency'),
+            'status': self.ORDER_STATUS.get(record.get('status'), 'pending'),
+            'fulfillment_status': 'fulfilled' if record.get('status') == 'completed' else None,
+            'payment_status': 'paid' if record.get('date_paid_gmt') else 'pending',
+            'notes': record.get('customer_note') or None,
+            'tags': [],
+            'created_at': record.get('date_created_gmt') and f"{record['date_created_gmt']}+00:00",
+            'items': [
+                {
+                    'platform_product_id': str(item['product_id']) if item.get('product_id') else None,
+                    'title': item.get('name'),
+                    'sku': item.get('sku'),
+                    'quantity': item.get('quantity'),
+                    'price': item.get('price'),
+                    'total': item.get('total'),
+                    'properties': {meta['key']: meta.get('value') for meta in item.get('meta_data') or []
+                                   if not str(meta.get('key', '')).startswith('_')},
+                }
+                for item in items
+            ]
+        }
+
+
+CLIENTS = {
+    'shopify': ShopifyClient,
+    'woocommerce': WooCommerceClient
+}
+
+
+def save_cursor(connection, store_id, resource, updated_since, error=None):
+    """Record a sync attempt; a successful one (no error) may move the cursor"""
+    with connection.cursor() as cursor:
+        cursor.execute(SAVE_CURSOR, {'store_id': store_id, 'resource': resource, 'updated_since': updated_since,
+                                     'error': error[:1000] if error else None})
+    connection.commit()
+
+
+class StoreSync:
+    """Syncs one store's resources from its cursors, over one connection"""
+
+    def __init__(self, connection, store, client, stop=None):
+        self.connection = connection
+        self.store = store
+        self.client = client
+        self.stop = stop
+        self.stats = {'store_id': store['id'], 'platform': store['platform'], 'errors': {}}
+
+    def run(self):
+        started = time.perf_counter()
+        for resource in RESOURCES:
+            try:
+                self.sync(resource)
+            except SyncCancelled:
+                self.connection.rollback()
+                raise
+            except Exception as e:
+                self.connection.rollback()
+                save_cursor(self.connection, self.store['id'], resource, None, error=str(e))
+                self.stats['errors'][resource] = str(e)
+                logger.warning(f"⚠️ Sync of {resource} for store {self.store['id']} failed: {e}")
+        self.stats['requests'] = self.client.requests
+        self.stats['seconds'] = round(time.perf_counter() - started, 3)
+        return self.stats
+
+    def sync(self, resource):
+        with self.connection.cursor() as cursor:
+            cursor.execute(SELECT_CURSOR, {'store_id': self.store['id'], 'resource': resource})
+            row = cursor.fetchone()
+        cursor_at = row[0] if row else None
+        since = cursor_at - CURSOR_OVERLAP if cursor_at else None
+
+        newest = [cursor_at]
+        stats = self.stats[resource] = {'fetched': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0}
+
+        def records():
+            for page in self.client.pages(resource, since):
+                if self.stop is not None and self.stop.is_set():
+                    raise SyncCancelled(f"Sync of store {self.store['id']} stopped")
+                stats['fetched'] += len(page)
+                for record in page:
+                    updated_at = self.client.updated_at(record)
+                    if updated_at and (newest[0] is None or updated_at > newest[0]):
+                        newest[0] = updated_at
+                    yield record
+
+        if resource == 'products':
+            self._write_products(records(), stats)
+        else:
+            ingest = OrderIngestor(self.connection, self.store['id'], batch_size=self.client.page_size,
+                                   skip_unchanged=True).ingest(self.client.order(record) for record in records())
+            stats.update(inserted=ingest.orders_inserted, updated=ingest.orders_updated,
+                         unchanged=ingest.orders_unchanged)
+        # Only a complete pass moves the cursor: pages need not come in updated_at order
+        save_cursor(self.connection, self.store['id'], resource, newest[0])
+
+    def _write_products(self, records, stats):
+        from psycopg2.extras import Json, execute_values
+
+        batch = {}
+
+        def flush():
+            rows = [[self.store['id'], *row[:10], Json(row[10]), Json(row[11]), *row[12:]] for row in batch.values()]
+            with self.connection.cursor() as cursor:
+                inserted, updated = execute_values(cursor, UPSERT_PRODUCTS, rows, template=UPSERT_PRODUCTS_TEMPLATE,
+                                                   page_size=len(rows), fetch=True)[0]
+            self.connection.commit()
+            if inserted or updated:
+                # Raw SQL, so the ORM commit hook cannot evict cached listings
+                response_cache.invalidate(f"store:{self.store['id']}:products")
+            stats['inserted'] += inserted
+            stats['updated'] += updated
+            stats['unchanged'] += len(rows) - inserted - updated
+            batch.clear()
+
+        for record in records:
+            row = self.client.product_row(record)
+            # One upsert can touch a row once; the last copy of a record wins
+            batch[row[0]] = row
+            if len(batch) >= self.client.page_size:
+                flush()
+        if batch:
+            flush()
+
+
+class SyncEngine:
+    """Syncs due stores concurrently, one worker and connection per store at a time"""
+
+    def __init__(self, database_url, workers=DEFAULT_WORKERS, interval=DEFAULT_INTERVAL, clients=None):
+        from psycopg2.pool import ThreadedConnectionPool
+
+        self.workers = workers
+        self.interval = interval
+        self.clients = clients or CLIENTS
+        self.pool = ThreadedConnectionPool(1, workers, database_url)
+
+    def close(self):
+        self.pool.closeall()
+
+    def _query(self, sql, params):
+        connection = self.pool.getconn()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                columns = [column.name for column in cursor.description]
+                rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            connection.commit()
+            return rows
+        finally:
+            self.pool.putconn(connection)
+
+    def due_stores(self):
+        """Active stores on a supported platform not attempted within `interval`, least recent first"""
+        return self._query(SELECT_DUE_STORES, {'platforms': list(self.clients), 'interval': self.interval})
+
+    def sync_store(self, store, stop=None):
+        """Sync one store (a due_stores() row); returns its stats"""
+        connection = self.pool.getconn()
+        try:
+            client = self.clients[store['platform']](store)
+            return StoreSync(connection, store, client, stop=stop).run()
+        except SyncError as e:
+            # e.g. no domain; recorded so the store waits an interval like any failure
+            for resource in RESOURCES:
+                save_cursor(connection, store['id'], resource, None, error=str(e))
+            logger.warning(f"⚠️ Cannot sync store {store['id']}: {e}")
+            return {'store_id': store['id'], 'platform': store['platform'], 'errors': {'store': str(e)}}
+        finally:
+            self.pool.putconn(connection)
+
+    def run_once(self, store_ids=None, stop=None):
+        """
+        Sync every due store (or exactly `store_ids`); returns per-store
+        stats. Raises SyncCancelled once `stop` is set.
+        """
+        if store_ids:
+            stores = [row for store_id in store_ids for row in self._query(SELECT_STORE, {'store_id': store_id})]
+        else:
+            stores = self.due_stores()
+        if not stores:
+            return []
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='platform-sync') as executor:
+            results = list(executor.map(lambda store: self.sync_store(store, stop), stores))
+        failed = sum(1 for result in results if result['errors'])
+        logger.info(f"Synced {len(results)} stores in {time.perf_counter() - started:.1f}s ({failed} with errors)")
+        return results
+
+    def run(self, stop=None):
+        """Sync due stores until `stop` is set, checking again every minute"""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            self.run_once()
+            stop.wait(60)
+
+
+def main(argv=None):
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Incrementally sync products and orders from store platforms")
+    parser.add_argument('--store-id', action='append', help='sync this store now (repeatable)')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('SYNC_WORKERS', DEFAULT_WORKERS)))
+    parser.add_argument('--interval', type=int, default=int(os.environ.get('SYNC_INTERVAL', DEFAULT_INTERVAL)),
+                        help='seconds between syncs of one store')
+    parser.add_argument('--loop', action='store_true', help='keep syncing stores as they come due')
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'),
+                        help='direct Postgres connection string (default: $DATABASE_URL)')
+    args = parser.parse_args(argv)
+    if not args.database_url:
+        parser.error('--database-url or DATABASE_URL is required')
+
+    response_cache.init_standalone()
+    engine = SyncEngine(args.database_url, workers=args.workers, interval=args.interval)
+    try:
+        if args.loop:
+            engine.run()
+        else:
+            for result in engine.run_once(args.store_id):
+                print(json.dumps(result, default=str))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        engine.close()
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
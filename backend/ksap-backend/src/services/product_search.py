@@ -0,0 +1,99 @@
+"""
+Ranked product search within a store.
+
+Matches come from three GIN indexes (migrations 19 and 20), combined by a
+BitmapOr so no query scans the whole catalog:
+- products.search_vector @@ websearch_to_tsquery(...)  full text over title,
+  vendor, product type, tags and description (weighted in that order)
+- query <% title    trigram word similarity, for typos and partial words
+- query <% sku      trigram word similarity, for partial SKUs
+
+Full-text matches are ranked with ts_rank_cd (normalized to 0..1); the best
+trigram similarity adds up to half a point on top, so exact word matches
+outrank fuzzy-only ones. Pages are keyset-paginated on (score DESC, id).
+
+Reference: https://www.postgresql.org/docs/current/pgtrgm.html
+"""
+
+from src.models import db, Product
+from src.utils.pagination import decode_cursor, encode_cursor
+from src.utils.serialization import serialize_many
+
+TEXT_SEARCH_CONFIG = 'english'
+FUZZY_WEIGHT = 0.5
+MAX_QUERY_LENGTH = 200
+
+
+class ProductSearch:
+    """Builds and runs ranked, keyset-paginated product searches"""
+
+    def __init__(self, config=TEXT_SEARCH_CONFIG, fuzzy_weight=FUZZY_WEIGHT):
+        self.config = config
+        self.fuzzy_weight = fuzzy_weight
+
+    def _score_and_filter(self, text):
+        config = db.literal_column(f"'{self.config}'::regconfig")
+        search_vector = db.literal_column('products.search_vector')
+        ts_query = db.func.websearch_to_tsquery(config, text)
+        sku = db.func.coalesce(Product.sku, '')
+
+        score = (
+            db.func.ts_rank_cd(search_vector, ts_query, 32)
+            + self.fuzzy_weight * db.func.greatest(
+                db.func.word_similarity(text, Product.title),
+                db.func.word_similarity(text, sku)
+            )
+        )
+        matches = db.or_(
+            search_vector.op('@@')(ts_query),
+            text.op('<%')(Product.title),
+            text.op('<%')(Product.sku)
+        )
+        return score, matches
+
+    def search(self, store_id, query, limit=50, cursor=None, status=None):
+        """
+        One page of products matching `query`, best first.
+
+        Returns (results, next_cursor) where each result is the product's
+        to_dict() plus its `score`; next_cursor is None on the last page.
+        Raises ValueError for an empty or oversized query or a bad cursor.
+        """
+        query = (query or '').strip()
+        if not query:
+            raise ValueError("q is required")
+        if len(query) > MAX_QUERY_LENGTH:
+            raise ValueError(f"q must be at most {MAX_QUERY_LENGTH} characters")
+
+        score, matches = self._score_and_filter(db.bindparam('q', query, type_=db.String))
+        score = score.label('score')
+        ranked = db.select(Product, score).where(Product.store_id == store_id, matches)
+        if status:
+            ranked = ranked.where(Product.status == status)
+        ranked = ranked.subquery()
+
+        product = db.aliased(Product, ranked)
+        statement = db.select(product, ranked.c.score)
+        if cursor:
+            last_score, last_id = decode_cursor(cursor, float, str)
+            statement = statement.where(db.or_(
+                ranked.c.score < last_score,
+                db.and_(ranked.c.score == last_score, ranked.c.id > last_id)
+            ))
+        statement = statement.order_by(ranked.c.score.desc(), ranked.c.id).limit(limit + 1)
+
+        rows = db.session.execute(statement).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last_product, last_score = rows[-1]
+            next_cursor = encode_cursor(last_score, str(last_product.id))
+
+        results = serialize_many([row_product for row_product, _ in rows], Product)
+        for result, (_, row_score) in zip(results, rows):
+            result['score'] = row_score
+        return results, next_cursor
+
+
+# Global instance
+product_search = ProductSearch()
@@ -0,0 +1,380 @@
+"""
+Concurrent proxy health checks.
+
+Thousands of proxies checked one after another take hours, since a dead
+proxy costs a full timeout. ProxyHealthChecker probes them on one asyncio
+event loop with a bounded number in flight, then writes `last_tested`,
+`test_result` ('success', 'failed' or 'timeout') and `latency_ms` back
+with one UPDATE ... FROM (VALUES ...) per batch.
+
+Each protocol gets a probe that speaks it directly, over asyncio streams:
+
+    http    GET <PROXY_CHECK_HTTP_URL> in absolute form through the proxy
+    https   CONNECT to the PROXY_CHECK_HTTPS_URL host, TLS, then GET
+    socks5  SOCKS5 CONNECT (RFC 1928, RFC 1929 auth), TLS, then GET
+
+A probe succeeds when the target answers through the proxy with a status
+below 500 (407 from the proxy counts as a failure). `timeout` bounds the
+whole probe, connect included. Credentials are sent as stored.
+
+Scheduling: `run_once()` checks active proxies never tested or last
+tested more than `stale_after` seconds ago, oldest first. Run it from
+cron, or keep it running:
+
+    python -m src.services.proxy_checker --loop --interval 300
+"""
+
+import argparse
+import asyncio
+import base64
+import logging
+import os
+import ssl
+import sys
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 200
+DEFAULT_TIMEOUT = 10.0
+DEFAULT_STALE_AFTER = 30 * 60
+DEFAULT_WRITE_BATCH = 500
+DEFAULT_HTTP_URL = 'http://www.gstatic.com/generate_204'
+DEFAULT_HTTPS_URL = 'https://www.gstatic.com/generate_204'
+
+PROTOCOLS = ('http', 'https', 'socks5')
+
+SELECT_DUE = """
+SELECT id::text, host, port, protocol, username, password
+FROM public.proxies
+WHERE is_active
+  AND (last_tested IS NULL OR last_tested < now() - make_interval(secs => %(stale_after)s))
+ORDER BY last_tested NULLS FIRST
+LIMIT %(limit)s
+"""
+
+UPDATE_RESULTS = """
+UPDATE public.proxies AS p
+SET last_tested = v.tested_at, test_result = v.result, latency_ms = v.latency_ms
+FROM (VALUES %s) AS v(id, tested_at, result, latency_ms)
+WHERE p.id = v.id::uuid
+"""
+UPDATE_TEMPLATE = '(%s, %s::timestamptz, %s, %s::integer)'
+
+
+class ProbeError(Exception):
+    """The proxy answered, but not with a working tunnel or response"""
+
+
+class Target:
+    """Parsed probe URL"""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError(f"Probe URL must be http(s)://host/...: {url}")
+        self.url = url
+        self.tls = parts.scheme == 'https'
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.tls else 80)
+        self.path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        default_port = self.port == (443 if self.tls else 80)
+        self.host_header = self.host if default_port else f'{self.host}:{self.port}'
+
+
+class ProbeResult:
+    """Outcome of probing one proxy"""
+
+    def __init__(self, proxy_id, result, latency_ms=None, error=None):
+        self.proxy_id = proxy_id
+        self.result = result
+        self.latency_ms = latency_ms
+        self.error = error
+        self.tested_at = datetime.now(timezone.utc)
+
+
+class CheckStats:
+    """Counts and latency percentiles of one run"""
+
+    def __init__(self):
+        self.results = {'success': 0, 'failed': 0, 'timeout': 0}
+        self.latencies = []
+        self.elapsed = 0.0
+
+    def add(self, result):
+        self.results[result.result] += 1
+        if result.latency_ms is not None:
+            self.latencies.append(result.latency_ms)
+
+    def _percentile(self, fraction):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def to_dict(self):
+        checked = sum(self.results.values())
+        return {
+            'checked': checked,
+            **self.results,
+            'latency_ms_p50': self._percentile(0.5),
+            'latency_ms_p95': self._percentile(0.95),
+            'elapsed_seconds': round(self.elapsed, 3),
+            'proxies_per_second': round(checked / self.elapsed, 1) if self.elapsed else None
+        }
+
+
+def _basic_auth(proxy):
+    if not proxy.get('username'):
+        return ''
+    token = base64.b64encode(f"{proxy['username']}:{proxy.get('password') or ''}".encode('utf-8')).decode('ascii')
+    return f'Proxy-Authorization: Basic {token}\r\n'
+
+
+async def _read_status(reader):
+    """Status code of an HTTP response; consumes the header block"""
+    line = await reader.readline()
+    parts = line.decode('latin-1').split(None, 2)
+    if len(parts) < 2 or not parts[0].startswith('HTTP/') or not parts[1].isdigit():
+        raise ProbeError(f'not an HTTP response: {line[:60]!r}')
+    while (await reader.readline()).strip():
+        pass
+    return int(parts[1])
+
+
+def _check_status(status):
+    if status == 407:
+        raise ProbeError('proxy authentication required')
+    if status >= 500:
+        raise ProbeError(f'HTTP {status}')
+
+
+async def _request_through_tunnel(reader, writer, target, ssl_context):
+    """GET the target over an established tunnel (TLS first for https targets)"""
+    if target.tls:
+        await writer.start_tls(ssl_context, server_hostname=target.host)
+    writer.write((
+        f'GET {target.path} HTTP/1.1\r\nHost: {target.host_header}\r\n'
+        f'User-Agent: ksap-proxy-check\r\nConnection: close\r\n\r\n'
+    ).encode('latin-1'))
+    await writer.drain()
+    _check_status(await _read_status(reader))
+
+
+async def probe_http(proxy, target, ssl_context=None):
+    """Plain HTTP proxy: the request line carries the absolute URL"""
+    reader, writer = await asyncio.open_connection(proxy['host'], proxy['port'])
+    try:
+        writer.write((
+            f'GET {target.url} HTTP/1.1\r\nHost: {target.host_header}\r\n{_basic_auth(proxy)}'
+            f'User-Agent: ksap-proxy-check\r\nConnection: close\r\n\r\n'
+        ).encode('latin-1'))
+        await writer.drain()
+        _check_status(await _read_status(reader))
+    finally:
+        writer.close()
+
+
+async def probe_https(proxy, target, ssl_context=None):
+    """HTTP CONNECT tunnel to the target"""
+    reader, writer = await asyncio.open_connection(proxy['host'], proxy['port'])
+    try:
+        authority = f'{target.host}:{target.port}'
+        writer.write(f'CONNECT {authority} HTTP/1.1\r\nHost: {authority}\r\n{_basic_auth(proxy)}\r\n'.encode('latin-1'))
+        await writer.drain()
+        status = await _read_status(reader)
+        if status != 200:
+            _check_status(status)
+            raise ProbeError(f'CONNECT refused with HTTP {status}')
+        await _request_through_tunnel(reader, writer, target, ssl_context)
+    finally:
+        writer.close()
+
+
+async def probe_socks5(proxy, target, ssl_context=None):
+    """SOCKS5 CONNECT by host name, with username/password auth when configured"""
+    reader, writer = await asyncio.open_connection(proxy['host'], proxy['port'])
+    try:
+        username = (proxy.get('username') or '').encode('utf-8')
+        password = (proxy.get('password') or '').encode('utf-8')
+        methods = b'\x00\x02' if username else b'\x00'
+        writer.write(b'\x05' + bytes([len(methods)]) + methods)
+        version, method = await reader.readexactly(2)
+        if version != 5 or method == 0xFF:
+            raise ProbeError('no acceptable SOCKS5 auth method')
+        if method == 0x02:
+            writer.write(b'\x01' + bytes([len(username)]) + username + bytes([len(password)]) + password)
+            if (await reader.readexactly(2))[1] != 0:
+                raise ProbeError('SOCKS5 authentication failed')
+
+        host = target.host.encode('idna')
+        writer.write(b'\x05\x01\x00\x03' + bytes([len(host)]) + host + target.port.to_bytes(2, 'big'))
+        _, reply, _, address_type = await reader.readexactly(4)
+        if reply != 0:
+            raise ProbeError(f'SOCKS5 CONNECT failed with code {reply}')
+        if address_type == 1:
+            await reader.readexactly(4 + 2)
+        elif address_type == 4:
+            await reader.readexactly(16 + 2)
+        else:
+            await reader.readexactly((await reader.readexactly(1))[0] + 2)
+        await _request_through_tunnel(reader, writer, target, ssl_context)
+    finally:
+        writer.close()
+
+
+PROBES = {
+    'http': probe_http,
+    'https': probe_https,
+    'socks5': probe_socks5
+}
+
+
+class ProxyHealthChecker:
+    """Probes proxies with bounded concurrency and records results in bulk"""
+
+    def __init__(self, connection=None, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT,
+                 http_url=DEFAULT_HTTP_URL, https_url=DEFAULT_HTTPS_URL, write_batch=DEFAULT_WRITE_BATCH,
+                 ssl_context=None):
+        self.connection = connection
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.http_target = Target(http_url)
+        self.https_target = Target(https_url)
+        self.write_batch = write_batch
+        self.ssl_context = ssl_context or ssl.create_default_context()
+
+    async def probe(self, proxy):
+        """Probe one proxy (a mapping with id, host, port, protocol, username, password)"""
+        protocol = (proxy.get('protocol') or 'http').lower()
+        probe = PROBES.get(protocol)
+        if probe is None:
+            return ProbeResult(proxy['id'], 'failed', error=f'unsupported protocol {protocol!r}')
+        target = self.http_target if protocol == 'http' else self.https_target
+
+        started = time.perf_counter()
+        try:
+            async with asyncio.timeout(self.timeout):
+                await probe(proxy, target, self.ssl_context)
+        except TimeoutError:
+            return ProbeResult(proxy['id'], 'timeout', error=f'no answer within {self.timeout}s')
+        except (OSError, ssl.SSLError, asyncio.IncompleteReadError, ProbeError, ValueError) as e:
+            return ProbeResult(proxy['id'], 'failed', error=str(e) or type(e).__name__)
+        return ProbeResult(proxy['id'], 'success', round((time.perf_counter() - started) * 1000))
+
+    async def check(self, proxies, on_results=None):
+        """
+        Probe every proxy with at most `concurrency` in flight. Results
+        are handed to `on_results(batch)` every `write_batch` results;
+        returns CheckStats.
+        """
+        queue = asyncio.Queue()
+        for proxy in proxies:
+            queue.put_nowait(proxy)
+        stats = CheckStats()
+        pending = []
+        started = time.perf_counter()
+
+        async def flush():
+            batch = pending[:]
+            pending.clear()
+            if batch and on_results is not None:
+                await on_results(batch)
+
+        async def worker():
+            while True:
+                try:
+                    proxy = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                result = await self.probe(proxy)
+                stats.add(result)
+                pending.append(result)
+                if len(pending) >= self.write_batch:
+                    await flush()
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, queue.qsize()) or 1)))
+        await flush()
+        stats.elapsed = time.perf_counter() - started
+        return stats
+
+    # Database
+
+    def due_proxies(self, stale_after=DEFAULT_STALE_AFTER, limit=10000):
+        """Active proxies never tested or tested more than `stale_after` seconds ago, oldest first"""
+        with self.connection.cursor() as cursor:
+            cursor.execute(SELECT_DUE, {'stale_after': stale_after, 'limit': limit})
+            columns = [column.name for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def write_results(self, results):
+        """Record a batch of results with a single UPDATE"""
+        from psycopg2.extras import execute_values
+
+        rows = [(r.proxy_id, r.tested_at, r.result, r.latency_ms) for r in results]
+        with self.connection.cursor() as cursor:
+            execute_values(cursor, UPDATE_RESULTS, rows, template=UPDATE_TEMPLATE, page_size=len(rows))
+        self.connection.commit()
+
+    async def _write_results(self, results):
+        # psycopg2 blocks; keep the event loop probing while the batch is written
+        await asyncio.to_thread(self.write_results, results)
+
+    def run_once(self, stale_after=DEFAULT_STALE_AFTER, limit=10000):
+        """Check every due proxy and record the results; returns the run's stats as a dict"""
+        proxies = self.due_proxies(stale_after, limit)
+        if not proxies:
+            return CheckStats().to_dict()
+        stats = asyncio.run(self.check(proxies, on_results=self._write_results))
+        summary = stats.to_dict()
+        logger.info(f"Checked {summary['checked']} proxies in {summary['elapsed_seconds']}s: "
+                    f"{summary['success']} ok, {summary['failed']} failed, {summary['timeout']} timed out")
+        return summary
+
+
+def main(argv=None):
+    import json
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Check proxy health and record the results")
+    parser.add_argument('--concurrency', type=int,
+                        default=int(os.environ.get('PROXY_CHECK_CONCURRENCY', DEFAULT_CONCURRENCY)))
+    parser.add_argument('--timeout', type=float, default=float(os.environ.get('PROXY_CHECK_TIMEOUT', DEFAULT_TIMEOUT)),
+                        help='seconds per probe, connect included')
+    parser.add_argument('--stale-after', type=int,
+                        default=int(os.environ.get('PROXY_CHECK_STALE_AFTER', DEFAULT_STALE_AFTER)),
+                        help='re-check proxies last tested more than this many seconds ago')
+    parser.add_argument('--limit', type=int, default=10000, help='proxies per run')
+    parser.add_argument('--http-url', default=os.environ.get('PROXY_CHECK_HTTP_URL', DEFAULT_HTTP_URL))
+    parser.add_argument('--https-url', default=os.environ.get('PROXY_CHECK_HTTPS_URL', DEFAULT_HTTPS_URL))
+    parser.add_argument('--loop', action='store_true', help='keep checking every --interval seconds')
+    parser.add_argument('--interval', type=float, default=300)
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'),
+                        help='direct Postgres connection string (default: $DATABASE_URL)')
+    args = parser.parse_args(argv)
+    if not args.database_url:
+        parser.error('--database-url or DATABASE_URL is required')
+
+    import psycopg2
+
+    connection = psycopg2.connect(args.database_url)
+    checker = ProxyHealthChecker(connection, concurrency=args.concurrency, timeout=args.timeout,
+                                 http_url=args.http_url, https_url=args.https_url)
+    try:
+        while True:
+            print(json.dumps(checker.run_once(stale_after=args.stale_after, limit=args.limit)), flush=True)
+            if not args.loop:
+                break
+            time.sleep(args.interval)
+    finally:
+        connection.close()
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
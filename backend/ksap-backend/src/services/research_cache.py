@@ -0,0 +1,468 @@
+"""
+Cache for market research lookups.
+
+Research sources (ad libraries, trend APIs) are slow, rate limited and
+answer the same questions for many users, so results are cached by what
+was asked rather than who asked: the key is a sha256 of the source, the
+research type and the query parameters in canonical JSON (keys sorted,
+no whitespace, None values dropped), so {"q": "mugs", "country": "US"}
+and {"country": "US", "q": "mugs"} share an entry. Entries are found
+through a hash index on that key.
+
+Each source has its own TTL (RESEARCH_CACHE_TTLS, e.g.
+"google_trends=43200,facebook_ad_library=21600"; RESEARCH_CACHE_TTL for
+the rest). Payloads are stored zlib-compressed in research_payloads,
+keyed by the hash of their content, so queries whose answers are
+identical (empty results, the same trend data under different spellings
+of a filter) store it once. Storing an entry is one statement: the
+payload upsert, dropping the entry it replaces, the new entry and
+releasing the fetch claim.
+
+Concurrent requests for the same key are coalesced into one fetch:
+within a process the first caller fetches and the others wait for its
+result; across processes the fetching caller claims the key in
+research_fetch_claims and the others poll the cache until the entry
+appears (or the claim is released or expires, when they claim it
+themselves). Sources are given RESEARCH_FETCH_TIMEOUT as their `timeout`
+and the claim lasts CLAIM_GRACE longer, so a fetch that keeps to it is
+stored before anyone else can claim the key. Claiming is a short
+transaction, so no pooled connection is held while the source is
+fetched. If a fetch fails, an expired entry younger than
+RESEARCH_CACHE_STALE_IF_ERROR is served instead.
+
+No real source integration exists yet: with RESEARCH_STUB_SOURCES on
+(the default in development only) the sources in DEFAULT_TTLS are
+served by StubSource, which makes up deterministic results.
+register_source() replaces them.
+
+Usage:
+    from src.services.research_cache import research_cache
+
+    research_cache.register_source('google_trends', fetch_trends, ttl=12 * 3600)
+    result = research_cache.get('google_trends', 'trend_analysis', {'keywords': ['mugs']})
+    result['data'], result['cache']   # 'hit', 'miss', 'coalesced' or 'stale'
+
+    python -m src.services.research_cache   # drop expired entries and unused payloads
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+import zlib
+
+from src.services.metrics import Counter, Histogram
+from src.utils.serialization import orjson
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 60 * 60
+DEFAULT_TTLS = {
+    'facebook_ad_library': 6 * 60 * 60,
+    'google_trends': 12 * 60 * 60
+}
+DEFAULT_STALE_IF_ERROR = 24 * 60 * 60
+DEFAULT_FETCH_TIMEOUT = 30
+# A fetch claim outlives the fetch timeout by this much, time to store the entry
+CLAIM_GRACE = 5
+# Callers waiting on another process's claim re-check the cache this often
+POLL_INTERVAL = 0.05
+COMPRESSION_LEVEL = 6
+# Unreferenced payloads are kept this long, in case an entry is being stored
+PAYLOAD_GRACE_SECONDS = 60 * 60
+
+LOOKUP = """
+    SELECT c.fetched_at, c.expires_at, c.expires_at > now() AS fresh,
+           extract(epoch FROM now() - c.fetched_at) AS age, p.data
+    FROM public.research_cache c
+    JOIN public.research_payloads p ON p.payload_hash = c.payload_hash
+    WHERE c.query_hash = :query_hash
+    ORDER BY c.fetched_at DESC
+    LIMIT 1
+"""
+
+# Takes the key unless another caller's claim is still live
+CLAIM = """
+    INSERT INTO public.research_fetch_claims (query_hash, claimed_by, expires_at)
+    VALUES (:query_hash, :claimed_by, now() + make_interval(secs => :lease))
+    ON CONFLICT (query_hash) DO UPDATE SET claimed_by = EXCLUDED.claimed_by, expires_at = EXCLUDED.expires_at
+    WHERE research_fetch_claims.expires_at <= now()
+    RETURNING claimed_by
+"""
+
+RELEASE = """
+    DELETE FROM public.research_fetch_claims WHERE query_hash = :query_hash AND claimed_by = :claimed_by
+"""
+
+STORE = """
+    WITH payload AS (
+        INSERT INTO public.research_payloads (payload_hash, data, raw_bytes)
+        VALUES (:payload_hash, :data, :raw_bytes)
+        ON CONFLICT (payload_hash) DO UPDATE SET last_used_at = now()
+        RETURNING payload_hash, xmax = 0 AS inserted
+    ), superseded AS (
+        DELETE FROM public.research_cache WHERE query_hash = :query_hash
+    ), released AS (
+        DELETE FROM public.research_fetch_claims WHERE query_hash = :query_hash AND claimed_by = :claimed_by
+    )
+    INSERT INTO public.research_cache
+        (query_hash, source, research_type, query_parameters, payload_hash, fetched_at, expires_at)
+    SELECT :query_hash, :source, :research_type, CAST(:query_parameters AS JSONB), payload_hash,
+           now(), now() + make_interval(secs => :ttl)
+    FROM payload
+    RETURNING fetched_at, expires_at, (SELECT inserted FROM payload)
+"""
+
+PRUNE_ENTRIES = """
+    DELETE FROM public.research_cache WHERE expires_at < now() - make_interval(secs => :retention)
+"""
+
+PRUNE_PAYLOADS = """
+    DELETE FROM public.research_payloads p
+    WHERE p.last_used_at < now() - make_interval(secs => :grace)
+      AND NOT EXISTS (SELECT 1 FROM public.research_cache c WHERE c.payload_hash = p.payload_hash)
+"""
+
+
+class ResearchError(Exception):
+    """A research request that can't be answered, with the API error code and HTTP status"""
+
+    def __init__(self, code, message, status, details=None):
+        super().__init__(message)
+        self.code = code
+        self.status = status
+        self.details = details
+
+
+def _drop_none(value):
+    if isinstance(value, dict):
+        return {str(k): _drop_none(v) for k, v in value.items() if v is not None}
+    if isinstance(value, (list, tuple)):
+        return [_drop_none(v) for v in value]
+    return value
+
+
+def canonical_json(value):
+    """Compact, key-sorted JSON; equal values always give equal bytes"""
+    return json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str).encode()
+
+
+def query_key(source, research_type, query_parameters):
+    """The cache key for a query: sha256 hex of its canonical form"""
+    return hashlib.sha256(canonical_json([source, research_type, _drop_none(query_parameters or {})])).hexdigest()
+
+
+def encode_payload(data):
+    """Canonical JSON bytes for a payload (orjson when installed, for large results)"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS, default=str)
+    return canonical_json(data)
+
+
+def decode_payload(raw):
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+def parse_ttls(value):
+    """"google_trends=43200,facebook_ad_library=21600" -> {'google_trends': 43200, ...}"""
+    ttls = {}
+    for item in (value or '').split(','):
+        if item.strip():
+            name, _, seconds = item.partition('=')
+            ttls[name.strip()] = int(seconds)
+    return ttls
+
+
+class StubSource:
+    """
+    Stand-in for a research source: deterministic made-up results for a
+    query, after `latency` seconds, so the cache works end to end locally
+    """
+
+    def __init__(self, name, latency=0.0, results=10):
+        self.name = name
+        self.latency = latency
+        self.results = results
+
+    def __call__(self, research_type, query_parameters, timeout=None):
+        if self.latency:
+            if timeout is not None and self.latency > timeout:
+                time.sleep(timeout)
+                raise TimeoutError(f"{self.name} took longer than {timeout}s")
+            time.sleep(self.latency)
+        rng = random.Random(query_key(self.name, research_type, query_parameters))
+        return {
+            'source': self.name,
+            'stub': True,
+            'results': [{
+                'id': f'{self.name}-{rng.getrandbits(48):012x}',
+                'title': f"{research_type or 'result'} {i + 1}",
+                'score': round(rng.random(), 4),
+                'volume': rng.randint(0, 100000)
+            } for i in range(self.results)]
+        }
+
+
+class _Flight:
+    """One in-progress fetch that callers asking for the same key wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.raw = None
+        self.meta = None
+        self.error = None
+
+
+class ResearchCache:
+    """Query-keyed research result cache with per-source TTLs and coalesced fetches"""
+
+    def __init__(self, default_ttl=DEFAULT_TTL, stale_if_error=DEFAULT_STALE_IF_ERROR,
+                 fetch_timeout=DEFAULT_FETCH_TIMEOUT):
+        self.default_ttl = default_ttl
+        self.ttls = dict(DEFAULT_TTLS)
+        self.stale_if_error = stale_if_error
+        self.fetch_timeout = fetch_timeout
+        self.sources = {}
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._registered = False
+
+        self.requests = Counter(
+            'ksap_research_cache_requests_total', 'Research lookups by outcome', ('source', 'outcome')
+        )
+        self.fetch_latency = Histogram(
+            'ksap_research_fetch_latency_seconds', 'Time spent fetching from a research source', ('source',)
+        )
+        self.stored = Counter(
+            'ksap_research_cache_stored_total', 'Entries stored, by whether their payload was already stored',
+            ('source', 'payload')
+        )
+
+    def init_app(self, app):
+        """Configure from app config and export metrics on /metrics"""
+        self.default_ttl = int(app.config.get('RESEARCH_CACHE_TTL', self.default_ttl))
+        self.ttls.update(parse_ttls(app.config.get('RESEARCH_CACHE_TTLS')))
+        self.stale_if_error = int(app.config.get('RESEARCH_CACHE_STALE_IF_ERROR', self.stale_if_error))
+        self.fetch_timeout = float(app.config.get('RESEARCH_FETCH_TIMEOUT', self.fetch_timeout))
+        if app.config.get('RESEARCH_STUB_SOURCES', False):
+            for name in DEFAULT_TTLS:
+                self.sources.setdefault(name, StubSource(name))
+        app.extensions['research_cache'] = self
+
+        from src.services.metrics import request_metrics
+        if not self._registered:
+            for metric in (self.requests, self.fetch_latency, self.stored):
+                request_metrics.registry.register(metric)
+            self._registered = True
+
+    def register_source(self, name, fetch, ttl=None):
+        """
+        Serve `name` with fetch(research_type, query_parameters, timeout),
+        which returns JSON-serializable data and gives up (raising, e.g.
+        TimeoutError) after `timeout` seconds. `ttl` overrides the
+        configured TTL.
+        """
+        self.sources[name] = fetch
+        if ttl is not None:
+            self.ttls[name] = int(ttl)
+
+    def ttl(self, source):
+        return self.ttls.get(source, self.default_ttl)
+
+    def get(self, source, research_type=None, query_parameters=None, refresh=False):
+        """
+        Cached result for a query, fetching it on a miss (or with refresh).
+        Returns the data with the key, fetch and expiry times and how it
+        was served in `cache`.
+        """
+        if source not in self.sources:
+            raise ResearchError('UNKNOWN_SOURCE', f"Unknown research source '{source}'", 404,
+                                {'sources': sorted(self.sources)})
+        if query_parameters is not None and not isinstance(query_parameters, dict):
+            raise ResearchError('BAD_REQUEST', 'query_parameters must be an object', 400)
+        query_parameters = _drop_none(query_parameters or {})
+        key = query_key(source, research_type, query_parameters)
+
+        cached = self._lookup(key)
+        if cached and cached['fresh'] and not refresh:
+            return self._result('hit', source, research_type, query_parameters, key, cached['raw'], cached)
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if leader:
+            try:
+                flight.raw, flight.meta, outcome = self._fetch_once(source, research_type, query_parameters, key, refresh)
+            except Exception as e:
+                flight.error = e
+            finally:
+                with self._lock:
+                    self._flights.pop(key, None)
+                flight.done.set()
+        else:
+            outcome = 'coalesced'
+            if not flight.done.wait(self.fetch_timeout):
+                return self._stale(source, research_type, query_parameters, key, cached,
+                                   ResearchError('SOURCE_TIMEOUT', f"Timed out waiting for '{source}'", 504))
+
+        if flight.error is not None:
+            return self._stale(source, research_type, query_parameters, key, cached, flight.error)
+        return self._result(outcome, source, research_type, query_parameters, key, flight.raw, flight.meta)
+
+    def _fetch_once(self, source, research_type, query_parameters, key, refresh):
+        """Fetch and store unless another process does; returns (raw, meta, outcome)"""
+        from src.models import db
+
+        started = time.monotonic()
+        token = uuid.uuid4().hex
+
+        def usable(cached):
+            # A refresh only accepts an entry fetched after it started
+            return cached and cached['fresh'] and (not refresh or cached['fetched'] >= started)
+
+        while True:
+            with db.engine.connect() as connection:
+                claimed = connection.execute(db.text(CLAIM), {
+                    'query_hash': key, 'claimed_by': token, 'lease': self.fetch_timeout + CLAIM_GRACE
+                }).first() is not None
+                # Checked after claiming, so an entry stored by the previous
+                # claimant is seen; the claim is rolled back if so
+                cached = self._lookup(key, connection)
+                if usable(cached):
+                    connection.rollback()
+                    return cached['raw'], cached, 'coalesced'
+                connection.commit()
+            if claimed:
+                break
+            # Another process is fetching this key: wait for its entry
+            if time.monotonic() - started > self.fetch_timeout:
+                raise ResearchError('SOURCE_TIMEOUT', f"Timed out waiting for '{source}'", 504)
+            time.sleep(POLL_INTERVAL)
+
+        try:
+            raw = self._fetch(source, research_type, query_parameters)
+            meta = self._store(source, research_type, query_parameters, key, raw, token)
+        except Exception:
+            with db.engine.begin() as connection:
+                connection.execute(db.text(RELEASE), {'query_hash': key, 'claimed_by': token})
+            raise
+        return raw, meta, 'miss'
+
+    def _fetch(self, source, research_type, query_parameters):
+        started = time.perf_counter()
+        try:
+            data = self.sources[source](research_type, query_parameters, timeout=self.fetch_timeout)
+        except TimeoutError as e:
+            raise ResearchError('SOURCE_TIMEOUT', f"Timed out waiting for '{source}'", 504) from e
+        finally:
+            self.fetch_latency.observe(time.perf_counter() - started, source)
+        return encode_payload(data)
+
+    def _lookup(self, key, connection=None):
+        from src.models import db
+
+        if connection is not None:
+            row = connection.execute(db.text(LOOKUP), {'query_hash': key}).first()
+        else:
+            with db.engine.connect() as connection:
+                row = connection.execute(db.text(LOOKUP), {'query_hash': key}).first()
+        if row is None:
+            return None
+        return {
+            'fetched_at': row.fetched_at,
+            'expires_at': row.expires_at,
+            'fresh': row.fresh,
+            'age': float(row.age),
+            'fetched': time.monotonic() - float(row.age),  # on this process's monotonic clock
+            'raw': zlib.decompress(bytes(row.data))
+        }
+
+    def _store(self, source, research_type, query_parameters, key, raw, claimed_by=None):
+        """Store an entry for `key`, releasing the fetch claim `claimed_by`"""
+        from src.models import db
+
+        with db.engine.begin() as connection:
+            row = connection.execute(db.text(STORE), {
+                'payload_hash': hashlib.sha256(raw).hexdigest(),
+                'data': zlib.compress(raw, COMPRESSION_LEVEL),
+                'raw_bytes': len(raw),
+                'query_hash': key,
+                'source': source,
+                'research_type': research_type,
+                'query_parameters': canonical_json(query_parameters).decode(),
+                'ttl': self.ttl(source),
+                'claimed_by': claimed_by
+            }).first()
+        self.stored.inc(source, 'new' if row.inserted else 'duplicate')
+        return {'fetched_at': row.fetched_at, 'expires_at': row.expires_at}
+
+    def _stale(self, source, research_type, query_parameters, key, cached, error):
+        """Serve an expired entry when a fetch fails, if it isn't too old"""
+        if cached is None:
+            cached = self._lookup(key)
+        if cached is not None:
+            age = time.monotonic() - cached['fetched']
+            if age <= self.ttl(source) + self.stale_if_error:
+                logger.warning(f"⚠️ Research source {source} failed ({error}), serving a {age:.0f}s old result")
+                return self._result('stale', source, research_type, query_parameters, key, cached['raw'], cached)
+        self.requests.inc(source, 'error')
+        if isinstance(error, ResearchError):
+            raise error
+        logger.warning(f"⚠️ Research source {source} failed: {error}")
+        raise ResearchError('SOURCE_UNAVAILABLE', f"Research source '{source}' is unavailable", 502) from error
+
+    def _result(self, outcome, source, research_type, query_parameters, key, raw, meta):
+        self.requests.inc(source, outcome)
+        return {
+            'source': source,
+            'research_type': research_type,
+            'query_parameters': query_parameters,
+            'query_hash': key,
+            'data': decode_payload(raw),
+            'fetched_at': meta['fetched_at'].isoformat(),
+            'expires_at': meta['expires_at'].isoformat(),
+            'cache': outcome
+        }
+
+    def prune(self):
+        """
+        Drop entries expired longer than the stale-if-error window and
+        payloads no entry uses; returns (entries, payloads) deleted
+        """
+        from src.models import db
+
+        with db.engine.begin() as connection:
+            entries = connection.execute(db.text(PRUNE_ENTRIES), {'retention': self.stale_if_error}).rowcount
+            payloads = connection.execute(db.text(PRUNE_PAYLOADS), {'grace': PAYLOAD_GRACE_SECONDS}).rowcount
+        if entries or payloads:
+            logger.info(f"✅ Pruned {entries} research cache entries and {payloads} payloads")
+        return entries, payloads
+
+
+# Global instance
+research_cache = ResearchCache()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drop expired research cache entries and unused payloads")
+    parser.parse_args(argv)
+
+    from src.main import app
+
+    with app.app_context():
+        research_cache.prune()
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
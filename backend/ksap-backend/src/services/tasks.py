@@ -0,0 +1,1087 @@
+"""
+Background tasks.
+
+Long work (store syncs, rollup refreshes, exports, reports) runs on task
+workers instead of inside request workers: a route enqueues a task and
+answers with its ID, a worker runs it and stores the result, and
+GET /api/v1/tasks/<task_id> returns it.
+
+- priorities: 0 (high) to 9 (low), 5 by default; a worker takes the
+  highest-priority task that is due, oldest first
+- concurrency caps: a task may belong to a user and a store; workers
+  skip tasks whose user already has TASK_USER_CONCURRENCY tasks running,
+  or whose store has TASK_STORE_CONCURRENCY (0 for no cap), so one
+  tenant's burst queues behind itself instead of taking every worker.
+  A task's cap_keys name the kwargs it is capped by (stores.sync:
+  store_id); enqueuing it without them is rejected
+- kwargs are bound to the task function's signature when it is
+  enqueued, so a call that could never run is rejected with a 400
+  instead of failing and retrying on a worker
+- API: only tasks registered with public=True (stores.sync) can be
+  queued through POST /api/v1/tasks, counted against the store owner
+  and at no higher priority than the task's own
+- retries: a task that raises runs again after an exponential backoff
+  with jitter (backoff * 2 ** (attempt - 1), at most backoff_max), up to
+  max_retries times, then fails with the last error
+- leases: a running task holds its claim for `timeout` seconds, renewed
+  every third of that while its function runs; if its worker dies, the
+  lease expires and counts as a failed run. A run whose lease was lost
+  (it couldn't be renewed in time, and another worker may have claimed
+  the task) records nothing, and its function can stop early by
+  checking current_lease().lost
+- results: a task's return value (JSON) or last error is kept for
+  TASK_RESULT_TTL seconds after it finishes; prune() drops older ones
+
+Brokers hold the tasks and make claims atomic. TASK_BROKER picks one:
+- postgres: the background_tasks table; claims are serialized by an
+  advisory lock, so the running counts they check can't race
+- sqlite:///path: a SQLite file shared by the processes of one host,
+  claimed under BEGIN IMMEDIATE (tests, single-host setups)
+- memory: a dict in this process (tests, the development server)
+The default is postgres with a Postgres DATABASE_URL, memory otherwise.
+
+Workers are threads, TASK_WORKERS per process. By default they run in
+the web process only with the memory broker; with a shared broker, run
+dedicated worker processes:
+    python -m src.services.tasks worker [--workers 4]
+    python -m src.services.tasks prune
+
+Queue depth and running tasks (read from the broker, so across all
+workers), wait (due to started) and run time by task, and outcomes are
+exported on /metrics.
+
+Usage:
+    from src.services.tasks import task_queue
+
+    @task_queue.task('reports.monthly', priority=7, max_retries=2, timeout=1800)
+    def monthly_report(store_id, month):
+        ...
+        return {'url': url}
+
+    task_id = task_queue.enqueue('reports.monthly', {'store_id': store_id, 'month': '2026-09'},
+                                 user_id=user_id, store_id=store_id)
+    task_queue.get(task_id)['status']   # 'queued', 'running', 'succeeded' or 'failed'
+
+    # Inside a long task: stop once another worker may have taken over
+    if task_queue.current_lease().lost.is_set():
+        ...
+
+enqueue() commits on its own connection, so a worker may start the task
+before the caller's transaction commits: commit what the task reads first.
+"""
+
+import argparse
+import atexit
+import heapq
+import inspect
+import itertools
+import json
+import logging
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from src.services.metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = {'high': 0, 'default': 5, 'low': 9}
+DEFAULT_PRIORITY = 5
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF = 5.0
+DEFAULT_BACKOFF_MAX = 600.0
+DEFAULT_TIMEOUT = 15 * 60
+DEFAULT_USER_CONCURRENCY = 2
+DEFAULT_STORE_CONCURRENCY = 1
+DEFAULT_MEMORY_WORKERS = 2
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_RESULT_TTL = 7 * 24 * 60 * 60
+UNLIMITED = 2 ** 31 - 1
+DEPTH_TTL = 1.0
+
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0)
+RUN_BUCKETS = (0.01, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0)
+
+LEASE_EXPIRED = 'Lease expired: the worker stopped or could not renew it within the timeout'
+CAP_KEYS = ('user_id', 'store_id')
+
+
+class TaskError(Exception):
+    """A task that can't be queued or found, with the API error code and HTTP status"""
+
+    def __init__(self, code, message, status, details=None):
+        super().__init__(message)
+        self.code = code
+        self.status = status
+        self.details = details
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _uuid(value, field):
+    if value is None or value == '':
+        return None
+    try:
+        return str(uuid.UUID(str(value)))
+    except ValueError:
+        raise TaskError('BAD_REQUEST', f'{field} must be a UUID', 400)
+
+
+def _json(value):
+    """`value` as plain JSON types (what a broker stores and gives back)"""
+    return json.loads(json.dumps(value, default=str))
+
+
+def public(task):
+    """A task as the API returns it"""
+    return {
+        'id': task['id'],
+        'name': task['name'],
+        'priority': task['priority'],
+        'user_id': task['user_id'],
+        'store_id': task['store_id'],
+        'status': task['status'],
+        'attempts': task['attempts'],
+        'max_retries': task['max_retries'],
+        'run_at': task['run_at'].isoformat() if task['run_at'] else None,
+        'enqueued_at': task['enqueued_at'].isoformat() if task['enqueued_at'] else None,
+        'started_at': task['started_at'].isoformat() if task['started_at'] else None,
+        'finished_at': task['finished_at'].isoformat() if task['finished_at'] else None,
+        'result': task['result'],
+        'error': task['error']
+    }
+
+
+# Brokers. Each stores task dicts (see TaskQueue.enqueue for the keys) and
+# implements put, claim, renew, finish, retry, get, depth and prune; renew,
+# finish and retry return False when the run no longer holds the task (its
+# lease expired and another worker claimed it).
+
+class MemoryBroker:
+    """Tasks in a dict of this process (tests, the development server)"""
+
+    name = 'memory'
+
+    def __init__(self):
+        self.tasks = {}
+        self._queue = []  # (priority, run_at, sequence, task ID) of queued tasks
+        self._sequence = itertools.count()
+        self._leased = set()
+        self._running = {'user_id': {}, 'store_id': {}}
+        self._changed = threading.Condition()
+
+    def _push(self, task):
+        heapq.heappush(self._queue, (task['priority'], task['run_at'], next(self._sequence), task['id']))
+
+    def _count(self, task, delta):
+        for key, counts in self._running.items():
+            if task[key] is not None:
+                counts[task[key]] = counts.get(task[key], 0) + delta
+                if not counts[task[key]]:
+                    del counts[task[key]]
+
+    def _busy(self, task, user_limit, store_limit):
+        return (
+            (task['user_id'] is not None and self._running['user_id'].get(task['user_id'], 0) >= user_limit)
+            or (task['store_id'] is not None and self._running['store_id'].get(task['store_id'], 0) >= store_limit)
+        )
+
+    def _release(self, task, **changes):
+        self._leased.discard(task['id'])
+        self._count(task, -1)
+        task.update(lease_expires_at=None, **changes)
+        if task['status'] == 'queued':
+            task['worker'] = None
+            self._push(task)
+        self._changed.notify_all()
+
+    def _holds(self, task):
+        current = self.tasks.get(task['id'])
+        if (current is None or current['status'] != 'running' or current['worker'] != task['worker']
+                or current['attempts'] != task['attempts']):
+            return None
+        return current
+
+    def put(self, task):
+        with self._changed:
+            self.tasks[task['id']] = task
+            self._push(task)
+            self._changed.notify()
+
+    def claim(self, worker, user_limit, store_limit):
+        now = _now()
+        with self._changed:
+            for task_id in [i for i in self._leased if self.tasks[i]['lease_expires_at'] <= now]:
+                task = self.tasks[task_id]
+                if task['attempts'] > task['max_retries']:
+                    self._release(task, status='failed', finished_at=now, error=LEASE_EXPIRED)
+                else:
+                    self._release(task, status='queued', run_at=now, error=LEASE_EXPIRED)
+
+            skipped, claimed = [], None
+            while self._queue:
+                entry = heapq.heappop(self._queue)
+                task = self.tasks.get(entry[3])
+                if task is None or task['status'] != 'queued' or task['run_at'] != entry[1]:
+                    continue  # pruned or rescheduled since
+                if task['run_at'] > now or self._busy(task, user_limit, store_limit):
+                    skipped.append(entry)
+                    continue
+                claimed = task
+                break
+            for entry in skipped:
+                heapq.heappush(self._queue, entry)
+            if claimed is None:
+                return None
+
+            claimed.update(
+                status='running', attempts=claimed['attempts'] + 1, started_at=now, worker=worker,
+                lease_expires_at=now + timedelta(seconds=claimed['timeout'])
+            )
+            self._leased.add(claimed['id'])
+            self._count(claimed, 1)
+            return dict(claimed)
+
+    def renew(self, task):
+        with self._changed:
+            current = self._holds(task)
+            if current is None or current['lease_expires_at'] <= _now():
+                return False
+            current['lease_expires_at'] = _now() + timedelta(seconds=current['timeout'])
+            return True
+
+    def finish(self, task, status, result=None, error=None):
+        with self._changed:
+            current = self._holds(task)
+            if current is None:
+                return False
+            self._release(current, status=status, result=result, error=error, finished_at=_now())
+            return True
+
+    def retry(self, task, delay, error):
+        with self._changed:
+            current = self._holds(task)
+            if current is None:
+                return False
+            self._release(current, status='queued', run_at=_now() + timedelta(seconds=delay), error=error)
+            return True
+
+    def get(self, task_id):
+        with self._changed:
+            task = self.tasks.get(task_id)
+            return dict(task) if task is not None else None
+
+    def depth(self):
+        with self._changed:
+            running = len(self._leased)
+            return {'queued': sum(1 for task in self.tasks.values() if task['status'] == 'queued'),
+                    'running': running}
+
+    def prune(self, older_than):
+        before = _now() - timedelta(seconds=older_than)
+        with self._changed:
+            finished = [task_id for task_id, task in self.tasks.items()
+                        if task['status'] in ('succeeded', 'failed') and task['finished_at'] < before]
+            for task_id in finished:
+                del self.tasks[task_id]
+            return len(finished)
+
+    def wait(self, timeout):
+        """Sleep until a task is put or released, or `timeout` seconds"""
+        with self._changed:
+            self._changed.wait(timeout)
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS background_tasks (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    kwargs TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    user_id TEXT,
+    store_id TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    max_retries INTEGER NOT NULL,
+    timeout_seconds INTEGER NOT NULL,
+    run_at REAL NOT NULL,
+    enqueued_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    lease_expires_at REAL,
+    worker TEXT,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_background_tasks_queued ON background_tasks(priority, run_at) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS idx_background_tasks_running_user_id ON background_tasks(user_id) WHERE status = 'running';
+CREATE INDEX IF NOT EXISTS idx_background_tasks_running_store_id ON background_tasks(store_id) WHERE status = 'running';
+CREATE INDEX IF NOT EXISTS idx_background_tasks_finished_at
+    ON background_tasks(finished_at) WHERE status IN ('succeeded', 'failed');
+"""
+
+# Shared by both SQL brokers: tasks of users and stores at their cap are skipped
+SQL_READY = """
+    status = 'queued'
+    AND (user_id IS NULL OR user_id NOT IN (
+        SELECT user_id FROM {table} WHERE status = 'running' AND user_id IS NOT NULL
+        GROUP BY user_id HAVING count(*) >= :user_limit))
+    AND (store_id IS NULL OR store_id NOT IN (
+        SELECT store_id FROM {table} WHERE status = 'running' AND store_id IS NOT NULL
+        GROUP BY store_id HAVING count(*) >= :store_limit))
+"""
+
+SQL_HOLDS = "id = :id AND status = 'running' AND worker = :worker AND attempts = :attempts"
+
+SQLITE_EXPIRE = """
+UPDATE background_tasks
+SET status = CASE WHEN attempts > max_retries THEN 'failed' ELSE 'queued' END,
+    finished_at = CASE WHEN attempts > max_retries THEN :now END,
+    run_at = :now, error = :error, lease_expires_at = NULL, worker = NULL
+WHERE status = 'running' AND lease_expires_at <= :now
+"""
+
+SQLITE_NEXT = (
+    "SELECT id FROM background_tasks WHERE run_at <= :now AND" + SQL_READY.format(table='background_tasks')
+    + "ORDER BY priority, run_at LIMIT 1"
+)
+
+SQLITE_START = """
+UPDATE background_tasks
+SET status = 'running', attempts = attempts + 1, started_at = :now, worker = :worker,
+    lease_expires_at = :now + timeout_seconds
+WHERE id = :id
+"""
+
+
+def _timestamp(value):
+    return datetime.fromtimestamp(value, timezone.utc) if value is not None else None
+
+
+class SQLiteBroker:
+    """Tasks in a SQLite file shared by the processes of one host"""
+
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.executescript(SQLITE_SCHEMA)
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # Autocommit; writes that must be atomic run in BEGIN IMMEDIATE
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _task(row):
+        task = dict(row)
+        task['kwargs'] = json.loads(task['kwargs'])
+        task['result'] = json.loads(task['result']) if task['result'] is not None else None
+        task['timeout'] = task.pop('timeout_seconds')
+        for key in ('run_at', 'enqueued_at', 'started_at', 'finished_at', 'lease_expires_at'):
+            task[key] = _timestamp(task[key])
+        return task
+
+    def put(self, task):
+        self._connection().execute(
+            "INSERT INTO background_tasks (id, name, kwargs, priority, user_id, store_id, status, attempts, "
+            "max_retries, timeout_seconds, run_at, enqueued_at) "
+            "VALUES (:id, :name, :kwargs, :priority, :user_id, :store_id, 'queued', 0, :max_retries, :timeout, "
+            ":run_at, :enqueued_at)",
+            {**task, 'kwargs': json.dumps(task['kwargs']), 'run_at': task['run_at'].timestamp(),
+             'enqueued_at': task['enqueued_at'].timestamp()}
+        )
+
+    def claim(self, worker, user_limit, store_limit):
+        connection = self._connection()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(SQLITE_EXPIRE, {'now': now, 'error': LEASE_EXPIRED})
+            row = connection.execute(
+                SQLITE_NEXT, {'now': now, 'user_limit': user_limit, 'store_limit': store_limit}
+            ).fetchone()
+            if row is not None:
+                connection.execute(SQLITE_START, {'now': now, 'worker': worker, 'id': row['id']})
+                row = connection.execute("SELECT * FROM background_tasks WHERE id = ?", (row['id'],)).fetchone()
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return self._task(row) if row is not None else None
+
+    def renew(self, task):
+        return self._connection().execute(
+            "UPDATE background_tasks SET lease_expires_at = :now + timeout_seconds "
+            "WHERE lease_expires_at > :now AND " + SQL_HOLDS,
+            {'now': time.time(), 'id': task['id'], 'worker': task['worker'], 'attempts': task['attempts']}
+        ).rowcount == 1
+
+    def finish(self, task, status, result=None, error=None):
+        return self._connection().execute(
+            "UPDATE background_tasks SET status = :status, result = :result, error = :error, "
+            "finished_at = :now, lease_expires_at = NULL WHERE " + SQL_HOLDS,
+            {'status': status, 'result': json.dumps(result) if result is not None else None, 'error': error,
+             'now': time.time(), 'id': task['id'], 'worker': task['worker'], 'attempts': task['attempts']}
+        ).rowcount == 1
+
+    def retry(self, task, delay, error):
+        return self._connection().execute(
+            "UPDATE background_tasks SET status = 'queued', run_at = :run_at, error = :error, "
+            "lease_expires_at = NULL, worker = NULL WHERE " + SQL_HOLDS,
+            {'run_at': time.time() + delay, 'error': error,
+             'id': task['id'], 'worker': task['worker'], 'attempts': task['attempts']}
+        ).rowcount == 1
+
+    def get(self, task_id):
+        row = self._connection().execute("SELECT * FROM background_tasks WHERE id = ?", (task_id,)).fetchone()
+        return self._task(row) if row is not None else None
+
+    def depth(self):
+        queued, running = self._connection().execute(
+            "SELECT count(*) FILTER (WHERE status = 'queued'), count(*) FILTER (WHERE status = 'running') "
+            "FROM background_tasks WHERE status IN ('queued', 'running')"
+        ).fetchone()
+        return {'queued': queued, 'running': running}
+
+    def prune(self, older_than):
+        return self._connection().execute(
+            "DELETE FROM background_tasks WHERE status IN ('succeeded', 'failed') AND finished_at < ?",
+            (time.time() - older_than,)
+        ).rowcount
+
+
+CLAIM_LOCK = 0x6b736170_7461736b  # 'ksaptask': one claim at a time, so running counts are exact
+
+PG_EXPIRE = """
+UPDATE public.background_tasks
+SET status = CASE WHEN attempts > max_retries THEN 'failed' ELSE 'queued' END,
+    finished_at = CASE WHEN attempts > max_retries THEN now() END,
+    run_at = now(), error = :error, lease_expires_at = NULL, worker = NULL
+WHERE status = 'running' AND lease_expires_at <= now()
+"""
+
+PG_CLAIM = (
+    "WITH next AS ("
+    "    SELECT id FROM public.background_tasks WHERE run_at <= now() AND"
+    + SQL_READY.format(table='public.background_tasks')
+    + "    ORDER BY priority, run_at LIMIT 1"
+    ") "
+    "UPDATE public.background_tasks t "
+    "SET status = 'running', attempts = attempts + 1, started_at = now(), worker = :worker, "
+    "    lease_expires_at = now() + make_interval(secs => timeout_seconds) "
+    "FROM next WHERE t.id = next.id "
+    "RETURNING t.*"
+)
+
+
+class PostgresBroker:
+    """Tasks in public.background_tasks, through the app's SQLAlchemy engine"""
+
+    name = 'postgres'
+
+    @staticmethod
+    def _begin():
+        from src.models import db
+
+        return db.engine.begin()
+
+    @staticmethod
+    def _task(row):
+        task = dict(row._mapping)
+        task['id'] = str(task['id'])
+        task['user_id'] = str(task['user_id']) if task['user_id'] is not None else None
+        task['store_id'] = str(task['store_id']) if task['store_id'] is not None else None
+        task['timeout'] = task.pop('timeout_seconds')
+        return task
+
+    def put(self, task):
+        from src.models import db
+
+        with self._begin() as connection:
+            connection.execute(
+                db.text(
+                    "INSERT INTO public.background_tasks (id, name, kwargs, priority, user_id, store_id, "
+                    "max_retries, timeout_seconds, run_at, enqueued_at) "
+                    "VALUES (:id, :name, CAST(:kwargs AS jsonb), :priority, :user_id, :store_id, :max_retries, "
+                    ":timeout, :run_at, :enqueued_at)"
+                ),
+                {**task, 'kwargs': json.dumps(task['kwargs'])}
+            )
+
+    def claim(self, worker, user_limit, store_limit):
+        from src.models import db
+
+        with self._begin() as connection:
+            connection.execute(db.text("SELECT pg_advisory_xact_lock(:key)"), {'key': CLAIM_LOCK})
+            connection.execute(db.text(PG_EXPIRE), {'error': LEASE_EXPIRED})
+            row = connection.execute(
+                db.text(PG_CLAIM), {'worker': worker, 'user_limit': user_limit, 'store_limit': store_limit}
+            ).first()
+        return self._task(row) if row is not None else None
+
+    def renew(self, task):
+        from src.models import db
+
+        with self._begin() as connection:
+            return connection.execute(
+                db.text(
+                    "UPDATE public.background_tasks "
+                    "SET lease_expires_at = now() + make_interval(secs => timeout_seconds) "
+                    "WHERE lease_expires_at > now() AND " + SQL_HOLDS
+                ),
+                {'id': task['id'], 'worker': task['worker'], 'attempts': task['attempts']}
+            ).rowcount == 1
+
+    def finish(self, task, status, result=None, error=None):
+        from src.models import db
+
+        with self._begin() as connection:
+            return connection.execute(
+                db.text(
+                    "UPDATE public.background_tasks SET status = :status, result = CAST(:result AS jsonb), "
+                    "error = :error, finished_at = now(), lease_expires_at = NULL WHERE " + SQL_HOLDS
+                ),
+                {'status': status, 'result': json.dumps(result) if result is not None else None, 'error': error,
+                 'id': task['id'], 'worker': task['worker'], 'attempts': task['attempts']}
+            ).rowcount == 1
+
+    def retry(self, task, delay, error):
+        from src.models import db
+
+        with self._begin() as connection:
+            return connection.execute(
+                db.text(
+                    "UPDATE public.background_tasks SET status = 'queued', "
+                    "run_at = now() + make_interval(secs => :delay), error = :error, "
+                    "lease_expires_at = NULL, worker = NULL WHERE " + SQL_HOLDS
+                ),
+                {'delay': delay, 'error': error, 'id': task['id'], 'worker': task['worker'],
+                 'attempts': task['attempts']}
+            ).rowcount == 1
+
+    def get(self, task_id):
+        from src.models import db
+
+        with self._begin() as connection:
+            row = connection.execute(
+                db.text("SELECT * FROM public.background_tasks WHERE id = :id"), {'id': task_id}
+            ).first()
+        return self._task(row) if row is not None else None
+
+    def depth(self):
+        from src.models import db
+
+        with self._begin() as connection:
+            queued, running = connection.execute(db.text(
+                "SELECT count(*) FILTER (WHERE status = 'queued'), count(*) FILTER (WHERE status = 'running') "
+                "FROM public.background_tasks WHERE status IN ('queued', 'running')"
+            )).one()
+        return {'queued': queued, 'running': running}
+
+    def prune(self, older_than):
+        from src.models import db
+
+        with self._begin() as connection:
+            return connection.execute(
+                db.text(
+                    "DELETE FROM public.background_tasks WHERE status IN ('succeeded', 'failed') "
+                    "AND finished_at < now() - make_interval(secs => :older_than)"
+                ),
+                {'older_than': older_than}
+            ).rowcount
+
+
+def create_broker(url):
+    """The broker for a TASK_BROKER value: postgres, memory or sqlite:///path"""
+    if url == 'postgres':
+        return PostgresBroker()
+    if url == 'memory':
+        return MemoryBroker()
+    if url.startswith('sqlite:///'):
+        return SQLiteBroker(url[len('sqlite:///'):])
+    raise ValueError(f"Unknown TASK_BROKER '{url}': use postgres, memory or sqlite:///path")
+
+
+class Lease:
+    """
+    A running task's claim, renewed every third of its timeout by the
+    queue's lease thread while its function runs. `lost` is set once a
+    renewal finds the run no longer holds the task.
+    """
+
+    def __init__(self, task):
+        self.task = task
+        self.lost = threading.Event()
+        self.renew_at = time.monotonic() + task['timeout'] / 3
+
+
+class TaskQueue:
+    """Registered tasks, the broker holding them and this process's worker threads"""
+
+    def __init__(self, broker=None, workers=0, user_concurrency=DEFAULT_USER_CONCURRENCY,
+                 store_concurrency=DEFAULT_STORE_CONCURRENCY, poll_interval=DEFAULT_POLL_INTERVAL,
+                 result_ttl=DEFAULT_RESULT_TTL):
+        self.broker = broker
+        self.workers = workers
+        self.user_concurrency = user_concurrency
+        self.store_concurrency = store_concurrency
+        self.poll_interval = poll_interval
+        self.result_ttl = result_ttl
+        self.tasks = {}
+        self.app = None
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._depth = (0.0, None)
+        self._registered = False
+        self._local = threading.local()
+        self._leases = set()
+        self._leases_changed = threading.Condition()
+        self._lease_thread = None
+        self._lease_wake_at = 0.0
+
+        self.outcomes = Counter(
+            'ksap_tasks_total', 'Tasks by outcome: enqueued, succeeded, retried, failed or discarded',
+            ('task', 'outcome')
+        )
+        self.wait_time = Histogram(
+            'ksap_task_wait_seconds', 'Time from a task being due to a worker starting it', ('task',),
+            buckets=WAIT_BUCKETS
+        )
+        self.run_time = Histogram(
+            'ksap_task_duration_seconds', 'Time a task ran, failed runs included', ('task',), buckets=RUN_BUCKETS
+        )
+        self.queued = Gauge(
+            'ksap_task_queue_depth', 'Tasks queued in the broker, retries waiting for their backoff included',
+            lambda: self._read_depth('queued')
+        )
+        self.running = Gauge('ksap_tasks_running', 'Tasks running on any worker', lambda: self._read_depth('running'))
+
+    def init_app(self, app):
+        """Configure from app config, export metrics on /metrics and start this process's workers"""
+        if self.broker is None:
+            url = app.config.get('TASK_BROKER') or (
+                'postgres' if app.config.get('SQLALCHEMY_DATABASE_URI', '').startswith('postgresql') else 'memory'
+            )
+            self.broker = create_broker(url)
+        workers = app.config.get('TASK_WORKERS')
+        if workers is None:
+            workers = DEFAULT_MEMORY_WORKERS if self.broker.name == 'memory' else 0
+        self.workers = int(workers)
+        self.user_concurrency = int(app.config.get('TASK_USER_CONCURRENCY', self.user_concurrency))
+        self.store_concurrency = int(app.config.get('TASK_STORE_CONCURRENCY', self.store_concurrency))
+        self.poll_interval = float(app.config.get('TASK_POLL_INTERVAL', self.poll_interval))
+        self.result_ttl = int(app.config.get('TASK_RESULT_TTL', self.result_ttl))
+        self.app = app
+        app.extensions['tasks'] = self
+
+        from src.services.metrics import request_metrics
+        if not self._registered:
+            for metric in (self.outcomes, self.wait_time, self.run_time, self.queued, self.running):
+                request_metrics.registry.register(metric)
+            atexit.register(self.stop)
+            self._registered = True
+        if self.workers:
+            self.ensure_started()
+
+    def _read_depth(self, state):
+        """Queued or running tasks in the broker, read at most once per DEPTH_TTL for both gauges"""
+        read_at, depth = self._depth
+        if depth is None or time.monotonic() - read_at > DEPTH_TTL:
+            try:
+                depth = self.broker.depth()
+            except Exception as e:
+                logger.warning(f"⚠️ Cannot read task queue depth: {e}")
+                return None
+            self._depth = (time.monotonic(), depth)
+        return depth[state]
+
+    # Tasks
+
+    def task(self, name, priority=DEFAULT_PRIORITY, max_retries=DEFAULT_MAX_RETRIES, backoff=DEFAULT_BACKOFF,
+             backoff_max=DEFAULT_BACKOFF_MAX, timeout=DEFAULT_TIMEOUT, cap_keys=(), public=False):
+        """
+        Register function(**kwargs) as task `name`. Its return value,
+        converted to JSON, is the task's result; an exception fails the
+        run and retries it after a backoff while retries are left.
+        `cap_keys` (user_id, store_id) are kwargs the task is capped by:
+        every enqueue must give them. Only `public` tasks may be queued
+        by API callers.
+        """
+        unknown = set(cap_keys) - set(CAP_KEYS)
+        if unknown:
+            raise ValueError(f"cap_keys must be among {CAP_KEYS}, not {sorted(unknown)}")
+
+        def decorator(function):
+            self.tasks[name] = {
+                'function': function,
+                'priority': priority,
+                'max_retries': max_retries,
+                'backoff': backoff,
+                'backoff_max': backoff_max,
+                'timeout': timeout,
+                'cap_keys': tuple(cap_keys),
+                'public': public,
+                'signature': inspect.signature(function)
+            }
+            return function
+        return decorator
+
+    def _definition(self, name, kwargs):
+        definition = self.tasks.get(name)
+        if definition is None:
+            raise TaskError('UNKNOWN_TASK', f"Unknown task '{name}'", 404, {'tasks': sorted(self.tasks)})
+        if kwargs is not None and not isinstance(kwargs, dict):
+            raise TaskError('BAD_REQUEST', 'kwargs must be an object', 400)
+        return definition
+
+    def caps(self, name, kwargs=None, user_id=None, store_id=None):
+        """
+        The (user_id, store_id) task `name` counts against: the ones given,
+        and those its cap_keys name in `kwargs`, which must be there and
+        agree with them
+        """
+        definition = self._definition(name, kwargs)
+        caps = {'user_id': _uuid(user_id, 'user_id'), 'store_id': _uuid(store_id, 'store_id')}
+        for key in definition['cap_keys']:
+            value = _uuid((kwargs or {}).get(key), f'kwargs.{key}')
+            if value is None:
+                raise TaskError('BAD_REQUEST', f"Task '{name}' requires kwargs.{key}", 400)
+            if caps[key] not in (None, value):
+                raise TaskError('BAD_REQUEST', f'{key} must match kwargs.{key}', 400)
+            caps[key] = value
+        return caps['user_id'], caps['store_id']
+
+    def public_tasks(self):
+        """Names of the tasks API callers may queue"""
+        return sorted(name for name, definition in self.tasks.items() if definition['public'])
+
+    def priority(self, name, priority=None):
+        """`priority` (0-9 or high, default, low) as a number; task `name`'s own when None"""
+        definition = self._definition(name, None)
+        if priority is None:
+            priority = definition['priority']
+        elif isinstance(priority, str):
+            priority = PRIORITIES.get(priority, priority)
+        if isinstance(priority, bool) or not isinstance(priority, int) or not 0 <= priority <= 9:
+            raise TaskError('BAD_REQUEST', 'priority must be 0-9, high, default or low', 400)
+        return priority
+
+    def enqueue(self, name, kwargs=None, user_id=None, store_id=None, priority=None, delay=0, max_retries=None):
+        """
+        Queue task `name` with keyword arguments `kwargs` (JSON), counted
+        against the caps of `user_id` and `store_id` (see caps()); returns
+        its ID. `priority` is 0-9 or high, default, low; the task runs no
+        sooner than `delay` seconds from now.
+        """
+        definition = self._definition(name, kwargs)
+        user_id, store_id = self.caps(name, kwargs, user_id, store_id)
+        try:
+            definition['signature'].bind(**(kwargs or {}))
+        except TypeError as e:
+            raise TaskError('BAD_REQUEST', f"Bad kwargs for task '{name}': {e}", 400)
+        priority = self.priority(name, priority)
+        try:
+            delay = max(0.0, float(delay or 0))
+        except (TypeError, ValueError):
+            raise TaskError('BAD_REQUEST', 'delay must be a number of seconds', 400)
+
+        now = _now()
+        task = {
+            'id': str(uuid.uuid4()),
+            'name': name,
+            'kwargs': _json(kwargs or {}),
+            'priority': priority,
+            'user_id': user_id,
+            'store_id': store_id,
+            'status': 'queued',
+            'attempts': 0,
+            'max_retries': definition['max_retries'] if max_retries is None else int(max_retries),
+            'timeout': definition['timeout'],
+            'run_at': now + timedelta(seconds=delay),
+            'enqueued_at': now,
+            'started_at': None,
+            'finished_at': None,
+            'lease_expires_at': None,
+            'worker': None,
+            'result': None,
+            'error': None
+        }
+        self.broker.put(task)
+        self.outcomes.inc(name, 'enqueued')
+        if self.workers:
+            self.ensure_started()
+        return task['id']
+
+    def get(self, task_id):
+        """A task with its status and result; raises TaskError when there is none"""
+        try:
+            task = self.broker.get(str(uuid.UUID(str(task_id))))
+        except ValueError:
+            task = None
+        if task is None:
+            raise TaskError('NOT_FOUND', 'Task not found', 404)
+        return public(task)
+
+    def prune(self):
+        """Drop tasks finished more than result_ttl seconds ago; returns how many"""
+        pruned = self.broker.prune(self.result_ttl)
+        if pruned:
+            logger.info(f"✅ Pruned {pruned} finished tasks")
+        return pruned
+
+    @staticmethod
+    def backoff_delay(definition, attempt):
+        """Seconds before retrying after failed run number `attempt`: exponential, with jitter"""
+        delay = min(definition['backoff_max'], definition['backoff'] * 2 ** (attempt - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    # Workers
+
+    def current_lease(self):
+        """The Lease of the task running on this thread, or None"""
+        return getattr(self._local, 'lease', None)
+
+    def claim(self, worker):
+        """The next task this worker may run, marked running, or None"""
+        return self.broker.claim(worker, self.user_concurrency or UNLIMITED, self.store_concurrency or UNLIMITED)
+
+    def execute(self, task):
+        """Run a claimed task and record its result, or a retry or failure; returns the outcome"""
+        name = task['name']
+        definition = self.tasks.get(name)
+        self.wait_time.observe(max(0.0, (task['started_at'] - task['run_at']).total_seconds()), name)
+        started = time.perf_counter()
+        try:
+            if definition is None:
+                raise LookupError(f"Task '{name}' is not registered in this worker")
+            self._local.lease = self._watch(Lease(task))
+            result = _json(definition['function'](**task['kwargs']))
+        except Exception as e:
+            self.run_time.observe(time.perf_counter() - started, name)
+            self._rollback()
+            error = f'{type(e).__name__}: {e}'
+            if definition is not None and task['attempts'] <= task['max_retries']:
+                delay = self.backoff_delay(definition, task['attempts'])
+                logger.warning(f"⚠️ Task {name} {task['id']} failed (run {task['attempts']}), "
+                               f"retrying in {delay:.1f}s: {error}")
+                outcome, recorded = 'retried', self._record(self.broker.retry, task, delay, error)
+            else:
+                logger.error(f"❌ Task {name} {task['id']} failed after {task['attempts']} runs: {error}")
+                outcome, recorded = 'failed', self._record(self.broker.finish, task, 'failed', error=error)
+        else:
+            self.run_time.observe(time.perf_counter() - started, name)
+            outcome, recorded = 'succeeded', self._record(self.broker.finish, task, 'succeeded', result=result)
+        finally:
+            if getattr(self._local, 'lease', None) is not None:
+                self._unwatch(self._local.lease)
+                self._local.lease = None
+            self._remove_session()
+
+        if not recorded:
+            logger.warning(f"⚠️ Task {name} {task['id']} lost its lease, outcome '{outcome}' discarded")
+            outcome = 'discarded'
+        self.outcomes.inc(name, outcome)
+        return outcome
+
+    @staticmethod
+    def _record(operation, *args, **kwargs):
+        try:
+            return operation(*args, **kwargs)
+        except Exception as e:
+            # The lease expires and the task runs again
+            logger.warning(f"⚠️ Task outcome not recorded: {e}")
+            return False
+
+    def _watch(self, lease):
+        """Renew `lease` until _unwatch(), starting this process's lease thread if needed"""
+        with self._leases_changed:
+            self._leases.add(lease)
+            if self._lease_thread is None or not self._lease_thread.is_alive():
+                self._lease_thread = threading.Thread(target=self._renew_leases, name='ksap-task-leases',
+                                                      daemon=True)
+                self._lease_thread.start()
+            elif lease.renew_at < self._lease_wake_at:
+                self._leases_changed.notify()
+        return lease
+
+    def _unwatch(self, lease):
+        with self._leases_changed:
+            self._leases.discard(lease)
+
+    def _renew_leases(self):
+        with self.app.app_context():
+            while True:
+                with self._leases_changed:
+                    now = time.monotonic()
+                    due = [lease for lease in self._leases if lease.renew_at <= now]
+                    if not due:
+                        self._lease_wake_at = min((lease.renew_at for lease in self._leases), default=now + 60)
+                        self._leases_changed.wait(self._lease_wake_at - now)
+                        continue
+                for lease in due:
+                    try:
+                        held = self.broker.renew(lease.task)
+                    except Exception as e:
+                        # Retried at the next interval; the lease lasts until then
+                        logger.warning(f"⚠️ Cannot renew the lease of task {lease.task['id']}: {e}")
+                        held = True
+                    lease.renew_at = time.monotonic() + lease.task['timeout'] / 3
+                    if not held:
+                        logger.warning(f"⚠️ Task {lease.task['name']} {lease.task['id']} lost its lease")
+                        lease.lost.set()
+                        self._unwatch(lease)
+
+    def _rollback(self):
+        if 'sqlalchemy' in self.app.extensions:
+            from src.models import db
+            db.session.rollback()
+
+    def _remove_session(self):
+        if 'sqlalchemy' in self.app.extensions:
+            from src.models import db
+            db.session.remove()
+
+    def ensure_started(self):
+        """Start this process's worker threads if they aren't running"""
+        if self._pid == os.getpid() and self._threads and all(thread.is_alive() for thread in self._threads):
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._threads = []
+            self._pid = os.getpid()
+            self._stopped.clear()
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(
+                    target=self._run, name=f'ksap-task-worker-{len(self._threads) + 1}', daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout=10):
+        """Stop the workers once their current tasks finish (or after `timeout` seconds)"""
+        self._stopped.set()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+    def _run(self):
+        worker = f'{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}'
+        idle = getattr(self.broker, 'wait', self._stopped.wait)
+        with self.app.app_context():
+            while not self._stopped.is_set():
+                try:
+                    task = self.claim(worker)
+                except Exception as e:
+                    logger.warning(f"⚠️ Task broker unavailable, retrying in {self.poll_interval:.0f}s: {e}")
+                    self._stopped.wait(self.poll_interval)
+                    continue
+                if task is None:
+                    idle(self.poll_interval)
+                else:
+                    self.execute(task)
+
+
+# Global instance
+task_queue = TaskQueue()
+
+
+# Built-in tasks
+
+@task_queue.task('stores.sync', max_retries=3, backoff=30, timeout=60 * 60, cap_keys=('store_id',), public=True)
+def sync_store(store_id):
+    """
+    Incrementally sync one store's products and orders from its platform
+    (DATABASE_URL); stops between pages if the lease is lost
+    """
+    from src.services.platform_sync import SyncEngine
+
+    lease = task_queue.current_lease()
+    engine = SyncEngine(os.environ['DATABASE_URL'], workers=1)
+    try:
+        results = engine.run_once([store_id], stop=lease.lost if lease else None)
+    finally:
+        engine.close()
+    if not results:
+        raise LookupError(f'Store {store_id} not found')
+    return results[0]
+
+
+@task_queue.task('analytics.refresh_rollups', priority=7)
+def refresh_rollups():
+    from src.services.analytics_rollups import analytics_rollups
+
+    return {'days': analytics_rollups.refresh()}
+
+
+@task_queue.task('dashboard.reconcile', priority=9)
+def reconcile_dashboards():
+    from src.services.dashboard import store_dashboard
+
+    checked, repaired = store_dashboard.reconcile()
+    return {'checked': checked, 'repaired': repaired}
+
+
+@task_queue.task('research.prune', priority=9)
+def prune_research_cache():
+    from src.services.research_cache import research_cache
+
+    entries, payloads = research_cache.prune()
+    return {'entries': entries, 'payloads': payloads}
+
+
+@task_queue.task('tasks.prune', priority=9)
+def prune_tasks():
+    return {'tasks': task_queue.prune()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run background task workers, or drop old finished tasks")
+    commands = parser.add_subparsers(dest='command', required=True)
+    worker = commands.add_parser('worker', help='claim and run tasks until interrupted')
+    worker.add_argument('--workers', type=int, default=int(os.environ.get('TASK_WORKERS') or 4),
+                        help='worker threads in this process')
+    commands.add_parser('prune', help='drop tasks finished more than TASK_RESULT_TTL seconds ago')
+    args = parser.parse_args(argv)
+
+    from src.main import app
+
+    if args.command == 'prune':
+        with app.app_context():
+            task_queue.prune()
+        return 0
+
+    task_queue.workers = args.workers
+    task_queue.ensure_started()
+    logger.info(f"✅ {args.workers} task workers on the {task_queue.broker.name} broker")
+    try:
+        while not task_queue._stopped.wait(1):
+            pass
+    except KeyboardInterrupt:
+        logger.info("Stopping task workers after their current tasks")
+        task_queue.stop(timeout=DEFAULT_TIMEOUT)
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,448 @@
+"""
+Ahead-of-expiry refresh of social account tokens.
+
+Tokens that are only refreshed after a call fails expire in bursts: many
+accounts connected together expire together, every call fails, and the
+retries storm the platform. TokenRefreshScheduler refreshes them before
+they expire instead:
+
+- accounts due within `horizon` are loaded into a heap ordered by
+  token_expires_at; each is due `lead_time` before expiry, minus a random
+  jitter (up to `jitter` x lead_time) so equal expiries spread out
+- due accounts are refreshed in batches of at most `batch_size` through a
+  thread pool, no faster than `rate` refreshes per second overall
+- each batch is written back with one UPDATE ... FROM (VALUES ...),
+  only over the tokens it was refreshed from: an account the user
+  reconnected meanwhile keeps its new tokens
+- a write that fails keeps the refreshed tokens in memory and is retried
+  (the old refresh token may already be spent on a rotating grant), and
+  later refreshes of those accounts use the tokens held in memory
+- failures are retried with jittered exponential backoff, except revoked
+  grants (invalid_grant, HTTP 401), which need the user to reconnect and
+  are logged once
+
+Providers speak the platform's refresh grant; the token URL of each can
+be overridden (FACEBOOK_TOKEN_URL, INSTAGRAM_TOKEN_URL), e.g. to point
+at a local OAuth stand-in. Tokens are sent and stored as they are kept in
+the table.
+
+Usage (direct connection via DATABASE_URL):
+    python -m src.services.token_refresh [--once] [--lead-minutes 60] [--rate 10]
+"""
+
+import argparse
+import heapq
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEAD_TIME = 60 * 60
+DEFAULT_HORIZON = 24 * 60 * 60
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_RATE = 10.0
+DEFAULT_WORKERS = 8
+DEFAULT_JITTER = 0.1
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_RELOAD_INTERVAL = 5 * 60
+BACKOFF_BASE = 30
+BACKOFF_MAX = 30 * 60
+WRITE_RETRY_INTERVAL = 5
+
+SELECT_DUE = """
+SELECT id::text, platform, access_token, refresh_token, token_expires_at
+FROM public.social_media_accounts
+WHERE status = 'active'
+  AND token_expires_at < now() + make_interval(secs => %(horizon)s)
+  AND platform = ANY(%(platforms)s)
+ORDER BY token_expires_at
+LIMIT %(limit)s
+"""
+
+# Writes only over the tokens a refresh started from (read_*); returns the
+# accounts written, so ones reconnected meanwhile can be told apart
+UPDATE_TOKENS = """
+UPDATE public.social_media_accounts AS a
+SET access_token = v.access_token,
+    refresh_token = COALESCE(v.refresh_token, a.refresh_token),
+    token_expires_at = COALESCE(v.token_expires_at, a.token_expires_at),
+    updated_at = now()
+FROM (VALUES %s) AS v(id, access_token, refresh_token, token_expires_at, read_access_token, read_refresh_token)
+WHERE a.id = v.id::uuid
+  AND a.access_token IS NOT DISTINCT FROM v.read_access_token
+  AND a.refresh_token IS NOT DISTINCT FROM v.read_refresh_token
+RETURNING a.id::text
+"""
+UPDATE_TEMPLATE = '(%s, %s, %s, %s::timestamptz, %s, %s)'
+
+
+class RefreshError(Exception):
+    """A refresh the platform rejected; `retry` is False when the grant is revoked"""
+
+    def __init__(self, message, retry=True):
+        super().__init__(message)
+        self.retry = retry
+
+
+class OAuthProvider:
+    """
+    Token endpoint of one platform. `grant` is one of:
+
+        refresh_token      RFC 6749 refresh (POST, form encoded)
+        fb_exchange_token  Facebook long-lived token exchange (GET)
+        ig_refresh_token   Instagram long-lived token refresh (GET)
+    """
+
+    def __init__(self, name, token_url, client_id=None, client_secret=None, grant='refresh_token'):
+        self.name = name
+        self.token_url = token_url
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.grant = grant
+
+    def request(self, account):
+        """(method, params) of the refresh request for `account`"""
+        if self.grant == 'fb_exchange_token':
+            return 'GET', {
+                'grant_type': 'fb_exchange_token',
+                'client_id': self.client_id,
+                'client_secret': self.client_secret,
+                'fb_exchange_token': account['access_token']
+            }
+        if self.grant == 'ig_refresh_token':
+            return 'GET', {'grant_type': 'ig_refresh_token', 'access_token': account['access_token']}
+        if not account.get('refresh_token'):
+            raise RefreshError('no refresh token stored', retry=False)
+        return 'POST', {
+            'grant_type': 'refresh_token',
+            'refresh_token': account['refresh_token'],
+            'client_id': self.client_id,
+            'client_secret': self.client_secret
+        }
+
+
+def providers_from_env():
+    """Providers of the supported platforms, configured from the environment"""
+    return {
+        'facebook': OAuthProvider(
+            'facebook',
+            os.environ.get('FACEBOOK_TOKEN_URL') or 'https://graph.facebook.com/oauth/access_token',
+            os.environ.get('FACEBOOK_APP_ID'), os.environ.get('FACEBOOK_APP_SECRET'),
+            grant='fb_exchange_token'
+        ),
+        'instagram': OAuthProvider(
+            'instagram',
+            os.environ.get('INSTAGRAM_TOKEN_URL') or 'https://graph.instagram.com/refresh_access_token',
+            os.environ.get('INSTAGRAM_APP_ID'), os.environ.get('INSTAGRAM_APP_SECRET'),
+            grant='ig_refresh_token'
+        )
+    }
+
+
+class RefreshResult:
+    """Outcome of one refresh"""
+
+    def __init__(self, account, access_token=None, refresh_token=None, expires_at=None, error=None):
+        self.account = account
+        self.access_token = access_token
+        self.refresh_token = refresh_token
+        self.expires_at = expires_at
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+class TokenRefreshScheduler:
+    """Refreshes social account tokens ahead of expiry, in rate-limited batches"""
+
+    def __init__(self, connection=None, providers=None, lead_time=DEFAULT_LEAD_TIME, horizon=DEFAULT_HORIZON,
+                 batch_size=DEFAULT_BATCH_SIZE, rate=DEFAULT_RATE, workers=DEFAULT_WORKERS, jitter=DEFAULT_JITTER,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, request_timeout=10, session=None):
+        self.connection = connection
+        self.providers = providers if providers is not None else providers_from_env()
+        self.lead_time = lead_time
+        self.horizon = horizon
+        self.batch_size = batch_size
+        self.rate = rate
+        self.workers = workers
+        self.jitter = jitter
+        self.max_attempts = max_attempts
+        self.request_timeout = request_timeout
+        self.session = session or self._session(workers)
+        self.stats = {'refreshed': 0, 'retried': 0, 'failed': 0, 'needs_reauth': 0, 'superseded': 0}
+
+        self._heap = []  # (due_at, token_expires_at, id)
+        self._accounts = {}  # id -> account, with 'due_at' and 'attempts'
+        self._needs_reauth = {}  # id -> token_expires_at the refresh was rejected for
+        self._unwritten = {}  # id -> UPDATE_TOKENS row not yet stored
+        self._next_dispatch = 0.0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='token-refresh')
+
+    @staticmethod
+    def _session(workers):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=workers)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.session.close()
+        if self._unwritten and not self.write_pending():
+            logger.error(f"❌ Refreshed tokens of {len(self._unwritten)} account(s) could not be stored: "
+                         f"{', '.join(self._unwritten)}")
+
+    # Queue
+
+    def __len__(self):
+        return len(self._accounts)
+
+    def push(self, account):
+        """
+        Queue `account` (id, platform, access_token, refresh_token,
+        token_expires_at as an aware datetime). An account already queued
+        is rescheduled from its new expiry; one whose grant was revoked is
+        skipped until its expiry changes (the user reconnected).
+        """
+        expires_at = account['token_expires_at'].timestamp()
+        if self._needs_reauth.get(account['id']) == expires_at:
+            return
+        queued = self._accounts.get(account['id'])
+        if queued is not None and queued['token_expires_at'].timestamp() == expires_at:
+            return
+        due_at = expires_at - self.lead_time * (1 + random.uniform(0, self.jitter))
+        self._schedule({**account, 'attempts': 0}, due_at)
+
+    def _schedule(self, account, due_at):
+        account['due_at'] = due_at
+        self._accounts[account['id']] = account
+        heapq.heappush(self._heap, (due_at, account['token_expires_at'].timestamp(), account['id']))
+
+    def next_due(self):
+        """When the earliest queued account is due (epoch seconds), or None"""
+        while self._heap:
+            due_at, _, account_id = self._heap[0]
+            account = self._accounts.get(account_id)
+            if account is not None and account['due_at'] == due_at:
+                return due_at
+            heapq.heappop(self._heap)  # superseded entry
+        return None
+
+    def due(self, now=None):
+        """Pop up to batch_size accounts that are due"""
+        now = time.time() if now is None else now
+        batch = []
+        while len(batch) < self.batch_size and (due_at := self.next_due()) is not None and due_at <= now:
+            _, _, account_id = heapq.heappop(self._heap)
+            batch.append(self._accounts.pop(account_id))
+        return batch
+
+    # Refreshing
+
+    def refresh(self, account):
+        """Refresh one account's token; never raises"""
+        provider = self.providers.get(account['platform'])
+        try:
+            if provider is None:
+                raise RefreshError(f"no provider for {account['platform']}", retry=False)
+            method, params = provider.request(account)
+            if method == 'GET':
+                response = self.session.get(provider.token_url, params=params, timeout=self.request_timeout)
+            else:
+                response = self.session.post(provider.token_url, data=params, timeout=self.request_timeout)
+            try:
+                body = response.json()
+            except ValueError:
+                body = {}
+            if response.status_code != 200 or 'access_token' not in body:
+                revoked = response.status_code == 401 or body.get('error') == 'invalid_grant'
+                raise RefreshError(f"HTTP {response.status_code}: {body.get('error') or response.text[:200]}",
+                                   retry=not revoked)
+        except RefreshError as e:
+            return RefreshResult(account, error=e)
+        except Exception as e:
+            return RefreshResult(account, error=RefreshError(f'{type(e).__name__}: {e}'))
+
+        expires_at = None
+        if body.get('expires_in'):
+            expires_at = datetime.now(timezone.utc) + timedelta(seconds=int(body['expires_in']))
+        return RefreshResult(account, body['access_token'], body.get('refresh_token'), expires_at)
+
+    def _throttle(self, count):
+        """Sleep so dispatches stay under `rate` per second, with a little jitter"""
+        now = time.time()
+        wait = self._next_dispatch - now
+        if wait > 0:
+            time.sleep(wait + random.uniform(0, self.jitter * wait))
+        self._next_dispatch = max(now, self._next_dispatch) + count / self.rate
+
+    def run_batch(self, accounts):
+        """Refresh `accounts` through the worker pool, reschedule them and write the successes"""
+        self._throttle(len(accounts))
+        results = list(self._executor.map(self.refresh, accounts))
+        for result in results:
+            account = result.account
+            if result.ok:
+                self.stats['refreshed'] += 1
+                if result.expires_at is not None:
+                    self.push({**account, 'access_token': result.access_token,
+                               'refresh_token': result.refresh_token or account.get('refresh_token'),
+                               'token_expires_at': result.expires_at})
+            elif not result.error.retry:
+                self.stats['needs_reauth'] += 1
+                self._needs_reauth[account['id']] = account['token_expires_at'].timestamp()
+                logger.warning(f"⚠️ {account['platform']} account {account['id']} needs to reconnect: {result.error}")
+            elif account['attempts'] + 1 >= self.max_attempts:
+                self.stats['failed'] += 1
+                logger.warning(f"⚠️ Giving up refreshing {account['platform']} account {account['id']} "
+                               f"after {self.max_attempts} attempts: {result.error}")
+            else:
+                self.stats['retried'] += 1
+                account['attempts'] += 1
+                backoff = min(BACKOFF_BASE * 2 ** (account['attempts'] - 1), BACKOFF_MAX)
+                self._schedule(account, time.time() + backoff * random.uniform(0.5, 1.5))
+
+        for result in results:
+            if result.ok:
+                account = result.account
+                row = (account['id'], result.access_token, result.refresh_token, result.expires_at,
+                       account['access_token'], account.get('refresh_token'))
+                unwritten = self._unwritten.get(account['id'])
+                # Refreshed again before the last refresh was stored: the
+                # table still holds the tokens that one started from
+                self._unwritten[account['id']] = row if unwritten is None else row[:4] + unwritten[4:]
+        self.write_pending()
+        return results
+
+    def write_pending(self):
+        """
+        Store refreshed tokens not written yet; returns False if the write
+        failed, in which case they are kept for the next attempt.
+        """
+        if not self._unwritten:
+            return True
+        rows = list(self._unwritten.values())
+        try:
+            written = self.write_results(rows)
+        except Exception as e:
+            if self.connection is not None:
+                try:
+                    self.connection.rollback()
+                except Exception:
+                    pass
+            logger.warning(f"⚠️ Could not store refreshed tokens of {len(rows)} account(s), will retry: {e}")
+            return False
+        self._unwritten.clear()
+        for account_id in {row[0] for row in rows} - written:
+            # Reconnected since it was read: the stored tokens win, and the
+            # next load() queues the account from them
+            self.stats['superseded'] += 1
+            self._accounts.pop(account_id, None)
+            logger.info(f"Account {account_id} changed while refreshing; kept its stored tokens")
+        return True
+
+    def run_due(self):
+        """Refresh every account due now; returns how many were attempted"""
+        attempted = 0
+        self.write_pending()
+        while batch := self.due():
+            self.run_batch(batch)
+            attempted += len(batch)
+        return attempted
+
+    def run(self, reload_interval=DEFAULT_RELOAD_INTERVAL, stop=None):
+        """Reload due-soon accounts every `reload_interval` seconds and refresh them as they come due"""
+        stop = stop or threading.Event()
+        next_reload = 0.0
+        while not stop.is_set():
+            if time.time() >= next_reload:
+                self.load()
+                next_reload = time.time() + reload_interval
+            self.run_due()
+            due_at = self.next_due()
+            wake = next_reload if due_at is None else min(next_reload, due_at)
+            if self._unwritten:
+                wake = min(wake, time.time() + WRITE_RETRY_INTERVAL)
+            stop.wait(max(0.0, wake - time.time()))
+
+    # Database
+
+    def load(self, limit=100000):
+        """Queue active accounts expiring within `horizon`; returns how many rows were read"""
+        with self.connection.cursor() as cursor:
+            cursor.execute(SELECT_DUE, {'horizon': self.horizon, 'platforms': list(self.providers), 'limit': limit})
+            columns = [column.name for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        self.connection.commit()
+        for row in rows:
+            self.push(row)
+        return len(rows)
+
+    def write_results(self, rows):
+        """Store UPDATE_TOKENS rows with a single UPDATE; returns the ids written"""
+        if self.connection is None:
+            return {row[0] for row in rows}
+        from psycopg2.extras import execute_values
+
+        with self.connection.cursor() as cursor:
+            written = execute_values(cursor, UPDATE_TOKENS, rows, template=UPDATE_TEMPLATE, page_size=len(rows),
+                                     fetch=True)
+        self.connection.commit()
+        return {account_id for account_id, in written}
+
+
+def main(argv=None):
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Refresh social account tokens ahead of expiry")
+    parser.add_argument('--once', action='store_true', help='refresh what is due now and exit')
+    parser.add_argument('--lead-minutes', type=float,
+                        default=float(os.environ.get('TOKEN_REFRESH_LEAD_MINUTES', DEFAULT_LEAD_TIME / 60)),
+                        help='refresh this long before expiry')
+    parser.add_argument('--batch-size', type=int,
+                        default=int(os.environ.get('TOKEN_REFRESH_BATCH_SIZE', DEFAULT_BATCH_SIZE)))
+    parser.add_argument('--rate', type=float, default=float(os.environ.get('TOKEN_REFRESH_RATE', DEFAULT_RATE)),
+                        help='refreshes per second, across all workers')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('TOKEN_REFRESH_WORKERS', DEFAULT_WORKERS)))
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'),
+                        help='direct Postgres connection string (default: $DATABASE_URL)')
+    args = parser.parse_args(argv)
+    if not args.database_url:
+        parser.error('--database-url or DATABASE_URL is required')
+
+    import psycopg2
+
+    connection = psycopg2.connect(args.database_url)
+    scheduler = TokenRefreshScheduler(connection, lead_time=args.lead_minutes * 60, batch_size=args.batch_size,
+                                      rate=args.rate, workers=args.workers)
+    try:
+        if args.once:
+            scheduler.load()
+            scheduler.run_due()
+            logger.info(f"Token refresh: {scheduler.stats}")
+        else:
+            scheduler.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scheduler.close()
+        connection.close()
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,14 @@
+from .pagination import encode_cursor, decode_cursor, parse_limit
+from .conditional import conditional, resource_validators, collection_validators
+from .serialization import FastJSONProvider, serialize_many
+
+__all__ = [
+    'encode_cursor',
+    'decode_cursor',
+    'parse_limit',
+    'conditional',
+    'resource_validators',
+    'collection_validators',
+    'FastJSONProvider',
+    'serialize_many'
+]
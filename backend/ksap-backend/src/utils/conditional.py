@@ -0,0 +1,113 @@
+"""
+Conditional GET support (ETag / Last-Modified) for KSAP endpoints.
+
+Every table with the handle_updated_at() trigger keeps updated_at exact,
+so a resource's validators come from its updated_at alone, and a
+collection's from max(updated_at) plus count(*) over the same filter
+(the count catches deletions). Both are cheap index lookups, run before
+the view: when the client's copy is current the view never runs, so the
+rows are neither fetched nor serialized and a 304 goes back.
+
+Deleting a row leaves max(updated_at) where it was, so a date alone
+cannot tell a collection changed: collections are validated by ETag
+only and send no Last-Modified, so If-Modified-Since never yields a
+stale 304 for them.
+
+ETags are weak (the same data may serialize slightly differently) and
+cover the request path, query string and Accept header, so pages,
+filters and formats of one collection never share a validator.
+
+Reference: https://www.rfc-editor.org/rfc/rfc9110#name-conditional-requests
+"""
+
+import hashlib
+from datetime import timezone
+from functools import wraps
+
+from flask import current_app, g, request
+
+from src.models import db
+
+
+def _utc(value):
+    if value is None:
+        return None
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def resource_validators(column, *criteria):
+    """
+    (last_modified, version) of one row, selecting only its updated_at
+    column. Returns None when no row matches, so the view can 404.
+    """
+    row = db.session.execute(db.select(column).where(*criteria)).first()
+    if row is None:
+        return None
+    last_modified = _utc(row[0])
+    return last_modified, last_modified.isoformat() if last_modified else ''
+
+
+def collection_validators(column, *criteria):
+    """
+    (None, version) of a collection, the version built from max(column)
+    and count(*). There is no last_modified: it would miss deletions.
+    """
+    latest, count = db.session.execute(
+        db.select(db.func.max(column), db.func.count()).select_from(column.table).where(*criteria)
+    ).one()
+    latest = _utc(latest)
+    return None, f'{latest.isoformat() if latest else ""}|{count}'
+
+
+def _etag(version):
+    scope = f'{request.full_path}|{request.headers.get("Accept", "")}|{version}'
+    return hashlib.sha256(scope.encode('utf-8')).hexdigest()[:32]
+
+
+def _not_modified(etag, last_modified):
+    # If-None-Match takes precedence over If-Modified-Since (RFC 9110 13.2.2)
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
+def conditional(validators):
+    """
+    Answer GET requests with 304 when the client's copy is current.
+
+    `validators` takes the view's keyword arguments and returns
+    (last_modified, version) - usually from resource_validators or
+    collection_validators - or None to skip conditional handling. Apply
+    it outside response caching so a 304 never needs a cache lookup; the
+    cache then serves only entries built from the same version.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(*args, **kwargs)
+
+            result = validators(**kwargs)
+            if result is None:
+                return view(*args, **kwargs)
+            last_modified, version = result
+            etag = _etag(version)
+            # Response caching keeps only bodies built from this version
+            g.validator_version = version
+
+            if _not_modified(etag, last_modified):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            # Revalidate on every use; the 304 path is what makes that cheap
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,60 @@
+"""
+Keyset (cursor) pagination helpers for KSAP list endpoints.
+
+Cursors are opaque, URL-safe tokens wrapping the sort key of the last row
+on a page, so the next page can seek straight to it through an index
+instead of scanning past an OFFSET.
+
+Reference: https://use-the-index-luke.com/no-offset
+"""
+
+import base64
+import json
+from datetime import datetime
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(*values):
+    """Encode the sort key of the last row on a page as an opaque cursor"""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, *types):
+    """
+    Decode a cursor produced by encode_cursor.
+
+    `types` gives the expected type of each key component; datetime
+    components are parsed back from ISO format. Raises ValueError when the
+    cursor is malformed.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+    if not isinstance(payload, list) or len(payload) != len(types):
+        raise ValueError("Invalid cursor: unexpected key shape")
+
+    values = []
+    for value, expected in zip(payload, types):
+        # Well-formed JSON can still hold the wrong types, e.g. [1, 2]
+        try:
+            if expected is datetime:
+                values.append(datetime.fromisoformat(value) if value is not None else None)
+            else:
+                values.append(expected(value))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid cursor: {e}")
+    return tuple(values)
+
+
+def parse_limit(raw_limit, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Clamp a `limit` query parameter to [1, maximum]; ValueError if not an integer"""
+    if raw_limit in (None, ''):
+        return default
+    return max(1, min(int(raw_limit), maximum))
@@ -0,0 +1,205 @@
+"""
+Fast JSON path for model responses.
+
+FastJSONProvider plugs into Flask (`app.json`) and encodes with orjson
+when it is installed: datetimes, dates and UUIDs are serialized natively
+in C and responses are built straight from bytes. Without orjson it
+behaves like Flask's default provider.
+
+`serialize_many(instances)` replaces `[obj.to_dict() for obj in ...]` on
+list endpoints. For each model a serializer is generated once, from the
+field list in SERIALIZED_FIELDS, as a single list comprehension that
+reads attributes directly: no per-row method call, no conditional dict
+assembly, and no isoformat() per value when orjson encodes datetimes
+itself. orjson still needs one mapping per row, so each row becomes
+exactly one dict literal and nothing is copied or merged afterwards.
+The output matches to_dict(); tests/test_serialization.py checks every
+model listed, so a field added to one and not the other fails the suite.
+
+Reference: https://github.com/ijl/orjson
+"""
+
+import decimal
+
+from flask import current_app, has_app_context
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import Date, DateTime, Integer, Numeric
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+def _default(value):
+    """Types orjson does not handle natively"""
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if hasattr(value, '__html__'):
+        return str(value.__html__())
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, falling back to the stdlib encoder"""
+
+    def _options(self):
+        options = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return options
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=self._options()).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if orjson is None or self._app.debug:
+            # Debug mode keeps the default provider's indented output
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=_default, option=self._options())
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+class Field:
+    """
+    One key of a serialized model.
+
+    `attr` defaults to the key; `empty` replaces None (mirroring e.g.
+    `self.settings or {}` in to_dict); `source` is a Python expression
+    for computed values, with `{attr}` standing for an attribute read.
+    """
+
+    def __init__(self, key, attr=None, empty=None, source=None):
+        self.key = key
+        self.attr = attr or key
+        self.empty = empty
+        self.source = source
+
+
+# Mirrors each model's to_dict(); plain strings are fields whose key is the attribute name
+SERIALIZED_FIELDS = {
+    'User': [
+        'id', 'email', 'first_name', 'last_name', 'full_name', 'is_active', 'is_verified',
+        'created_at', 'updated_at', 'last_login', Field('settings', empty={})
+    ],
+    'Store': [
+        'id', 'user_id', 'name', 'description', 'domain', 'platform', 'status', 'is_connected',
+        'total_products', 'total_orders', 'created_at', 'updated_at', Field('settings', empty={})
+    ],
+    'Product': [
+        'id', 'store_id', 'platform_product_id', 'title', 'description', 'price', 'compare_at_price',
+        'cost_per_item', 'sku', 'barcode', 'inventory_quantity', 'track_inventory', 'in_stock', 'weight',
+        Field('images', empty=[]), Field('tags', empty=[]), 'vendor', 'product_type', 'status',
+        'created_at', 'updated_at'
+    ],
+    'AnalyticsRollup': [
+        'period_start', 'metric_name', Field('sum', 'value_sum'), Field('count', 'value_count'),
+        Field('avg', source='(float({value_sum}) / {value_count} if {value_count} else None)'),
+        Field('min', 'value_min'), Field('max', 'value_max')
+    ],
+}
+
+_serializers = {}
+
+
+def _column(model, attr):
+    """The mapped column behind `attr`, or None for properties"""
+    column_attrs = model.__mapper__.column_attrs
+    return column_attrs[attr].columns[0] if attr in column_attrs else None
+
+
+def _expression(model, field, native_dates, access):
+    """Python source reading one field, with `access(attr)` giving the source of an attribute read"""
+    if field.source:
+        return field.source.format_map(_Accessors(access))
+    value = access(field.attr)
+    if field.empty is not None:
+        return f'({value} or {field.empty!r})'
+    column = _column(model, field.attr)
+    if column is None:
+        return value  # property, e.g. full_name or in_stock
+    if isinstance(column.type, Numeric) and not isinstance(column.type, Integer):
+        return f'(None if (v := {value}) is None else float(v))'
+    if isinstance(column.type, (Date, DateTime)) and not native_dates:
+        return f'(None if (v := {value}) is None else v.isoformat())'
+    return value
+
+
+class _Accessors(dict):
+    """format_map() mapping that turns `{attr}` into an attribute read"""
+
+    def __init__(self, access):
+        super().__init__()
+        self.access = access
+
+    def __missing__(self, attr):
+        return self.access(attr)
+
+
+def compile_serializer(model, native_dates=False):
+    """
+    Generate `serialize(objects) -> list of dicts` for a model listed in
+    SERIALIZED_FIELDS. With native_dates, dates and datetimes are left for
+    the encoder (orjson writes the same ISO 8601 text as isoformat()).
+
+    Going through the instrumented attributes is most of what a to_dict()
+    costs, so rows whose columns are all loaded are read straight from
+    the instance __dict__ (`d`); expired or deferred rows fall back to the
+    attributes, which load them.
+    """
+    fields = [field if isinstance(field, Field) else Field(field) for field in SERIALIZED_FIELDS[model.__name__]]
+    columns = set()
+
+    def direct(attr):
+        if _column(model, attr) is None:
+            return f'o.{attr}'
+        columns.add(attr)
+        return f'd[{attr!r}]'
+
+    def row(access):
+        items = ', '.join(f'{field.key!r}: {_expression(model, field, native_dates, access)}' for field in fields)
+        return f'{{{items}}}'
+
+    fast_row = row(direct)
+    slow_row = row(lambda attr: f'o.{attr}')
+    source = (
+        'def serialize(objects):\n'
+        f'    return [{fast_row} if (d := o.__dict__).keys() >= columns else {slow_row} for o in objects]\n'
+    )
+    namespace = {'columns': frozenset(columns)}
+    exec(compile(source, f'<serializer {model.__name__}>', 'exec'), namespace)
+    return namespace['serialize']
+
+
+def native_dates():
+    """True when the current app's JSON provider encodes datetimes itself"""
+    return orjson is not None and has_app_context() and isinstance(current_app.json, FastJSONProvider)
+
+
+def serialize_many(objects, model=None, native=None):
+    """
+    [obj.to_dict() for obj in objects], built by the model's compiled
+    serializer. Models without a field list fall back to to_dict().
+    """
+    objects = objects if isinstance(objects, list) else list(objects)
+    if not objects:
+        return []
+    model = model or type(objects[0])
+    if model.__name__ not in SERIALIZED_FIELDS:
+        return [obj.to_dict() for obj in objects]
+    native = native_dates() if native is None else native
+    serialize = _serializers.get((model, native))
+    if serialize is None:
+        serialize = _serializers[(model, native)] = compile_serializer(model, native)
+    return serialize(objects)
+
@@ -0,0 +1,35 @@
+"""
+Startup timing for create_app().
+
+Cold starts (new workers, autoscale-ups) are paid on every deploy, so
+create_app() records how long each phase takes in a StartupProfile kept
+at `app.extensions['startup']`. benchmarks/startup.py combines it with
+an import-time breakdown (`python -X importtime`) for CI.
+"""
+
+import time
+from contextlib import contextmanager
+
+
+class StartupProfile:
+    """Wall-clock duration of each named startup phase"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.total_ms = None
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round((time.perf_counter() - started) * 1000, 2)
+
+    def finish(self):
+        self.total_ms = round((time.perf_counter() - self.started) * 1000, 2)
+        return self.total_ms
+
+    def to_dict(self):
+        return {'total_ms': self.total_ms, 'phases': dict(self.phases)}
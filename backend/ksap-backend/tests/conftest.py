@@ -0,0 +1,111 @@
+"""
+Shared pytest fixtures.
+
+Every test runs under the N+1 detector: a statement shape executed more
+than NPLUSONE_THRESHOLD (default 5) times in one test raises
+NPlusOneError from the offending query, and a test whose queries
+repeated a shape that often fails even if it swallowed the error. Tests
+that repeat a statement on purpose (workers polling a broker, load
+loops) opt out with @pytest.mark.allow_n_plus_one.
+
+Tests that need Postgres use TEST_DATABASE_URL, a database with every
+migration applied (the same setup as the benchmarks), and are skipped
+without it. Rows they create are deleted afterwards.
+
+    TEST_DATABASE_URL=postgresql://... python -m pytest -q
+"""
+
+import os
+import uuid
+
+import pytest
+
+# Before src.main is imported: the test app uses the test database (or an
+# in-memory SQLite database), probes nothing at startup and runs no
+# background task workers
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL', '')
+os.environ['DATABASE_URL'] = TEST_DATABASE_URL or 'sqlite://'
+os.environ['STARTUP_CHECKS'] = 'off'
+os.environ['TASK_BROKER'] = 'memory'
+os.environ['TASK_WORKERS'] = '0'
+os.environ['RESEARCH_STUB_SOURCES'] = 'true'
+os.environ.setdefault('NPLUSONE_MODE', 'raise')
+
+from src.services.n_plus_one import n_plus_one_detector  # noqa: E402
+
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('NPLUSONE_THRESHOLD', 5))
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'allow_n_plus_one: the test repeats a statement on purpose')
+
+
+@pytest.fixture(autouse=True)
+def n_plus_one(request):
+    """The test's N+1 scope; fails the test when a statement shape repeated past the threshold"""
+    if request.node.get_closest_marker('allow_n_plus_one'):
+        yield None
+        return
+    with n_plus_one_detector.watch(threshold=N_PLUS_ONE_THRESHOLD, mode='raise', name=request.node.nodeid) as scope:
+        yield scope
+    if scope.violations():
+        pytest.fail(scope.report(), pytrace=False)
+
+
+@pytest.fixture(scope='session')
+def app():
+    from src.main import app
+
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture(scope='session')
+def database_url():
+    if not TEST_DATABASE_URL:
+        pytest.skip('TEST_DATABASE_URL is not set')
+    return TEST_DATABASE_URL
+
+
+@pytest.fixture
+def db(app, database_url):
+    """The app's SQLAlchemy handle inside an app context, on the test database"""
+    from src.models import db
+
+    with app.app_context():
+        yield db
+        db.session.rollback()
+        db.session.remove()
+
+
+@pytest.fixture
+def user_id(db):
+    """A user (with its auth.users row); deleting it afterwards cascades to its stores"""
+    user_id = str(uuid.uuid4())
+    db.session.execute(db.text("INSERT INTO auth.users (id) VALUES (:id)"), {'id': user_id})
+    db.session.execute(
+        db.text("INSERT INTO public.users (id, email) VALUES (:id, :email)"),
+        {'id': user_id, 'email': f'test-{user_id}@example.com'}
+    )
+    db.session.commit()
+    yield user_id
+    db.session.rollback()
+    db.session.execute(db.text("DELETE FROM public.users WHERE id = :id"), {'id': user_id})
+    db.session.execute(db.text("DELETE FROM auth.users WHERE id = :id"), {'id': user_id})
+    db.session.commit()
+
+
+@pytest.fixture
+def store_id(db, user_id):
+    """A store of `user_id`"""
+    store_id = str(uuid.uuid4())
+    db.session.execute(
+        db.text("INSERT INTO public.stores (id, user_id, name, platform) VALUES (:id, :user_id, 'Test store', 'custom')"),
+        {'id': store_id, 'user_id': user_id}
+    )
+    db.session.commit()
+    return store_id
@@ -0,0 +1,126 @@
+import time
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from src.models import Product, Store, User, db
+from src.services.cache import MemoryBackend, model_tags, response_cache
+
+
+@pytest.fixture
+def backend(app, monkeypatch):
+    """A fresh in-process backend behind the global response cache"""
+    backend = MemoryBackend(max_entries=8)
+    monkeypatch.setattr(response_cache, 'backend', backend)
+    return backend
+
+
+@pytest.fixture
+def session(app):
+    """An ORM session on a scratch SQLite database with the users, stores and products tables"""
+    engine = create_engine('sqlite://')
+    db.metadata.create_all(engine, tables=[User.__table__, Store.__table__, Product.__table__])
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def test_invalidate_evicts_entries_with_any_tag(backend):
+    backend.set('a', b'a', ['store:1:products', 'products:p1'], 60)
+    backend.set('b', b'b', ['store:1:products'], 60)
+    backend.set('c', b'c', ['store:2:products'], 60)
+
+    assert backend.invalidate({'products:p1', 'users'}) == 1
+    assert backend.get('a') is None
+    assert backend.get('b') == b'b'
+
+    assert backend.invalidate({'store:1:products'}) == 1
+    assert backend.get('b') is None
+    assert backend.get('c') == b'c'
+    # Evicted keys leave no empty tag sets behind
+    assert set(backend._tags) == {'store:2:products'}
+
+
+def test_lru_evicts_least_recently_read(backend):
+    for n in range(8):
+        backend.set(f'k{n}', n, [f'tag:{n}'], 60)
+    assert backend.get('k0') == 0
+
+    backend.set('k8', 8, ['tag:8'], 60)
+    assert backend.get('k1') is None
+    assert backend.get('k0') == 0
+    assert len(backend._entries) == 8
+    assert 'tag:1' not in backend._tags
+
+
+def test_expired_entries_are_misses(backend, monkeypatch):
+    backend.set('k', b'v', ['t'], 60)
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now + 61)
+    assert backend.get('k') is None
+    assert backend._tags == {}
+
+
+def test_model_tags():
+    product = Product(id='p1', store_id='s1', title='Product')
+    assert model_tags(product) == {'products:p1', 'store:s1:products'}
+    assert model_tags(User(id='u1')) == {'users:u1', 'users'}
+
+
+def test_commit_evicts_changed_rows_tags(backend, session):
+    product = Product(id='p1', store_id='s1', title='Product')
+    session.add(product)
+    session.commit()
+    backend.set('listing', b'v', ['store:s1:products'], 60)
+    backend.set('other', b'v', ['store:s2:products'], 60)
+
+    product.title = 'Renamed'
+    session.flush()
+    # Flushed but uncommitted changes evict nothing yet
+    assert backend.get('listing') == b'v'
+    session.commit()
+    assert backend.get('listing') is None
+    assert backend.get('other') == b'v'
+
+
+def test_moving_a_row_evicts_both_stores(backend, session):
+    product = Product(id='p1', store_id='s1', title='Product')
+    session.add(product)
+    session.commit()
+    backend.set('s1', b'v', ['store:s1:products'], 60)
+    backend.set('s2', b'v', ['store:s2:products'], 60)
+
+    product.store_id = 's2'
+    session.commit()
+    assert backend.get('s1') is None
+    assert backend.get('s2') is None
+
+
+def test_rollback_discards_collected_tags(backend, session):
+    session.add(Product(id='p1', store_id='s1', title='Product'))
+    session.flush()
+    session.rollback()
+    backend.set('listing', b'v', ['store:s1:products'], 60)
+
+    session.add(User(id='u1', email='a@example.com', password_hash='x'))
+    session.commit()
+    assert backend.get('listing') == b'v'
+
+
+def test_rollup_refresh_evicts_refreshed_stores(backend, db, store_id):
+    from src.services.analytics_rollups import analytics_rollups
+
+    db.session.execute(
+        db.text("INSERT INTO public.analytics_data (store_id, metric_type, metric_name, value, date_recorded) "
+                "VALUES (:store_id, 'sales', 'revenue', 10, :day)"),
+        {'store_id': store_id, 'day': date(2025, 3, 1)}
+    )
+    db.session.commit()
+    backend.set('series', b'v', [f'store:{store_id}:analytics_data'], 60)
+    backend.set('other', b'v', ['store:other:analytics_data'], 60)
+
+    assert analytics_rollups.refresh() >= 1
+    assert backend.get('series') is None
+    assert backend.get('other') == b'v'
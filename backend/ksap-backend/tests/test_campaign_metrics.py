@@ -0,0 +1,65 @@
+import subprocess
+import sys
+import uuid
+from datetime import date, timedelta
+
+import pytest
+
+from src.services.campaign_metrics import MAX_WINDOW_DAYS, CampaignSeries, compute
+
+END = date(2025, 6, 30)
+
+
+def test_creating_the_app_does_not_load_numpy():
+    code = (
+        "import os, sys\n"
+        "os.environ.update(DATABASE_URL='sqlite://', STARTUP_CHECKS='off', TASK_WORKERS='0')\n"
+        "import src.main\n"
+        "print('numpy' in sys.modules)\n"
+    )
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip().splitlines()[-1] == 'False'
+
+
+def test_window_over_the_cap_is_a_bad_request(client):
+    start = END - timedelta(days=MAX_WINDOW_DAYS)
+    response = client.get(f'/api/v1/analytics/stores/{uuid.uuid4()}/campaigns/metrics'
+                          f'?start={start.isoformat()}&end={END.isoformat()}')
+    assert response.status_code == 400
+    assert response.get_json()['error']['code'] == 'BAD_REQUEST'
+    assert str(MAX_WINDOW_DAYS) in response.get_json()['error']['message']
+
+
+def test_spend_spike_and_pacing():
+    series = CampaignSeries(['a', 'b'], END - timedelta(days=29), 30, daily_budget=[True, True], budget=[10, 10])
+    series.values['spend'][:] = 10
+    series.values['spend'][0, -1] = 60
+    series.values['spend'][:, ::2] += 0.5
+    series.values['impressions'][:] = 1000
+    metrics = compute(series)
+    assert list(metrics.flagged('spend_spike')) == [0]
+    # 50 over budget on top of the rest pushes it past the pacing tolerance
+    assert list(metrics.flagged('overpacing')) == [0]
+    assert metrics.spend[1] == pytest.approx(307.5)
+    assert metrics.pacing[1] == pytest.approx(1.025)
+
+
+def test_load_reads_a_window_of_daily_stats(db, user_id, store_id):
+    campaign_id = db.session.execute(db.text(
+        "INSERT INTO public.ad_campaigns (user_id, store_id, name, status, budget_type, budget_amount) "
+        "VALUES (:user_id, :store_id, 'Test campaign', 'active', 'daily', 50) RETURNING id::text"
+    ), {'user_id': user_id, 'store_id': store_id}).scalar_one()
+    db.session.execute(db.text(
+        "INSERT INTO public.ad_campaign_daily_stats (campaign_id, stat_date, impressions, clicks, spend, revenue) "
+        "SELECT :id, d::date, 100, 5, 20, 50 FROM generate_series(CAST(:start AS date), :end, '2 days') d"
+    ), {'id': campaign_id, 'start': END - timedelta(days=9), 'end': END})
+    db.session.commit()
+    try:
+        series = CampaignSeries.load(store_id=store_id, start=END - timedelta(days=9), end=END)
+        assert series.campaign_ids == [campaign_id]
+        assert series.values['spend'][0].tolist() == [20, 0] * 5
+        record, = compute(series).records()
+        assert (record['spend'], record['roas'], record['ctr']) == (100, 2.5, 0.05)
+    finally:
+        db.session.execute(db.text("DELETE FROM public.ad_campaigns WHERE id = :id"), {'id': campaign_id})
+        db.session.commit()
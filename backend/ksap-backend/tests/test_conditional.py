@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+from flask import Flask, jsonify
+
+from src.models import Product, db
+from src.services.cache import MemoryBackend, response_cache
+from src.utils.conditional import collection_validators, conditional, resource_validators
+
+
+@pytest.fixture(scope='module')
+def validated_app(app, database_url):
+    """A bare app with collections and a resource behind @conditional, one of them also cached"""
+    validated = Flask(__name__)
+    validated.config['SQLALCHEMY_DATABASE_URI'] = app.config['SQLALCHEMY_DATABASE_URI']
+    db.init_app(validated)
+
+    @validated.route('/stores/<store_id>/products')
+    @conditional(lambda store_id: collection_validators(Product.updated_at, Product.store_id == store_id))
+    def products(store_id):
+        return jsonify([str(row.id) for row in db.session.scalars(db.select(Product).where(Product.store_id == store_id))])
+
+    @validated.route('/stores/<store_id>/products/titles')
+    @conditional(lambda store_id: collection_validators(Product.updated_at, Product.store_id == store_id))
+    @response_cache.cached(tags=lambda store_id: [f'store:{store_id}:products'])
+    def product_titles(store_id):
+        return jsonify(sorted(db.session.scalars(db.select(Product.title).where(Product.store_id == store_id))))
+
+    @validated.route('/products/<product_id>')
+    @conditional(lambda product_id: resource_validators(Product.updated_at, Product.id == product_id))
+    def product(product_id):
+        return jsonify({'id': product_id})
+
+    return validated
+
+
+@pytest.fixture
+def validated_client(validated_app):
+    return validated_app.test_client()
+
+
+@pytest.fixture
+def product_ids(db, store_id):
+    ids = [
+        db.session.execute(
+            db.text("INSERT INTO public.products (store_id, title, price) VALUES (:store_id, :title, 1) RETURNING id"),
+            {'store_id': store_id, 'title': f'Product {n}'}
+        ).scalar_one()
+        for n in range(3)
+    ]
+    db.session.commit()
+    return ids
+
+
+def test_unchanged_collection_answers_304(validated_client, db, store_id, product_ids):
+    etag = validated_client.get(f'/stores/{store_id}/products').headers['ETag']
+    response = validated_client.get(f'/stores/{store_id}/products', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+
+
+def test_deleting_a_row_changes_the_collection_etag(validated_client, db, store_id, product_ids):
+    etag = validated_client.get(f'/stores/{store_id}/products').headers['ETag']
+    # The oldest row goes, so max(updated_at) stays where it was
+    db.session.execute(db.text("DELETE FROM public.products WHERE id = :id"), {'id': product_ids[0]})
+    db.session.commit()
+
+    response = validated_client.get(f'/stores/{store_id}/products', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert len(response.get_json()) == 2
+    assert response.headers['ETag'] != etag
+
+
+def test_collections_ignore_if_modified_since(validated_client, db, store_id, product_ids):
+    response = validated_client.get(f'/stores/{store_id}/products')
+    assert 'Last-Modified' not in response.headers
+    tomorrow = format_datetime(datetime.now(timezone.utc) + timedelta(days=1), usegmt=True)
+    response = validated_client.get(f'/stores/{store_id}/products', headers={'If-Modified-Since': tomorrow})
+    assert response.status_code == 200
+
+
+def test_resource_answers_304_on_if_modified_since(validated_client, db, product_ids):
+    url = f'/products/{product_ids[0]}'
+    last_modified = validated_client.get(url).headers['Last-Modified']
+    assert validated_client.get(url, headers={'If-Modified-Since': last_modified}).status_code == 304
+
+
+def test_cached_body_follows_the_etag_after_raw_sql_writes(validated_client, db, store_id, product_ids, monkeypatch):
+    monkeypatch.setattr(response_cache, 'backend', MemoryBackend())
+    url = f'/stores/{store_id}/products/titles'
+    first = validated_client.get(url)
+    assert first.headers['X-Cache'] == 'MISS'
+    assert validated_client.get(url).headers['X-Cache'] == 'HIT'
+
+    # Bypasses the ORM, so nothing invalidates the cached entry
+    db.session.execute(db.text("UPDATE public.products SET title = 'Renamed' WHERE id = :id"), {'id': product_ids[0]})
+    db.session.commit()
+
+    second = validated_client.get(url)
+    assert second.headers['ETag'] != first.headers['ETag']
+    assert second.headers['X-Cache'] == 'MISS'
+    assert 'Renamed' in second.get_json()
+    third = validated_client.get(url)
+    assert third.headers['X-Cache'] == 'HIT'
+    assert third.get_json() == second.get_json()
@@ -0,0 +1,110 @@
+from decimal import Decimal
+
+import pytest
+
+from src.services.dashboard import store_dashboard
+
+RECOMPUTE = """
+    SELECT
+        (SELECT COALESCE(SUM(total_amount) FILTER (WHERE status IS DISTINCT FROM 'cancelled'), 0)
+         FROM public.orders WHERE store_id = :store_id),
+        (SELECT COUNT(*) FILTER (WHERE status IS DISTINCT FROM 'cancelled')
+         FROM public.orders WHERE store_id = :store_id),
+        (SELECT COUNT(*) FILTER (WHERE COALESCE(status NOT IN ('cancelled', 'fulfilled', 'shipped', 'delivered'), true)
+                                   AND fulfillment_status IS DISTINCT FROM 'fulfilled')
+         FROM public.orders WHERE store_id = :store_id),
+        (SELECT COUNT(*) FROM public.products WHERE store_id = :store_id),
+        (SELECT COUNT(*) FILTER (WHERE status = 'active') FROM public.products WHERE store_id = :store_id)
+"""
+
+
+def summary(db, store_id):
+    return tuple(db.session.execute(
+        db.text("SELECT revenue, order_count, pending_fulfillment_count, product_count, active_product_count "
+                "FROM public.store_dashboard_summaries WHERE store_id = :store_id"),
+        {'store_id': store_id}
+    ).one())
+
+
+def assert_matches_recompute(db, store_id):
+    db.session.commit()
+    expected = tuple(db.session.execute(db.text(RECOMPUTE), {'store_id': store_id}).one())
+    assert summary(db, store_id) == expected
+    return expected
+
+
+def execute(db, sql, **params):
+    db.session.execute(db.text(sql), params)
+
+
+@pytest.fixture
+def orders(db, store_id):
+    """Three orders inserted by one statement: pending, fulfilled and cancelled"""
+    execute(db, """
+        INSERT INTO public.orders (store_id, platform_order_id, total_amount, status, fulfillment_status)
+        VALUES (:store_id, 'o1', 10.50, 'pending', NULL),
+               (:store_id, 'o2', 20.00, 'fulfilled', 'fulfilled'),
+               (:store_id, 'o3', 99.99, 'cancelled', NULL)
+    """, store_id=store_id)
+    return store_id
+
+
+def test_new_store_starts_with_an_empty_card(db, store_id):
+    assert summary(db, store_id) == (Decimal('0'), 0, 0, 0, 0)
+
+
+def test_order_inserts_and_updates_add_their_deltas(db, orders):
+    assert assert_matches_recompute(db, orders) == (Decimal('30.50'), 2, 1, 0, 0)
+
+    execute(db, "UPDATE public.orders SET total_amount = total_amount + 1 WHERE store_id = :store_id",
+            store_id=orders)
+    assert assert_matches_recompute(db, orders)[0] == Decimal('32.50')
+
+    execute(db, "UPDATE public.orders SET fulfillment_status = 'fulfilled' "
+                "WHERE store_id = :store_id AND platform_order_id = 'o1'", store_id=orders)
+    assert assert_matches_recompute(db, orders)[2] == 0
+
+
+def test_status_changes_move_orders_in_and_out_of_the_counts(db, orders):
+    execute(db, "UPDATE public.orders SET status = 'cancelled' "
+                "WHERE store_id = :store_id AND platform_order_id = 'o1'", store_id=orders)
+    assert assert_matches_recompute(db, orders) == (Decimal('20.00'), 1, 0, 0, 0)
+
+    # Un-cancelling counts the order again, with a NULL status counting as open
+    execute(db, "UPDATE public.orders SET status = NULL "
+                "WHERE store_id = :store_id AND platform_order_id = 'o3'", store_id=orders)
+    assert assert_matches_recompute(db, orders) == (Decimal('119.99'), 2, 1, 0, 0)
+
+
+def test_deletes_subtract_their_rows(db, orders):
+    execute(db, "DELETE FROM public.orders WHERE store_id = :store_id AND platform_order_id IN ('o2', 'o3')",
+            store_id=orders)
+    assert assert_matches_recompute(db, orders) == (Decimal('10.50'), 1, 1, 0, 0)
+
+
+def test_product_changes(db, store_id):
+    execute(db, """
+        INSERT INTO public.products (store_id, platform_product_id, title, status)
+        VALUES (:store_id, 'p1', 'One', 'active'), (:store_id, 'p2', 'Two', 'draft'),
+               (:store_id, 'p3', 'Three', 'active')
+    """, store_id=store_id)
+    assert assert_matches_recompute(db, store_id)[3:] == (3, 2)
+
+    execute(db, "UPDATE public.products SET status = 'active' WHERE store_id = :store_id", store_id=store_id)
+    assert assert_matches_recompute(db, store_id)[3:] == (3, 3)
+
+    execute(db, "DELETE FROM public.products WHERE store_id = :store_id AND platform_product_id = 'p1'",
+            store_id=store_id)
+    assert assert_matches_recompute(db, store_id)[3:] == (2, 2)
+
+
+def test_reconcile_repairs_a_drifted_card(db, orders):
+    # As after a TRUNCATE or a disabled trigger: nothing applies the delta
+    execute(db, "UPDATE public.store_dashboard_summaries SET revenue = 0, order_count = 0 "
+                "WHERE store_id = :store_id", store_id=orders)
+    db.session.commit()
+
+    checked, repaired = store_dashboard.reconcile()
+    assert checked >= 1 and repaired >= 1
+    assert_matches_recompute(db, orders)
+    assert store_dashboard.reconcile()[1] == 0
@@ -0,0 +1,128 @@
+import uuid
+
+import psycopg2
+import pytest
+from psycopg2.extras import Json, execute_values
+
+from src.services.inventory import InventoryError, inventory
+from src.services.platform_sync import UPSERT_PRODUCTS, UPSERT_PRODUCTS_TEMPLATE
+
+
+@pytest.fixture
+def products(db, store_id):
+    """Two tracked products (10 and 3 in stock, synced from the platform as 'p0' and 'p1') and an untracked one"""
+    ids = [
+        db.session.execute(
+            db.text("INSERT INTO public.products (store_id, platform_product_id, title, inventory_quantity, "
+                    "track_inventory) VALUES (:store_id, :platform_id, :title, :stock, :tracked) RETURNING id::text"),
+            {'store_id': store_id, 'platform_id': f'p{n}', 'title': f'Product {n}', 'stock': stock, 'tracked': tracked}
+        ).scalar_one()
+        for n, (stock, tracked) in enumerate([(10, True), (3, True), (0, False)])
+    ]
+    db.session.commit()
+    return ids
+
+
+def stock(db, product_id):
+    return tuple(db.session.execute(
+        db.text("SELECT inventory_quantity, inventory_held FROM public.products WHERE id = :id"), {'id': product_id}
+    ).one())
+
+
+def items(*lines):
+    return [{'product_id': product_id, 'quantity': quantity} for product_id, quantity in lines]
+
+
+def test_reserve_takes_every_line(db, store_id, products):
+    hold = inventory.reserve(store_id, items((products[0], 2), (products[0], 1), (products[2], 5)))
+    assert hold['status'] == 'held'
+    assert sorted(hold['items'], key=lambda item: item['quantity']) == items((products[0], 3), (products[2], 5))
+    assert stock(db, products[0]) == (7, 3)
+    # Untracked products are held without touching stock
+    assert stock(db, products[2]) == (0, 0)
+
+
+def test_short_cart_takes_nothing(db, store_id, products):
+    with pytest.raises(InventoryError) as refused:
+        inventory.reserve(store_id, items((products[0], 2), (products[1], 4)))
+    assert refused.value.status == 409
+    assert refused.value.details == {'shortages': [{'product_id': products[1], 'requested': 4, 'available': 3}]}
+    assert stock(db, products[0]) == (10, 0)
+
+
+def test_reserve_rejects_bad_input(db, store_id, products):
+    for bad in ([], items((products[0], 0)), items(('not-a-uuid', 1))):
+        with pytest.raises(InventoryError) as rejected:
+            inventory.reserve(store_id, bad)
+        assert rejected.value.status == 400
+    with pytest.raises(InventoryError) as missing:
+        inventory.reserve(store_id, items((str(uuid.uuid4()), 1)))
+    assert missing.value.status == 404
+
+
+def test_retried_reservation_is_not_taken_twice(db, store_id, products):
+    reservation_id = str(uuid.uuid4())
+    first = inventory.reserve(store_id, items((products[1], 2)), reservation_id=reservation_id)
+    again = inventory.reserve(store_id, items((products[1], 2)), reservation_id=reservation_id)
+    assert again['reservation_id'] == first['reservation_id']
+    assert stock(db, products[1]) == (1, 2)
+
+
+def test_release_returns_stock_once(db, store_id, products):
+    hold = inventory.reserve(store_id, items((products[0], 4)))
+    assert inventory.release(hold['reservation_id']) is True
+    assert inventory.release(hold['reservation_id']) is False
+    assert stock(db, products[0]) == (10, 0)
+
+
+def test_commit_keeps_stock_taken(db, store_id, products):
+    hold = inventory.reserve(store_id, items((products[0], 4)))
+    order_id = str(uuid.uuid4())
+    assert inventory.commit(hold['reservation_id'], order_id)['status'] == 'committed'
+    assert stock(db, products[0]) == (6, 0)
+    # Idempotent for the same order; a committed hold can't be released or given to another order
+    assert inventory.commit(hold['reservation_id'], order_id)['order_id'] == order_id
+    assert inventory.release(hold['reservation_id']) is False
+    with pytest.raises(InventoryError) as conflict:
+        inventory.commit(hold['reservation_id'], str(uuid.uuid4()))
+    assert conflict.value.status == 409
+    assert stock(db, products[0]) == (6, 0)
+
+
+def test_expired_holds_are_returned(db, store_id, products):
+    hold = inventory.reserve(store_id, items((products[1], 3)))
+    db.session.execute(
+        db.text("UPDATE public.inventory_reservations SET expires_at = now() - interval '1 second' "
+                "WHERE reservation_id = :id"),
+        {'id': hold['reservation_id']}
+    )
+    db.session.commit()
+
+    # A checkout short of stock first releases expired holds on its products
+    assert inventory.reserve(store_id, items((products[1], 1)))['status'] == 'held'
+    assert stock(db, products[1]) == (2, 1)
+    assert inventory.get(hold['reservation_id'])['status'] == 'expired'
+
+
+def sync_stock(database_url, store_id, platform_id, platform_stock):
+    """Upsert one product the way a platform sync does, with the platform's stock count"""
+    row = [store_id, platform_id, 'Product', None, None, None, None, None, platform_stock, True, None,
+           Json([]), Json([]), None, None, 'active']
+    connection = psycopg2.connect(database_url)
+    try:
+        with connection.cursor() as cursor:
+            execute_values(cursor, UPSERT_PRODUCTS, [row], template=UPSERT_PRODUCTS_TEMPLATE, fetch=True)
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def test_sync_keeps_holds_out_of_stock(db, database_url, store_id, products):
+    hold = inventory.reserve(store_id, items((products[0], 4)))
+    # The platform sold 2 elsewhere; its count knows nothing of our hold
+    sync_stock(database_url, store_id, 'p0', 8)
+    db.session.expire_all()
+    assert stock(db, products[0]) == (4, 4)
+
+    inventory.release(hold['reservation_id'])
+    assert stock(db, products[0]) == (8, 0)
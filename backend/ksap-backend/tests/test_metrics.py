@@ -0,0 +1,28 @@
+import subprocess
+import sys
+
+import httpx
+
+from src.database.pool import PooledTransport
+from src.services.metrics import request_metrics
+
+
+def test_creating_the_app_does_not_load_the_supabase_stack():
+    # A fresh interpreter, so nothing imported by other tests counts
+    code = (
+        "import os, sys\n"
+        "os.environ.update(DATABASE_URL='sqlite://', STARTUP_CHECKS='off', TASK_WORKERS='0')\n"
+        "import src.main\n"
+        "print(sorted(m for m in ('httpx', 'src.database', 'src.database.pool', 'supabase') if m in sys.modules))\n"
+    )
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip().splitlines()[-1] == '[]'
+
+
+def test_pooled_requests_are_timed(app):
+    transport = PooledTransport(pool_size=1, transport=httpx.MockTransport(lambda request: httpx.Response(200)))
+    with httpx.Client(base_url='http://supabase.test', transport=transport) as client:
+        client.get('/rest/v1/products')
+    counts = [sample for sample in request_metrics.supabase_latency.samples()
+              if sample.startswith('ksap_supabase_request_duration_seconds_count') and 'table="products"' in sample]
+    assert counts and counts[0].endswith(' 1')
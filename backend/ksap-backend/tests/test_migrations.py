@@ -0,0 +1,122 @@
+import pytest
+
+from src.database import migrate
+from src.database.migrations import Migration, MigrationChecksumError, MigrationError, MigrationRunner
+from src.database.schema import MIGRATIONS
+
+
+class FakeExecutor:
+    """Records what the runner sends; `applied` is schema_migrations as {version: checksum}"""
+
+    supports_concurrent = True
+
+    def __init__(self, applied=None, fail_on=None):
+        self.applied = dict(applied or {})
+        self.fail_on = fail_on
+        self.calls = []
+
+    def ensure_migrations_table(self):
+        self.calls.append(('ensure',))
+
+    def applied_versions(self):
+        return dict(self.applied)
+
+    def run_transactional(self, migration, record_sql):
+        if migration.version == self.fail_on:
+            raise RuntimeError('lock timeout')
+        self.calls.append(('transactional', migration.version, record_sql))
+        self.applied[migration.version] = migration.checksum
+
+    def run_concurrent_statement(self, statement):
+        self.calls.append(('statement', statement))
+
+    def record(self, record_sql):
+        self.calls.append(('record', record_sql))
+        version = int(record_sql.split('VALUES (')[1].split(',')[0])
+        self.applied[version] = next(m.checksum for m in MIGRATIONS_UNDER_TEST if m.version == version)
+
+    def close(self):
+        self.calls.append(('close',))
+
+
+MIGRATIONS_UNDER_TEST = [
+    Migration(1, 'create_things', "CREATE TABLE things (id int);"),
+    Migration(2, 'index_things', "CREATE INDEX CONCURRENTLY IF NOT EXISTS a ON things(id);\n"
+                                 "CREATE INDEX CONCURRENTLY IF NOT EXISTS b ON things(id);", concurrent=True),
+    Migration(3, 'backfill_things', ["DO $$ BEGIN PERFORM 1; COMMIT; END $$", "ANALYZE things"], concurrent=True)
+]
+
+
+def kinds(executor):
+    return [call[0] for call in executor.calls]
+
+
+def test_applies_pending_migrations_in_order():
+    executor = FakeExecutor()
+    applied = MigrationRunner(executor, list(reversed(MIGRATIONS_UNDER_TEST))).migrate()
+    assert [migration.version for migration in applied] == [1, 2, 3]
+    # Each concurrent statement is sent on its own, then recorded
+    assert kinds(executor) == ['ensure', 'transactional', 'statement', 'statement', 'record',
+                               'statement', 'statement', 'record']
+    assert executor.calls[5] == ('statement', 'DO $$ BEGIN PERFORM 1; COMMIT; END $$')
+    assert set(executor.applied) == {1, 2, 3}
+
+
+def test_skips_applied_versions():
+    executor = FakeExecutor({1: MIGRATIONS_UNDER_TEST[0].checksum, 2: MIGRATIONS_UNDER_TEST[1].checksum})
+    applied = MigrationRunner(executor, MIGRATIONS_UNDER_TEST).migrate()
+    assert [migration.version for migration in applied] == [3]
+    assert 'transactional' not in kinds(executor)
+
+
+def test_edited_migration_raises_checksum_error():
+    executor = FakeExecutor({1: '0' * 64})
+    with pytest.raises(MigrationChecksumError):
+        MigrationRunner(executor, MIGRATIONS_UNDER_TEST).migrate()
+    assert kinds(executor) == ['ensure']
+    # Unless asked to run it again
+    applied = MigrationRunner(executor, MIGRATIONS_UNDER_TEST).migrate(reapply_changed=True)
+    assert [migration.version for migration in applied] == [1, 2, 3]
+
+
+def test_dry_run_applies_nothing():
+    executor = FakeExecutor()
+    assert len(MigrationRunner(executor, MIGRATIONS_UNDER_TEST).migrate(dry_run=True)) == 3
+    assert kinds(executor) == ['ensure']
+
+
+def test_failure_is_a_migration_error_and_stops_the_run():
+    executor = FakeExecutor(fail_on=1)
+    with pytest.raises(MigrationError, match='lock timeout'):
+        MigrationRunner(executor, MIGRATIONS_UNDER_TEST).migrate()
+    assert executor.applied == {}
+
+
+def test_duplicate_versions_are_rejected():
+    with pytest.raises(MigrationError, match='Duplicate'):
+        MigrationRunner(FakeExecutor(), MIGRATIONS_UNDER_TEST + [Migration(2, 'again', 'SELECT 1;')])
+
+
+def test_concurrent_script_with_dollar_quotes_is_rejected():
+    with pytest.raises(MigrationError, match='as a list'):
+        Migration(4, 'backfill', "DO $$ BEGIN PERFORM 1; END $$;", concurrent=True)
+    with pytest.raises(MigrationError):
+        Migration(4, 'backfill', "DO $body$ BEGIN PERFORM 1; END $body$;", concurrent=True)
+    # Fine in a transactional migration, which is sent as one script
+    assert Migration(4, 'backfill', "DO $$ BEGIN PERFORM 1; END $$;").statements
+
+
+def test_baseline_marks_without_running(monkeypatch):
+    executor = FakeExecutor({1: MIGRATIONS_UNDER_TEST[0].checksum})
+    monkeypatch.setattr(migrate, 'PsycopgExecutor', lambda url: executor)
+    monkeypatch.setattr(migrate, 'MIGRATIONS', MIGRATIONS_UNDER_TEST)
+    assert migrate.main(['--database-url', 'postgresql://test', '--baseline', '2']) == 0
+    assert kinds(executor) == ['ensure', 'record', 'close']
+    assert set(executor.applied) == {1, 2}
+    # Then only what's after the baseline runs
+    assert [m.version for m in MigrationRunner(executor, MIGRATIONS_UNDER_TEST).migrate()] == [3]
+
+
+def test_schema_migrations_are_valid():
+    runner = MigrationRunner(FakeExecutor(), MIGRATIONS)
+    assert [migration.version for migration in runner.migrations] == list(range(1, len(MIGRATIONS) + 1))
@@ -0,0 +1,66 @@
+import logging
+
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine, text
+
+from src.services.n_plus_one import NPlusOneDetector, NPlusOneError, n_plus_one_detector, statement_shape
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine('sqlite://')
+    yield engine
+    engine.dispose()
+
+
+def test_statement_shape_ignores_values_and_in_list_lengths():
+    assert statement_shape("SELECT * FROM stores WHERE id = 'a' AND n = 3") == \
+        statement_shape("SELECT * FROM stores WHERE id = 'b' AND n = 41")
+    assert statement_shape("SELECT * FROM products WHERE id IN (?, ?)") == \
+        statement_shape("SELECT * FROM products WHERE id IN (?, ?, ?, ?)")
+
+
+def test_tests_fail_on_a_query_per_row_loop(n_plus_one, engine):
+    with engine.connect() as connection:
+        with pytest.raises(NPlusOneError, match=r'executed 6 times \(threshold 5\)'):
+            for store_id in range(10):
+                connection.execute(text("SELECT :store_id"), {'store_id': store_id})
+    assert n_plus_one.violations()
+    # Expected here; without this the fixture fails the test on teardown
+    n_plus_one.counts.clear()
+
+
+def test_batched_query_passes(engine):
+    with engine.connect() as connection:
+        rows = connection.execute(text("SELECT value FROM json_each('[1, 2, 3, 4, 5, 6, 7, 8]')")).all()
+    assert len(rows) == 8
+
+
+def test_watch_reports_location_in_log_mode(engine):
+    with n_plus_one_detector.watch(threshold=2, mode='log') as scope:
+        with engine.connect() as connection:
+            for i in range(3):
+                connection.execute(text("SELECT :i"), {'i': i})
+    (count, location), = scope.violations().values()
+    assert count == 3
+    assert 'test_n_plus_one.py' in location or location == 'unknown location'
+
+
+@pytest.mark.allow_n_plus_one
+def test_dev_server_mode_logs_a_report_per_request(engine, caplog):
+    app = Flask(__name__)
+    app.config.update(NPLUSONE_MODE='log', NPLUSONE_THRESHOLD=3)
+    detector = NPlusOneDetector()
+    detector.init_app(app)
+
+    @app.route('/stores')
+    def stores():
+        with engine.connect() as connection:
+            return {'stores': [connection.execute(text("SELECT :i"), {'i': i}).scalar() for i in range(5)]}
+
+    with caplog.at_level(logging.WARNING, logger='src.services.n_plus_one'):
+        response = app.test_client().get('/stores')
+    assert response.status_code == 200
+    assert 'N+1 queries in GET /stores (threshold 3)' in caplog.text
+    assert '5x at' in caplog.text
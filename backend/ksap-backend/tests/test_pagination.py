@@ -0,0 +1,59 @@
+import base64
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from src.utils.pagination import decode_cursor, encode_cursor, parse_limit
+
+
+def raw_cursor(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2025, 3, 1, 12, 30, tzinfo=timezone.utc)
+    cursor = encode_cursor(created_at, 'b2c1', 0.75)
+    assert decode_cursor(cursor, datetime, str, float) == (created_at, 'b2c1', 0.75)
+
+
+@pytest.mark.parametrize('cursor', [
+    'not base64!',
+    raw_cursor({'created_at': 1}),
+    raw_cursor(['2025-03-01T12:30:00']),
+    # Well-formed, but the components have the wrong types
+    raw_cursor([1, 2]),
+    raw_cursor([[1], 'id']),
+    raw_cursor(['yesterday', 'id']),
+])
+def test_malformed_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError, match='Invalid cursor'):
+        decode_cursor(cursor, datetime, str)
+
+
+def test_float_component_rejects_non_numbers():
+    with pytest.raises(ValueError, match='Invalid cursor'):
+        decode_cursor(raw_cursor([{'score': 1}, 'id']), float, str)
+
+
+def test_parse_limit_clamps():
+    assert parse_limit(None) == 50
+    assert parse_limit('0') == 1
+    assert parse_limit('10000') == 200
+    with pytest.raises(ValueError):
+        parse_limit('ten')
+
+
+@pytest.fixture
+def users_table(app):
+    """The users table the route's validators read; created in the default in-memory SQLite database"""
+    from src.models import User, db
+
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            User.__table__.create(db.engine, checkfirst=True)
+
+
+def test_users_rejects_cursor_with_wrong_types(client, users_table):
+    response = client.get('/api/v1/users/users', query_string={'cursor': raw_cursor([1, 2])})
+    assert response.status_code == 400
@@ -0,0 +1,126 @@
+import threading
+from datetime import date
+
+import pytest
+
+from src.database.partitioning import PartitionManager, PartitionSpec
+
+TABLE = 'test_partition_events'
+SPEC = PartitionSpec(TABLE, key='created_at', key_fill='COALESCE(r.created_at, CURRENT_TIMESTAMP)')
+
+
+def connect(database_url):
+    import psycopg2
+
+    connection = psycopg2.connect(database_url)
+    connection.autocommit = True
+    return connection
+
+
+def execute(connection, sql, params=None):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall() if cursor.description else None
+
+
+@pytest.fixture
+def manager(database_url):
+    """A PartitionManager and a 500-row table over three months to convert; dropped afterwards"""
+    connection = connect(database_url)
+    drop = (f"DROP TABLE IF EXISTS public.{TABLE}, public.{SPEC.shadow}, public.{SPEC.legacy} CASCADE; "
+            f"DROP FUNCTION IF EXISTS public.{TABLE}_mirror_to_partitioned()")
+    execute(connection, drop)
+    execute(connection, f"""
+        CREATE TABLE public.{TABLE} (
+            id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+            created_at TIMESTAMP WITH TIME ZONE,
+            note TEXT NOT NULL
+        );
+        CREATE INDEX idx_{TABLE}_note ON public.{TABLE}(note);
+        INSERT INTO public.{TABLE} (created_at, note)
+        SELECT CASE WHEN i % 50 = 0 THEN NULL ELSE now() - (i % 90) * interval '1 day' END, 'note ' || i
+        FROM generate_series(1, 500) i;
+    """)
+    yield PartitionManager(connection)
+    execute(connection, drop)
+    connection.close()
+
+
+def prepare(manager):
+    columns = manager._columns(TABLE)
+    manager._create_shadow(SPEC)
+    manager.ensure_partitions(SPEC, from_month=date.today().replace(day=1).replace(year=date.today().year - 1),
+                              table=SPEC.shadow)
+    execute(manager.connection, f"CREATE TABLE public.{TABLE}_default PARTITION OF public.{SPEC.shadow} DEFAULT")
+    manager._install_mirror(SPEC, columns)
+    return columns
+
+
+def rows(connection, table):
+    return dict(execute(connection, f"SELECT id::text, note FROM public.{table}"))
+
+
+@pytest.mark.allow_n_plus_one
+def test_convert_copies_every_row_and_keeps_writes(manager):
+    copied = manager.convert(SPEC, batch_size=120)
+    assert copied == 500
+    connection = manager.connection
+    assert manager.is_partitioned(TABLE)
+    assert rows(connection, TABLE) == rows(connection, SPEC.legacy)
+    assert not execute(connection, f"SELECT 1 FROM public.{TABLE} WHERE created_at IS NULL")
+    execute(connection, f"INSERT INTO public.{TABLE} (created_at, note) VALUES (now(), 'after')")
+    assert execute(connection, f"SELECT count(*) FROM public.{TABLE}")[0][0] == 501
+
+
+@pytest.mark.allow_n_plus_one
+def test_writes_racing_an_uncommitted_batch_are_not_lost(manager, database_url):
+    columns = prepare(manager)
+    updated, deleted = [str(row[0]) for row in execute(
+        manager.connection, f"SELECT id FROM public.{TABLE} ORDER BY id LIMIT 2")]
+
+    # The batch copied but not yet committed
+    manager.connection.autocommit = False
+    manager._backfill(SPEC, columns, 1000)
+
+    writer = connect(database_url)
+    done = threading.Event()
+
+    def write():
+        execute(writer, f"UPDATE public.{TABLE} SET note = 'changed' WHERE id = %s", (updated,))
+        execute(writer, f"DELETE FROM public.{TABLE} WHERE id = %s", (deleted,))
+        done.set()
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    # The writes wait for the batch's row locks
+    assert not done.wait(0.3)
+    manager.connection.commit()
+    manager.connection.autocommit = True
+    thread.join(5)
+    writer.close()
+
+    copy = rows(manager.connection, SPEC.shadow)
+    assert copy[updated] == 'changed'
+    assert deleted not in copy
+    assert copy == rows(manager.connection, TABLE)
+
+
+@pytest.mark.allow_n_plus_one
+def test_verify_recopies_differing_ranges(manager):
+    columns = prepare(manager)
+    manager._backfill(SPEC, columns, 1000)
+    connection = manager.connection
+    # Drift the mirror could not have caught: a lost update, a resurrected and a missing row
+    execute(connection, f"ALTER TABLE public.{TABLE} DISABLE TRIGGER trigger_{TABLE}_mirror_to_partitioned")
+    first, second, third = [str(row[0]) for row in execute(
+        connection, f"SELECT id FROM public.{TABLE} ORDER BY id OFFSET 100 LIMIT 3")]
+    execute(connection, f"UPDATE public.{TABLE} SET note = 'stale' WHERE id = %s", (first,))
+    execute(connection, f"DELETE FROM public.{TABLE} WHERE id = %s", (second,))
+    execute(connection, f"DELETE FROM public.{SPEC.shadow} WHERE id = %s", (third,))
+    execute(connection, f"ALTER TABLE public.{TABLE} ENABLE TRIGGER trigger_{TABLE}_mirror_to_partitioned")
+
+    ranges = manager._ranges(SPEC, 100)
+    assert len(manager._differing_ranges(SPEC, columns, ranges)) == 1
+    manager._verify(SPEC, columns, 100)
+    assert manager._differing_ranges(SPEC, columns, ranges) == []
+    assert rows(connection, SPEC.shadow) == rows(connection, TABLE)
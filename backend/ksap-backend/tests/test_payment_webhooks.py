@@ -0,0 +1,231 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+import uuid
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from benchmarks.payment_webhooks import SECRET, sign, stripe_event
+from src.services import payment_webhooks as webhooks
+from src.services.payment_webhooks import (
+    PaymentWebhookIngestor, WebhookError, generic_transaction, square_transaction, stripe_transaction,
+    verify_hmac, verify_square, verify_stripe
+)
+
+URL = 'https://api.example.com/api/v1/webhooks/payments/p1'
+
+
+def stripe_headers(body, timestamp):
+    signature = hmac.new(SECRET.encode(), str(timestamp).encode() + b'.' + body, hashlib.sha256).hexdigest()
+    return {'Stripe-Signature': f't={timestamp},v1={signature}'}
+
+
+def test_stripe_signature():
+    body = json.dumps(stripe_event('pi_1', 'payment_intent.succeeded', 1000)).encode()
+    verify_stripe(SECRET, body, sign(body), URL)
+
+    with pytest.raises(WebhookError, match='does not match') as rejected:
+        verify_stripe(SECRET, body + b' ', sign(body), URL)
+    assert rejected.value.status == 401
+    with pytest.raises(WebhookError, match='does not match'):
+        verify_stripe('whsec_other', body, sign(body), URL)
+    with pytest.raises(WebhookError, match='Missing or malformed'):
+        verify_stripe(SECRET, body, {'Stripe-Signature': 't=soon,v1=abc'}, URL)
+    with pytest.raises(WebhookError, match='Missing or malformed'):
+        verify_stripe(SECRET, body, {}, URL)
+
+
+@pytest.mark.parametrize('age, accepted', [
+    (webhooks.STRIPE_TOLERANCE - 5, True),
+    (webhooks.STRIPE_TOLERANCE + 5, False),
+    # Clock skew the other way
+    (-webhooks.STRIPE_TOLERANCE - 5, False),
+])
+def test_stripe_timestamp_tolerance(age, accepted):
+    body = b'{"id": "evt_1"}'
+    headers = stripe_headers(body, int(time.time()) - age)
+    if accepted:
+        verify_stripe(SECRET, body, headers, URL)
+    else:
+        with pytest.raises(WebhookError, match='outside the tolerance'):
+            verify_stripe(SECRET, body, headers, URL)
+
+
+def test_stripe_accepts_any_matching_v1_signature():
+    body = b'{"id": "evt_1"}'
+    timestamp = int(time.time())
+    valid = stripe_headers(body, timestamp)['Stripe-Signature']
+    # Stripe sends one v1 per active secret while a secret is being rolled
+    verify_stripe(SECRET, body, {'Stripe-Signature': f'{valid},v1={"0" * 64}'}, URL)
+
+
+def test_square_signature_covers_the_notification_url():
+    body = b'{"event_id": "sq_1"}'
+    signature = base64.b64encode(hmac.new(SECRET.encode(), URL.encode() + body, hashlib.sha256).digest()).decode()
+    verify_square(SECRET, body, {'X-Square-Hmacsha256-Signature': signature}, URL)
+    with pytest.raises(WebhookError):
+        verify_square(SECRET, body, {'X-Square-Hmacsha256-Signature': signature}, URL + '/other')
+
+
+def test_hmac_signature():
+    body = b'{"id": "evt_1"}'
+    signature = hmac.new(SECRET.encode(), body, hashlib.sha256).hexdigest()
+    verify_hmac(SECRET, body, {'X-Webhook-Signature': f'sha256={signature}'}, URL)
+    verify_hmac(SECRET, body, {'X-Webhook-Signature': signature}, URL)
+    with pytest.raises(WebhookError):
+        verify_hmac(SECRET, body, {}, URL)
+
+
+def test_stripe_transaction():
+    order_id = str(uuid.uuid4())
+    event = stripe_event('pi_1', 'payment_intent.succeeded', 1999)
+    event['data']['object']['metadata'] = {'order_id': order_id}
+    assert stripe_transaction(event) == {
+        'platform_transaction_id': 'pi_1', 'type': 'payment', 'amount': Decimal('19.99'),
+        'currency': 'USD', 'status': 'completed', 'order_id': order_id
+    }
+
+    event = stripe_event('pi_2', 'payment_intent.created', 500)
+    event['data']['object'].update(currency='jpy', metadata={'order_id': 'not-a-uuid'})
+    change = stripe_transaction(event)
+    # Zero-decimal currencies are not in cents; foreign order references are dropped
+    assert (change['amount'], change['status'], change['order_id']) == (Decimal(500), 'pending', None)
+
+    refund = {'type': 'refund.updated', 'data': {'object': {'id': 're_1', 'amount': 250, 'status': 'succeeded'}}}
+    assert stripe_transaction(refund)['type'] == 'refund'
+    assert stripe_transaction({'type': 'customer.created', 'data': {'object': {}}}) is None
+
+
+def test_square_and_generic_transactions():
+    event = {'data': {'object': {'refund': {'id': 'r1', 'status': 'COMPLETED',
+                                            'amount_money': {'amount': 1050, 'currency': 'EUR'}}}}}
+    assert square_transaction(event) == {
+        'platform_transaction_id': 'r1', 'type': 'refund', 'amount': Decimal('10.5'),
+        'currency': 'EUR', 'status': 'completed', 'order_id': None
+    }
+    assert square_transaction({'data': {'object': {}}}) is None
+
+    change = generic_transaction({'data': {'transaction_id': 42, 'amount': '12.30', 'currency': 'gbp'}})
+    assert change['platform_transaction_id'] == '42'
+    assert (change['amount'], change['currency'], change['status']) == (Decimal('12.30'), 'GBP', 'pending')
+    assert generic_transaction({'data': {'transaction_id': 42}}) is None
+
+
+@pytest.fixture
+def ingestor(monkeypatch):
+    """An ingestor with a cached Stripe processor 'p1' and no consumer thread"""
+    ingestor = PaymentWebhookIngestor(queue_size=2)
+    ingestor._processors['p1'] = {
+        'provider': 'stripe', 'secret': SECRET, 'webhook_url': None, 'active': True,
+        'expires': time.monotonic() + 60
+    }
+    monkeypatch.setattr(ingestor, 'ensure_started', lambda: None)
+    return ingestor
+
+
+def delivery(event_id=None):
+    event = stripe_event('pi_1', 'payment_intent.succeeded', 1000)
+    if event_id:
+        event['id'] = event_id
+    body = json.dumps(event).encode()
+    return body, sign(body)
+
+
+def test_receive_drops_events_queued_recently(ingestor):
+    body, headers = delivery('evt_1')
+    assert ingestor.receive('p1', body, headers, URL) is False
+    assert ingestor.receive('p1', body, headers, URL) is True
+    assert ingestor._queue.qsize() == 1
+
+
+def test_full_queue_answers_503_and_accepts_the_retry(ingestor):
+    for event_id in ('evt_1', 'evt_2'):
+        ingestor.receive('p1', *delivery(event_id), URL)
+
+    body, headers = delivery('evt_3')
+    with pytest.raises(WebhookError) as rejected:
+        ingestor.receive('p1', body, headers, URL)
+    assert (rejected.value.code, rejected.value.status) == ('QUEUE_FULL', 503)
+
+    # A throttled event is not remembered as seen, so the provider's retry is queued
+    ingestor._queue.get_nowait()
+    assert ingestor.receive('p1', body, headers, URL) is False
+
+
+def test_receive_rejects_bad_deliveries(ingestor):
+    body, headers = delivery()
+    with pytest.raises(WebhookError) as rejected:
+        ingestor.receive('p1', body, {'Stripe-Signature': 't=1,v1=00'}, URL)
+    assert rejected.value.status == 401
+
+    no_id = json.dumps({'type': 'payment_intent.created'}).encode()
+    with pytest.raises(WebhookError, match='no ID'):
+        ingestor.receive('p1', no_id, sign(no_id), URL)
+    assert ingestor._queue.empty()
+
+
+@pytest.fixture
+def processor_id(db, user_id):
+    processor_id = db.session.execute(
+        db.text("INSERT INTO public.payment_processors (user_id, name, provider, api_credentials) "
+                "VALUES (:user_id, 'Test', 'custom', :credentials) RETURNING id::text"),
+        {'user_id': user_id, 'credentials': json.dumps({'webhook_secret': SECRET})}
+    ).scalar_one()
+    db.session.commit()
+    return processor_id
+
+
+def queued(processor_id, event_id, transaction_id, amount, status='pending'):
+    payload = {'id': event_id, 'type': 'payment', 'data': {
+        'transaction_id': transaction_id, 'amount': amount, 'status': status
+    }}
+    return {
+        'processor_id': processor_id, 'provider': 'custom', 'event_id': event_id, 'event_type': 'payment',
+        'payload': payload, 'received_at': datetime.utcnow(), 'received': time.monotonic()
+    }
+
+
+def transactions(db, processor_id):
+    return db.session.execute(
+        db.text("SELECT platform_transaction_id, amount, status FROM public.transactions "
+                "WHERE payment_processor_id = :id ORDER BY platform_transaction_id"),
+        {'id': processor_id}
+    ).all()
+
+
+def test_process_batch_is_idempotent(db, processor_id):
+    ingestor = PaymentWebhookIngestor()
+    completed = queued(processor_id, 'evt_2', 'tx_1', '10.00', 'completed')
+    batch = [queued(processor_id, 'evt_1', 'tx_1', '10.00'), completed, dict(completed)]
+
+    assert len(ingestor.process_batch(batch)) == 2
+    assert transactions(db, processor_id) == [('tx_1', Decimal('10.00'), 'completed')]
+
+    # Redelivered after the commit, e.g. by another worker: nothing is applied twice
+    assert ingestor.process_batch([dict(event) for event in batch]) == []
+    # A late 'pending' never undoes a final status
+    assert len(ingestor.process_batch([queued(processor_id, 'evt_3', 'tx_1', '10.00')])) == 1
+    assert transactions(db, processor_id) == [('tx_1', Decimal('10.00'), 'completed')]
+
+
+def test_process_batch_falls_back_to_one_by_one(db, processor_id):
+    ingestor = PaymentWebhookIngestor()
+    # Too large for DECIMAL(10,2): fails the batch's commit
+    batch = [queued(processor_id, 'evt_1', 'tx_1', '5.00'), queued(processor_id, 'evt_2', 'tx_2', '1e12')]
+
+    applied = ingestor.process_batch(batch)
+    assert [event['event_id'] for event in applied] == ['evt_1']
+    assert transactions(db, processor_id) == [('tx_1', Decimal('5.00'), 'pending')]
+    inbox = dict(db.session.execute(
+        db.text("SELECT event_id, error FROM public.payment_webhook_events WHERE payment_processor_id = :id"),
+        {'id': processor_id}
+    ).all())
+    assert inbox['evt_1'] is None
+    assert 'numeric field overflow' in inbox['evt_2']
+
+    # The failed event is recorded, so a retry of it is a duplicate
+    assert ingestor.process_batch([queued(processor_id, 'evt_2', 'tx_2', '1e12')]) == []
@@ -0,0 +1,167 @@
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from benchmarks.platform_sync import MockPlatformAPI, MockStore
+from src.services.platform_sync import RateLimiter, ShopifyClient, SyncCancelled, SyncEngine, WooCommerceClient
+
+PRODUCTS, ORDERS = 300, 120
+
+
+@pytest.fixture
+def platform_api():
+    """The benchmark's mock Shopify (store 0) and WooCommerce (store 1) APIs"""
+    started = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(hours=1)
+    api = MockPlatformAPI([MockStore('shopify', PRODUCTS, ORDERS, started),
+                           MockStore('woocommerce', PRODUCTS, ORDERS, started)])
+    thread = threading.Thread(target=api.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+    thread.start()
+    api.base = f'http://127.0.0.1:{api.server_address[1]}'
+    yield api
+    api.shutdown()
+    api.server_close()
+
+
+@pytest.fixture
+def engine(database_url):
+    engine = SyncEngine(database_url, workers=2)
+    yield engine
+    engine.close()
+
+
+@pytest.fixture
+def store_ids(db, user_id, platform_api):
+    ids = []
+    for index, store in enumerate(platform_api.stores):
+        ids.append(db.session.execute(
+            db.text("INSERT INTO public.stores (user_id, name, platform, domain, api_credentials) "
+                    "VALUES (:user_id, :name, :platform, :domain, :credentials) RETURNING id::text"),
+            {'user_id': user_id, 'name': f'Mock {store.platform}', 'platform': store.platform,
+             'domain': f'{platform_api.base}/s/{index}',
+             'credentials': json.dumps({'access_token': 'mock', 'consumer_key': 'ck', 'consumer_secret': 'cs'})}
+        ).scalar_one())
+    db.session.commit()
+    return ids
+
+
+def counts(db, store_id):
+    return db.session.execute(db.text(
+        "SELECT (SELECT count(*) FROM public.products WHERE store_id = :id), "
+        "(SELECT count(*) FROM public.orders WHERE store_id = :id), "
+        "(SELECT count(*) FROM public.order_items WHERE store_id = :id)"
+    ), {'id': store_id}).one()
+
+
+def test_initial_sync_pulls_everything(engine, store_ids, db):
+    results = engine.run_once(store_ids)
+    assert [result['errors'] for result in results] == [{}, {}]
+    for result in results:
+        assert result['products']['inserted'] == PRODUCTS
+        assert result['orders']['inserted'] == ORDERS
+    for store_id in store_ids:
+        assert tuple(counts(db, store_id)) == (PRODUCTS, ORDERS, ORDERS)
+    cursors = db.session.execute(db.text(
+        "SELECT count(*) FROM public.store_sync_state "
+        "WHERE store_id = ANY(CAST(:ids AS uuid[])) AND updated_since IS NOT NULL AND last_error IS NULL"
+    ), {'ids': store_ids}).scalar_one()
+    assert cursors == 4
+
+
+def test_incremental_sync_fetches_and_writes_only_what_changed(engine, platform_api, store_ids, db):
+    engine.run_once(store_ids)
+    for store in platform_api.stores:
+        store.mutate(0.05, datetime.now(timezone.utc))
+    served = platform_api.requests - platform_api.throttled
+
+    results = engine.run_once(store_ids)
+    changed = {'products': int(PRODUCTS * 0.05), 'orders': int(ORDERS * 0.05)}
+    for result in results:
+        assert not result['errors']
+        for resource, count in changed.items():
+            stats = result[resource]
+            # Changed and touched records come back (plus any at the inclusive
+            # cursor); only the changed are written
+            assert stats['fetched'] >= 2 * count
+            assert (stats['inserted'], stats['updated']) == (0, count)
+            assert stats['unchanged'] == stats['fetched'] - count
+    # One page per resource and store (the 429s of a drained bucket aside)
+    assert platform_api.requests - platform_api.throttled - served == 4
+
+
+def test_unchanged_rows_keep_updated_at(engine, platform_api, store_ids, db):
+    engine.run_once(store_ids)
+    before = db.session.execute(db.text("SELECT max(updated_at) FROM public.products WHERE store_id = :id"),
+                                {'id': store_ids[0]}).scalar_one()
+    db.session.commit()
+    db.session.execute(db.text("DELETE FROM public.store_sync_state WHERE store_id = :id"), {'id': store_ids[0]})
+    db.session.commit()
+
+    result, = engine.run_once(store_ids[:1])
+    assert result['products']['unchanged'] == PRODUCTS
+    after = db.session.execute(db.text("SELECT max(updated_at) FROM public.products WHERE store_id = :id"),
+                               {'id': store_ids[0]}).scalar_one()
+    assert after == before
+
+
+def test_throttled_requests_are_retried(engine, platform_api, store_ids):
+    # WooCommerce reports no call limit, so a bucket smaller than the
+    # client's burst answers 429s the client has to wait out
+    platform_api.stores[1].capacity = 1
+    result, = engine.run_once(store_ids[1:])
+    assert not result['errors']
+    assert result['products']['inserted'] == PRODUCTS
+    assert platform_api.throttled > 0
+
+
+def test_store_without_domain_records_the_error(engine, db, user_id):
+    store_id = db.session.execute(db.text(
+        "INSERT INTO public.stores (user_id, name, platform) VALUES (:user_id, 'No domain', 'woocommerce') "
+        "RETURNING id::text"
+    ), {'user_id': user_id}).scalar_one()
+    db.session.commit()
+
+    result, = engine.run_once([store_id])
+    assert 'has no domain' in result['errors']['store']
+    errors = db.session.execute(db.text(
+        "SELECT resource, last_error FROM public.store_sync_state WHERE store_id = :id ORDER BY resource"
+    ), {'id': store_id}).all()
+    assert [resource for resource, _ in errors] == ['orders', 'products']
+    assert all('has no domain' in error for _, error in errors)
+    # Attempted just now, so not due again within the interval
+    assert store_id not in {store['id'] for store in engine.due_stores()}
+
+
+def test_rate_limiter_spaces_requests_past_the_burst():
+    limiter = RateLimiter(rate=50, burst=2)
+    started = time.perf_counter()
+    for _ in range(6):
+        limiter.acquire()
+    # Two free, then four at 50/s
+    assert time.perf_counter() - started >= 0.07
+
+
+def test_clients_map_records_to_rows():
+    started = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    for platform, client_class in (('shopify', ShopifyClient), ('woocommerce', WooCommerceClient)):
+        mock = MockStore(platform, 1, 1, started)
+        client = client_class({'id': 's', 'platform': platform, 'domain': 'http://shop.test'})
+        row = client.product_row(mock.records['products'][0])
+        assert row[0] == '1' and row[1] == 'Product 1' and row[5] == 'SKU-1'
+        order = client.order(mock.records['orders'][0])
+        assert order['platform_order_id'] == '1'
+        assert [item['sku'] for item in order['items']] == ['SKU-1']
+        assert client.updated_at(mock.records['orders'][0]) == started - timedelta(minutes=1)
+
+
+def test_stop_event_cancels_between_pages(engine, store_ids, db):
+    stop = threading.Event()
+    stop.set()
+    with pytest.raises(SyncCancelled):
+        engine.run_once(store_ids[:1], stop=stop)
+    assert tuple(counts(db, store_ids[0])) == (0, 0, 0)
+    cursors = db.session.execute(db.text("SELECT count(*) FROM public.store_sync_state WHERE store_id = :id"),
+                                 {'id': store_ids[0]}).scalar_one()
+    assert cursors == 0
@@ -0,0 +1,117 @@
+import asyncio
+import threading
+import time
+
+import psycopg2
+import pytest
+
+from benchmarks.proxy_checker import PASSWORD, USERNAME, StandIns, make_proxies
+from src.services.proxy_checker import ProxyHealthChecker, Target
+
+
+@pytest.fixture(scope='module')
+def stand_ins():
+    """The benchmark's local target, proxies and blackhole, served from a background event loop"""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    servers = StandIns(delay=0)
+    asyncio.run_coroutine_threadsafe(servers.start(), loop).result(timeout=5)
+    servers.target_url = f'http://127.0.0.1:{servers.target}/generate_204'
+    yield servers
+    asyncio.run_coroutine_threadsafe(servers.close(), loop).result(timeout=5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=5)
+
+
+def checker(stand_ins, **options):
+    options.setdefault('timeout', 0.5)
+    return ProxyHealthChecker(http_url=stand_ins.target_url, https_url=stand_ins.target_url, **options)
+
+
+def test_every_protocol_gets_the_expected_result(stand_ins):
+    proxies = make_proxies(stand_ins, 9)
+    results = {}
+
+    async def collect(batch):
+        results.update((result.proxy_id, result) for result in batch)
+
+    stats = asyncio.run(checker(stand_ins).check([proxy for proxy, _ in proxies], on_results=collect))
+    assert {proxy['id']: results[proxy['id']].result for proxy, _ in proxies} == \
+        {proxy['id']: expected for proxy, expected in proxies}
+    assert stats.to_dict()['checked'] == 9
+    assert all(results[proxy['id']].latency_ms is not None for proxy, expected in proxies if expected == 'success')
+
+
+def test_wrong_credentials_are_reported(stand_ins):
+    proxy = {'id': 'p', 'host': '127.0.0.1', 'port': stand_ins.http_proxy_auth, 'protocol': 'http',
+             'username': USERNAME, 'password': 'wrong'}
+    result = asyncio.run(checker(stand_ins).probe(proxy))
+    assert (result.result, result.error) == ('failed', 'proxy authentication required')
+
+
+def test_unsupported_protocol_fails_without_connecting(stand_ins):
+    result = asyncio.run(checker(stand_ins).probe({'id': 'p', 'host': '127.0.0.1', 'port': 1, 'protocol': 'ftp'}))
+    assert result.result == 'failed' and 'ftp' in result.error
+
+
+def test_timeouts_overlap_up_to_the_concurrency(stand_ins):
+    blackholes = [{'id': str(i), 'host': '127.0.0.1', 'port': stand_ins.blackhole, 'protocol': 'http'}
+                  for i in range(8)]
+    started = time.perf_counter()
+    stats = asyncio.run(checker(stand_ins, timeout=0.3, concurrency=8).check(blackholes))
+    assert stats.results['timeout'] == 8
+    # One after another these would take 2.4s
+    assert time.perf_counter() - started < 1.2
+
+
+def test_results_are_handed_over_in_write_batches(stand_ins):
+    proxies = [{'id': str(i), 'host': '127.0.0.1', 'port': stand_ins.http_proxy, 'protocol': 'http'}
+               for i in range(7)]
+    batches = []
+
+    async def collect(batch):
+        batches.append(len(batch))
+
+    asyncio.run(checker(stand_ins, write_batch=3).check(proxies, on_results=collect))
+    assert batches == [3, 3, 1]
+
+
+def test_target_parsing():
+    target = Target('https://example.com:8443/generate_204?x=1')
+    assert (target.tls, target.host, target.port, target.path, target.host_header) == \
+        (True, 'example.com', 8443, '/generate_204?x=1', 'example.com:8443')
+    with pytest.raises(ValueError):
+        Target('ftp://example.com/')
+
+
+def test_run_once_records_results_of_due_proxies(stand_ins, database_url, db, user_id):
+    ports = {'success': stand_ins.socks5_auth, 'failed': stand_ins.closed}
+    ids = {}
+    for expected, port in ports.items():
+        ids[expected] = db.session.execute(
+            db.text("INSERT INTO public.proxies (user_id, host, port, protocol, username, password) "
+                    "VALUES (:user_id, '127.0.0.1', :port, 'socks5', :username, :password) RETURNING id::text"),
+            {'user_id': user_id, 'port': port, 'username': USERNAME, 'password': PASSWORD}
+        ).scalar_one()
+    db.session.commit()
+
+    connection = psycopg2.connect(database_url)
+    try:
+        run = checker(stand_ins)
+        run.connection = connection
+        summary = run.run_once(stale_after=60)
+        assert summary['success'] >= 1 and summary['failed'] >= 1
+        # Just checked, so not due again
+        assert not {proxy['id'] for proxy in run.due_proxies(stale_after=60)} & set(ids.values())
+    finally:
+        connection.close()
+
+    rows = dict(db.session.execute(
+        db.text("SELECT id::text, test_result FROM public.proxies WHERE user_id = :user_id"), {'user_id': user_id}
+    ).all())
+    assert rows == {ids['success']: 'success', ids['failed']: 'failed'}
+    latency = db.session.execute(
+        db.text("SELECT latency_ms FROM public.proxies WHERE id = :id"), {'id': ids['success']}
+    ).scalar_one()
+    assert latency is not None
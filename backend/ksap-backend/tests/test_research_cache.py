@@ -0,0 +1,163 @@
+import threading
+import time
+import uuid
+
+import pytest
+
+from src.services.research_cache import ResearchCache, ResearchError, StubSource, query_key
+
+
+class CountingSource(StubSource):
+    """A stub source that records its fetches and what the pool held during them"""
+
+    def __init__(self, name, latency=0.0, fail=False):
+        super().__init__(name, latency=latency, results=3)
+        self.fail = fail
+        self.calls = 0
+        self.checked_out = []
+        self.claims = []
+
+    def __call__(self, research_type, query_parameters, timeout=None):
+        from src.models import db
+
+        self.calls += 1
+        self.checked_out.append(db.engine.pool.checkedout())
+        with db.engine.connect() as connection:
+            self.claims.append(connection.execute(db.text(
+                "SELECT count(*) FROM public.research_fetch_claims WHERE query_hash = :key"
+            ), {'key': query_key(self.name, research_type, query_parameters)}).scalar())
+        if self.fail:
+            raise RuntimeError('source is down')
+        return super().__call__(research_type, query_parameters, timeout)
+
+
+@pytest.fixture
+def query(db):
+    """Parameters unique to the test; its entries and claim are deleted afterwards"""
+    parameters = {'key': uuid.uuid4().hex, 'country': 'US'}
+    yield parameters
+    db.session.rollback()
+    db.session.execute(db.text(
+        "DELETE FROM public.research_cache WHERE query_parameters->>'key' = :key"
+    ), {'key': parameters['key']})
+    db.session.execute(db.text(
+        "DELETE FROM public.research_fetch_claims WHERE claimed_by = 'test' OR query_hash IN "
+        "(SELECT query_hash FROM public.research_cache WHERE query_parameters->>'key' = :key)"
+    ), {'key': parameters['key']})
+    db.session.commit()
+
+
+def cache_with(source, fetch_timeout=5):
+    cache = ResearchCache(fetch_timeout=fetch_timeout)
+    cache.register_source(source.name, source, ttl=60)
+    return cache
+
+
+def claim(db, source, query, seconds):
+    key = query_key(source.name, 'trend', query)
+    db.session.execute(db.text(
+        "INSERT INTO public.research_fetch_claims (query_hash, claimed_by, expires_at) "
+        "VALUES (:key, 'test', now() + make_interval(secs => :seconds))"
+    ), {'key': key, 'seconds': seconds})
+    db.session.commit()
+    return key
+
+
+def test_miss_then_hit_with_canonical_key(db, query):
+    source = CountingSource('test_trends')
+    cache = cache_with(source)
+    first = cache.get('test_trends', 'trend', query)
+    second = cache.get('test_trends', 'trend', dict(reversed(list(query.items()))))
+    assert (first['cache'], second['cache']) == ('miss', 'hit')
+    assert first['data'] == second['data'] and source.calls == 1
+
+
+def test_fetch_holds_no_pooled_connection_and_releases_its_claim(db, query):
+    source = CountingSource('test_trends')
+    cache = cache_with(source)
+    cache.get('test_trends', 'trend', query)
+    # The claim is in place while the source is fetched, with no connection checked out
+    assert source.checked_out == [0]
+    assert source.claims == [1]
+    claims = db.session.execute(db.text(
+        "SELECT count(*) FROM public.research_fetch_claims WHERE query_hash = :key"
+    ), {'key': cache.get('test_trends', 'trend', query)['query_hash']}).scalar()
+    assert claims == 0
+
+
+@pytest.mark.allow_n_plus_one
+def test_callers_in_other_processes_share_one_fetch(app, db, query):
+    # Separate instances coalesce only through the database, like processes
+    source = CountingSource('test_trends', latency=0.3)
+    caches = [cache_with(source) for _ in range(4)]
+    outcomes = []
+
+    def ask(cache):
+        with app.app_context():
+            outcomes.append(cache.get('test_trends', 'trend', query)['cache'])
+
+    threads = [threading.Thread(target=ask, args=(cache,)) for cache in caches]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert source.calls == 1
+    assert sorted(outcomes) == ['coalesced', 'coalesced', 'coalesced', 'miss']
+
+
+@pytest.mark.allow_n_plus_one
+def test_live_claim_of_another_process_is_waited_on(db, query):
+    source = CountingSource('test_trends')
+    cache = cache_with(source, fetch_timeout=0.3)
+    claim(db, source, query, seconds=60)
+    started = time.monotonic()
+    with pytest.raises(ResearchError) as raised:
+        cache.get('test_trends', 'trend', query)
+    assert raised.value.status == 504
+    assert time.monotonic() - started >= 0.3
+    assert source.calls == 0
+
+
+def test_expired_claim_of_a_crashed_process_is_taken_over(db, query):
+    source = CountingSource('test_trends')
+    cache = cache_with(source)
+    claim(db, source, query, seconds=-1)
+    assert cache.get('test_trends', 'trend', query)['cache'] == 'miss'
+    assert source.calls == 1
+
+
+def test_failed_fetch_releases_its_claim(db, query):
+    source = CountingSource('test_trends', fail=True)
+    cache = cache_with(source)
+    with pytest.raises(ResearchError) as raised:
+        cache.get('test_trends', 'trend', query)
+    assert raised.value.code == 'SOURCE_UNAVAILABLE'
+    assert source.claims == [1]
+    # The next caller claims and fetches straight away
+    source.fail = False
+    assert cache.get('test_trends', 'trend', query)['cache'] == 'miss'
+    assert source.calls == 2
+
+
+def test_slow_source_is_given_the_fetch_timeout(db, query):
+    source = CountingSource('test_trends', latency=5)
+    cache = cache_with(source, fetch_timeout=0.2)
+    started = time.monotonic()
+    with pytest.raises(ResearchError) as raised:
+        cache.get('test_trends', 'trend', query)
+    assert (raised.value.code, raised.value.status) == ('SOURCE_TIMEOUT', 504)
+    assert time.monotonic() - started < 1
+    # The claim is released, not left to expire
+    source.latency = 0
+    assert cache.get('test_trends', 'trend', query)['cache'] == 'miss'
+
+
+def test_unknown_source_and_bad_parameters():
+    cache = ResearchCache()
+    with pytest.raises(ResearchError) as raised:
+        cache.get('nope')
+    assert raised.value.status == 404
+    cache.register_source('test_trends', StubSource('test_trends'))
+    with pytest.raises(ResearchError) as raised:
+        cache.get('test_trends', 'trend', ['not', 'an', 'object'])
+    assert raised.value.status == 400
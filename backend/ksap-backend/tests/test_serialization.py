@@ -0,0 +1,57 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import JSON, Boolean, Date, DateTime, Integer, Numeric
+
+import src.models as models
+from src.utils.serialization import SERIALIZED_FIELDS, serialize_many
+
+SAMPLE_VALUES = [
+    (Boolean, True),
+    (Integer, 7),
+    (Numeric, Decimal('12.5')),
+    (DateTime, datetime(2025, 3, 1, 12, 30, 15, 250000)),
+    (Date, date(2025, 3, 1)),
+    (JSON, {'key': 'value'}),
+]
+
+
+def sample(column, n):
+    for column_type, value in SAMPLE_VALUES:
+        if isinstance(column.type, column_type):
+            return value
+    return f'{column.key}-{n}'
+
+
+def populated(model, n):
+    """A transient instance with every column set, so the serializer reads its __dict__"""
+    instance = model(**{attr.key: sample(attr.columns[0], n) for attr in model.__mapper__.column_attrs})
+    if model is models.Store:
+        instance._preloaded_counts = {'products': 3, 'orders': n}
+    return instance
+
+
+def sparse(model):
+    """A transient instance with no columns set: None values and the attribute fallback"""
+    instance = model()
+    if model is models.Store:
+        instance._preloaded_counts = {'products': 0, 'orders': 0}
+    if model is models.AnalyticsRollup:
+        # to_dict() requires the NOT NULL aggregates
+        instance.value_sum, instance.value_count = Decimal('0'), 0
+    return instance
+
+
+@pytest.mark.parametrize('name', sorted(SERIALIZED_FIELDS))
+def test_serialize_many_matches_to_dict(app, name):
+    model = getattr(models, name)
+    rows = [populated(model, 1), populated(model, 2), sparse(model)]
+
+    with app.app_context():
+        serialized = serialize_many(rows, model, native=False)
+    expected = [row.to_dict() for row in rows]
+
+    assert serialized == expected
+    # Same key order too, so the JSON bodies are byte-identical
+    assert [list(row) for row in serialized] == [list(row) for row in expected]
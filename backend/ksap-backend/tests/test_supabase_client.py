@@ -0,0 +1,64 @@
+import httpx
+import pytest
+
+from src.database.pool import PooledTransport
+from src.database.supabase_client import SupabaseClient
+
+# Any JWT-shaped string passes the SDK's key check
+ANON_KEY = 'eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.anon'
+SERVICE_KEY = 'eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZV9yb2xlIn0.service'
+
+
+class FakeSession:
+    access_token = 'user-access-token'
+
+
+@pytest.fixture
+def supabase(monkeypatch):
+    monkeypatch.setenv('SUPABASE_URL', 'http://supabase.test')
+    monkeypatch.setenv('SUPABASE_ANON_KEY', ANON_KEY)
+    monkeypatch.setenv('SUPABASE_SERVICE_KEY', SERVICE_KEY)
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json=[])
+
+    client = SupabaseClient()
+    client._transport = PooledTransport(pool_size=2, transport=httpx.MockTransport(handler))
+    client.requests = requests
+    yield client
+    client.close()
+
+
+def test_queries_go_through_the_pooled_transport(supabase):
+    supabase.client.table('products').select('id').execute()
+    supabase.admin_client.table('products').select('id').execute()
+    assert len(supabase.requests) == 2
+    assert supabase.pool_metrics()['requests_total'] == 2
+
+
+@pytest.mark.parametrize('event', ['SIGNED_IN', 'TOKEN_REFRESHED', 'SIGNED_OUT'])
+def test_postgrest_client_rebuilt_after_auth_event_stays_pooled(supabase, event):
+    client = supabase.client
+    client.table('products').select('id').execute()
+    # What the SDK does on sign-in/refresh/sign-out: drop its PostgREST client
+    client.auth._notify_all_subscribers(event, FakeSession())
+    assert client._postgrest is None
+
+    client.table('products').select('id').execute()
+    assert len(supabase.requests) == 2
+    assert supabase.pool_metrics()['requests_total'] == 2
+    if event != 'SIGNED_OUT':
+        assert supabase.requests[-1].headers['Authorization'] == 'Bearer user-access-token'
+
+
+def test_service_role_client_ignores_auth_events(supabase):
+    admin = supabase.admin_client
+    admin.table('products').select('id').execute()
+    postgrest = admin.postgrest
+    admin.auth._notify_all_subscribers('SIGNED_IN', FakeSession())
+
+    admin.table('products').select('id').execute()
+    assert admin.postgrest is postgrest
+    assert supabase.requests[-1].headers['Authorization'] == f'Bearer {SERVICE_KEY}'
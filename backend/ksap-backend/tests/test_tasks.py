@@ -0,0 +1,144 @@
+import time
+import uuid
+from datetime import timedelta
+
+import pytest
+from flask import Flask
+
+from src.services.tasks import MemoryBroker, SQLiteBroker, TaskError, TaskQueue, _now
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def queue(request, tmp_path):
+    broker = MemoryBroker() if request.param == 'memory' else SQLiteBroker(str(tmp_path / 'tasks.db'))
+    queue = TaskQueue(broker=broker, poll_interval=0.01)
+    # Not init_app: no metrics registered for a throwaway broker, no workers
+    queue.app = Flask(__name__)
+    return queue
+
+
+def expire_lease(queue, task_id):
+    """As if the run's worker had stopped renewing it"""
+    if isinstance(queue.broker, MemoryBroker):
+        queue.broker.tasks[task_id]['lease_expires_at'] = _now() - timedelta(seconds=1)
+    else:
+        queue.broker._connection().execute(
+            "UPDATE background_tasks SET lease_expires_at = ? WHERE id = ?", (time.time() - 1, task_id)
+        )
+
+
+def test_cap_keys_come_from_kwargs(queue):
+    queue.task('test.sync', cap_keys=('store_id',))(lambda store_id: None)
+    store_id = str(uuid.uuid4())
+    task_id = queue.enqueue('test.sync', {'store_id': store_id})
+    assert queue.get(task_id)['store_id'] == store_id
+
+    for kwargs, store in (({}, None), ({'store_id': store_id}, str(uuid.uuid4())), ({'store_id': 'nope'}, None)):
+        with pytest.raises(TaskError) as raised:
+            queue.enqueue('test.sync', kwargs, store_id=store)
+        assert raised.value.status == 400
+    with pytest.raises(ValueError):
+        queue.task('test.bad', cap_keys=('campaign_id',))
+
+
+def test_kwargs_are_bound_to_the_signature_when_enqueued(queue):
+    queue.task('test.report', max_retries=5)(lambda store_id, month=None: None)
+    queue.enqueue('test.report', {'store_id': 's1', 'month': '2026-09'})
+    for kwargs in ({}, {'store_id': 's1', 'year': 2026}):
+        with pytest.raises(TaskError) as raised:
+            queue.enqueue('test.report', kwargs)
+        assert raised.value.status == 400
+    # Rejected calls never reach the queue to be retried
+    assert queue.broker.depth()['queued'] == 1
+
+
+def test_two_syncs_of_a_store_never_run_at_once(queue):
+    queue.task('test.sync', cap_keys=('store_id',))(lambda store_id: None)
+    store_id = str(uuid.uuid4())
+    first = queue.enqueue('test.sync', {'store_id': store_id})
+    second = queue.enqueue('test.sync', {'store_id': store_id})
+
+    running = queue.claim('worker-1')
+    assert running['id'] == first
+    assert queue.claim('worker-2') is None
+    assert queue.execute(running) == 'succeeded'
+    assert queue.claim('worker-2')['id'] == second
+
+
+def test_lease_is_renewed_while_a_task_runs(queue):
+    taken_over = []
+
+    @queue.task('test.slow', timeout=1)
+    def slow():
+        time.sleep(1.5)
+        # Without renewals the lease would have expired and this claim take the task
+        taken_over.append(queue.claim('worker-2'))
+        return {'lost': queue.current_lease().lost.is_set()}
+
+    task_id = queue.enqueue('test.slow')
+    assert queue.execute(queue.claim('worker-1')) == 'succeeded'
+    assert taken_over == [None]
+    task = queue.get(task_id)
+    assert (task['status'], task['attempts'], task['result']) == ('succeeded', 1, {'lost': False})
+
+
+def test_a_run_that_lost_its_lease_stops_and_records_nothing(queue):
+    second_runs = []
+
+    @queue.task('test.long', timeout=1)
+    def long_running():
+        lease = queue.current_lease()
+        # The worker stalled past its lease and another one took the task
+        expire_lease(queue, lease.task['id'])
+        second_runs.append(queue.claim('worker-2'))
+        assert lease.lost.wait(2)
+        return {'run': 1}
+
+    task_id = queue.enqueue('test.long')
+    assert queue.execute(queue.claim('worker-1')) == 'discarded'
+
+    second, = second_runs
+    assert (second['id'], second['attempts']) == (task_id, 2)
+    task = queue.get(task_id)
+    assert (task['status'], task['result']) == ('running', None)
+    assert queue.broker.finish(second, 'succeeded', result={'run': 2})
+    assert queue.get(task_id)['result'] == {'run': 2}
+
+
+def test_sync_task_takes_its_store_from_kwargs(client, store_id, user_id):
+    response = client.post('/api/v1/tasks', json={'task': 'stores.sync', 'kwargs': {'store_id': store_id}})
+    assert response.status_code == 202
+    task = response.get_json()
+    assert (task['store_id'], task['user_id']) == (store_id, user_id)
+
+    response = client.post('/api/v1/tasks', json={'task': 'stores.sync', 'store_id': store_id})
+    assert response.status_code == 400
+    assert response.get_json()['error']['message'] == "Task 'stores.sync' requires kwargs.store_id"
+
+
+def test_api_queues_only_public_tasks(client, store_id):
+    response = client.post('/api/v1/tasks', json={'task': 'tasks.prune', 'store_id': store_id})
+    assert response.status_code == 404
+    assert response.get_json()['error']['tasks'] == ['stores.sync']
+
+
+def test_api_counts_tasks_against_the_store_owner(client, store_id, user_id):
+    response = client.post('/api/v1/tasks', json={
+        'task': 'stores.sync', 'kwargs': {'store_id': store_id}, 'user_id': str(uuid.uuid4())
+    })
+    assert response.status_code == 202
+    assert response.get_json()['user_id'] == user_id
+
+
+def test_api_priority_and_kwargs(client, store_id):
+    def post(**body):
+        return client.post('/api/v1/tasks', json={'task': 'stores.sync', 'kwargs': {'store_id': store_id}, **body})
+
+    assert post(priority='high').status_code == 400
+    assert post(priority=0).status_code == 400
+    assert post(priority=['low']).status_code == 400
+    assert post(priority='low').get_json()['priority'] == 9
+
+    response = post(kwargs={'store_id': store_id, 'full': True})
+    assert response.status_code == 400
+    assert response.get_json()['error']['message'].startswith("Bad kwargs for task 'stores.sync'")
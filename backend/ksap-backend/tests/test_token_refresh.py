@@ -0,0 +1,213 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import psycopg2
+import pytest
+
+from benchmarks.token_refresh import OAuthStandIn
+from src.services import token_refresh
+from src.services.token_refresh import OAuthProvider, RefreshError, TokenRefreshScheduler
+
+
+@pytest.fixture(scope='module')
+def oauth_stand_in():
+    """The benchmark's local OAuth stand-in; tokens starting with 'revoked' get invalid_grant"""
+    server = OAuthStandIn(error_rate=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f'http://127.0.0.1:{server.server_address[1]}/oauth/token'
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def oauth_server(oauth_stand_in):
+    oauth_stand_in.error_rate = 0
+    oauth_stand_in.request_times.clear()
+    return oauth_stand_in
+
+
+@pytest.fixture
+def scheduler(oauth_server):
+    providers = {
+        'facebook': OAuthProvider('facebook', oauth_server.url, 'app', 'secret', grant='fb_exchange_token'),
+        'instagram': OAuthProvider('instagram', oauth_server.url, grant='ig_refresh_token'),
+        'tiktok': OAuthProvider('tiktok', oauth_server.url, 'app', 'secret'),
+    }
+    scheduler = TokenRefreshScheduler(providers=providers, lead_time=60, rate=1000, workers=4, jitter=0)
+    yield scheduler
+    scheduler.close()
+
+
+def account(account_id, platform='facebook', token=None, expires_in=30, refresh_token=None):
+    return {
+        'id': account_id,
+        'platform': platform,
+        'access_token': token or f'token-{account_id}',
+        'refresh_token': refresh_token,
+        'token_expires_at': datetime.now(timezone.utc) + timedelta(seconds=expires_in),
+    }
+
+
+@pytest.mark.parametrize('platform, refresh_token, expected_refresh_token', [
+    ('facebook', None, None),
+    ('instagram', None, None),
+    ('tiktok', 'refresh-1', 'new-refresh-1'),
+])
+def test_each_grant_returns_a_new_token(scheduler, platform, refresh_token, expected_refresh_token):
+    result = scheduler.refresh(account('a', platform, refresh_token=refresh_token))
+    assert result.ok
+    assert result.access_token == ('new-refresh-1' if refresh_token else 'new-token-a')
+    assert result.refresh_token == expected_refresh_token
+    assert result.expires_at > datetime.now(timezone.utc) + timedelta(days=59)
+
+
+def test_refresh_grant_without_refresh_token_needs_reauth(scheduler):
+    result = scheduler.refresh(account('a', 'tiktok'))
+    assert not result.ok and not result.error.retry
+
+
+def test_accounts_come_due_ahead_of_expiry_in_order(scheduler):
+    scheduler.batch_size = 2
+    scheduler.push(account('late', expires_in=300))
+    scheduler.push(account('soon', expires_in=30))
+    scheduler.push(account('sooner', expires_in=10))
+    scheduler.push(account('soon', expires_in=20))  # rescheduled; the old entry is superseded
+    assert len(scheduler) == 3
+    assert [a['id'] for a in scheduler.due()] == ['sooner', 'soon']
+    assert scheduler.due() == []
+    assert scheduler.next_due() == pytest.approx(time.time() + 240, abs=5)
+
+
+def test_revoked_grant_is_not_retried_until_the_user_reconnects(scheduler, oauth_server):
+    revoked = account('r', token='revoked-1')
+    scheduler.push(revoked)
+    assert scheduler.run_due() == 1
+    assert scheduler.stats['needs_reauth'] == 1 and scheduler.stats['retried'] == 0
+
+    scheduler.push(revoked)
+    assert len(scheduler) == 0
+    # A reconnect stores a new token with a new expiry
+    scheduler.push(account('r', expires_in=40))
+    assert len(scheduler) == 1
+
+
+def test_server_errors_are_retried_then_given_up(scheduler, oauth_server, monkeypatch):
+    monkeypatch.setattr(token_refresh, 'BACKOFF_BASE', 0)
+    oauth_server.error_rate = 1.0
+    scheduler.max_attempts = 3
+    scheduler.push(account('e'))
+    assert scheduler.run_due() == 3
+    assert scheduler.stats == {'refreshed': 0, 'retried': 2, 'failed': 1, 'needs_reauth': 0, 'superseded': 0}
+    assert len(oauth_server.request_times) == 3
+
+
+def test_refreshed_accounts_are_requeued_from_their_new_expiry(scheduler):
+    scheduler.push(account('a'))
+    scheduler.run_due()
+    assert scheduler.stats['refreshed'] == 1
+    assert scheduler.next_due() > time.time() + 59 * 24 * 3600
+
+
+def test_dispatch_rate_is_capped(scheduler, oauth_server):
+    scheduler.rate = 20
+    scheduler.batch_size = 5
+    for i in range(10):
+        scheduler.push(account(str(i)))
+    scheduler.run_due()
+    times = sorted(oauth_server.request_times)
+    # Ten refreshes at 20/s: the second batch waits a quarter second
+    assert times[-1] - times[0] >= 0.2
+
+
+def test_provider_errors_surface_as_refresh_errors(scheduler):
+    scheduler.providers['facebook'] = OAuthProvider('facebook', 'http://127.0.0.1:9/unreachable', grant='fb_exchange_token')
+    result = scheduler.refresh(account('a'))
+    assert isinstance(result.error, RefreshError) and result.error.retry
+
+
+def test_failed_write_is_kept_and_retried(scheduler, monkeypatch):
+    written = []
+
+    def write_results(rows):
+        if not written:
+            written.append(None)
+            raise psycopg2.OperationalError('connection lost')
+        written.append(rows)
+        return {row[0] for row in rows}
+
+    monkeypatch.setattr(scheduler, 'write_results', write_results)
+    scheduler.push(account('a', 'tiktok', refresh_token='refresh-1'))
+    scheduler.run_due()
+    assert list(scheduler._unwritten) == ['a']
+
+    # Refreshed again from the rotated token held in memory before any write landed
+    scheduler.run_batch(scheduler.due(now=time.time() + 365 * 24 * 3600))
+    assert scheduler._unwritten == {}
+    (row,), = written[1:]
+    assert row[:3] == ('a', 'new-new-refresh-1', 'new-new-refresh-1')
+    # Still guarded by the tokens the table holds
+    assert row[4:] == ('token-a', 'refresh-1')
+
+
+def test_write_back_skips_reconnected_accounts(scheduler, database_url, db, user_id):
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+    account_id = db.session.execute(
+        db.text("INSERT INTO public.social_media_accounts (user_id, platform, access_token, token_expires_at) "
+                "VALUES (:user_id, 'instagram', 'token-db', :expires_at) RETURNING id::text"),
+        {'user_id': user_id, 'expires_at': expires_at}
+    ).scalar_one()
+    db.session.commit()
+
+    connection = psycopg2.connect(database_url)
+    try:
+        scheduler.connection = connection
+        scheduler.load()
+        # The user reconnects between the read and the write
+        db.session.execute(
+            db.text("UPDATE public.social_media_accounts SET access_token = 'reconnected' WHERE id = :id"),
+            {'id': account_id}
+        )
+        db.session.commit()
+        scheduler.run_due()
+        assert scheduler.stats['superseded'] == 1
+        assert account_id not in scheduler._accounts
+
+        # A refresh without expires_in keeps the stored expiry
+        assert scheduler.write_results([(account_id, 'token-2', None, None, 'reconnected', None)]) == {account_id}
+    finally:
+        connection.close()
+
+    access_token, stored_expiry = db.session.execute(
+        db.text("SELECT access_token, token_expires_at FROM public.social_media_accounts WHERE id = :id"),
+        {'id': account_id}
+    ).one()
+    assert access_token == 'token-2'
+    assert stored_expiry == expires_at
+
+
+def test_load_and_write_back(scheduler, database_url, db, user_id):
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+    account_id = db.session.execute(
+        db.text("INSERT INTO public.social_media_accounts (user_id, platform, access_token, token_expires_at) "
+                "VALUES (:user_id, 'instagram', 'token-db', :expires_at) RETURNING id::text"),
+        {'user_id': user_id, 'expires_at': expires_at}
+    ).scalar_one()
+    db.session.commit()
+
+    connection = psycopg2.connect(database_url)
+    try:
+        scheduler.connection = connection
+        assert scheduler.load() >= 1
+        scheduler.run_due()
+    finally:
+        connection.close()
+
+    access_token, stored_expiry = db.session.execute(
+        db.text("SELECT access_token, token_expires_at FROM public.social_media_accounts WHERE id = :id"),
+        {'id': account_id}
+    ).one()
+    assert access_token == 'new-token-db'
+    assert stored_expiry > expires_at + timedelta(days=59)